@@ -6,6 +6,8 @@ Simplified: webhook data only, FM actions, Claude chart analysis
 
 import enum
 import os
+from datetime import date as date_type
+from datetime import datetime as datetime_type
 
 from sqlalchemy import (
     JSON,
@@ -19,6 +21,7 @@ from sqlalchemy import (
     Integer,
     String,
     Text,
+    TypeDecorator,
     UniqueConstraint,
     create_engine,
 )
@@ -36,6 +39,28 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class IsoDate(TypeDecorator):
+    """Native DATE column that reads and binds as "YYYY-MM-DD" strings.
+
+    Lets a String(10) date column move to DATE (range scans on a real date
+    type, 4 bytes vs 11) without changing the string-based code that reads it.
+    """
+    impl = Date
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, datetime_type):
+            return value.date()
+        if isinstance(value, date_type):
+            return value
+        return date_type.fromisoformat(str(value)[:10])
+
+    def process_result_value(self, value, dialect):
+        return value.isoformat() if value is not None else None
+
+
 class AlertStatus(str, enum.Enum):
     PENDING   = "PENDING"
     APPROVED  = "APPROVED"
@@ -146,7 +171,7 @@ class IndexPrice(Base):
     __tablename__ = "index_prices"
 
     id          = Column(Integer, primary_key=True, autoincrement=True)
-    date        = Column(String(10), nullable=False)   # "YYYY-MM-DD"
+    date        = Column(IsoDate, nullable=False)      # DATE, exposed as "YYYY-MM-DD"
     index_name  = Column(String(50), nullable=False)   # e.g. "NIFTY", "BANKNIFTY"
     close_price = Column(Float, nullable=True)
     open_price  = Column(Float, nullable=True)
@@ -157,12 +182,57 @@ class IndexPrice(Base):
 
     __table_args__ = (
         Index('idx_indexprice_date_name', 'date', 'index_name', unique=True),
-        Index('idx_indexprice_name', 'index_name'),
         # Standalone date index for date-range queries (min/max date, date filtering)
         Index('idx_indexprice_date', 'date'),
     )
 
 
+# Latest-close / as-of / range lookups per instrument: index-only scans on PG
+Index(
+    'idx_indexprice_name_date', IndexPrice.index_name, IndexPrice.date.desc(),
+    postgresql_include=['close_price', 'high_price', 'low_price', 'volume'],
+)
+
+
+class PeriodReturn(Base):
+    """Materialized period anchors + returns per instrument (refreshed after EOD prices)."""
+    __tablename__ = "period_returns"
+
+    id           = Column(Integer, primary_key=True, autoincrement=True)
+    index_name   = Column(String(50), nullable=False)
+    period       = Column(String(5), nullable=False)    # "1d", "1w", "1m", "3m", "6m", "12m"
+    as_of_date   = Column(String(10), nullable=False)   # instrument's latest close date
+    close        = Column(Float, nullable=False)        # close on as_of_date
+    anchor_date  = Column(String(10), nullable=True)    # close date used as the period start
+    anchor_close = Column(Float, nullable=True)
+    return_pct   = Column(Float, nullable=True)
+    computed_at  = Column(DateTime, default=func.now())
+    # max(IndexPrice.fetched_at) on the latest date when built — changes on in-place price edits
+    source_fetched_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_period_returns_name_period', 'index_name', 'period', unique=True),
+        Index('idx_period_returns_asof', 'as_of_date', 'period'),
+    )
+
+
+class BackfillEmptyRange(Base):
+    """A date range the price provider returned no rows for (services/backfill_planner.py).
+    The planner does not request it again until the record expires."""
+    __tablename__ = "backfill_empty_ranges"
+
+    id          = Column(Integer, primary_key=True, autoincrement=True)
+    price_table = Column(String(10), nullable=False)    # "index", "stock", "etf"
+    ticker      = Column(String(50), nullable=False)
+    first_date  = Column(String(10), nullable=False)    # inclusive
+    last_date   = Column(String(10), nullable=False)    # inclusive
+    checked_at  = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('idx_backfill_empty_table_ticker', 'price_table', 'ticker'),
+    )
+
+
 # ─── Init ───────────────────────────────────────────────
 
 def init_db():
@@ -210,6 +280,16 @@ def _run_migrations():
         "ALTER TYPE compassaction ADD VALUE IF NOT EXISTS 'WATCH_RELATIVE'",
         "ALTER TYPE compassaction ADD VALUE IF NOT EXISTS 'WATCH_EARLY'",
         "ALTER TYPE compassaction ADD VALUE IF NOT EXISTS 'AVOID'",
+        # Fundamentals store: staleness tracking + ETF/index rows
+        "ALTER TABLE fundamentals ADD COLUMN kind VARCHAR(10) DEFAULT 'stock' NOT NULL",
+        "ALTER TABLE fundamentals ADD COLUMN yf_symbol VARCHAR(50)",
+        "ALTER TABLE fundamentals ADD COLUMN forward_pe FLOAT",
+        "ALTER TABLE fundamentals ADD COLUMN last_attempt_at TIMESTAMP",
+        "ALTER TABLE fundamentals ADD COLUMN fail_count INTEGER DEFAULT 0 NOT NULL",
+        # Period returns snapshot: staleness key for in-place price updates
+        "ALTER TABLE period_returns ADD COLUMN source_fetched_at TIMESTAMP",
+        # Decision log: outcomes that can never resolve stop being re-queried
+        "ALTER TABLE compass_decision_log ADD COLUMN outcome_given_up_at TIMESTAMP",
     ]
     for sql in migrations:
         try:
@@ -219,9 +299,21 @@ def _run_migrations():
         except Exception:
             db.rollback()
 
+    _migrate_index_price_date(db)
+
     # Index migrations — CREATE INDEX IF NOT EXISTS for existing databases
     index_migrations = [
         "CREATE INDEX IF NOT EXISTS idx_indexprice_date ON index_prices (date)",
+        # Covering (index_name, date DESC) index; INCLUDE is PG-only, the plain form is the SQLite fallback
+        "CREATE INDEX IF NOT EXISTS idx_indexprice_name_date ON index_prices (index_name, date DESC) "
+        "INCLUDE (close_price, high_price, low_price, volume)",
+        "CREATE INDEX IF NOT EXISTS idx_indexprice_name_date ON index_prices (index_name, date DESC)",
+        # Superseded by idx_indexprice_name_date (same leading column)
+        "DROP INDEX IF EXISTS idx_indexprice_name",
+        "CREATE INDEX IF NOT EXISTS idx_compass_rs_type_date_inst "
+        "ON compass_rs_scores (instrument_type, date, instrument_id)",
+        # Superseded by idx_compass_rs_type_date_inst (same leading column)
+        "DROP INDEX IF EXISTS idx_compass_rs_type",
         "CREATE INDEX IF NOT EXISTS idx_pms_nav_date ON pms_nav_daily (date)",
         "CREATE INDEX IF NOT EXISTS idx_metric_portfolio ON portfolio_metrics (portfolio_id)",
         "CREATE INDEX IF NOT EXISTS idx_metric_portfolio_period ON portfolio_metrics (portfolio_id, period)",
@@ -250,6 +342,31 @@ def _run_migrations():
     db.close()
 
 
+def _migrate_index_price_date(db):
+    """index_prices.date VARCHAR(10) -> DATE on PostgreSQL (one-time rewrite).
+
+    Checked against information_schema first so restarts never rewrite the
+    table again. SQLite needs nothing: DATE is stored as the same ISO text.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    from sqlalchemy import text
+    try:
+        data_type = db.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'index_prices' AND column_name = 'date'"
+        )).scalar()
+        if data_type and data_type != "date":
+            db.execute(text(
+                "ALTER TABLE index_prices ALTER COLUMN date TYPE DATE USING NULLIF(date, '')::date"
+            ))
+            db.commit()
+            print("Migrated index_prices.date to DATE")
+    except Exception as e:
+        db.rollback()
+        print(f"index_prices.date migration skipped: {e}")
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -369,6 +486,24 @@ class PortfolioNAV(Base):
     )
 
 
+class PortfolioNavState(Base):
+    """Checkpoint for incremental NAV materialization (one row per portfolio)."""
+    __tablename__ = "portfolio_nav_state"
+
+    id                      = Column(Integer, primary_key=True, autoincrement=True)
+    portfolio_id            = Column(Integer, ForeignKey("model_portfolios.id"), nullable=False)
+    as_of_date              = Column(String(10), nullable=False)   # last NAV date materialized
+    positions               = Column(JSON, nullable=False)         # {ticker: [quantity, total_cost]}
+    realized_pnl_cumulative = Column(Float, nullable=False, default=0.0)
+    last_txn_id             = Column(Integer, nullable=True)       # highest txn id applied
+    dirty_from              = Column(String(10), nullable=True)    # back-dated edit: recompute from here
+    updated_at              = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('idx_nav_state_portfolio', 'portfolio_id', unique=True),
+    )
+
+
 # ═══════════════════════════════════════════════════════════
 #  MICROBASKET TABLES (custom stock baskets with ratio analysis)
 # ═══════════════════════════════════════════════════════════
@@ -416,6 +551,30 @@ class IndexConstituent(Base):
     )
 
 
+class Fundamental(Base):
+    """Fundamentals (yfinance .info) for stocks, ETFs and sector indices.
+
+    Filled only by the scheduled batch job (services/fundamentals.py);
+    request paths read it and never call yfinance. `fetched_at` is the last
+    successful fetch, `last_attempt_at`/`fail_count` drive retry backoff.
+    """
+    __tablename__ = "fundamentals"
+
+    id              = Column(Integer, primary_key=True, autoincrement=True)
+    symbol          = Column(String(50), nullable=False, unique=True)  # NSE ticker or sector index key
+    kind            = Column(String(10), nullable=False, default="stock")  # stock | etf | index
+    yf_symbol       = Column(String(50), nullable=True)
+    trailing_pe     = Column(Float, nullable=True)
+    forward_pe      = Column(Float, nullable=True)
+    trailing_eps    = Column(Float, nullable=True)
+    week_52_high    = Column(Float, nullable=True)
+    week_52_low     = Column(Float, nullable=True)
+    market_cap      = Column(Float, nullable=True)              # raw INR
+    fetched_at      = Column(DateTime, nullable=True)
+    last_attempt_at = Column(DateTime, nullable=True)
+    fail_count      = Column(Integer, nullable=False, default=0)
+
+
 class MicrobasketConstituent(Base):
     __tablename__ = "microbasket_constituents"
 
@@ -695,7 +854,8 @@ class CompassRSScore(Base):
     __table_args__ = (
         Index("idx_compass_rs_date_inst", "date", "instrument_id", "instrument_type", unique=True),
         Index("idx_compass_rs_date", "date"),
-        Index("idx_compass_rs_type", "instrument_type"),
+        # Batch history: all instruments of a type over a date range
+        Index("idx_compass_rs_type_date_inst", "instrument_type", "date", "instrument_id"),
         Index("idx_compass_rs_sector", "parent_sector"),
     )
 
@@ -789,7 +949,7 @@ class CompassLabRun(Base):
     __tablename__ = "compass_lab_runs"
 
     id            = Column(Integer, primary_key=True, autoincrement=True)
-    run_type      = Column(String(20), nullable=False)      # FULL, FOCUSED, DAILY
+    run_type      = Column(String(20), nullable=False)      # FULL, ADAPTIVE, FOCUSED, STOCK, DAILY
     status        = Column(String(15), nullable=False, default="RUNNING")  # RUNNING, COMPLETED, FAILED
     started_at    = Column(DateTime, nullable=False, default=func.now())
     completed_at  = Column(DateTime, nullable=True)
@@ -800,6 +960,25 @@ class CompassLabRun(Base):
     notes         = Column(Text, nullable=True)
 
 
+class CompassSimResult(Base):
+    """Lab simulation result keyed by what produced it — see services/compass_sim_store.py."""
+    __tablename__ = "compass_sim_results"
+
+    id                = Column(Integer, primary_key=True, autoincrement=True)
+    param_hash        = Column(String(12), nullable=False)
+    data_fingerprint  = Column(String(40), nullable=False)   # sha1 of the simulated price slice
+    simulator_version = Column(String(10), nullable=False)
+    n_days            = Column(Integer, nullable=False)       # length of that slice
+    result            = Column(Text, nullable=False)          # SimResult.to_dict() JSON
+    state             = Column(Text, nullable=True)           # SimState JSON, to extend onto new days
+    created_at        = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index("idx_sim_result_key", "param_hash", "data_fingerprint", "simulator_version", unique=True),
+        Index("idx_sim_result_created", "created_at"),
+    )
+
+
 class CompassRegimeConfig(Base):
     """Lab-derived optimal parameter set per market regime."""
     __tablename__ = "compass_regime_configs"
@@ -850,6 +1029,8 @@ class CompassDecisionLog(Base):
     outcome_20d_return  = Column(Float, nullable=True)
     outcome_60d_return  = Column(Float, nullable=True)
     was_correct         = Column(Boolean, nullable=True)
+    # Set when an outcome is still unresolvable past the longest horizon + grace; skipped from then on
+    outcome_given_up_at = Column(DateTime, nullable=True)
     created_at          = Column(DateTime, default=func.now())
 
     __table_args__ = (
@@ -857,6 +1038,25 @@ class CompassDecisionLog(Base):
     )
 
 
+class CompassDecisionPrecedent(Base):
+    """Outcome tally per (regime, decision, sector) — maintained by backfill_decision_outcomes."""
+    __tablename__ = "compass_decision_precedents"
+
+    id              = Column(Integer, primary_key=True, autoincrement=True)
+    market_regime   = Column(String(15), nullable=False)
+    decision        = Column(String(20), nullable=False)
+    sector_key      = Column(String(50), nullable=False)
+    n               = Column(Integer, nullable=False, default=0)   # decisions with a known outcome
+    n_correct       = Column(Integer, nullable=False, default=0)
+    updated_at      = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("idx_precedent_regime_decision_sector", "market_regime", "decision", "sector_key", unique=True),
+        # Covers the all-sector fallback: SUM(n), SUM(n_correct) for one (regime, decision)
+        Index("idx_precedent_regime_decision_counts", "market_regime", "decision", "n", "n_correct"),
+    )
+
+
 class CompassDiscoveredRule(Base):
     """Patterns discovered by Lab from historical simulations."""
     __tablename__ = "compass_discovered_rules"
@@ -6,6 +6,7 @@ Fallback: yfinance for BSE, commodities, currencies, and individual stocks.
 """
 
 import logging
+import threading
 import time
 from datetime import date as date_type
 from datetime import datetime, timedelta
@@ -27,6 +28,8 @@ from index_constants import (  # noqa: F401 — re-exported for backward compat
 
 logger = logging.getLogger(__name__)
 
+_YF_DOWNLOAD_LOCK = threading.Lock()
+
 
 # ─── NSE Historical API (direct HTTP, no nselib dependency) ────
 
@@ -78,74 +81,19 @@ def _parse_nse_history_response(data_items):
     return rows
 
 
-def fetch_nse_index_history(nse_display_name, days=365, _session=None):
+def fetch_nse_index_history(nse_display_name, days=365):
     """
     Fetch historical daily data for a single NSE index from NSE's website API.
-    NSE API returns max ~70-90 days per request, so we chunk into 90-day segments.
     nse_display_name: e.g., "NIFTY 50", "NIFTY BANK"
     days: number of days of history to fetch (default 365)
     Returns [{date, open, high, low, close, volume}, ...]
     """
-    try:
-        if _session:
-            session, base_headers = _session
-        else:
-            session, base_headers = _nse_session()
-
-        api_headers = {
-            **base_headers,
-            "referer": "https://www.nseindia.com/",
-            "Accept": "application/json, text/html, */*",
-            "Sec-Fetch-Site": "same-origin",
-            "Sec-Fetch-Mode": "cors",
-        }
-
-        encoded_name = quote(nse_display_name)
-        all_rows = []
-        seen_dates = set()
-
-        # Chunk into 90-day segments (NSE API limits per request)
-        end = date_type.today()
-        start = end - timedelta(days=days)
-        chunk_start = start
-
-        while chunk_start < end:
-            chunk_end = min(chunk_start + timedelta(days=89), end)
-            from_str = chunk_start.strftime("%d-%m-%Y")
-            to_str = chunk_end.strftime("%d-%m-%Y")
-
-            url = (
-                f"https://www.nseindia.com/api/historicalOR/indicesHistory"
-                f"?indexType={encoded_name}&from={from_str}&to={to_str}"
-            )
-
-            resp = session.get(url, headers=api_headers, timeout=15)
-            if resp.status_code != 200:
-                logger.debug("NSE history chunk returned %d for %s (%s-%s)",
-                             resp.status_code, nse_display_name, from_str, to_str)
-                chunk_start = chunk_end + timedelta(days=1)
-                continue
-
-            resp_json = resp.json()
-            data_items = resp_json.get("data", [])
-
-            if data_items:
-                rows = _parse_nse_history_response(data_items)
-                for r in rows:
-                    if r["date"] not in seen_dates:
-                        all_rows.append(r)
-                        seen_dates.add(r["date"])
-
-            chunk_start = chunk_end + timedelta(days=1)
-            time.sleep(0.2)  # small delay between chunks
-
-        if all_rows:
-            logger.info("NSE history: %s — %d days fetched", nse_display_name, len(all_rows))
-        else:
-            logger.debug("NSE history: %s — 0 days (API returned no data)", nse_display_name)
-
-        return all_rows
+    from services.nse_history import fetch_index_histories
 
+    start = date_type.today() - timedelta(days=days)
+    try:
+        return fetch_index_histories({nse_display_name: nse_display_name}, {nse_display_name: start}).get(
+            nse_display_name, [])
     except Exception as e:
         logger.debug("NSE history fetch failed for %s: %s", nse_display_name, e)
         return []
@@ -369,12 +317,16 @@ def compute_returns(alert_price: float, current_price: float, direction: str = "
     return {"return_pct": ret_pct, "return_absolute": round(ret_abs, 2)}
 
 
-def fetch_historical_indices_nse_sync(period: str = "1y") -> dict:
+def fetch_historical_indices_nse_sync(period: str = "1y", db=None) -> dict:
     """
     Fetch historical daily data from NSE website API for all NSE indices.
     Called as a background task AFTER startup (does NOT block the server).
+    With a db session, each index resumes from its last stored date, so only
+    missing days are requested (never further back than `period`).
     Returns {index_name: [{date, open, high, low, close, volume}, ...]}
     """
+    from services.nse_history import fetch_index_histories
+
     period_days = {"1y": 365, "6m": 180, "3m": 90, "1m": 30, "1w": 7, "5d": 5}
     days = period_days.get(period, 365)
     results = {}
@@ -385,33 +337,18 @@ def fetch_historical_indices_nse_sync(period: str = "1y") -> dict:
             logger.warning("NSE background: no live data to build index list")
             return results
 
-        session_tuple = _nse_session()
-        fetched_count = 0
+        indices = {item["index_name"]: item["nse_name"] for item in live if item.get("nse_name")}
+        floor = date_type.today() - timedelta(days=days)
+        start_dates = {key: floor for key in indices}
+        if db is not None:
+            from services.data_helpers import get_last_price_dates
 
-        for i, item in enumerate(live):
-            idx_name = item["index_name"]
-            nse_name = item.get("nse_name")
-            if not nse_name:
-                continue
+            # Re-request the last stored day too, so a live-snapshot close gets the official EOD row
+            for key, last in get_last_price_dates(db, list(indices)).items():
+                start_dates[key] = max(floor, date_type.fromisoformat(last))
 
-            try:
-                rows = fetch_nse_index_history(nse_name, days=days, _session=session_tuple)
-                if rows:
-                    results[idx_name] = rows
-                    fetched_count += 1
-
-                # Rate limit
-                time.sleep(0.5)
-
-                # Re-establish session every 25 requests
-                if (i + 1) % 25 == 0:
-                    session_tuple = _nse_session()
-                    time.sleep(1)
-
-            except Exception as e:
-                logger.debug("NSE bg history error for %s: %s", nse_name, e)
-
-        logger.info("NSE background fetch: %d/%d indices got data", fetched_count, len(live))
+        results = fetch_index_histories(indices, start_dates)
+        logger.info("NSE background fetch: %d/%d indices got data", len(results), len(indices))
     except Exception as e:
         logger.warning("NSE background fetch failed: %s", e)
 
@@ -491,7 +428,14 @@ def fetch_yfinance_index_history(index_key: str, period: str = "2y") -> list:
 
 
 def _yf_download_with_retry(tickers: str, max_retries: int = 3, **kwargs):  # -> pd.DataFrame
-    """Wrapper around yf.download() with retry logic for rate limits."""
+    """Wrapper around yf.download() with retry logic for rate limits.
+    Serialized process-wide: yf.download keeps per-call results in module
+    globals, so concurrent calls (EOD pipeline stages) can mix up tickers."""
+    with _YF_DOWNLOAD_LOCK:
+        return _yf_download_locked(tickers, max_retries, **kwargs)
+
+
+def _yf_download_locked(tickers: str, max_retries: int, **kwargs):
     import yfinance as yf
 
     for attempt in range(max_retries):
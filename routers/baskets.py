@@ -7,14 +7,13 @@ import csv
 import io
 import logging
 import threading
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from pydantic import BaseModel, Field
 from sqlalchemy import desc
-from sqlalchemy import func as sqlfunc
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
 from models import (
     BasketStatus,
@@ -23,13 +22,16 @@ from models import (
     MicrobasketConstituent,
     get_db,
 )
+from services.asof_prices import latest_prices
 from services.basket_service import (
     backfill_basket_nav,
     basket_slug,
     compute_basket_live_value,
     compute_constituent_units,
+    invalidate_basket_weights,
 )
 from services.data_helpers import upsert_price_row
+from services.period_returns import PERIOD_DAYS, ensure_period_returns, load_period_returns, ratio_return
 
 logger = logging.getLogger("fie_v3.baskets")
 router = APIRouter()
@@ -201,6 +203,7 @@ async def create_basket(req: CreateBasketRequest, db: Session = Depends(get_db))
 
     db.commit()
     db.refresh(basket)
+    invalidate_basket_weights()
 
     # Background: fetch constituent history + compute NAV series
     threading.Thread(
@@ -267,6 +270,7 @@ async def baskets_live(base: str = "NIFTY", db: Session = Depends(get_db)):
     """All baskets with live values + ratio returns (mirrors /api/indices/live shape)."""
     baskets = (
         db.query(Microbasket)
+        .options(selectinload(Microbasket.constituents))
         .filter(Microbasket.status == BasketStatus.ACTIVE)
         .order_by(Microbasket.name)
         .all()
@@ -275,116 +279,40 @@ async def baskets_live(base: str = "NIFTY", db: Session = Depends(get_db)):
     if not baskets:
         return {"success": True, "count": 0, "base": base, "baskets": [], "timestamp": datetime.now().isoformat() + "Z"}
 
-    # Compute live values for all baskets
-    results = []
-    period_map = {"1d": 1, "1w": 7, "1m": 30, "3m": 90, "6m": 180, "12m": 365}
-    tolerance = {"1d": 5, "1w": 5, "1m": 10, "3m": 15, "6m": 15, "12m": 15}
-
-    # Pre-load historical dates (same bidirectional lookup as indices.py)
-    historical_dates = {}
-    for pk, days in period_map.items():
-        target = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        tol = tolerance.get(pk, 15)
-        before = db.query(sqlfunc.max(IndexPrice.date)).filter(IndexPrice.date <= target).scalar()
-        after = db.query(sqlfunc.min(IndexPrice.date)).filter(IndexPrice.date >= target).scalar()
-        best = None
-        if before:
-            gap_before = (datetime.strptime(target, "%Y-%m-%d") - datetime.strptime(before, "%Y-%m-%d")).days
-            if gap_before <= tol:
-                best = before
-        if after:
-            gap_after = (datetime.strptime(after, "%Y-%m-%d") - datetime.strptime(target, "%Y-%m-%d")).days
-            if gap_after <= tol:
-                if best is None:
-                    best = after
-                else:
-                    gap_best = abs((datetime.strptime(target, "%Y-%m-%d") - datetime.strptime(best, "%Y-%m-%d")).days)
-                    if gap_after < gap_best:
-                        best = after
-        if best:
-            historical_dates[pk] = best
-
-    # Load all prices at historical dates
-    unique_dates = list(set(historical_dates.values()))
-    date_price_map: dict = {}
-    if unique_dates:
-        all_rows = db.query(IndexPrice).filter(IndexPrice.date.in_(unique_dates)).all()
-        for r in all_rows:
-            if r.date not in date_price_map:
-                date_price_map[r.date] = {}
-            if r.close_price:
-                date_price_map[r.date][r.index_name] = r.close_price
-
-    historical_prices = {}
-    for pk, d in historical_dates.items():
-        historical_prices[pk] = date_price_map.get(d, {})
+    # Latest NAV, 1d change and period anchors for every basket + base: one snapshot read
+    ensure_period_returns(db)
+    snapshot = load_period_returns(db, names=[b.slug for b in baskets] + [base])
+    base_snap = snapshot.get(base, {})
+
+    # Latest closes for every constituent of every basket: one batched lookup
+    latest = latest_prices(db, {c.ticker for b in baskets for c in b.constituents})
+    price_map = {ticker: p.close for ticker, p in latest.items()}
 
+    results = []
     for b in baskets:
         slug = b.slug
+        basket_snap = snapshot.get(slug, {})
+        latest_nav = basket_snap.get("1d")
+        close = latest_nav.close if latest_nav else None
+        change_pct = latest_nav.return_pct if latest_nav else None
 
-        # Get latest NAV
-        latest_nav = (
-            db.query(IndexPrice)
-            .filter(IndexPrice.index_name == slug)
-            .order_by(desc(IndexPrice.date))
-            .first()
-        )
-        close = latest_nav.close_price if latest_nav else None
-
-        # Previous close for 1d change
-        prev_nav = None
-        if latest_nav:
-            prev_nav = (
-                db.query(IndexPrice)
-                .filter(IndexPrice.index_name == slug, IndexPrice.date < latest_nav.date)
-                .order_by(desc(IndexPrice.date))
-                .first()
-            )
-        change_pct = None
-        if prev_nav and prev_nav.close_price and close:
-            change_pct = round(((close - prev_nav.close_price) / prev_nav.close_price) * 100, 2)
-
-        # Get base close (latest available)
-        base_latest = (
-            db.query(IndexPrice)
-            .filter(IndexPrice.index_name == base)
-            .order_by(desc(IndexPrice.date))
-            .first()
-        )
-        base_close = base_latest.close_price if base_latest else None
-
-        # Ratio returns
+        # Ratio returns (basket / base between each period's anchors and now)
         ratio_returns: dict = {}
-        ratio_today = (close / base_close) if (close and base_close and base_close > 0) else None
-
-        if ratio_today:
-            for pk in period_map:
-                old_prices = historical_prices.get(pk, {})
-                old_idx = old_prices.get(slug)
-                old_base = old_prices.get(base)
-                if old_idx and old_base and old_base > 0:
-                    ratio_old = old_idx / old_base
-                    if ratio_old > 0:
-                        ratio_returns[pk] = round(((ratio_today / ratio_old) - 1) * 100, 2)
+        for pk in PERIOD_DAYS:
+            ret = ratio_return(basket_snap.get(pk), base_snap.get(pk))
+            if ret is not None:
+                ratio_returns[pk] = ret
 
         # Index (basket's own) returns
-        index_returns: dict = {}
-        if change_pct is not None:
-            index_returns["1d"] = change_pct
-        if close:
-            for pk in period_map:
-                if pk == "1d" and "1d" in index_returns:
-                    continue
-                old_prices = historical_prices.get(pk, {})
-                old_idx = old_prices.get(slug)
-                if old_idx and old_idx > 0:
-                    index_returns[pk] = round(((close / old_idx) - 1) * 100, 2)
+        index_returns: dict = {
+            pk: row.return_pct for pk, row in basket_snap.items() if row.return_pct is not None
+        }
 
         # Enrich constituents with current_price, computed_units, allocated_amount
         portfolio_worth = None
         portfolio_cost = None
         if b.portfolio_size and b.portfolio_size > 0:
-            constituents_data = compute_constituent_units(b.constituents, b.portfolio_size, db)
+            constituents_data = compute_constituent_units(b.constituents, b.portfolio_size, db, price_map)
             # Also include buy_price and compute per-constituent P&L
             for cd, c in zip(constituents_data, b.constituents):
                 cd["buy_price"] = c.buy_price
@@ -426,7 +354,7 @@ async def baskets_live(base: str = "NIFTY", db: Session = Depends(get_db)):
             "exit_date": b.exit_date.isoformat() if b.exit_date else None,
             "num_constituents": len(b.constituents),
             "current_value": close,
-            "value_date": latest_nav.date if latest_nav else None,
+            "value_date": latest_nav.as_of_date if latest_nav else None,
             "change_pct": change_pct,
             "ratio_returns": ratio_returns,
             "index_returns": index_returns,
@@ -563,6 +491,7 @@ async def update_basket(basket_id: int, req: UpdateBasketRequest, db: Session =
             ))
 
     db.commit()
+    invalidate_basket_weights()
 
     # Rebuild NAV if constituents changed
     if req.constituents is not None:
@@ -588,6 +517,7 @@ async def archive_basket(basket_id: int, db: Session = Depends(get_db)):
 
     basket.status = BasketStatus.ARCHIVED
     db.commit()
+    invalidate_basket_weights()
     return {"success": True, "message": f"Basket '{basket.name}' archived"}
 
 
@@ -608,6 +538,7 @@ async def stop_basket(basket_id: int, db: Session = Depends(get_db)):
     basket.exit_date = date.today()
     basket.status = BasketStatus.ARCHIVED
     db.commit()
+    invalidate_basket_weights()
 
     return {
         "success": True,
@@ -730,6 +661,7 @@ async def upload_baskets_csv(file: UploadFile = File(...), db: Session = Depends
             ))
 
         db.commit()
+        invalidate_basket_weights()
 
         # Background build
         threading.Thread(
@@ -12,11 +12,13 @@ import time
 import threading
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from models import get_db
+from services.chart_series import MIN_POINTS, downsample_rows, etag_response, to_columns
 
 logger = logging.getLogger("fie_v3.compass")
 
@@ -31,6 +33,10 @@ _rs_cache: dict[str, dict] = {}
 _rs_cache_lock = threading.Lock()
 CACHE_TTL_SECONDS = 900  # 15 minutes
 
+# Batch RS history payloads, keyed by the type's latest score date (one set per
+# EOD); cleared with the RS cache whenever scores are recomputed.
+_history_cache: TTLCache = TTLCache(maxsize=128, ttl=86400)
+
 
 def _cache_key(prefix: str, base: str, period: str) -> str:
     return f"{prefix}:{base}:{period}"
@@ -52,6 +58,7 @@ def _set_cached(key: str, data: list) -> None:
 def _clear_cache() -> None:
     with _rs_cache_lock:
         _rs_cache.clear()
+        _history_cache.clear()
 
 
 # ─── Response Models ──────────────────────────────────────
@@ -251,13 +258,21 @@ def get_model_trades(
 
 @router.get("/model-portfolio/nav")
 def get_model_nav(
+    request: Request,
     portfolio_type: str = Query("etf_only"),
     days: int = Query(365, ge=7, le=730),
+    max_points: Optional[int] = Query(None, ge=MIN_POINTS, description="LTTB downsample to at most N points"),
+    shape: str = Query("rows", description="rows or columns"),
     db: Session = Depends(get_db),
 ):
-    """Get model portfolio NAV history."""
+    """Get model portfolio NAV history (optionally downsampled / columnar, ETag-served)."""
     from services.compass_portfolio import get_nav_history
-    return get_nav_history(db, portfolio_type=portfolio_type, days=days)
+    rows = downsample_rows(get_nav_history(db, portfolio_type=portfolio_type, days=days), "nav", max_points)
+    if shape == "columns":
+        return etag_response(request, to_columns(
+            rows, "nav", ("benchmark_nav", "fm_nav", "cash_pct", "num_positions", "max_drawdown"),
+        ))
+    return etag_response(request, rows)
 
 
 @router.get("/model-portfolio/performance")
@@ -276,13 +291,14 @@ def refresh_compass(db: Session = Depends(get_db)):
     from services.compass_rs import compute_sector_rs_scores, persist_rs_scores
     from services.compass_portfolio import run_weekly_rebalance, update_model_nav
 
-    # Clear all cached data — force fresh computation
-    _clear_cache()
-
     # Compute sector RS
     sector_scores = compute_sector_rs_scores(db, base_index="NIFTY", period_key="3M")
     persist_rs_scores(db, sector_scores, instrument_type="index")
 
+    # Clear all cached data once the new scores are committed — a read in between
+    # would otherwise re-cache the old rows under an unchanged latest date
+    _clear_cache()
+
     # Run model portfolio rebalance
     rebalance = run_weekly_rebalance(db, sector_scores)
 
@@ -296,35 +312,116 @@ def refresh_compass(db: Session = Depends(get_db)):
     }
 
 
+def _history_cutoff(days: int) -> str:
+    from datetime import datetime, timedelta
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _enum_value(v):
+    return v.value if v is not None and hasattr(v, "value") else v
+
+
+@router.get("/history")
+def get_rs_history_batch(
+    request: Request,
+    instrument_type: str = Query("index", description="index, etf, or stock"),
+    ids: Optional[str] = Query(None, description="Comma-separated instrument ids (default: all of the type)"),
+    days: int = Query(60, ge=7, le=365),
+    max_points: Optional[int] = Query(None, ge=MIN_POINTS, description="Thin the shared date axis to at most N dates"),
+    db: Session = Depends(get_db),
+):
+    """RS score/momentum paths for many instruments in one columnar response (RRG trailing dots).
+
+    {"dates": [...], "instruments": {id: {"rs_score": [...], "rs_momentum": [...],
+    "quadrant": [...], "action": [...]}}} — every list is aligned to "dates",
+    with null where an instrument has no score that day.
+    """
+    from sqlalchemy import func as sqlfunc
+    from models import CompassRSScore
+
+    wanted = tuple(sorted({i.strip() for i in ids.split(",") if i.strip()})) if ids else ()
+    cutoff = _history_cutoff(days)
+    latest = (
+        db.query(sqlfunc.max(CompassRSScore.date))
+        .filter(CompassRSScore.instrument_type == instrument_type)
+        .scalar()
+    )
+    key = (instrument_type, wanted, cutoff, max_points, latest)
+    with _rs_cache_lock:
+        payload = _history_cache.get(key)
+
+    if payload is None:
+        query = (
+            db.query(CompassRSScore.date, CompassRSScore.instrument_id, CompassRSScore.rs_score,
+                     CompassRSScore.rs_momentum, CompassRSScore.quadrant, CompassRSScore.action)
+            .filter(CompassRSScore.instrument_type == instrument_type, CompassRSScore.date >= cutoff)
+        )
+        if wanted:
+            query = query.filter(CompassRSScore.instrument_id.in_(wanted))
+        rows = query.order_by(CompassRSScore.date).all()
+
+        dates = sorted({r.date for r in rows})
+        if max_points and len(dates) > max_points:
+            import numpy as np
+            keep = np.unique(np.linspace(0, len(dates) - 1, max_points).round().astype(int))
+            dates = [dates[i] for i in keep]
+        position = {d: i for i, d in enumerate(dates)}
+
+        instruments: dict[str, dict] = {}
+        for r in rows:
+            i = position.get(r.date)
+            if i is None:
+                continue
+            series = instruments.get(r.instrument_id)
+            if series is None:
+                series = instruments[r.instrument_id] = {
+                    field: [None] * len(dates) for field in ("rs_score", "rs_momentum", "quadrant", "action")
+                }
+            series["rs_score"][i] = r.rs_score
+            series["rs_momentum"][i] = r.rs_momentum
+            series["quadrant"][i] = _enum_value(r.quadrant)
+            series["action"][i] = _enum_value(r.action)
+
+        payload = {"instrument_type": instrument_type, "dates": dates, "instruments": instruments}
+        with _rs_cache_lock:
+            _history_cache[key] = payload
+    return etag_response(request, payload)
+
+
 @router.get("/history/{instrument_id}")
 def get_rs_history(
     instrument_id: str,
+    request: Request,
     instrument_type: str = Query("index", description="index, etf, or stock"),
     days: int = Query(60, ge=7, le=365),
+    max_points: Optional[int] = Query(None, ge=MIN_POINTS, description="LTTB downsample to at most N points"),
+    shape: str = Query("rows", description="rows or columns"),
     db: Session = Depends(get_db),
 ):
     """Get RS score time-series for an instrument (for trailing dots on chart)."""
-    from datetime import datetime, timedelta
     from models import CompassRSScore
 
-    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
     rows = (
-        db.query(CompassRSScore)
+        db.query(CompassRSScore.date, CompassRSScore.rs_score, CompassRSScore.rs_momentum,
+                 CompassRSScore.quadrant, CompassRSScore.action)
         .filter(
             CompassRSScore.instrument_id == instrument_id,
             CompassRSScore.instrument_type == instrument_type,
-            CompassRSScore.date >= cutoff,
+            CompassRSScore.date >= _history_cutoff(days),
         )
         .order_by(CompassRSScore.date)
         .all()
     )
-    return [
+    history = downsample_rows([
         {
             "date": r.date,
             "rs_score": r.rs_score,
             "rs_momentum": r.rs_momentum,
-            "quadrant": r.quadrant.value if r.quadrant else None,
-            "action": r.action.value if r.action else None,
+            "quadrant": _enum_value(r.quadrant),
+            "action": _enum_value(r.action),
         }
         for r in rows
-    ]
+    ], "rs_score", max_points)
+    if shape == "columns":
+        return etag_response(request, to_columns(history, "rs_score", ("rs_momentum", "quadrant", "action")))
+    return etag_response(request, history)
@@ -250,19 +250,24 @@ def get_decision_accuracy(
 
 @router.post("/sweep/trigger")
 def trigger_sweep(
-    sweep_type: str = Query("focused", description="full or focused"),
+    sweep_type: str = Query("focused", description="full, focused or stock"),
+    search: str = Query("halving", description="full sweeps: halving or grid"),
     db: Session = Depends(get_db),
 ):
     """Manually trigger a Lab sweep."""
     import threading
-    from services.compass_lab import run_focused_sweep, run_full_lab_sweep
+    if search not in ("halving", "grid"):
+        raise HTTPException(400, "Invalid search. Use halving or grid")
+    from services.compass_lab import run_focused_sweep, run_full_lab_sweep, run_stock_lab_sweep
 
     def _run_in_bg():
         from models import SessionLocal
         bg_db = SessionLocal()
         try:
             if sweep_type == "full":
-                run_full_lab_sweep(bg_db)
+                run_full_lab_sweep(bg_db, search=search)
+            elif sweep_type == "stock":
+                run_stock_lab_sweep(bg_db)
             else:
                 run_focused_sweep(bg_db)
         finally:
@@ -270,7 +275,7 @@ def trigger_sweep(
 
     t = threading.Thread(target=_run_in_bg, daemon=True, name="manual-sweep")
     t.start()
-    return {"status": "started", "sweep_type": sweep_type}
+    return {"status": "started", "sweep_type": sweep_type, "search": search if sweep_type == "full" else None}
 
 
 @router.post("/backfill-history")
@@ -22,6 +22,7 @@ from models import (
     TradingViewAlert,
     get_db,
 )
+from services.pipeline import last_runs
 
 logger = logging.getLogger("fie_v3.health")
 router = APIRouter()
@@ -130,6 +131,7 @@ async def health(db: Session = Depends(get_db)):
             "holdings": holding_count,
             "nav_rows": nav_count,
         },
+        "pipelines": last_runs(),
         "system": {
             "python_version": sys.version.split()[0],
             "uptime_hours": uptime_hours,
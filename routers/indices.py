@@ -7,8 +7,6 @@ import logging
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, Request
-from sqlalchemy import desc
-from sqlalchemy import func as sqlfunc
 from sqlalchemy.orm import Session
 
 from models import (
@@ -17,7 +15,14 @@ from models import (
     TradingViewAlert,
     get_db,
 )
+from services.asof_prices import asof_prices, latest_prices
 from services.data_helpers import upsert_price_row
+from services.period_returns import (
+    PERIOD_DAYS,
+    ensure_period_returns,
+    load_period_returns,
+    refresh_period_returns,
+)
 
 logger = logging.getLogger("fie_v3.indices")
 router = APIRouter()
@@ -43,6 +48,7 @@ async def fetch_eod(db: Session = Depends(get_db)):
             if upsert_price_row(db, idx_name, row):
                 stored += 1
     db.commit()
+    refresh_period_returns(db)
     return {"success": True, "stored": stored, "indices": len(data)}
 
 
@@ -56,7 +62,7 @@ async def fetch_historical(db: Session = Depends(get_db)):
     """Fetch 1Y historical data from NSE API for all indices + today's live from nsetools."""
     from price_service import fetch_historical_indices_nse_sync, fetch_live_indices
 
-    hist_data = fetch_historical_indices_nse_sync(period="1y")
+    hist_data = fetch_historical_indices_nse_sync(period="1y", db=db)
     stored = 0
     for idx_name, rows in hist_data.items():
         for row in rows:
@@ -79,6 +85,7 @@ async def fetch_historical(db: Session = Depends(get_db)):
             live_stored += 1
 
     db.commit()
+    refresh_period_returns(db)
     logger.info("Historical fetch: %d historical + %d live records", stored, live_stored)
     return {"success": True, "stored_historical": stored, "stored_live": live_stored, "indices": len(hist_data)}
 
@@ -107,6 +114,8 @@ async def bulk_upload_indices(request: Request, db: Session = Depends(get_db)):
                 stored += 1
 
     db.commit()
+    if stored:
+        refresh_period_returns(db)
     logger.info("Bulk upload: %d records across %d indices", stored, indices_count)
     return {"success": True, "stored": stored, "indices": indices_count}
 
@@ -143,70 +152,27 @@ async def fetch_stock_history_endpoint(db: Session = Depends(get_db)):
     "/api/indices/latest",
     tags=["Market Data"],
     summary="Latest index prices with period returns",
-    description="Returns the most recent EOD index prices with ratio vs base index, recommendation signals, day change, and period returns (1d, 1w, 1m, 3m, 6m, 12m). Uses batch queries for performance.",
+    description="Returns the most recent EOD index prices with ratio vs base index, recommendation signals, day change, and period returns (1d, 1w, 1m, 3m, 6m, 12m). Served from the materialized period_returns snapshot.",
 )
 async def indices_latest(base: str = "NIFTY", db: Session = Depends(get_db)):
     """Return latest index prices with ratio vs base, recommendations, and period returns.
-    Optimized: uses batch queries for period returns instead of per-index per-period queries."""
-    latest_date = db.query(sqlfunc.max(IndexPrice.date)).scalar()
+    Reads the materialized period_returns snapshot (refreshed after EOD writes)."""
+    latest_date = ensure_period_returns(db)
     if not latest_date:
         return {"date": None, "base": base, "indices": [],
                 "message": "No EOD data. Call POST /api/indices/fetch-eod first."}
 
-    base_row = db.query(IndexPrice).filter_by(date=latest_date, index_name=base).first()
-    base_close = base_row.close_price if base_row else None
-
-    all_rows = db.query(IndexPrice).filter_by(date=latest_date).order_by(IndexPrice.index_name).all()
-
-    # Build current close map from latest date rows (already fetched, no extra query)
-    current_close_map = {r.index_name: r.close_price for r in all_rows if r.close_price}
-
-    # Batch-fetch previous close for all indices (1 query instead of N)
-    prev_date = (
-        db.query(sqlfunc.max(IndexPrice.date))
-        .filter(IndexPrice.date < latest_date)
-        .scalar()
-    )
-    prev_close_map: dict = {}
-    if prev_date:
-        prev_rows = db.query(IndexPrice).filter_by(date=prev_date).all()
-        prev_close_map = {r.index_name: r.close_price for r in prev_rows if r.close_price}
-
-    # Batch-fetch historical prices for period returns using bidirectional date lookup
-    # Same approach as /api/indices/live — eliminates N*6 individual queries
-    period_map = {"1d": 1, "1w": 7, "1m": 30, "3m": 90, "6m": 180, "12m": 365}
-    tolerance = {"1d": 5, "1w": 5, "1m": 10, "3m": 15, "6m": 15, "12m": 15}
-
-    # Per-index closest-date within tolerance range (handles different trading calendars)
-    historical_prices: dict = {}
-    latest_dt = datetime.strptime(latest_date, "%Y-%m-%d")
-    for pk, days in period_map.items():
-        target_dt = latest_dt - timedelta(days=days)
-        tol = tolerance.get(pk, 15)
-        range_start = (target_dt - timedelta(days=tol)).strftime("%Y-%m-%d")
-        range_end = (target_dt + timedelta(days=tol)).strftime("%Y-%m-%d")
-
-        rows = db.query(IndexPrice).filter(
-            IndexPrice.date >= range_start,
-            IndexPrice.date <= range_end,
-            IndexPrice.close_price.isnot(None),
-        ).all()
-
-        best_per_index: dict[str, tuple[float, int]] = {}
-        for r in rows:
-            gap = abs((datetime.strptime(r.date, "%Y-%m-%d") - target_dt).days)
-            existing = best_per_index.get(r.index_name)
-            if existing is None or gap < existing[1]:
-                best_per_index[r.index_name] = (r.close_price, gap)
-
-        historical_prices[pk] = {name: price for name, (price, _) in best_per_index.items()}
+    snapshot = load_period_returns(db, as_of_date=latest_date)
+    base_row = snapshot.get(base, {}).get("1d")
+    base_close = base_row.close if base_row else None
 
     results = []
-    for row in all_rows:
-        close = row.close_price
+    for name in sorted(snapshot):
+        periods_snap = snapshot[name]
+        close = periods_snap["1d"].close
         ratio = round(close / base_close, 4) if (close and base_close and base_close > 0) else None
 
-        if ratio is not None and row.index_name != base:
+        if ratio is not None and name != base:
             if ratio > 1.05:
                 signal = "STRONG OW"
             elif ratio > 1.0:
@@ -218,40 +184,21 @@ async def indices_latest(base: str = "NIFTY", db: Session = Depends(get_db)):
             else:
                 signal = "NEUTRAL"
         else:
-            signal = "BASE" if row.index_name == base else "NEUTRAL"
+            signal = "BASE" if name == base else "NEUTRAL"
 
-        # Previous day change from batch-loaded prev_close_map
-        prev_close = prev_close_map.get(row.index_name)
-        chg_pct = None
-        if prev_close and prev_close > 0 and close:
-            chg_pct = round(((close - prev_close) / prev_close) * 100, 2)
-
-        # Invert change_pct for currency pairs (rising USDINR = weaker rupee = negative)
-        if chg_pct is not None and row.index_name in INVERTED_RETURN_KEYS:
-            chg_pct = round(-chg_pct, 2)
-
-        # Period returns from batch-loaded historical prices
+        # Period returns (1d doubles as the day change); invert for currency pairs
         periods = {}
-        if close:
-            for label in period_map:
-                old_prices = historical_prices.get(label, {})
-                old_close = old_prices.get(row.index_name)
-                if old_close and old_close > 0:
-                    ret = round(((close - old_close) / old_close) * 100, 2)
-                    # Invert returns for currency pairs
-                    if row.index_name in INVERTED_RETURN_KEYS:
-                        ret = round(-ret, 2)
-                    periods[label] = ret
-                else:
-                    periods[label] = None
-        else:
-            for label in period_map:
-                periods[label] = None
+        for label in PERIOD_DAYS:
+            row = periods_snap.get(label)
+            ret = row.return_pct if row else None
+            if ret is not None and name in INVERTED_RETURN_KEYS:
+                ret = round(-ret, 2)
+            periods[label] = ret
 
         results.append({
-            "index_name": row.index_name,
+            "index_name": name,
             "close": close,
-            "change_pct": chg_pct,
+            "change_pct": periods["1d"],
             "ratio": ratio,
             "signal": signal,
             **periods,
@@ -289,25 +236,17 @@ async def indices_live(base: str = "NIFTY", tracked_only: bool = True, db: Sessi
 
         # Append non-nsetools instruments (BSE, commodities, currencies) from latest DB prices
         nsetools_keys = set(item["index_name"].upper() for item in data)
-        for key in NON_NSETOOLS_KEYS:
-            if key.upper() in nsetools_keys:
-                continue
-            latest_row = (
-                db.query(IndexPrice)
-                .filter(IndexPrice.index_name == key)
-                .order_by(desc(IndexPrice.date))
-                .first()
-            )
-            if latest_row and latest_row.close_price:
-                prev_row = (
-                    db.query(IndexPrice)
-                    .filter(IndexPrice.index_name == key, IndexPrice.date < latest_row.date)
-                    .order_by(desc(IndexPrice.date))
-                    .first()
-                )
+        db_keys = [k for k in NON_NSETOOLS_KEYS if k.upper() not in nsetools_keys]
+        latest = latest_prices(db, db_keys)
+        latest_dates = {p.date for p in latest.values()}
+        previous = asof_prices(db, db_keys, latest_dates, strict=True)
+        for key in db_keys:
+            latest_row = latest.get(key)
+            if latest_row:
+                prev_row = previous[latest_row.date].get(key)
                 pct_change = None
-                if prev_row and prev_row.close_price:
-                    pct_change = round(((latest_row.close_price - prev_row.close_price) / prev_row.close_price) * 100, 2)
+                if prev_row:
+                    pct_change = round(((latest_row.close - prev_row.close) / prev_row.close) * 100, 2)
                 # Invert for currency pairs (rising USDINR = weaker rupee = negative)
                 if pct_change is not None and key in INVERTED_RETURN_KEYS:
                     pct_change = round(-pct_change, 2)
@@ -316,11 +255,11 @@ async def indices_live(base: str = "NIFTY", tracked_only: bool = True, db: Sessi
                 data.append({
                     "index_name": key,
                     "nse_name": display_name,
-                    "last": latest_row.close_price,
-                    "open": latest_row.open_price,
-                    "high": latest_row.high_price,
-                    "low": latest_row.low_price,
-                    "previousClose": prev_row.close_price if prev_row else None,
+                    "last": latest_row.close,
+                    "open": latest_row.open,
+                    "high": latest_row.high,
+                    "low": latest_row.low,
+                    "previousClose": prev_row.close if prev_row else None,
                     "variation": None,
                     "percentChange": pct_change,
                     "source": "db",
@@ -7,9 +7,10 @@ win/loss analysis.
 import logging
 from collections import defaultdict
 from datetime import date, timedelta
+from typing import Optional
 
 import pandas as pd
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
 from sqlalchemy import desc
 from sqlalchemy.orm import Session
 
@@ -22,6 +23,8 @@ from models import (
     PortfolioMetric,
     get_db,
 )
+from services.asof_prices import asof_prices
+from services.chart_series import MIN_POINTS, downsample_rows, etag_response, to_columns
 from services.pms_service import (
     calculate_risk_metrics,
     compute_enhanced_risk_metrics,
@@ -183,14 +186,27 @@ async def upload_pms_files(
 #  NAV HISTORY (with NIFTY 50 benchmark)
 # ═══════════════════════════════════════════════════════════
 
+_PMS_NAV_FIELDS = (
+    "nav", "unit_nav", "corpus", "equity_holding", "etf_investment", "cash_equivalent",
+    "bank_balance", "liquidity_pct", "high_water_mark", "benchmark_nav",
+)
+
+
 @router.get(
     "/{portfolio_id}/nav",
     summary="PMS NAV history",
-    description="Returns daily NAV time series with normalized NIFTY 50 benchmark overlay (base 100). Supports period filtering: 1M, 3M, 6M, 1Y, 3Y, 5Y, or all.",
+    description=(
+        "Returns daily NAV time series with normalized NIFTY 50 benchmark overlay (base 100). Supports period "
+        "filtering: 1M, 3M, 6M, 1Y, 3Y, 5Y, or all. max_points downsamples (LTTB on the TWR unit NAV); "
+        "shape=columns returns a columnar payload. Served with an ETag."
+    ),
 )
 def get_nav_history(
     portfolio_id: int,
+    request: Request,
     period: str = "all",
+    max_points: Optional[int] = Query(None, ge=MIN_POINTS),
+    shape: str = "rows",
     db: Session = Depends(get_db),
 ):
     """Return NAV time series with normalized NIFTY 50 benchmark, optionally filtered by period."""
@@ -262,11 +278,19 @@ def get_nav_history(
             "benchmark_nav": benchmark_nav,
         })
 
-    return {
+    # Downsample on the TWR unit NAV when available (what the chart plots)
+    value_key = "unit_nav" if any(r["unit_nav"] is not None for r in nav_history) else "nav"
+    nav_history = downsample_rows(nav_history, value_key, max_points)
+    if shape == "columns":
+        extra = [k for k in _PMS_NAV_FIELDS if k != value_key]
+        nav_history = to_columns(nav_history, value_key, extra)
+        nav_history["value_key"] = value_key
+
+    return etag_response(request, {
         "portfolio_id": portfolio_id,
         "count": len(rows),
         "nav_history": nav_history,
-    }
+    })
 
 
 # ═══════════════════════════════════════════════════════════
@@ -276,7 +300,7 @@ def get_nav_history(
 def _load_nifty_series(db: Session) -> tuple[pd.Series, pd.Series]:
     """Load all NIFTY close prices from IndexPrice, return (nav_series, date_series).
 
-    IndexPrice dates are stored as strings ("YYYY-MM-DD"). We convert them
+    IndexPrice dates are read back as strings ("YYYY-MM-DD"). We convert them
     to datetime.date objects so they can be compared with PortfolioMetric dates.
     """
     nifty_rows = (
@@ -877,20 +901,12 @@ def get_sector_history(portfolio_id: int, db: Session = Depends(get_db)):
     # Live prices for today
     live_prices = get_batch_prices(list(all_active_scripts)) if all_active_scripts else {}
 
-    # Historical prices from IndexPrice (closest available date)
+    # Historical prices from IndexPrice (closest available date), whole grid in one lookup
+    historical = asof_prices(db, all_active_scripts, snapshot_dates[1:])
+
     def _get_price_on_date(script: str, target_date: date) -> float | None:
-        row = (
-            db.query(IndexPrice)
-            .filter(
-                IndexPrice.index_name == script,
-                IndexPrice.date <= str(target_date),
-            )
-            .order_by(desc(IndexPrice.date))
-            .first()
-        )
-        if row and row.close_price:
-            return float(row.close_price)
-        return None
+        hit = historical.get(target_date.isoformat(), {}).get(script)
+        return float(hit.close) if hit else None
 
     # Also get cash from PmsNavDaily for each snapshot
     def _get_cash_on_date(pid: int, target_date: date) -> float:
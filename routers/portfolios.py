@@ -12,7 +12,7 @@ from datetime import date as date_type
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy import desc
@@ -22,9 +22,7 @@ from sqlalchemy.orm import Session
 from models import (
     IndexPrice,
     ModelPortfolio,
-    PmsNavDaily,
     PortfolioHolding,
-    PortfolioMetric,
     PortfolioNAV,
     PortfolioStatus,
     PortfolioTransaction,
@@ -32,13 +30,17 @@ from models import (
     TransactionType,
     get_db,
 )
+from services.chart_series import MIN_POINTS, downsample_rows, etag_response, to_columns
+from services.nav_service import invalidate_nav_from
 from services.portfolio_service import (
     compute_max_drawdown,
     compute_nav_for_portfolio,
     compute_xirr,
+    compute_xirr_batch,
     empty_totals,
     get_live_prices,
 )
+from services.valuation_service import get_portfolio_summaries
 
 logger = logging.getLogger("fie_v3.portfolios")
 router = APIRouter()
@@ -70,71 +72,6 @@ class CreateTransactionRequest(BaseModel):
     sector: Optional[str] = None
 
 
-# ─── PMS Summary Helper ─────────────────────────────────
-
-def _get_pms_list_data(portfolio_id: int, db: Session) -> dict:
-    """Fetch PMS summary data for the portfolio list view.
-
-    Returns total_invested (sum of all capital infusions), current_value (latest NAV),
-    and total_return_pct (CAGR from SI metric or simple return).
-    """
-    # Latest NAV row for current value
-    latest_nav = (
-        db.query(PmsNavDaily)
-        .filter(PmsNavDaily.portfolio_id == portfolio_id)
-        .order_by(desc(PmsNavDaily.date))
-        .first()
-    )
-    if not latest_nav:
-        return {"total_invested": 0.0, "current_value": 0.0, "total_return_pct": 0.0}
-
-    current_value = latest_nav.nav or 0.0
-
-    # Total invested = first corpus + sum of all positive corpus changes (capital infusions)
-    nav_rows = (
-        db.query(PmsNavDaily.corpus)
-        .filter(
-            PmsNavDaily.portfolio_id == portfolio_id,
-            PmsNavDaily.corpus.isnot(None),
-        )
-        .order_by(PmsNavDaily.date)
-        .all()
-    )
-    total_invested = 0.0
-    if nav_rows:
-        total_invested = nav_rows[0][0] or 0.0  # first corpus
-        for i in range(1, len(nav_rows)):
-            prev = nav_rows[i - 1][0] or 0.0
-            curr = nav_rows[i][0] or 0.0
-            delta = curr - prev
-            if delta > 10000:  # capital infusion threshold (>10K)
-                total_invested += delta
-
-    # Try to get CAGR from SI (Since Inception) metric
-    total_return_pct = 0.0
-    si_metric = (
-        db.query(PortfolioMetric)
-        .filter(
-            PortfolioMetric.portfolio_id == portfolio_id,
-            PortfolioMetric.period == "SI",
-        )
-        .order_by(desc(PortfolioMetric.as_of_date))
-        .first()
-    )
-    if si_metric:
-        # Prefer CAGR, fall back to simple return
-        total_return_pct = si_metric.cagr_pct if si_metric.cagr_pct is not None else (si_metric.return_pct or 0.0)
-    elif total_invested and total_invested > 0:
-        # Fallback: simple return from corpus vs latest NAV
-        total_return_pct = ((current_value - total_invested) / total_invested) * 100
-
-    return {
-        "total_invested": round(total_invested, 2),
-        "current_value": round(current_value, 2),
-        "total_return_pct": round(total_return_pct, 2),
-    }
-
-
 # ─── Portfolio CRUD ──────────────────────────────────────
 
 @router.post(
@@ -161,79 +98,7 @@ async def create_portfolio(req: CreatePortfolioRequest, db: Session = Depends(ge
     description="Returns all active portfolios with summary data including holdings count, invested value, current value, realized P&L, and total return. Supports both manual and PMS portfolio types.",
 )
 async def list_portfolios(db: Session = Depends(get_db)):
-    portfolios = (
-        db.query(ModelPortfolio)
-        .filter(ModelPortfolio.status == PortfolioStatus.ACTIVE)
-        .order_by(desc(ModelPortfolio.updated_at))
-        .all()
-    )
-    results = []
-    for p in portfolios:
-        p_type = getattr(p, 'portfolio_type', 'manual') or 'manual'
-
-        # PMS portfolios: fetch summary from PmsNavDaily / PortfolioMetric
-        if p_type == 'pms':
-            pms_data = _get_pms_list_data(p.id, db)
-            results.append({
-                "id": p.id, "name": p.name, "description": p.description,
-                "benchmark": p.benchmark,
-                "status": p.status.value if p.status else "ACTIVE",
-                "portfolio_type": p_type,
-                "ucc_code": getattr(p, 'ucc_code', None),
-                "created_at": (p.created_at.isoformat() + "Z") if p.created_at else None,
-                "updated_at": (p.updated_at.isoformat() + "Z") if p.updated_at else None,
-                "num_holdings": 0,
-                "total_invested": pms_data["total_invested"],
-                "current_value": pms_data["current_value"],
-                "realized_pnl": 0.0,
-                "total_return_pct": pms_data["total_return_pct"],
-            })
-            continue
-
-        # Manual portfolios: compute from holdings + live prices
-        holdings = (
-            db.query(PortfolioHolding)
-            .filter(PortfolioHolding.portfolio_id == p.id, PortfolioHolding.quantity > 0)
-            .all()
-        )
-        total_invested = sum(h.total_cost for h in holdings)
-        current_value = total_invested
-        tickers = [h.ticker for h in holdings if h.ticker]
-        if tickers:
-            prices = get_live_prices(tickers)
-            if prices:
-                current_value = 0.0
-                for h in holdings:
-                    cp = prices.get(h.ticker, {}).get("current_price")
-                    current_value += (h.quantity * cp) if cp else h.total_cost
-
-        realized = (
-            db.query(sa_func.sum(PortfolioTransaction.realized_pnl))
-            .filter(
-                PortfolioTransaction.portfolio_id == p.id,
-                PortfolioTransaction.txn_type == TransactionType.SELL,
-            )
-            .scalar()
-        ) or 0.0
-
-        total_return = (current_value - total_invested) + realized
-        total_return_pct = (total_return / total_invested * 100) if total_invested > 0 else 0.0
-
-        results.append({
-            "id": p.id, "name": p.name, "description": p.description,
-            "benchmark": p.benchmark,
-            "status": p.status.value if p.status else "ACTIVE",
-            "portfolio_type": p_type,
-            "ucc_code": getattr(p, 'ucc_code', None),
-            "created_at": (p.created_at.isoformat() + "Z") if p.created_at else None,
-            "updated_at": (p.updated_at.isoformat() + "Z") if p.updated_at else None,
-            "num_holdings": len([h for h in holdings if h.quantity > 0]),
-            "total_invested": round(total_invested, 2),
-            "current_value": round(current_value, 2),
-            "realized_pnl": round(realized, 2),
-            "total_return_pct": round(total_return_pct, 2),
-        })
-    return {"success": True, "portfolios": results}
+    return {"success": True, "portfolios": get_portfolio_summaries(db)}
 
 
 @router.get(
@@ -394,6 +259,7 @@ async def create_transaction(
         cost_basis_at_sell=cost_basis_at_sell,
     )
     db.add(txn)
+    invalidate_nav_from(portfolio_id, req.txn_date, db)
     db.commit()
     db.refresh(txn)
 
@@ -499,6 +365,32 @@ async def list_holdings(portfolio_id: int, db: Session = Depends(get_db)):
         cv = row["current_value"] or row["total_cost"]
         row["weight_pct"] = round((cv / total_current) * 100, 2) if total_current > 0 else 0.0
 
+    # Per-holding XIRR: one transaction query, one batched solve
+    txns = (
+        db.query(PortfolioTransaction.ticker, PortfolioTransaction.txn_type,
+                 PortfolioTransaction.txn_date, PortfolioTransaction.total_value)
+        .filter(PortfolioTransaction.portfolio_id == portfolio_id)
+        .order_by(PortfolioTransaction.txn_date)
+        .all()
+    )
+    flows_by_ticker: dict = {}
+    for t in txns:
+        try:
+            d = datetime.strptime(t.txn_date, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        amount = -t.total_value if t.txn_type == TransactionType.BUY else t.total_value
+        flows_by_ticker.setdefault(t.ticker, []).append((d, amount))
+    today = date_type.today()
+    cashflow_sets = []
+    for row in rows:
+        flows = list(flows_by_ticker.get(row["ticker"], []))
+        if row["current_value"]:
+            flows.append((today, row["current_value"]))
+        cashflow_sets.append(flows)
+    for row, xirr in zip(rows, compute_xirr_batch(cashflow_sets)):
+        row["xirr"] = xirr
+
     realized_total = (
         db.query(sa_func.sum(PortfolioTransaction.realized_pnl))
         .filter(PortfolioTransaction.portfolio_id == portfolio_id, PortfolioTransaction.txn_type == TransactionType.SELL)
@@ -599,9 +491,17 @@ _PERIOD_DAYS = {"1m": 30, "3m": 90, "6m": 180, "1y": 365, "ytd": None, "all": No
     "/api/portfolios/{portfolio_id}/nav-history",
     tags=["Portfolios"],
     summary="NAV history for charts",
-    description="Returns daily NAV time series for a portfolio with normalized benchmark overlay. Supports period filtering (1m, 3m, 6m, 1y, ytd, all).",
+    description=(
+        "Returns daily NAV time series for a portfolio with normalized benchmark overlay. Supports period filtering "
+        "(1m, 3m, 6m, 1y, ytd, all), LTTB downsampling via max_points, and a columnar shape (shape=columns). "
+        "Served with an ETag."
+    ),
 )
-async def get_nav_history(portfolio_id: int, period: str = "all", db: Session = Depends(get_db)):
+async def get_nav_history(
+    portfolio_id: int, request: Request, period: str = "all",
+    max_points: Optional[int] = Query(None, ge=MIN_POINTS), shape: str = "rows",
+    db: Session = Depends(get_db),
+):
     portfolio = db.query(ModelPortfolio).filter(ModelPortfolio.id == portfolio_id).first()
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
@@ -650,7 +550,10 @@ async def get_nav_history(portfolio_id: int, period: str = "all", db: Session =
             "date": n.date, "total_value": n.total_value, "total_cost": n.total_cost,
             "unrealized_pnl": n.unrealized_pnl, "benchmark_value": benchmark_normalized,
         })
-    return {"success": True, "nav_history": result, "period": period}
+    result = downsample_rows(result, "total_value", max_points)
+    if shape == "columns":
+        result = to_columns(result, "total_value", ("total_cost", "unrealized_pnl", "benchmark_value"))
+    return etag_response(request, {"success": True, "nav_history": result, "period": period})
 
 
 # ─── Performance Metrics ────────────────────────────────
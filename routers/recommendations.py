@@ -2,30 +2,34 @@
 FIE v3 -- Sector Recommendation Engine Routes
 Generates stock/ETF recommendations based on sector ratio performance vs base index.
 
-Performance: All price lookups use batch queries. A full generate call
-does ~15 DB queries regardless of sector/stock count (no N+1 patterns).
-Fundamentals fetched via yfinance in parallel after DB work completes.
+Performance: ratio returns for every reco sector and constituent (all
+periods) plus stored fundamentals are computed once into an in-memory
+snapshot, rebuilt only when prices, constituents or fundamentals change.
+A generate call filters and ranks that snapshot -- a handful of cheap
+staleness queries, no per-request price scans and no yfinance calls.
+Fundamentals are read from the `fundamentals` table (services/fundamentals.py).
 """
 
 import logging
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Set
 
-import yfinance as yf
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy import func as sqlfunc
 from sqlalchemy.orm import Session
 
-from models import IndexConstituent, IndexPrice, get_db
+from models import Fundamental, IndexConstituent, IndexPrice, get_db
 from price_service import (
     NSE_INDEX_CATEGORIES,
     SECTOR_ETF_MAP,
     SECTOR_INDICES_FOR_RECO,
     fetch_nse_index_constituents,
 )
+from services.asof_prices import price_generation
+from services.fundamentals import load_fundamentals
 
 logger = logging.getLogger("fie_v3.recommendations")
 router = APIRouter()
@@ -142,42 +146,110 @@ def _compute_ratio_returns_from_cache(
     return returns
 
 
-# --- Fundamentals Fetcher -----------------------------------------------------
+# --- Fundamentals -------------------------------------------------------------
 
-def _fetch_fundamentals(tickers: List[str]) -> Dict[str, Dict]:
-    """Fetch fundamental data for a list of NSE tickers via yfinance.
+def _fundamental_fields(row: Optional[Fundamental]) -> Dict[str, Optional[float]]:
+    """Response fields for one stock from its stored fundamentals row (None when never fetched)."""
+    if row is None:
+        return {"pe_ratio": None, "eps": None, "week_52_high": None, "week_52_low": None, "market_cap_cr": None}
+    return {
+        "pe_ratio": row.trailing_pe,
+        "eps": row.trailing_eps,
+        "week_52_high": row.week_52_high,
+        "week_52_low": row.week_52_low,
+        "market_cap_cr": round(row.market_cap / 1e7, 2) if row.market_cap else None,
+    }
 
-    Uses ThreadPoolExecutor(max_workers=8) for parallel fetching.
-    Returns {ticker: {trailingPE, trailingEps, fiftyTwoWeekHigh, fiftyTwoWeekLow, marketCap}}.
-    Graceful per-ticker failure -- missing data returns None values.
-    """
-    if not tickers:
-        return {}
 
-    fundamentals: Dict[str, Dict] = {}
-    fields = ["trailingPE", "trailingEps", "fiftyTwoWeekHigh", "fiftyTwoWeekLow", "marketCap"]
+# --- Recommendation Snapshot --------------------------------------------------
+# Everything that does not depend on the request (period dates, prices, every
+# stock's ratio return vs its sector for all periods, fundamentals) is built
+# once and shared. The key changes when a new trading day lands, any price is
+# written in this process, or constituents/fundamentals are refreshed.
 
-    def _fetch_one(ticker: str) -> tuple:
-        try:
-            info = yf.Ticker(f"{ticker}.NS").info
-            data = {field: info.get(field) for field in fields}
-            return (ticker, data)
-        except Exception as exc:
-            logger.debug("Fundamentals fetch failed for %s: %s", ticker, exc)
-            return (ticker, {field: None for field in fields})
-
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = {executor.submit(_fetch_one, t): t for t in tickers}
-        for future in as_completed(futures, timeout=60):
-            try:
-                ticker, data = future.result(timeout=60)
-                fundamentals[ticker] = data
-            except Exception as exc:
-                ticker = futures[future]
-                logger.debug("Fundamentals future failed for %s: %s", ticker, exc)
-                fundamentals[ticker] = {field: None for field in fields}
-
-    return fundamentals
+_snapshot_lock = threading.Lock()
+_snapshot: Optional[Dict] = None
+
+
+def _snapshot_key(db: Session) -> tuple:
+    latest_date = db.query(sqlfunc.max(IndexPrice.date)).scalar()
+    constituents = db.query(
+        sqlfunc.count(IndexConstituent.id), sqlfunc.max(IndexConstituent.id), sqlfunc.max(IndexConstituent.fetched_at),
+    ).one()
+    fundamentals = db.query(sqlfunc.count(Fundamental.id), sqlfunc.max(Fundamental.fetched_at)).one()
+    return (
+        datetime.now().strftime("%Y-%m-%d"), price_generation(), latest_date,
+        tuple(constituents), tuple(fundamentals),
+    )
+
+
+def _build_snapshot(db: Session) -> Dict:
+    """Compute period dates, prices and per-stock ratio returns for all reco sectors."""
+    period_dates = _resolve_period_dates(db)
+    hist_dates = [d for d in period_dates.values() if d]
+    sector_by_name = {name: key for key, name in SECTOR_INDICES_FOR_RECO}
+
+    constituents = (
+        db.query(IndexConstituent)
+        .filter(IndexConstituent.index_name.in_(list(sector_by_name)))
+        .all()
+    )
+    tickers: Set[str] = {"NIFTY", *sector_by_name.values()}
+    for sector_key in sector_by_name.values():
+        tickers.update(SECTOR_ETF_MAP.get(sector_key, []))
+    tickers.update(c.ticker for c in constituents)
+
+    latest_prices = _batch_latest_prices(db, tickers)
+    hist_prices = _batch_historical_prices(db, hist_dates, tickers)
+
+    fundamentals = load_fundamentals(db, {c.ticker for c in constituents})
+
+    stocks: Dict[str, List[Dict]] = {}
+    for c in constituents:
+        sector_key = sector_by_name[c.index_name]
+        stocks.setdefault(sector_key, []).append({
+            "ticker": c.ticker,
+            "name": c.company_name or c.ticker,
+            "last_price": c.last_price,
+            "weight_pct": c.weight_pct,
+            "ratio_returns": _compute_ratio_returns_from_cache(
+                c.ticker, sector_key, latest_prices, period_dates, hist_prices,
+            ),
+            **_fundamental_fields(fundamentals.get(c.ticker)),
+        })
+
+    return {
+        "period_dates": period_dates,
+        "tickers": tickers,
+        "latest_prices": latest_prices,
+        "hist_prices": hist_prices,
+        "stocks": stocks,
+    }
+
+
+def get_recommendation_snapshot(db: Session, base: str = "NIFTY") -> Dict:
+    """Return the current snapshot, rebuilding it if stale, with `base` prices loaded."""
+    global _snapshot
+    key = _snapshot_key(db)
+    with _snapshot_lock:
+        snap = _snapshot if _snapshot is not None and _snapshot["key"] == key else None
+    if snap is None:
+        snap = _build_snapshot(db)
+        snap["key"] = key
+        with _snapshot_lock:
+            _snapshot = snap
+
+    if base not in snap["tickers"]:
+        # Non-default base: 2 small queries, then kept for this snapshot's lifetime
+        hist_dates = [d for d in snap["period_dates"].values() if d]
+        latest = _batch_latest_prices(db, {base})
+        hist = _batch_historical_prices(db, hist_dates, {base})
+        with _snapshot_lock:
+            snap["latest_prices"].update(latest)
+            for date_str, prices in hist.items():
+                snap["hist_prices"].setdefault(date_str, {}).update(prices)
+            snap["tickers"].add(base)
+    return snap
 
 
 # --- Endpoints ----------------------------------------------------------------
@@ -215,14 +287,14 @@ async def get_sectors(db: Session = Depends(get_db)):
     summary="Generate sector recommendations",
     description="Generates stock and ETF recommendations based on sector ratio performance vs the "
                 "base index. Sectors exceeding the threshold get top-N stock picks ranked by ratio "
-                "return. Includes fundamental data (P/E, EPS, 52W range, market cap) fetched in parallel.",
+                "return. Includes stored fundamental data (P/E, EPS, 52W range, market cap).",
 )
 async def generate_recommendations(req: GenerateRequest, db: Session = Depends(get_db)):
     """Generate stock/ETF recommendations based on sector ratio thresholds.
 
-    Optimized: pre-fetches all prices in batch queries, then computes
-    ratio returns in-memory. Fundamentals fetched via yfinance after
-    DB work. Total DB queries: ~15 regardless of input size.
+    Only threshold filtering and top-N ranking happen per request; ratio
+    returns and fundamentals come from the shared snapshot, so changing
+    threshold/top_n/sectors never recomputes prices.
     """
     try:
         base = req.base.upper()
@@ -246,61 +318,27 @@ async def generate_recommendations(req: GenerateRequest, db: Session = Depends(g
                 detail="No valid sectors selected. Check sector keys against /api/recommendations/sectors.",
             )
 
-        # Step 1: Resolve period dates (10 queries, done once)
-        period_dates = _resolve_period_dates(db)
-        hist_dates = [d for d in period_dates.values() if d]
+        # Step 1: Shared snapshot (rebuilt only when the underlying data changed)
+        snap = get_recommendation_snapshot(db, base)
+        latest_prices = snap["latest_prices"]
 
-        # Step 2: Collect ALL tickers we'll need prices for
-        all_tickers: Set[str] = {base}
-
-        # Sector index keys
-        for sector_key in valid_sectors:
-            all_tickers.add(sector_key)
-
-        # Pre-load ALL constituents for all selected sectors (1 query)
-        requested_display_names = [sector_lookup[sk] for sk in valid_sectors]
-        all_constituents: List[IndexConstituent] = []
-        if requested_display_names:
-            all_constituents = (
-                db.query(IndexConstituent)
-                .filter(IndexConstituent.index_name.in_(requested_display_names))
-                .all()
-            )
-
-        # Group constituents by sector display name
-        sector_constituents: Dict[str, List[IndexConstituent]] = {}
-        for c in all_constituents:
-            sector_constituents.setdefault(c.index_name, []).append(c)
-            all_tickers.add(c.ticker)
-
-        # ETF tickers
-        for sector_key in valid_sectors:
-            for etf in SECTOR_ETF_MAP.get(sector_key, []):
-                all_tickers.add(etf)
-
-        # Step 3: Batch-fetch all prices (2 queries)
-        latest_prices = _batch_latest_prices(db, all_tickers)
-        hist_prices = _batch_historical_prices(db, hist_dates, all_tickers)
-
-        # Step 4: Compute sector ratio returns (in-memory)
-        sector_ratios: Dict[str, Dict[str, float]] = {}
-        for sector_key in valid_sectors:
-            sector_ratios[sector_key] = _compute_ratio_returns_from_cache(
-                sector_key, base, latest_prices, period_dates, hist_prices,
+        # Step 2: Sector ratio returns vs base (in-memory)
+        sector_ratios: Dict[str, Dict[str, float]] = {
+            sector_key: _compute_ratio_returns_from_cache(
+                sector_key, base, latest_prices, snap["period_dates"], snap["hist_prices"],
             )
+            for sector_key in valid_sectors
+        }
 
-        # Step 5: Assemble qualifying and non-qualifying sectors
+        # Step 3: Filter by threshold and rank precomputed stock ratios
         qualifying_sectors = []
         non_qualifying_sectors = []
-        # Collect all stock tickers across qualifying sectors for fundamentals
-        all_stock_tickers: List[str] = []
 
         for sector_key in valid_sectors:
             display_name = sector_lookup[sector_key]
             ratio_return = sector_ratios.get(sector_key, {}).get(period)
             qualifies = ratio_return is not None and ratio_return > threshold
 
-            # ETF recommendations from cache
             etf_tickers = SECTOR_ETF_MAP.get(sector_key, [])
             recommended_etfs = [
                 {"ticker": etf, "last_price": latest_prices.get(etf)}
@@ -308,34 +346,26 @@ async def generate_recommendations(req: GenerateRequest, db: Session = Depends(g
             ]
 
             if qualifies:
-                # Compute stock-vs-sector ratios for all constituents
-                constituents = sector_constituents.get(display_name, [])
-                top_stocks = []
-                for c in constituents:
-                    stock_ratio = _compute_ratio_returns_from_cache(
-                        c.ticker, sector_key, latest_prices, period_dates, hist_prices,
-                    )
-                    top_stocks.append({
-                        "ticker": c.ticker,
-                        "name": c.company_name or c.ticker,
-                        "ratio_return_vs_sector": stock_ratio.get(period),
-                        "last_price": c.last_price,
-                        "weight_pct": c.weight_pct,
-                        # Fundamental placeholders -- filled after batch fetch
-                        "pe_ratio": None,
-                        "eps": None,
-                        "week_52_high": None,
-                        "week_52_low": None,
-                        "market_cap_cr": None,
-                    })
-                    all_stock_tickers.append(c.ticker)
-
-                # Sort by ratio return descending, take top N
-                top_stocks.sort(
-                    key=lambda s: s["ratio_return_vs_sector"] if s["ratio_return_vs_sector"] is not None else -9999,
+                ranked = sorted(
+                    snap["stocks"].get(sector_key, []),
+                    key=lambda s: s["ratio_returns"].get(period, -9999),
                     reverse=True,
-                )
-                top_stocks = top_stocks[:top_n]
+                )[:top_n]
+                top_stocks = [
+                    {
+                        "ticker": s["ticker"],
+                        "name": s["name"],
+                        "ratio_return_vs_sector": s["ratio_returns"].get(period),
+                        "last_price": s["last_price"],
+                        "weight_pct": s["weight_pct"],
+                        "pe_ratio": s["pe_ratio"],
+                        "eps": s["eps"],
+                        "week_52_high": s["week_52_high"],
+                        "week_52_low": s["week_52_low"],
+                        "market_cap_cr": s["market_cap_cr"],
+                    }
+                    for s in ranked
+                ]
 
                 qualifying_sectors.append({
                     "sector_key": sector_key,
@@ -361,23 +391,6 @@ async def generate_recommendations(req: GenerateRequest, db: Session = Depends(g
             reverse=True,
         )
 
-        # Step 6: Batch-fetch fundamentals for all stock tickers
-        if all_stock_tickers:
-            # Deduplicate tickers
-            unique_tickers = list(set(all_stock_tickers))
-            fundamentals = _fetch_fundamentals(unique_tickers)
-
-            # Merge fundamental data into each qualifying sector's stocks
-            for sector in qualifying_sectors:
-                for stock in sector["top_stocks"]:
-                    fdata = fundamentals.get(stock["ticker"], {})
-                    stock["pe_ratio"] = fdata.get("trailingPE")
-                    stock["eps"] = fdata.get("trailingEps")
-                    stock["week_52_high"] = fdata.get("fiftyTwoWeekHigh")
-                    stock["week_52_low"] = fdata.get("fiftyTwoWeekLow")
-                    raw_mcap = fdata.get("marketCap")
-                    stock["market_cap_cr"] = round(raw_mcap / 1e7, 2) if raw_mcap else None
-
         return {
             "success": True,
             "base": base,
@@ -449,3 +462,4 @@ def refresh_sector_constituents(db: Session) -> int:
     logger.info("Constituent refresh: stored/updated %d records across %d sectors",
                 total_stored, len(SECTOR_INDICES_FOR_RECO))
     return total_stored
+
@@ -163,40 +163,28 @@ async def start_scheduler():
         from apscheduler.triggers.cron import CronTrigger
 
         from services.eod_jobs import (
-            compass_eod_rebalance,
             compass_intraday_refresh,
             compass_lab_update,
-            eod_sentiment_refresh,
+            fundamentals_refresh,
             scheduled_eod_fetch,
         )
 
         scheduler = BackgroundScheduler()
         ist = pytz.timezone("Asia/Kolkata")
 
+        # EOD pipeline: sentiment and the Compass rebalance run as its final stages
         scheduler.add_job(
             scheduled_eod_fetch,
             CronTrigger(hour=15, minute=30, timezone=ist),
             id="daily_eod_fetch",
             replace_existing=True,
         )
-        scheduler.add_job(
-            eod_sentiment_refresh,
-            CronTrigger(hour=15, minute=35, timezone=ist),
-            id="daily_sentiment_refresh",
-            replace_existing=True,
-        )
         scheduler.add_job(
             compass_intraday_refresh,
             CronTrigger(minute="*/15", hour="9-15", day_of_week="mon-fri", timezone=ist),
             id="compass_intraday_refresh",
             replace_existing=True,
         )
-        scheduler.add_job(
-            compass_eod_rebalance,
-            CronTrigger(hour=15, minute=40, timezone=ist),
-            id="compass_eod_rebalance",
-            replace_existing=True,
-        )
         # Lab: historical data update + outcome backfill at 4 AM IST
         scheduler.add_job(
             compass_lab_update,
@@ -204,11 +192,18 @@ async def start_scheduler():
             id="compass_lab_update",
             replace_existing=True,
         )
+        # Fundamentals store: rate-limited yfinance batch at 2 AM IST
+        scheduler.add_job(
+            fundamentals_refresh,
+            CronTrigger(hour=2, minute=0, timezone=ist),
+            id="fundamentals_refresh",
+            replace_existing=True,
+        )
 
         scheduler.start()
         logger.info(
-            "APScheduler started — EOD 3:30, sentiment 3:35, compass autonomous 3:40, "
-            "lab update 4:00 AM IST, compass intraday 15min (9:15-3:45 Mon-Fri)"
+            "APScheduler started — EOD pipeline 3:30 (then sentiment + compass autonomous), "
+            "fundamentals 2:00 AM, lab update 4:00 AM IST, compass intraday 15min (9:15-3:45 Mon-Fri)"
         )
 
         # Start Lab daemon (background simulation sweeps)
@@ -0,0 +1,185 @@
+"""
+FIE v3 — As-Of Price Lookup
+"Latest close on or before date D" for a whole tickers x dates grid in one
+round trip. PostgreSQL uses a LATERAL (ORDER BY date DESC LIMIT 1) join per
+(ticker, date) pair, which the (index_name, date DESC) index answers with one
+index probe each; SQLite uses the equivalent correlated subquery.
+
+Resolved pairs are kept in a small TTL/LRU cache. Any ORM flush or DML
+statement touching a price table bumps a generation counter, so cached
+answers never outlive a write in this process; the TTL bounds staleness
+across workers.
+"""
+
+import logging
+import threading
+from datetime import date as date_type
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import String, event, select, true, values
+from sqlalchemy import column as sa_column
+from sqlalchemy.orm import Session
+
+from models import CompassETFPrice, CompassStockPrice, IndexPrice, IsoDate
+
+logger = logging.getLogger("fie_v3.asof_prices")
+
+ASOF_CACHE_TTL = 300
+ASOF_CACHE_SIZE = 50_000
+# (ticker, date) pairs per statement — keeps SQLite under its bound-parameter limit
+_CHUNK = 2000
+# "Latest available" is an as-of lookup on a date after any stored close
+LATEST = date_type.max.isoformat()
+
+
+class AsOfPrice(NamedTuple):
+    """The close row an as-of lookup resolved to."""
+    date: str                 # date of the close used (<= requested date)
+    close: float
+    open: Optional[float]
+    high: Optional[float]
+    low: Optional[float]
+
+
+# source -> (model, name column, date column, close, open, high, low)
+_SOURCES = {
+    "index": (IndexPrice, IndexPrice.index_name, IndexPrice.date, IndexPrice.close_price,
+              IndexPrice.open_price, IndexPrice.high_price, IndexPrice.low_price),
+    "etf": (CompassETFPrice, CompassETFPrice.ticker, CompassETFPrice.date, CompassETFPrice.close,
+            CompassETFPrice.open, CompassETFPrice.high, CompassETFPrice.low),
+    "stock": (CompassStockPrice, CompassStockPrice.ticker, CompassStockPrice.date, CompassStockPrice.close,
+              CompassStockPrice.open, CompassStockPrice.high, CompassStockPrice.low),
+}
+
+_cache: TTLCache = TTLCache(maxsize=ASOF_CACHE_SIZE, ttl=ASOF_CACHE_TTL)
+_cache_lock = threading.Lock()
+_generation = 0
+
+
+def invalidate_asof_cache() -> None:
+    """Drop cached lookups (call after writing prices). O(1): old entries age out."""
+    global _generation
+    _generation += 1
+
+
+def price_generation() -> int:
+    """Counter bumped on every price write in this process (for derived caches)."""
+    return _generation
+
+
+_PRICE_MODELS = tuple(spec[0] for spec in _SOURCES.values())
+_PRICE_TABLES = {m.__tablename__ for m in _PRICE_MODELS}
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_flush(session, _flush_context):
+    if any(isinstance(obj, _PRICE_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        invalidate_asof_cache()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_dml(state):
+    if not state.is_select:
+        table = getattr(state.statement, "table", None)
+        if getattr(table, "name", None) in _PRICE_TABLES:
+            invalidate_asof_cache()
+
+
+def _iso(d) -> str:
+    return d if isinstance(d, str) else d.isoformat()
+
+
+# ─── Query ───────────────────────────────────────────────
+
+def _grid_query(db: Session, source: str, pairs: List[Tuple[str, str]], strict: bool):
+    _model, name_col, date_col, close_col, open_col, high_col, low_col = _SOURCES[source]
+    date_type_ = IsoDate if source == "index" else String
+    grid = values(sa_column("ticker", String), sa_column("d", date_type_), name="g").data(pairs)
+
+    if db.get_bind().dialect.name == "postgresql":
+        date_cond = date_col < grid.c.d if strict else date_col <= grid.c.d
+        lateral = (
+            select(date_col.label("date"), close_col.label("close"), open_col.label("open"),
+                   high_col.label("high"), low_col.label("low"))
+            .where(name_col == grid.c.ticker, date_cond, close_col > 0)
+            .order_by(date_col.desc())
+            .limit(1)
+            .lateral("p")
+        )
+        query = (
+            select(grid.c.ticker, grid.c.d, lateral.c.date, lateral.c.close,
+                   lateral.c.open, lateral.c.high, lateral.c.low)
+            .select_from(grid)
+            .join(lateral, true())
+        )
+    else:
+        # SQLite has no LATERAL and no column list on FROM (VALUES ...); a CTE
+        # plus a correlated "pick the row id" subquery is the same plan.
+        grid = grid.cte("g")
+        date_cond = date_col < grid.c.d if strict else date_col <= grid.c.d
+        pick = (
+            select(_model.id)
+            .where(name_col == grid.c.ticker, date_cond, close_col > 0)
+            .order_by(date_col.desc())
+            .limit(1)
+            .correlate(grid)
+            .scalar_subquery()
+        )
+        query = (
+            select(grid.c.ticker, grid.c.d, date_col, close_col, open_col, high_col, low_col)
+            .select_from(grid)
+            .join(_model, _model.id == pick)
+        )
+    return db.execute(query).all()
+
+
+def asof_prices(
+    db: Session,
+    tickers: Iterable[str],
+    dates: Iterable,
+    strict: bool = False,
+    source: str = "index",
+) -> Dict[str, Dict[str, AsOfPrice]]:
+    """{date: {ticker: AsOfPrice}} — latest positive close on or before each date.
+
+    strict=True resolves to the latest close strictly before the date (e.g.
+    previous close). Tickers with no qualifying row are absent from the inner
+    dict. source picks the price table: "index" (IndexPrice), "etf", "stock".
+    """
+    tickers = sorted(set(tickers))
+    dates = sorted({_iso(d) for d in dates})
+    result: Dict[str, Dict[str, AsOfPrice]] = {d: {} for d in dates}
+    if not tickers or not dates:
+        return result
+
+    gen = _generation
+    missing: List[Tuple[str, str]] = []
+    with _cache_lock:
+        for d in dates:
+            for t in tickers:
+                key = (gen, source, strict, t, d)
+                if key in _cache:
+                    hit = _cache[key]
+                    if hit is not None:
+                        result[d][t] = hit
+                else:
+                    missing.append((t, d))
+
+    if missing:
+        found: Dict[Tuple[str, str], AsOfPrice] = {}
+        for i in range(0, len(missing), _CHUNK):
+            for t, d, row_date, close, open_, high, low in _grid_query(db, source, missing[i:i + _CHUNK], strict):
+                found[(t, _iso(d))] = AsOfPrice(_iso(row_date), close, open_, high, low)
+        with _cache_lock:
+            for t, d in missing:
+                hit = found.get((t, d))
+                _cache[(gen, source, strict, t, d)] = hit  # None = negative cache
+                if hit is not None:
+                    result[d][t] = hit
+    return result
+
+
+def latest_prices(db: Session, tickers: Iterable[str], source: str = "index") -> Dict[str, AsOfPrice]:
+    """{ticker: AsOfPrice} for each ticker's most recent positive close."""
+    return asof_prices(db, tickers, [LATEST], source=source)[LATEST]
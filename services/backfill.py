@@ -2,72 +2,27 @@
 Startup backfill — fetches historical price data for all tracked instruments.
 Runs once on app startup in a background thread.
 
-Incremental: checks last date in DB per instrument, only fetches from there.
+Incremental: services.backfill_planner works out each instrument's missing
+date ranges (gaps, holes, tail) and fetches only those, in grouped batches.
 """
 
 import logging
 import threading
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import List, Optional
 
 from models import (
     AlertStatus,
     IndexConstituent,
-    IndexPrice,
     SessionLocal,
     TradingViewAlert,
 )
+from services.backfill_planner import run_backfill, window_starts
 from services.data_helpers import get_all_portfolio_tickers_with_inception, upsert_price_row
 
 logger = logging.getLogger("fie_v3.backfill")
 
 
-def _get_last_price_date(db, instrument_name: str) -> Optional[str]:
-    """Return the most recent date string we have for an instrument, or None."""
-    row = (
-        db.query(IndexPrice.date)
-        .filter(IndexPrice.index_name == instrument_name)
-        .order_by(IndexPrice.date.desc())
-        .first()
-    )
-    return row[0] if row else None
-
-
-def _incremental_period(db, tickers: List[str], default_period: str = "1y") -> Dict:
-    """Determine start date for bulk fetch — use last known date if recent enough."""
-    if not tickers:
-        return {"period": default_period}
-
-    # Sample a few tickers to find the most recent data
-    sample = tickers[:5]
-    latest_dates = []
-    for t in sample:
-        last = _get_last_price_date(db, t)
-        if last:
-            latest_dates.append(last)
-
-    if not latest_dates:
-        return {"period": default_period}
-
-    # If we have data from within last 7 days, just fetch 10d
-    most_recent = max(latest_dates)
-    try:
-        last_dt = datetime.strptime(most_recent, "%Y-%m-%d")
-        days_ago = (datetime.now() - last_dt).days
-        if days_ago <= 7:
-            return {"period": "10d"}
-        elif days_ago <= 35:
-            return {"period": "1mo"}
-        elif days_ago <= 95:
-            return {"period": "3mo"}
-        elif days_ago <= 190:
-            return {"period": "6mo"}
-    except (ValueError, TypeError):
-        pass
-
-    return {"period": default_period}
-
-
 def run_startup_backfill() -> None:
     """Background thread: fetch historical data for indices, ETFs, portfolio instruments, etc."""
     logger.info("Background backfill starting (thread: %s)...", threading.current_thread().name)
@@ -77,29 +32,20 @@ def run_startup_backfill() -> None:
             NSE_ETF_UNIVERSE,
             NSE_INDEX_KEYS,
             fetch_yfinance_bulk_history,
-            fetch_yfinance_bulk_stock_history,
         )
 
         db = SessionLocal()
 
         # ── 1. Indices via yfinance ──────────────────────────────
-        idx_params = _incremental_period(db, list(NSE_INDEX_KEYS))
-        logger.info("Backfill: fetching %s history for %d indices...", idx_params.get("period", "?"), len(NSE_INDEX_KEYS))
-        idx_data = fetch_yfinance_bulk_history(NSE_INDEX_KEYS, **idx_params)
-        idx_stored = 0
-        for idx_name, rows in idx_data.items():
-            for row in rows:
-                if upsert_price_row(db, idx_name, row):
-                    idx_stored += 1
-        db.commit()
-        logger.info("Backfill: stored %d index records across %d indices", idx_stored, len(idx_data))
+        idx_stored = run_backfill(db, window_starts(NSE_INDEX_KEYS), fetch=fetch_yfinance_bulk_history)
+        logger.info("Backfill: stored %d index records for %d indices", idx_stored, len(NSE_INDEX_KEYS))
 
         # ── 1b. NSE API historical ───────────────────────────────
         try:
             from price_service import fetch_historical_indices_nse_sync
 
             logger.info("Backfill: fetching history from NSE API for tracked indices...")
-            nse_hist = fetch_historical_indices_nse_sync()
+            nse_hist = fetch_historical_indices_nse_sync(db=db)
             nse_stored = 0
             tracked = set(NSE_INDEX_KEYS)
             for idx_name, rows in nse_hist.items():
@@ -115,35 +61,15 @@ def run_startup_backfill() -> None:
 
         # ── 2. ETFs via yfinance ─────────────────────────────────
         etf_tickers = list(NSE_ETF_UNIVERSE.keys())
-        etf_params = _incremental_period(db, etf_tickers)
-        logger.info("Backfill: fetching %s history for %d ETFs...", etf_params.get("period", "?"), len(etf_tickers))
-        etf_data = fetch_yfinance_bulk_stock_history(etf_tickers, **etf_params)
-        etf_stored = 0
-        for ticker, rows in etf_data.items():
-            for row in rows:
-                if upsert_price_row(db, ticker, row):
-                    etf_stored += 1
-        db.commit()
-        logger.info("Backfill: stored %d ETF records across %d ETFs", etf_stored, len(etf_data))
+        etf_stored = run_backfill(db, window_starts(etf_tickers))
+        logger.info("Backfill: stored %d ETF records for %d ETFs", etf_stored, len(etf_tickers))
 
         # ── 3. Portfolio instruments ─────────────────────────────
         ticker_inception = get_all_portfolio_tickers_with_inception(db)
         if ticker_inception:
-            all_portfolio_tickers = list(ticker_inception.keys())
-            ptf_params = _incremental_period(db, all_portfolio_tickers)
-            # If incremental says short period, use it; otherwise use inception date
-            if ptf_params.get("period") == "1y":
-                earliest_start = min(ticker_inception.values())
-                ptf_params = {"start": earliest_start}
-            logger.info("Backfill: fetching history for %d portfolio instruments...", len(all_portfolio_tickers))
-            portfolio_data = fetch_yfinance_bulk_stock_history(all_portfolio_tickers, **ptf_params)
-            ptf_stored = 0
-            for ticker, rows in portfolio_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        ptf_stored += 1
-            db.commit()
-            logger.info("Backfill: stored %d portfolio records across %d tickers", ptf_stored, len(portfolio_data))
+            # Each holding from its own portfolio's inception date
+            ptf_stored = run_backfill(db, ticker_inception)
+            logger.info("Backfill: stored %d portfolio records for %d tickers", ptf_stored, len(ticker_inception))
         else:
             logger.info("Backfill: no portfolio instruments to fetch")
 
@@ -160,16 +86,8 @@ def run_startup_backfill() -> None:
         covered.update(t.upper() for t in etf_tickers)
         new_alert_tickers = [t for t in alert_tickers if t.upper() not in covered]
         if new_alert_tickers:
-            alert_params = _incremental_period(db, new_alert_tickers)
-            logger.info("Backfill: fetching %s history for %d alert tickers...", alert_params.get("period", "?"), len(new_alert_tickers))
-            alert_data = fetch_yfinance_bulk_stock_history(new_alert_tickers, **alert_params)
-            alert_stored = 0
-            for ticker, rows in alert_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        alert_stored += 1
-            db.commit()
-            logger.info("Backfill: stored %d alert records across %d tickers", alert_stored, len(alert_data))
+            alert_stored = run_backfill(db, window_starts(new_alert_tickers))
+            logger.info("Backfill: stored %d alert records for %d tickers", alert_stored, len(new_alert_tickers))
 
         # ── 5. Basket constituents + NAV ─────────────────────────
         _backfill_baskets(db, etf_tickers, new_alert_tickers, ticker_inception)
@@ -205,8 +123,8 @@ def run_startup_backfill() -> None:
             from services.compass_rs import compute_sector_rs_scores, persist_rs_scores
 
             logger.info("Compass backfill: starting stock + ETF price fetch...")
-            compass_stocks = backfill_compass_stocks(db, period="1y")
-            compass_etfs = backfill_compass_etfs(db, period="1y")
+            compass_stocks = backfill_compass_stocks(db)
+            compass_etfs = backfill_compass_etfs(db)
             logger.info("Compass backfill: %d stock + %d ETF records stored", compass_stocks, compass_etfs)
 
             scores = compute_sector_rs_scores(db, base_index="NIFTY", period_key="3M")
@@ -217,6 +135,15 @@ def run_startup_backfill() -> None:
         except Exception as e:
             logger.warning("Compass backfill failed (non-fatal): %s", e)
 
+        # ── 11. Fundamentals (only missing/stale symbols) ────────
+        try:
+            from services.fundamentals import refresh_fundamentals
+
+            refresh_fundamentals(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning("Fundamentals backfill failed (non-fatal): %s", e)
+
         logger.info("Background backfill complete")
     except Exception as e:
         logger.warning("Background backfill failed (non-fatal): %s", e)
@@ -228,8 +155,6 @@ def run_startup_backfill() -> None:
 def _backfill_baskets(db, etf_tickers: list, alert_tickers: list, ticker_inception: Optional[dict]) -> None:
     """Fetch basket constituent prices and compute NAVs."""
     try:
-        from price_service import fetch_yfinance_bulk_stock_history
-
         from models import BasketStatus, Microbasket
         from services.basket_service import backfill_basket_nav, get_all_basket_constituent_tickers
 
@@ -240,15 +165,7 @@ def _backfill_baskets(db, etf_tickers: list, alert_tickers: list, ticker_incepti
         new_basket_tickers = [t for t in basket_tickers if t.upper() not in already_fetched]
 
         if new_basket_tickers:
-            bkt_params = _incremental_period(db, new_basket_tickers)
-            logger.info("Backfill: fetching %s history for %d basket tickers...", bkt_params.get("period", "?"), len(new_basket_tickers))
-            basket_data = fetch_yfinance_bulk_stock_history(new_basket_tickers, **bkt_params)
-            bkt_stored = 0
-            for ticker, rows in basket_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        bkt_stored += 1
-            db.commit()
+            bkt_stored = run_backfill(db, window_starts(new_basket_tickers))
             logger.info("Backfill: stored %d basket constituent records", bkt_stored)
 
         active_baskets = db.query(Microbasket).filter(Microbasket.status == BasketStatus.ACTIVE).all()
@@ -264,8 +181,6 @@ def _backfill_sector_constituents(
     """Refresh sector constituents from NSE + fetch price history. Returns all constituent tickers."""
     all_constituent_tickers: List[str] = []
     try:
-        from price_service import fetch_yfinance_bulk_stock_history
-
         from routers.recommendations import refresh_sector_constituents
 
         constituent_count = refresh_sector_constituents(db)
@@ -278,16 +193,8 @@ def _backfill_sector_constituents(
         new_tickers = [t for t in all_constituent_tickers if t.upper() not in already_fetched]
 
         if new_tickers:
-            cst_params = _incremental_period(db, new_tickers)
-            logger.info("Backfill: fetching %s history for %d constituent stocks...", cst_params.get("period", "?"), len(new_tickers))
-            cst_data = fetch_yfinance_bulk_stock_history(new_tickers, **cst_params)
-            cst_stored = 0
-            for ticker, rows in cst_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        cst_stored += 1
-            db.commit()
-            logger.info("Backfill: stored %d constituent price records across %d tickers", cst_stored, len(cst_data))
+            cst_stored = run_backfill(db, window_starts(new_tickers))
+            logger.info("Backfill: stored %d constituent price records for %d tickers", cst_stored, len(new_tickers))
     except Exception as e:
         logger.warning("Sector constituent backfill failed (non-fatal): %s", e)
 
@@ -299,7 +206,7 @@ def _backfill_nifty500(
 ) -> None:
     """Fetch Nifty 500 constituents from NSE + price history."""
     try:
-        from price_service import fetch_nse_index_constituents, fetch_yfinance_bulk_stock_history
+        from price_service import fetch_nse_index_constituents
 
         nifty500_items = fetch_nse_index_constituents("NIFTY 500")
         if not nifty500_items:
@@ -341,15 +248,7 @@ def _backfill_nifty500(
         new_n500 = [t for t in nifty500_tickers if t.upper() not in all_covered]
 
         if new_n500:
-            n500_params = _incremental_period(db, new_n500)
-            logger.info("Backfill: fetching %s history for %d Nifty 500 stocks...", n500_params.get("period", "?"), len(new_n500))
-            n500_data = fetch_yfinance_bulk_stock_history(new_n500, **n500_params)
-            n500_stored = 0
-            for ticker, rows in n500_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        n500_stored += 1
-            db.commit()
+            n500_stored = run_backfill(db, window_starts(new_n500))
             logger.info("Backfill: stored %d Nifty 500 stock price records", n500_stored)
     except Exception as e:
         logger.warning("Nifty 500 constituent backfill failed (non-fatal): %s", e)
@@ -0,0 +1,347 @@
+"""
+FIE v3 — Backfill Planner
+Works out, per ticker, which date ranges are actually missing from a price
+table and turns them into the fewest yf.download batches.
+
+Expected trading days are the benchmark's (NIFTY) stored dates, with plain
+weekdays standing in outside the range NIFTY covers. A ticker is missing:
+  - its whole window             if it has no rows at all
+  - a leading gap                window start .. day before first stored row
+  - holes                        runs of >= MIN_HOLE_DAYS missing trading days
+  - a tail                       day after last stored row .. NIFTY's last stored date
+Leading gaps and holes shorter than MIN_HOLE_DAYS are left alone (suspensions,
+one-off yfinance blanks), so a complete ticker costs nothing on restart. Tails
+stop at NIFTY's last trading day, since the weekdays past it may be holidays or
+a bar that is not published yet. Only NIFTY itself, or a table with no NIFTY
+rows, runs up to today.
+
+A ticker may get no rows back for a requested range (suspended, delisted, not
+listed yet) or only rows up to some date. That empty part is recorded in
+BackfillEmptyRange and left out of plans for EMPTY_RANGE_TTL_DAYS.
+
+One grouped count/min/max query finds the complete tickers; only those whose
+row count falls short of the calendar get their dates loaded. Ranges that end
+on the same day and start within MERGE_GAP_DAYS of each other share a
+download, and only rows for dates not already stored are inserted, in bulk.
+Stored rows are never rewritten here — live/EOD refresh jobs own corrections.
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func as sqlfunc
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import BackfillEmptyRange, CompassETFPrice, CompassStockPrice, IndexPrice
+
+logger = logging.getLogger("fie_v3.backfill_planner")
+
+CALENDAR_TICKER = "NIFTY"
+MIN_HOLE_DAYS = 3
+MERGE_GAP_DAYS = 30
+EMPTY_RANGE_TTL_DAYS = 30
+# tickers per IN (...) query
+_CHUNK = 500
+
+Fetcher = Callable[..., Dict[str, List[dict]]]
+
+
+def _index_row(name: str, r: dict) -> dict:
+    return {"index_name": name, "date": r["date"], "close_price": float(r["close"]),
+            "open_price": r.get("open"), "high_price": r.get("high"),
+            "low_price": r.get("low"), "volume": r.get("volume")}
+
+
+def _compass_row(name: str, r: dict) -> dict:
+    return {"ticker": name, "date": r["date"], "close": float(r["close"]),
+            "open": r.get("open"), "high": r.get("high"),
+            "low": r.get("low"), "volume": r.get("volume")}
+
+
+# table -> (model, name column, date column, fetched row -> insert values)
+_TABLES = {
+    "index": (IndexPrice, IndexPrice.index_name, IndexPrice.date, _index_row),
+    "stock": (CompassStockPrice, CompassStockPrice.ticker, CompassStockPrice.date, _compass_row),
+    "etf": (CompassETFPrice, CompassETFPrice.ticker, CompassETFPrice.date, _compass_row),
+}
+
+
+class BackfillBatch(NamedTuple):
+    """One download: [start, end) for all tickers (end exclusive, as yfinance takes it)."""
+    start: str
+    end: str
+    tickers: Tuple[str, ...]
+
+
+def window_starts(tickers: Iterable[str], days: int = 365, today: Optional[date] = None) -> Dict[str, str]:
+    """{ticker: start} with the same lookback window for every ticker."""
+    start = ((today or date.today()) - timedelta(days=days)).isoformat()
+    return {t: start for t in tickers}
+
+
+def _weekdays(first: date, last: date) -> List[str]:
+    days = []
+    day = first
+    while day <= last:
+        if day.weekday() < 5:
+            days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def trading_calendar(db: Session, since: str, today: date) -> List[str]:
+    """Sorted trading days since..today: NIFTY's stored dates, weekdays outside them."""
+    stored = [
+        d for (d,) in db.query(IndexPrice.date)
+        .filter(IndexPrice.index_name == CALENDAR_TICKER, IndexPrice.date >= since, IndexPrice.date <= today.isoformat())
+        .order_by(IndexPrice.date)
+        .all()
+    ]
+    if not stored:
+        return _weekdays(date.fromisoformat(since), today)
+    before = _weekdays(date.fromisoformat(since), date.fromisoformat(stored[0]) - timedelta(days=1))
+    after = _weekdays(date.fromisoformat(stored[-1]) + timedelta(days=1), today)
+    return before + stored + after
+
+
+def _holes(calendar: List[str], have: set) -> List[Tuple[str, str]]:
+    """Runs of >= MIN_HOLE_DAYS consecutive calendar days not in `have`."""
+    holes = []
+    run: List[str] = []
+    for d in calendar + [None]:
+        if d is not None and d not in have:
+            run.append(d)
+            continue
+        if len(run) >= MIN_HOLE_DAYS:
+            holes.append((run[0], run[-1]))
+        run = []
+    return holes
+
+
+def missing_ranges(
+    db: Session,
+    starts: Dict[str, str],
+    table: str = "index",
+    today: Optional[date] = None,
+) -> Dict[str, List[Tuple[str, str]]]:
+    """{ticker: [(first_missing, last_missing), ...]} — inclusive ISO dates, sorted.
+    Complete tickers are absent."""
+    if not starts:
+        return {}
+    _model, name_col, date_col, _ = _TABLES[table]
+    today = today or date.today()
+    since = min(starts.values())
+    calendar = trading_calendar(db, since, today)
+    if not calendar:
+        return {}
+    calendar_last = (
+        db.query(sqlfunc.max(IndexPrice.date))
+        .filter(IndexPrice.index_name == CALENDAR_TICKER, IndexPrice.date >= since, IndexPrice.date <= today.isoformat())
+        .scalar()
+    )
+
+    names = list(starts)
+    stats: Dict[str, Tuple[int, str, str]] = {}
+    for i in range(0, len(names), _CHUNK):
+        rows = (
+            db.query(name_col, sqlfunc.count(), sqlfunc.min(date_col), sqlfunc.max(date_col))
+            .filter(name_col.in_(names[i:i + _CHUNK]), date_col >= since)
+            .group_by(name_col)
+            .all()
+        )
+        stats.update({name: (count, first, last) for name, count, first, last in rows})
+
+    result: Dict[str, List[Tuple[str, str]]] = {}
+    holey: List[str] = []
+    for name, start in starts.items():
+        end = calendar_last if calendar_last and name != CALENDAR_TICKER else today.isoformat()
+        window = [d for d in calendar if start <= d <= end]
+        if not window:
+            continue
+        if name not in stats:
+            result[name] = [(window[0], window[-1])]
+            continue
+        count, first, last = stats[name]
+        ranges = []
+        leading = [d for d in window if d < first]
+        if len(leading) >= MIN_HOLE_DAYS:
+            ranges.append((leading[0], leading[-1]))
+        tail = [d for d in window if d > last]
+        if tail:
+            ranges.append((tail[0], tail[-1]))
+        if ranges:
+            result[name] = ranges
+        # Enough rows to cover the calendar between first and last -> no hole worth fetching
+        expected = sum(1 for d in window if first <= d <= last)
+        if count <= expected - MIN_HOLE_DAYS:
+            holey.append(name)
+
+    for i in range(0, len(holey), _CHUNK):
+        chunk = holey[i:i + _CHUNK]
+        have: Dict[str, set] = {name: set() for name in chunk}
+        for name, d in db.query(name_col, date_col).filter(name_col.in_(chunk), date_col >= since).all():
+            have[name].add(d)
+        for name in chunk:
+            _count, first, last = stats[name]
+            inner = [d for d in calendar if max(first, starts[name]) <= d <= last]
+            holes = _holes(inner, have[name])
+            if holes:
+                result[name] = sorted(result.get(name, []) + holes)
+    return _without_empty(db, table, result, calendar)
+
+
+def _without_empty(
+    db: Session, table: str, ranges: Dict[str, List[Tuple[str, str]]], calendar: List[str]
+) -> Dict[str, List[Tuple[str, str]]]:
+    """ranges minus the unexpired empty fetches recorded for each ticker."""
+    cutoff = datetime.now() - timedelta(days=EMPTY_RANGE_TTL_DAYS)
+    empty: Dict[str, List[Tuple[str, str]]] = {}
+    names = list(ranges)
+    for i in range(0, len(names), _CHUNK):
+        rows = (
+            db.query(BackfillEmptyRange.ticker, BackfillEmptyRange.first_date, BackfillEmptyRange.last_date)
+            .filter(BackfillEmptyRange.price_table == table, BackfillEmptyRange.ticker.in_(names[i:i + _CHUNK]),
+                    BackfillEmptyRange.checked_at >= cutoff)
+            .all()
+        )
+        for name, first, last in rows:
+            empty.setdefault(name, []).append((first, last))
+    if not empty:
+        return ranges
+
+    result: Dict[str, List[Tuple[str, str]]] = {}
+    for name, spans in ranges.items():
+        tried = empty.get(name)
+        if not tried:
+            result[name] = spans
+            continue
+        kept = []
+        for lo, hi in spans:
+            run: List[str] = []
+            for d in [d for d in calendar if lo <= d <= hi] + [None]:
+                if d is not None and not any(first <= d <= last for first, last in tried):
+                    run.append(d)
+                    continue
+                if run:
+                    kept.append((run[0], run[-1]))
+                run = []
+        if kept:
+            result[name] = kept
+    return result
+
+
+def _record_empty(
+    db: Session, table: str, batch: BackfillBatch, data: Dict[str, List[dict]], today: date
+) -> None:
+    """Record, per ticker, the part of the batch after the last row the provider returned.
+    Today is never recorded: its bar may just not be published yet."""
+    last = (min(date.fromisoformat(batch.end), today) - timedelta(days=1)).isoformat()
+    now = datetime.now()
+    records = []
+    for name in batch.tickers:
+        got = [r["date"] for r in data.get(name) or []
+               if r.get("close") and batch.start <= (r.get("date") or "") < batch.end]
+        first = (date.fromisoformat(max(got)) + timedelta(days=1)).isoformat() if got else batch.start
+        if first <= last:
+            records.append({"price_table": table, "ticker": name, "first_date": first, "last_date": last,
+                            "checked_at": now})
+    if records:
+        db.query(BackfillEmptyRange).filter(
+            BackfillEmptyRange.checked_at < now - timedelta(days=EMPTY_RANGE_TTL_DAYS)
+        ).delete(synchronize_session=False)
+        db.execute(insert(BackfillEmptyRange), records)
+        db.commit()
+
+
+def plan_backfill(
+    db: Session,
+    starts: Dict[str, str],
+    table: str = "index",
+    today: Optional[date] = None,
+) -> List[BackfillBatch]:
+    """Missing ranges grouped into download batches, in (end, start) order."""
+    spans: List[Tuple[str, str, str]] = []   # (start, last inclusive, ticker)
+    for name, ranges in missing_ranges(db, starts, table, today).items():
+        # A ticker's ranges close to each other become one download
+        merged = [list(ranges[0])]
+        for lo, hi in ranges[1:]:
+            if (date.fromisoformat(lo) - date.fromisoformat(merged[-1][1])).days <= MERGE_GAP_DAYS:
+                merged[-1][1] = hi
+            else:
+                merged.append([lo, hi])
+        spans.extend((lo, hi, name) for lo, hi in merged)
+
+    groups: List[List[Tuple[str, str, str]]] = []
+    for span in sorted(spans, key=lambda s: (s[1], s[0])):
+        head = groups[-1][0] if groups else None
+        if (head is not None and span[1] == head[1]
+                and (date.fromisoformat(span[0]) - date.fromisoformat(head[0])).days <= MERGE_GAP_DAYS):
+            groups[-1].append(span)
+        else:
+            groups.append([span])
+
+    return [
+        BackfillBatch(
+            start=group[0][0],
+            end=(date.fromisoformat(group[0][1]) + timedelta(days=1)).isoformat(),
+            tickers=tuple(sorted({s[2] for s in group})),
+        )
+        for group in groups
+    ]
+
+
+def run_backfill(
+    db: Session,
+    starts: Dict[str, str],
+    table: str = "index",
+    fetch: Optional[Fetcher] = None,
+    today: Optional[date] = None,
+) -> int:
+    """Plan, download and insert only the missing rows. Returns rows inserted.
+
+    fetch(tickers, start=, end=) -> {ticker: [{date, open, high, low, close, volume}]};
+    defaults to price_service.fetch_yfinance_bulk_stock_history.
+    """
+    if fetch is None:
+        from price_service import fetch_yfinance_bulk_stock_history as fetch
+
+    model, name_col, date_col, to_row = _TABLES[table]
+    batches = plan_backfill(db, starts, table, today)
+    if not batches:
+        logger.info("Backfill planner (%s): all %d tickers complete", table, len(starts))
+        return 0
+
+    stored = 0
+    for batch in batches:
+        try:
+            data = fetch(list(batch.tickers), start=batch.start, end=batch.end) or {}
+        except Exception as e:
+            logger.warning("Backfill batch %s..%s (%d tickers) failed: %s", batch.start, batch.end, len(batch.tickers), e)
+            continue
+        _record_empty(db, table, batch, data, today or date.today())
+        wanted = set(batch.tickers)
+        names = [n for n in data if n in wanted]
+        if not names:
+            continue
+        seen = set(
+            db.query(name_col, date_col)
+            .filter(name_col.in_(names), date_col >= batch.start, date_col < batch.end)
+            .all()
+        )
+        rows = []
+        for name in names:
+            for r in data[name] or []:
+                key = (name, r.get("date"))
+                if r.get("close") and batch.start <= key[1] < batch.end and key not in seen:
+                    seen.add(key)
+                    rows.append(to_row(name, r))
+        if rows:
+            db.execute(insert(model), rows)
+            db.commit()
+            stored += len(rows)
+
+    logger.info("Backfill planner (%s): %d batches, %d ticker-ranges -> %d rows stored",
+                table, len(batches), sum(len(b.tickers) for b in batches), stored)
+    return stored
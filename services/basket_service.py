@@ -8,18 +8,26 @@ reusing all existing ratio return infrastructure with zero changes.
 import logging
 import math
 import re
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-from sqlalchemy import func as sqlfunc
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
 from models import BasketStatus, IndexPrice, Microbasket, MicrobasketConstituent
+from services.asof_prices import asof_prices, latest_prices
 from services.data_helpers import upsert_price_row
 
 logger = logging.getLogger("fie_v3.baskets")
 
 MB_PREFIX = "MB_"
+# A constituent close stays usable for this many calendar days (holidays, stale tickers)
+MAX_PRICE_GAP_DAYS = 7
+WEIGHTS_CACHE_TTL = 600
 
 
 def basket_slug(name: str) -> str:
@@ -47,34 +55,14 @@ def compute_basket_value_from_db(
     if not constituents:
         return None
 
-    # Batch-fetch latest price on or before date_str for all tickers
-    tickers = [c.ticker for c in constituents]
-    subq = (
-        db.query(
-            IndexPrice.index_name,
-            sqlfunc.max(IndexPrice.date).label("max_date"),
-        )
-        .filter(IndexPrice.index_name.in_(tickers), IndexPrice.date <= date_str)
-        .group_by(IndexPrice.index_name)
-        .subquery()
-    )
-    price_rows = (
-        db.query(IndexPrice.index_name, IndexPrice.close_price, IndexPrice.date)
-        .join(subq, (IndexPrice.index_name == subq.c.index_name) & (IndexPrice.date == subq.c.max_date))
-        .all()
-    )
+    # Latest close on or before date_str for all tickers in one lookup
+    asof = asof_prices(db, [c.ticker for c in constituents], [date_str])[date_str]
+    target_dt = datetime.strptime(date_str, "%Y-%m-%d")
     price_map = {}
-    for row_name, close, row_date in price_rows:
-        if close:
-            # Only use prices within 5 trading days of target
-            row_dt = datetime.strptime(row_date, "%Y-%m-%d") if isinstance(row_date, str) else row_date
-            target_dt = datetime.strptime(date_str, "%Y-%m-%d")
-            if isinstance(row_dt, datetime):
-                gap = (target_dt - row_dt).days
-            else:
-                gap = (target_dt.date() - row_dt).days if hasattr(row_dt, 'day') else 999
-            if gap <= 7:
-                price_map[row_name] = close
+    for ticker, p in asof.items():
+        # Only use prices within 5 trading days of target
+        if (target_dt - datetime.strptime(p.date, "%Y-%m-%d")).days <= MAX_PRICE_GAP_DAYS:
+            price_map[ticker] = p.close
 
     total = 0.0
     for c in constituents:
@@ -85,22 +73,126 @@ def compute_basket_value_from_db(
     return round(total, 4) if total > 0 else None
 
 
+# ─── Live Valuation ─────────────────────────────────────
+
+class BasketWeights(NamedTuple):
+    """Active basket weights as a dense slug x ticker matrix (weight fractions)."""
+    slugs: List[str]
+    tickers: List[str]
+    matrix: np.ndarray
+    constituents: Dict[str, List[Tuple[str, Optional[str], float]]]  # slug -> [(ticker, company, weight_pct)]
+
+
+_weights_cache: Dict = {"table": None, "loaded_at": 0.0}
+_weights_lock = threading.Lock()
+
+
+def invalidate_basket_weights() -> None:
+    """Drop the cached weight table (call after any basket/constituent edit)."""
+    with _weights_lock:
+        _weights_cache["table"] = None
+
+
+def get_basket_weights(db: Optional[Session] = None) -> BasketWeights:
+    """Weight table for all active baskets, loaded once and kept in memory.
+
+    Invalidated explicitly on basket edits; WEIGHTS_CACHE_TTL bounds staleness
+    for edits made by other worker processes.
+    """
+    with _weights_lock:
+        table = _weights_cache["table"]
+        if table is not None and time.time() - _weights_cache["loaded_at"] < WEIGHTS_CACHE_TTL:
+            return table
+
+    own_session = db is None
+    if own_session:
+        from models import SessionLocal
+        db = SessionLocal()
+    try:
+        rows = (
+            db.query(Microbasket.slug, MicrobasketConstituent.ticker,
+                     MicrobasketConstituent.company_name, MicrobasketConstituent.weight_pct)
+            .join(MicrobasketConstituent, MicrobasketConstituent.basket_id == Microbasket.id)
+            .filter(Microbasket.status == BasketStatus.ACTIVE)
+            .order_by(Microbasket.slug, MicrobasketConstituent.id)
+            .all()
+        )
+    finally:
+        if own_session:
+            db.close()
+
+    constituents: Dict[str, List[Tuple[str, Optional[str], float]]] = {}
+    for slug, ticker, company, weight in rows:
+        constituents.setdefault(slug, []).append((ticker, company, weight or 0.0))
+    slugs = list(constituents)
+    tickers = sorted({t for items in constituents.values() for t, _, _ in items})
+    col = {t: k for k, t in enumerate(tickers)}
+    matrix = np.zeros((len(slugs), len(tickers)))
+    for r, slug in enumerate(slugs):
+        for ticker, _, weight in constituents[slug]:
+            matrix[r, col[ticker]] += weight / 100.0
+
+    table = BasketWeights(slugs, tickers, matrix, constituents)
+    with _weights_lock:
+        _weights_cache["table"] = table
+        _weights_cache["loaded_at"] = time.time()
+    return table
+
+
+def value_baskets(
+    weights: BasketWeights, prices: Dict[str, float], slugs: Optional[List[str]] = None,
+) -> Dict[str, Dict]:
+    """Value baskets from one shared price map in a single matrix product.
+
+    Missing prices count as 0 (same as valuing constituents one by one).
+    Returns {slug: {current_price, constituents: [...]}} for baskets with a
+    positive value.
+    """
+    rows = range(len(weights.slugs))
+    if slugs is not None:
+        wanted = set(slugs)
+        rows = [r for r in rows if weights.slugs[r] in wanted]
+    if not rows or not weights.tickers:
+        return {}
+
+    price_vec = np.array([prices.get(t) or 0.0 for t in weights.tickers])
+    totals = weights.matrix[list(rows)] @ price_vec
+
+    result = {}
+    for r, total in zip(rows, totals):
+        if total <= 0:
+            continue
+        slug = weights.slugs[r]
+        details = []
+        for ticker, company, weight_pct in weights.constituents[slug]:
+            price = prices.get(ticker)
+            details.append({
+                "ticker": ticker,
+                "company_name": company,
+                "weight_pct": weight_pct,
+                "current_price": price,
+                "weighted_value": round((weight_pct / 100.0) * price, 4) if price else None,
+            })
+        result[slug] = {"current_price": round(float(total), 4), "constituents": details}
+    return result
+
+
 def compute_basket_live_value(
     constituents: List[MicrobasketConstituent],
 ) -> Optional[Dict]:
     """Compute live basket value using Yahoo Finance prices.
+    All constituent quotes are fetched as one parallel batch.
     Returns {current_price, constituents: [{ticker, weight_pct, price, weighted_value}]}
     """
-    from services.portfolio_service import fetch_live_price, get_yahoo_symbol
+    from services.portfolio_service import get_live_prices, get_yahoo_symbol
+
+    priced = [c for c in constituents if get_yahoo_symbol(c.ticker)]
+    quotes = get_live_prices([c.ticker for c in priced]) if priced else {}
 
     total = 0.0
     details = []
-    for c in constituents:
-        yf_sym = get_yahoo_symbol(c.ticker)
-        if not yf_sym:
-            continue
-        price_data = fetch_live_price(yf_sym)
-        price = price_data.get("current_price") if price_data else None
+    for c in priced:
+        price = quotes.get(c.ticker, {}).get("current_price")
         weighted = (c.weight_pct / 100.0) * price if price else 0.0
         total += weighted
         details.append({
@@ -120,37 +212,95 @@ def compute_basket_live_value(
     }
 
 
+def _basket_nav_series(
+    constituents: List[MicrobasketConstituent],
+    start: datetime,
+    end: datetime,
+    db: Session,
+) -> pd.Series:
+    """Weighted basket value for every weekday in [start, end], vectorized.
+
+    Loads all constituent closes for the window once into a calendar-day x
+    ticker frame, forward-fills each close for at most MAX_PRICE_GAP_DAYS,
+    and takes the weighted sum per day. Days where any constituent has no
+    usable close are dropped (same rule as compute_basket_value_from_db).
+    """
+    weights: Dict[str, float] = {}
+    for c in constituents:
+        weights[c.ticker] = weights.get(c.ticker, 0.0) + c.weight_pct / 100.0
+    tickers = list(weights)
+
+    seed_start = start - timedelta(days=MAX_PRICE_GAP_DAYS)
+    rows = (
+        db.query(IndexPrice.date, IndexPrice.index_name, IndexPrice.close_price)
+        .filter(
+            IndexPrice.index_name.in_(tickers),
+            IndexPrice.date >= seed_start.strftime("%Y-%m-%d"),
+            IndexPrice.date <= end.strftime("%Y-%m-%d"),
+            IndexPrice.close_price > 0,
+        )
+        .all()
+    )
+    if not rows:
+        return pd.Series(dtype=float)
+
+    closes = pd.DataFrame(rows, columns=["date", "ticker", "close"]).pivot(index="date", columns="ticker", values="close")
+    closes.index = pd.to_datetime(closes.index)
+    calendar = pd.date_range(seed_start.date(), end.date(), freq="D")
+    closes = closes.reindex(index=calendar, columns=tickers).ffill(limit=MAX_PRICE_GAP_DAYS)
+
+    weekdays = closes.loc[(closes.index >= pd.Timestamp(start.date())) & (closes.index.dayofweek < 5)]
+    matrix = weekdays.to_numpy(dtype=float)
+    complete = ~np.isnan(matrix).any(axis=1)
+    values = matrix[complete] @ np.array([weights[t] for t in tickers])
+    nav = pd.Series(values, index=weekdays.index[complete]).round(4)
+    return nav[nav > 0]
+
+
 def backfill_basket_nav(
     basket: Microbasket,
     db: Session,
     days: int = 365,
 ) -> int:
     """Compute daily NAV for a basket over the past N days, store in IndexPrice.
-    Returns count of records stored."""
+    One price load, one vectorized valuation and one bulk upsert, so
+    multi-year windows are cheap. Returns count of records stored."""
     slug = basket.slug
     constituents = basket.constituents
     if not constituents:
         return 0
 
-    stored = 0
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
-    current = start_date
-
-    while current <= end_date:
-        date_str = current.strftime("%Y-%m-%d")
-        # Skip weekends
-        if current.weekday() < 5:
-            value = compute_basket_value_from_db(constituents, date_str, db)
-            if value is not None:
-                row = {"date": date_str, "close": value, "open": None, "high": None, "low": None, "volume": None}
-                if upsert_price_row(db, slug, row):
-                    stored += 1
-        current += timedelta(days=1)
+    nav = _basket_nav_series(constituents, start_date, end_date, db)
+    if nav.empty:
+        return 0
 
-    if stored > 0:
-        db.commit()
-        logger.info("Basket backfill: %s — %d NAV records stored", slug, stored)
+    dates = nav.index.strftime("%Y-%m-%d")
+    existing = dict(
+        db.query(IndexPrice.date, IndexPrice.id)
+        .filter(IndexPrice.index_name == slug, IndexPrice.date >= dates[0], IndexPrice.date <= dates[-1])
+        .all()
+    )
+    now = datetime.now()
+    updates, inserts = [], []
+    for date_str, value in zip(dates, nav.to_numpy()):
+        fields = {
+            "close_price": float(value), "open_price": None, "high_price": None,
+            "low_price": None, "volume": None, "fetched_at": now,
+        }
+        if date_str in existing:
+            updates.append({"id": existing[date_str], **fields})
+        else:
+            inserts.append({"date": date_str, "index_name": slug, **fields})
+    if updates:
+        db.execute(update(IndexPrice), updates)
+    if inserts:
+        db.execute(insert(IndexPrice), inserts)
+
+    stored = len(updates) + len(inserts)
+    db.commit()
+    logger.info("Basket backfill: %s — %d NAV records stored", slug, stored)
     return stored
 
 
@@ -170,25 +320,16 @@ def compute_constituent_units(
     constituents: List[MicrobasketConstituent],
     portfolio_size: float,
     db: Session,
+    price_map: Optional[Dict[str, float]] = None,
 ) -> List[Dict]:
     """Compute units per constituent based on portfolio size and latest prices.
     units = (weight_pct / 100) * portfolio_size / last_price
-    Uses a single batch query for all constituent prices.
+    price_map ({ticker: close}) lets callers valuing many baskets share one
+    lookup; otherwise latest closes are fetched in a single batch.
     """
-    # Batch-fetch latest prices for all tickers (1 query instead of N)
-    tickers = [c.ticker for c in constituents]
-    subq = (
-        db.query(IndexPrice.index_name, sqlfunc.max(IndexPrice.date).label("max_date"))
-        .filter(IndexPrice.index_name.in_(tickers))
-        .group_by(IndexPrice.index_name)
-        .subquery()
-    )
-    price_rows = (
-        db.query(IndexPrice.index_name, IndexPrice.close_price)
-        .join(subq, (IndexPrice.index_name == subq.c.index_name) & (IndexPrice.date == subq.c.max_date))
-        .all()
-    )
-    price_map = {r[0]: r[1] for r in price_rows if r[1]}
+    if price_map is None:
+        latest = latest_prices(db, [c.ticker for c in constituents])
+        price_map = {ticker: p.close for ticker, p in latest.items()}
 
     results = []
     for c in constituents:
@@ -0,0 +1,81 @@
+"""
+FIE v3 — Chart Series Helpers
+Server-side downsampling (LTTB on NumPy arrays), compact columnar JSON
+and ETag handling for time-series chart endpoints.
+"""
+
+import hashlib
+import json
+from typing import Iterable, List, Optional
+
+import numpy as np
+from fastapi import Request, Response
+
+# Smallest useful max_points: LTTB always keeps the first and last point
+MIN_POINTS = 3
+
+
+def lttb_indices(values, max_points: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    x is the point index (daily series are near-uniform in time). The first
+    and last points are always kept; each interior bucket keeps the point
+    forming the largest triangle with the previous pick and the next
+    bucket's mean. None/NaN values are never preferred.
+    """
+    y = np.array([np.nan if v is None else v for v in values], dtype=float)
+    n = len(y)
+    if max_points >= n or max_points < MIN_POINTS:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=float)
+    y_filled = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+
+    picks = np.empty(max_points, dtype=int)
+    picks[0], picks[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        else:
+            nlo, nhi = n - 1, n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y_filled[nlo:nhi].mean()
+
+        bx, by = x[lo:hi], y_filled[lo:hi]
+        area = np.abs((x[a] - avg_x) * (by - y_filled[a]) - (x[a] - bx) * (avg_y - y_filled[a]))
+        area[np.isnan(y[lo:hi])] = -1.0
+        a = lo + int(np.argmax(area))
+        picks[i + 1] = a
+    return picks
+
+
+def downsample_rows(rows: List[dict], value_key: str, max_points: Optional[int]) -> List[dict]:
+    """Thin a list of row dicts to at most max_points using LTTB on value_key."""
+    if not max_points or len(rows) <= max_points:
+        return rows
+    keep = lttb_indices([r.get(value_key) for r in rows], max_points)
+    return [rows[i] for i in keep]
+
+
+def to_columns(rows: List[dict], value_key: str, extra_keys: Iterable[str] = ()) -> dict:
+    """Row dicts -> {"dates": [...], "values": [...], <extra_key>: [...]}."""
+    columns = {
+        "dates": [r["date"] for r in rows],
+        "values": [r.get(value_key) for r in rows],
+    }
+    for key in extra_keys:
+        columns[key] = [r.get(key) for r in rows]
+    return columns
+
+
+def etag_response(request: Request, payload) -> Response:
+    """Serialize payload once, tag it, and answer 304 when the client's copy matches."""
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -2,17 +2,26 @@
 Compass Autonomous Trader
 Fully autonomous paper trading engine that uses Lab-derived configs.
 
-Runs at 3:40 PM IST daily. Reads regime-optimal parameters from Lab,
-applies discovered rules, executes trades, logs every decision.
+Runs as an EOD pipeline stage once index prices are stored. Reads
+regime-optimal parameters from Lab, applies discovered rules, executes
+trades, logs every decision.
+
+The inputs every portfolio type shares — scores, regime, config, rules,
+latest prices and entry volatilities — are assembled once into a read-only
+RebalanceSnapshot. The portfolio types are then rebalanced concurrently
+against it, each in its own session and a single transaction.
 
 No human in the loop. Monitoring only.
 """
 
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Optional
+from types import MappingProxyType
+from typing import Any, Callable, Mapping, Optional
 
 from sqlalchemy.orm import Session
 
@@ -29,6 +38,7 @@ from models import (
     CompassVolumeSignal,
     IndexPrice,
     PortfolioNAV,
+    SessionLocal,
 )
 
 logger = logging.getLogger("fie_v3.compass.trader")
@@ -54,9 +64,24 @@ LTCG_EXEMPTION = 125000
 STCG_HOLDING_DAYS = 365
 
 
-def run_autonomous_rebalance(db: Session) -> dict:
+@dataclass(frozen=True)
+class RebalanceSnapshot:
+    """Everything the per-type rebalances read, assembled once before they start.
+    Read-only: mappings are MappingProxyType views and sequences are tuples."""
+    date: str
+    regime: str
+    scores: tuple                                  # sector score mappings, in score order
+    config: Mapping[str, Any]                      # Lab params for the regime
+    config_source: str
+    rules: tuple
+    max_positions: int                             # config value, capped by REDUCE_POSITIONS rules
+    prices: Mapping[tuple[str, str], float]        # (instrument_id, instrument_type) → latest close
+    volatility: Mapping[str, Optional[float]]      # sector_key → annualized volatility
+
+
+def run_autonomous_rebalance(db: Session, session_factory: Callable = SessionLocal) -> dict:
     """
-    Main entry point. Called by scheduler at 3:40 PM IST.
+    Main entry point. Called by the EOD pipeline once index prices are stored.
     Fully autonomous — reads Lab configs, makes decisions, executes trades.
     """
     from services.compass_rs import compute_sector_rs_scores, persist_rs_scores
@@ -74,38 +99,88 @@ def run_autonomous_rebalance(db: Session) -> dict:
     persist_rs_scores(db, scores, instrument_type="index")
     _clear_cache()
 
-    # 3. Detect market regime
-    regime = _detect_current_regime(scores)
-    logger.info("Current regime: %s", regime)
-
-    # 4. Load Lab config for current regime
-    config = _load_regime_config(db, regime)
-    logger.info("Active config: %s (source: %s)", config["params"], config["source"])
-
-    # 5. Load discovered rules
-    active_rules = _load_active_rules(db)
+    # 3. Regime, Lab config, rules, prices — once for all portfolio types
+    snapshot = build_rebalance_snapshot(db, scores, today_str)
+    db.commit()   # the per-type sessions below write concurrently
+    logger.info("Current regime: %s | active config: %s (source: %s)",
+                snapshot.regime, dict(snapshot.config), snapshot.config_source)
 
-    # 6. Run rebalance for all 3 portfolio types
-    all_results = {}
-    for pt in PORTFOLIO_TYPES:
-        result = _rebalance_portfolio(
-            db, scores, pt, config["params"], regime, active_rules, today_str,
-        )
-        all_results[pt] = result
+    # 4. Rebalance all 3 portfolio types concurrently against the snapshot
+    with ThreadPoolExecutor(max_workers=len(PORTFOLIO_TYPES), thread_name_prefix="rebalance") as executor:
+        all_results = dict(zip(
+            PORTFOLIO_TYPES,
+            executor.map(lambda pt: _rebalance_in_session(snapshot, pt, session_factory), PORTFOLIO_TYPES),
+        ))
 
-    # 7. Update NAV
-    nav_results = _update_all_navs(db)
+    # 5. Update NAV
+    nav_results = _update_all_navs(db, snapshot.prices)
 
     logger.info("=== Autonomous Rebalance Complete ===")
     return {
         "date": today_str,
-        "regime": regime,
-        "config_source": config["source"],
+        "regime": snapshot.regime,
+        "config_source": snapshot.config_source,
         "portfolios": all_results,
         "nav": nav_results,
     }
 
 
+def build_rebalance_snapshot(db: Session, scores: list[dict], today_str: str) -> RebalanceSnapshot:
+    """Regime, config, rules, latest prices (open positions + every candidate instrument)
+    and entry volatilities, in a handful of queries."""
+    from services.compass_portfolio import _get_latest_prices
+
+    regime = _detect_current_regime(scores)
+    config = _load_regime_config(db, regime)
+    rules = _load_active_rules(db)
+
+    max_positions = config["params"]["max_positions"]
+    for rule in rules:
+        cond = rule.get("condition_json", {})
+        if cond.get("regime") == regime and rule["override_action"] == "REDUCE_POSITIONS":
+            max_positions = min(max_positions, 4)
+            logger.info("Rule reduces max_positions to %d for %s", max_positions, regime)
+            break
+
+    instruments = set(
+        db.query(CompassModelState.instrument_id, CompassModelState.instrument_type)
+        .filter(CompassModelState.status == "OPEN")
+        .distinct()
+        .all()
+    )
+    for score in scores:
+        instruments.add((score["sector_key"], "index"))
+        if score.get("etfs"):
+            instruments.add((score["etfs"][0], "etf"))
+
+    return RebalanceSnapshot(
+        date=today_str,
+        regime=regime,
+        scores=tuple(MappingProxyType(dict(score)) for score in scores),
+        config=MappingProxyType(dict(config["params"])),
+        config_source=config["source"],
+        rules=tuple(MappingProxyType(rule) for rule in rules),
+        max_positions=max_positions,
+        prices=MappingProxyType(_get_latest_prices(db, instruments)),
+        volatility=MappingProxyType(_entry_volatilities(db, [score["sector_key"] for score in scores])),
+    )
+
+
+def _rebalance_in_session(snapshot: RebalanceSnapshot, portfolio_type: str, session_factory: Callable) -> dict:
+    """One portfolio type's rebalance in its own session: committed as one transaction, rolled back on error."""
+    db = session_factory()
+    try:
+        result = _rebalance_portfolio(db, snapshot, portfolio_type)
+        db.commit()
+        return result
+    except Exception as e:
+        db.rollback()
+        logger.warning("[%s] Rebalance failed (non-fatal): %s", portfolio_type, e)
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+
 def _detect_current_regime(scores: list[dict]) -> str:
     """Detect regime from computed scores (already includes market_regime)."""
     if not scores:
@@ -195,42 +270,22 @@ def _find_historical_precedent(
 ) -> tuple[int, float]:
     """
     Find how many similar past decisions exist and their win rate.
-    Returns (n_similar, win_rate).
+    Returns (n_similar, win_rate) from the maintained precedent tally.
     """
-    similar = db.query(CompassDecisionLog).filter(
-        CompassDecisionLog.market_regime == regime,
-        CompassDecisionLog.decision == action,
-        CompassDecisionLog.was_correct.isnot(None),
-    ).all()
-
-    if not similar:
-        return 0, 0.0
+    from services.compass_lab import decision_precedent
 
-    correct = sum(1 for d in similar if d.was_correct)
-    return len(similar), round(correct / len(similar) * 100, 1)
+    return decision_precedent(db, regime, action, sector_key)
 
 
-def _rebalance_portfolio(
-    db: Session,
-    sector_scores: list[dict],
-    portfolio_type: str,
-    config: dict,
-    regime: str,
-    rules: list[dict],
-    today_str: str,
-) -> dict:
-    """Rebalance a single portfolio type using Lab-derived config."""
+def _rebalance_portfolio(db: Session, snapshot: RebalanceSnapshot, portfolio_type: str) -> dict:
+    """Rebalance a single portfolio type using Lab-derived config. Leaves the commit to the caller."""
     actions_taken = {"entries": [], "exits": [], "decisions_logged": 0}
-    score_map = {s["sector_key"]: s for s in sector_scores}
-    max_positions = config["max_positions"]
-
-    # Check if any rule reduces max positions for this regime
-    for rule in rules:
-        cond = rule.get("condition_json", {})
-        if cond.get("regime") == regime and rule["override_action"] == "REDUCE_POSITIONS":
-            max_positions = min(max_positions, 4)
-            logger.info("Rule reduces max_positions to %d for %s", max_positions, regime)
-            break
+    score_map = {s["sector_key"]: s for s in snapshot.scores}
+    config = snapshot.config
+    regime = snapshot.regime
+    rules = snapshot.rules
+    today_str = snapshot.date
+    max_positions = snapshot.max_positions
 
     # ── Check exits ──────────────────────────────────────────
     open_positions = (
@@ -240,6 +295,10 @@ def _rebalance_portfolio(
     )
 
     for pos in open_positions:
+        price = snapshot.prices.get((pos.instrument_id, pos.instrument_type))
+        if price:
+            pos.current_price = price
+
         sector_data = score_map.get(pos.sector_key, {})
         if not sector_data:
             continue
@@ -298,16 +357,10 @@ def _rebalance_portfolio(
         actions_taken["decisions_logged"] += 1
 
     # ── Check entries ────────────────────────────────────────
-    current_open = (
-        db.query(CompassModelState)
-        .filter(CompassModelState.status == "OPEN", CompassModelState.portfolio_type == portfolio_type)
-        .count()
-    )
-    available_slots = max_positions - current_open
-
     held_sectors = {p.sector_key for p in open_positions if p.status == "OPEN"}
+    available_slots = max_positions - len(held_sectors)
 
-    for s in sector_scores:
+    for s in snapshot.scores:
         sector_key = s["sector_key"]
         if sector_key in held_sectors:
             continue
@@ -331,9 +384,7 @@ def _rebalance_portfolio(
         is_buy = action in (CompassAction.BUY.value, "BUY")
 
         if is_buy and available_slots > 0:
-            success = _execute_entry(
-                db, s, portfolio_type, config, today_str, actions_taken,
-            )
+            success = _execute_entry(db, snapshot, s, portfolio_type, actions_taken)
             if success:
                 available_slots -= 1
                 held_sectors.add(sector_key)
@@ -363,7 +414,6 @@ def _rebalance_portfolio(
 
         actions_taken["decisions_logged"] += 1
 
-    db.commit()
     logger.info(
         "[%s] Rebalance: %d entries, %d exits, %d decisions logged",
         portfolio_type, len(actions_taken["entries"]),
@@ -472,12 +522,14 @@ def _execute_exit(
 
 
 def _execute_entry(
-    db: Session, candidate: dict, portfolio_type: str,
-    config: dict, today_str: str, actions_taken: dict,
+    db: Session, snapshot: RebalanceSnapshot, candidate: Mapping,
+    portfolio_type: str, actions_taken: dict,
 ) -> bool:
-    """Execute an entry trade. Returns True if successful."""
+    """Execute an entry trade at the snapshot's latest price. Returns True if successful."""
     sector_key = candidate["sector_key"]
     etfs = candidate.get("etfs", [])
+    config = snapshot.config
+    today_str = snapshot.date
     stop_pct = config["stop_loss_pct"]
 
     if portfolio_type == "etf_only":
@@ -496,7 +548,7 @@ def _execute_entry(
             instrument_id = sector_key
             instrument_type = "index"
 
-    entry_price = _get_latest_price(db, instrument_id, instrument_type)
+    entry_price = snapshot.prices.get((instrument_id, instrument_type))
     if not entry_price:
         logger.warning("No price for %s (%s), skipping entry", instrument_id, instrument_type)
         return False
@@ -505,8 +557,8 @@ def _execute_entry(
     max_pos = config.get("max_positions", 6)
     weight = round(100 / max_pos, 1)
 
-    # Compute volatility for position sizing
-    volatility = _compute_entry_volatility(db, sector_key)
+    # Volatility for position sizing
+    volatility = snapshot.volatility.get(sector_key)
 
     quadrant_val = candidate.get("quadrant")
     if isinstance(quadrant_val, str):
@@ -579,58 +631,29 @@ def _compute_holding_days(entry_date_str: str) -> int:
         return 0
 
 
-def _compute_entry_volatility(db: Session, sector_key: str) -> Optional[float]:
-    """Compute annualized volatility at entry for position sizing."""
+def _entry_volatilities(db: Session, sector_keys: list[str]) -> dict[str, Optional[float]]:
+    """Annualized volatility per sector for position sizing, from one query over the last 120 days."""
     from services.compass_rs import compute_annualized_volatility
 
     cutoff = (datetime.now() - timedelta(days=120)).strftime("%Y-%m-%d")
-    rows = (
-        db.query(IndexPrice.date, IndexPrice.close_price)
-        .filter(IndexPrice.index_name == sector_key, IndexPrice.date >= cutoff)
+    closes: dict[str, dict[str, float]] = {key: {} for key in sector_keys}
+    for index_name, date, close in (
+        db.query(IndexPrice.index_name, IndexPrice.date, IndexPrice.close_price)
+        .filter(IndexPrice.index_name.in_(sector_keys), IndexPrice.date >= cutoff)
         .order_by(IndexPrice.date)
         .all()
-    )
-    closes = {r.date: r.close_price for r in rows if r.close_price}
-    return compute_annualized_volatility(closes) if closes else None
-
-
-def _get_latest_price(db: Session, instrument_id: str, instrument_type: str) -> Optional[float]:
-    """Get the most recent close price for an instrument."""
-    from models import CompassETFPrice, CompassStockPrice
-
-    if instrument_type == "etf":
-        row = (
-            db.query(CompassETFPrice)
-            .filter(CompassETFPrice.ticker == instrument_id)
-            .order_by(CompassETFPrice.date.desc())
-            .first()
-        )
-        return row.close if row else None
-    elif instrument_type == "stock":
-        row = (
-            db.query(CompassStockPrice)
-            .filter(CompassStockPrice.ticker == instrument_id)
-            .order_by(CompassStockPrice.date.desc())
-            .first()
-        )
-        return row.close if row else None
-    elif instrument_type == "index":
-        row = (
-            db.query(IndexPrice)
-            .filter(IndexPrice.index_name == instrument_id)
-            .order_by(IndexPrice.date.desc())
-            .first()
-        )
-        return row.close_price if row else None
-    return None
-
-
-def _update_all_navs(db: Session) -> dict:
-    """Compute and store today's NAV for all 3 portfolio types."""
+    ):
+        if close:
+            closes[index_name][date] = close
+    return {key: compute_annualized_volatility(c) if c else None for key, c in closes.items()}
+
+
+def _update_all_navs(db: Session, prices: Optional[Mapping] = None) -> dict:
+    """Compute and store today's NAV for all 3 portfolio types (prices: latest closes already looked up)."""
     from services.compass_portfolio import _compute_nav_for_portfolio
     result = {}
     for pt in PORTFOLIO_TYPES:
-        nav = _compute_nav_for_portfolio(db, pt)
+        nav = _compute_nav_for_portfolio(db, pt, prices=prices)
         if nav:
             result[pt] = nav
     return result
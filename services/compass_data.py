@@ -20,6 +20,7 @@ from models import (
     CompassStockPrice,
     IndexConstituent,
 )
+from services.backfill_planner import run_backfill, window_starts
 
 logger = logging.getLogger("fie_v3.compass.data")
 
@@ -90,48 +91,26 @@ def get_all_compass_stock_tickers(db: Session) -> list[str]:
     return [r[0] for r in rows if r[0]]
 
 
-def backfill_compass_stocks(db: Session, period: str = "1y") -> int:
-    """Backfill 1Y stock prices for all sector constituent stocks into compass tables."""
-    from price_service import fetch_yfinance_bulk_stock_history
-
+def backfill_compass_stocks(db: Session, days: int = 365) -> int:
+    """Backfill missing stock prices (last `days`) for all sector constituent stocks."""
     tickers = get_all_compass_stock_tickers(db)
     if not tickers:
         logger.info("Compass backfill: no constituent tickers found")
         return 0
 
-    logger.info("Compass backfill: fetching %s history for %d stocks...", period, len(tickers))
-    data = fetch_yfinance_bulk_stock_history(tickers, period=period)
-    stored = 0
-    for ticker, rows in data.items():
-        if rows is None:
-            continue
-        for row in rows:
-            if _upsert_compass_stock(db, ticker, row):
-                stored += 1
-    db.commit()
-    logger.info("Compass backfill: stored %d stock price records", stored)
+    stored = run_backfill(db, window_starts(tickers, days), table="stock")
+    logger.info("Compass backfill: stored %d stock price records for %d stocks", stored, len(tickers))
     return stored
 
 
-def backfill_compass_etfs(db: Session, period: str = "1y") -> int:
-    """Backfill 1Y ETF prices for all sector ETFs into compass tables."""
-    from price_service import fetch_yfinance_bulk_stock_history
-
+def backfill_compass_etfs(db: Session, days: int = 365) -> int:
+    """Backfill missing ETF prices (last `days`) for all sector ETFs."""
     etf_tickers = list(COMPASS_ETF_UNIVERSE.keys())
     if not etf_tickers:
         return 0
 
-    logger.info("Compass backfill: fetching %s history for %d ETFs...", period, len(etf_tickers))
-    data = fetch_yfinance_bulk_stock_history(etf_tickers, period=period)
-    stored = 0
-    for ticker, rows in data.items():
-        if rows is None:
-            continue
-        for row in rows:
-            if _upsert_compass_etf(db, ticker, row):
-                stored += 1
-    db.commit()
-    logger.info("Compass backfill: stored %d ETF price records", stored)
+    stored = run_backfill(db, window_starts(etf_tickers, days), table="etf")
+    logger.info("Compass backfill: stored %d ETF price records for %d ETFs", stored, len(etf_tickers))
     return stored
 
 
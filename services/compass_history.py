@@ -5,6 +5,10 @@ Stores as compressed numpy arrays for fast simulator consumption.
 
 Data is stored in data/compass_history/ as .npz files.
 One-time download, then incremental daily appends.
+
+The stock panel (Nifty 500 closes on the same dates, plus each stock's
+sector memberships) for the stock-level simulator is a separate file,
+rebuilt whenever the sector history moves on.
 """
 
 import logging
@@ -19,6 +23,8 @@ logger = logging.getLogger("fie_v3.compass.history")
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "compass_history")
 PRICES_FILE = os.path.join(DATA_DIR, "sector_prices.npz")
 META_FILE = os.path.join(DATA_DIR, "metadata.npz")
+STOCK_PRICES_FILE = os.path.join(DATA_DIR, "stock_prices.npz")
+STOCK_UNIVERSE_INDEX = "NIFTY 500"
 
 
 def _ensure_data_dir() -> None:
@@ -240,6 +246,98 @@ def update_historical_data() -> Optional[dict]:
     return merged
 
 
+def download_stock_panel(db, data: dict, universe_index: str = STOCK_UNIVERSE_INDEX) -> dict:
+    """
+    Download daily closes for the universe index's constituents on the
+    sector history's dates, with their sector memberships.
+
+    Uses today's constituents throughout, so the panel carries survivorship
+    bias. Returns dict with 'stock_prices' (n_days × n_stocks, 0 before
+    listing), 'stock_keys', 'members' (n_stocks × n_sectors bool) and 'dates'.
+    """
+    import yfinance as yf
+
+    from index_constants import NSE_DISPLAY_MAP
+    from models import IndexConstituent
+
+    tickers = sorted({
+        t for (t,) in db.query(IndexConstituent.ticker)
+        .filter(IndexConstituent.index_name == universe_index).distinct().all() if t
+    })
+    if not tickers:
+        logger.warning("No %s constituents stored, cannot build stock panel", universe_index)
+        return {}
+
+    sector_col = {NSE_DISPLAY_MAP.get(k, k): j for j, k in enumerate(data["sector_keys"])}
+    stock_row = {t: i for i, t in enumerate(tickers)}
+    members = np.zeros((len(tickers), len(sector_col)), dtype=bool)
+    for index_name, ticker in (
+        db.query(IndexConstituent.index_name, IndexConstituent.ticker)
+        .filter(IndexConstituent.index_name.in_(list(sector_col))).all()
+    ):
+        if ticker in stock_row:
+            members[stock_row[ticker], sector_col[index_name]] = True
+
+    dates = data["dates"]
+    end = (datetime.strptime(dates[-1], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    symbols = [f"{t}.NS" for t in tickers]
+    logger.info("Downloading %d stocks from %s to %s...", len(symbols), dates[0], dates[-1])
+    raw = yf.download(symbols, start=dates[0], end=end, auto_adjust=True, progress=False, threads=True)
+    if raw.empty:
+        logger.error("No stock data returned from yfinance")
+        return {}
+
+    close_df = raw["Close"] if "Close" in raw.columns.get_level_values(0) else raw.xs("Close", axis=1, level=0)
+    close_df.index = [d.strftime("%Y-%m-%d") for d in close_df.index]
+    close_df = close_df.reindex(index=dates, columns=symbols).ffill()
+    stock_prices = np.nan_to_num(close_df.values.astype(np.float64), nan=0.0)
+
+    logger.info(
+        "Downloaded stock panel: %d days × %d stocks, %d in a tracked sector",
+        len(dates), len(tickers), int(members.any(axis=1).sum()),
+    )
+    return {"stock_prices": stock_prices, "stock_keys": tickers, "members": members, "dates": dates}
+
+
+def save_stock_panel(panel: dict) -> str:
+    """Save the stock panel to a compressed numpy file."""
+    _ensure_data_dir()
+    np.savez_compressed(
+        STOCK_PRICES_FILE,
+        stock_prices=panel["stock_prices"],
+        stock_keys=panel["stock_keys"],
+        members=panel["members"],
+        dates=panel["dates"],
+    )
+    return STOCK_PRICES_FILE
+
+
+def load_stock_panel(data: dict) -> Optional[dict]:
+    """Cached stock panel, or None when missing or not on the same dates as the sector history."""
+    if not os.path.exists(STOCK_PRICES_FILE):
+        return None
+    stored = np.load(STOCK_PRICES_FILE, allow_pickle=True)
+    dates = stored["dates"].astype(str)
+    if len(dates) != len(data["dates"]) or dates[-1] != data["dates"][-1]:
+        return None
+    return {
+        "stock_prices": stored["stock_prices"],
+        "stock_keys": list(stored["stock_keys"].astype(str)),
+        "members": stored["members"],
+        "dates": dates,
+    }
+
+
+def update_stock_panel(db, data: dict) -> Optional[dict]:
+    """Cached stock panel for this sector history, downloading it again if stale."""
+    panel = load_stock_panel(data)
+    if panel is None:
+        panel = download_stock_panel(db, data)
+        if panel:
+            save_stock_panel(panel)
+    return panel or None
+
+
 def get_data_summary() -> dict:
     """Get summary of cached historical data without loading full arrays."""
     if not os.path.exists(PRICES_FILE):
@@ -1,37 +1,53 @@
 """
 Compass Lab — Simulation Sweep Orchestrator
 Runs thousands of parameter combinations against historical data,
-extracts regime-optimal configs and conditional rules.
+extracts regime-optimal configs (on walk-forward out-of-sample scores)
+and conditional rules.
 
 Runs as a background daemon: full sweeps every 6 hours, focused sweeps hourly.
+Stock-level sweeps (run_stock_lab_sweep) are triggered on demand.
 """
 
 import json
 import logging
+import math
 import threading
 import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 
 import numpy as np
+import pandas as pd
+from sqlalchemy import case
+from sqlalchemy import func as sqlfunc
 from sqlalchemy.orm import Session
 
 from models import (
     CompassDecisionLog,
+    CompassDecisionPrecedent,
     CompassDiscoveredRule,
     CompassLabRun,
     CompassRegimeConfig,
     get_db,
 )
 from services.compass_simulator import (
+    PERIOD_DAYS,
     REGIME_NAMES,
+    SIMULATOR_VERSION,
+    WF_TEST_DAYS,
+    WF_TRAIN_DAYS,
+    Fold,
     SimParams,
     SimResult,
+    SimState,
     generate_focused_grid,
     generate_param_grid,
+    pooled_regime_metrics,
     simulate,
+    simulate_walk_forward,
+    walk_forward_folds,
 )
 
 logger = logging.getLogger("fie_v3.compass.lab")
@@ -60,40 +76,63 @@ def get_lab_status() -> dict:
 # ─── Worker function (runs in subprocess) ────────────────────
 
 def _run_single_simulation(args: tuple) -> dict:
-    """Worker function for ProcessPoolExecutor. Must be top-level for pickling."""
-    prices, benchmark, sector_keys, params_dict = args
+    """Worker function for ProcessPoolExecutor. Must be top-level for pickling.
+
+    args: (prices, benchmark, sector_keys, params_dict[, resume_state_json, keep_state]).
+    With keep_state the result dict also carries the end state as "state" (JSON).
+    """
+    prices, benchmark, sector_keys, params_dict, *extra = args
+    resume_json, keep_state = (extra + [None, False])[:2]
     params = SimParams(**params_dict)
-    result = simulate(prices, benchmark, sector_keys, params)
-    return result.to_dict()
+    resume = SimState.from_json(resume_json) if resume_json else None
+    result = simulate(prices, benchmark, sector_keys, params, resume=resume)
+    out = result.to_dict()
+    if keep_state:
+        out["state"] = result.state.to_json() if result.state else None
+    return out
+
+
+def _run_walk_forward_simulation(args: tuple) -> dict:
+    """Worker: (prices, benchmark, sector_keys, params_dict, folds) -> out-of-sample result dict."""
+    prices, benchmark, sector_keys, params_dict, folds = args
+    return simulate_walk_forward(prices, benchmark, sector_keys, SimParams(**params_dict), folds)
 
 
 # ─── Sweep Runner ────────────────────────────────────────────
 
-def run_sweep(
+# Longest RS lookback + momentum window: days a windowed run needs before its first trade
+SIM_WARMUP_DAYS = max(PERIOD_DAYS.values()) + 20
+# A windowed run's first day moves in steps of this many days, so for most
+# days its stored run covers a prefix of the new window and can be extended
+WINDOW_ALIGN_DAYS = 21
+
+
+def _simulate_all(
     prices: np.ndarray,
     benchmark: np.ndarray,
     sector_keys: list[str],
-    param_grid: list[SimParams],
-    max_workers: int = 2,
-    batch_size: int = 100,
+    jobs: list[tuple[dict, Optional[str]]],
+    max_workers: int,
+    batch_size: int,
+    keep_state: bool = False,
+    folds: Optional[list[Fold]] = None,
 ) -> list[dict]:
-    """
-    Run simulation sweep across all parameter combinations.
-    Uses ProcessPoolExecutor for parallelism.
-
-    Returns list of SimResult dicts sorted by Sortino ratio.
-    """
-    total = len(param_grid)
-    logger.info("Starting sweep: %d combinations, %d workers", total, max_workers)
-
+    """Simulate (params_dict, resume_state_json) jobs on a process pool, in batches.
+    With folds, each job is scored walk-forward instead (resume is ignored)."""
+    total = len(jobs)
     results = []
     start_time = time.time()
 
     # Prepare args — pass params as dicts for pickling
-    all_args = [
-        (prices, benchmark, sector_keys, p.to_dict())
-        for p in param_grid
-    ]
+    if folds is None:
+        worker = _run_single_simulation
+        all_args = [
+            (prices, benchmark, sector_keys, params_dict, resume_json, keep_state)
+            for params_dict, resume_json in jobs
+        ]
+    else:
+        worker = _run_walk_forward_simulation
+        all_args = [(prices, benchmark, sector_keys, params_dict, folds) for params_dict, _ in jobs]
 
     # Process in batches to manage memory
     for batch_start in range(0, total, batch_size):
@@ -101,7 +140,7 @@ def run_sweep(
         batch_args = all_args[batch_start:batch_end]
 
         with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(_run_single_simulation, args): i for i, args in enumerate(batch_args)}
+            futures = {executor.submit(worker, args): i for i, args in enumerate(batch_args)}
             for future in as_completed(futures):
                 try:
                     result = future.result(timeout=30)
@@ -117,6 +156,71 @@ def run_sweep(
             "Sweep progress: %d/%d (%.0f/s, ~%.0f min remaining)",
             done, total, rate, remaining / 60,
         )
+    return results
+
+
+def _stored_sweep(
+    db: Session,
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    param_grid: list[SimParams],
+    max_workers: int,
+    batch_size: int,
+) -> list[dict]:
+    """Reuse stored results, extend stored runs onto new days, simulate the rest."""
+    from services import compass_sim_store as store
+
+    fingerprint = store.data_fingerprint(prices, benchmark, sector_keys)
+    by_hash = {p.param_hash(): p for p in param_grid}
+    hits = store.lookup(db, list(by_hash), fingerprint)
+    misses = [h for h in by_hash if h not in hits]
+    resumable = store.resumable(db, misses, prices, benchmark, sector_keys)
+
+    jobs = [(by_hash[h].to_dict(), resumable[h][1] if h in resumable else None) for h in misses]
+    fresh = _simulate_all(prices, benchmark, sector_keys, jobs, max_workers, batch_size, keep_state=True)
+    store.save(db, fresh, fingerprint, len(benchmark), superseded=[row_id for row_id, _ in resumable.values()])
+
+    logger.info("Stored sweep: %d reused, %d extended, %d simulated from scratch",
+                len(hits), len(resumable), len(misses) - len(resumable))
+    return list(hits.values()) + fresh
+
+
+def run_sweep(
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    param_grid: list[SimParams],
+    max_workers: int = 2,
+    batch_size: int = 100,
+    window_days: Optional[int] = None,
+    db: Optional[Session] = None,
+) -> list[dict]:
+    """
+    Run simulation sweep across all parameter combinations.
+    Uses ProcessPoolExecutor for parallelism.
+
+    window_days: simulate only the most recent window_days trading days
+    (plus SIM_WARMUP_DAYS of lookback, and up to WINDOW_ALIGN_DAYS more)
+    instead of the full history.
+    db: reuse / extend / record results in the simulation result store.
+
+    Returns list of SimResult dicts sorted by Sortino ratio.
+    """
+    if window_days is not None and window_days + SIM_WARMUP_DAYS < len(benchmark):
+        start = len(benchmark) - window_days - SIM_WARMUP_DAYS
+        start -= start % WINDOW_ALIGN_DAYS
+        prices = prices[start:]
+        benchmark = benchmark[start:]
+    total = len(param_grid)
+    logger.info("Starting sweep: %d combinations, %d workers, %d days", total, max_workers, len(benchmark))
+    start_time = time.time()
+
+    if db is not None:
+        results = _stored_sweep(db, prices, benchmark, sector_keys, param_grid, max_workers, batch_size)
+    else:
+        jobs = [(p.to_dict(), None) for p in param_grid]
+        results = _simulate_all(prices, benchmark, sector_keys, jobs, max_workers, batch_size)
 
     # Sort by Sortino ratio (best risk-adjusted returns first)
     results.sort(key=lambda x: x.get("sortino", 0), reverse=True)
@@ -131,6 +235,9 @@ def run_sweep(
 
 # ─── Regime Config Extraction ────────────────────────────────
 
+REGIME_MIN_TRADES = 10     # trades a config needs in a regime to be considered for it
+
+
 def extract_regime_configs(results: list[dict]) -> dict[str, dict]:
     """
     From sweep results, find the best parameter set for each market regime.
@@ -144,7 +251,7 @@ def extract_regime_configs(results: list[dict]) -> dict[str, dict]:
         for r in results:
             rm = r.get("regime_metrics", {}).get(regime_name, {})
             n_trades = rm.get("n_trades", 0)
-            if n_trades >= 10:  # need at least 10 trades in this regime
+            if n_trades >= REGIME_MIN_TRADES:
                 candidates.append({
                     "params": r["params"],
                     "sortino": rm.get("sortino", 0),
@@ -218,121 +325,270 @@ def persist_regime_configs(db: Session, regime_configs: dict, lab_run_id: int) -
     logger.info("Persisted %d regime configs", len(regime_configs))
 
 
-# ─── Rule Discovery ─────────────────────────────────────────
+# ─── Walk-Forward Validation ────────────────────────────────
+# Regime configs are chosen without looking at the data they are scored on.
+# Every param set of the sweep's candidate pool — never a ranking of it — is
+# simulated once and sliced into rolling train/test folds (see
+# compass_simulator.simulate_walk_forward). Per fold and regime the best
+# config on the train window is scored on the next test window; those test
+# results are the evidence. Param sets run in parallel on the process pool.
 
-def discover_rules(results: list[dict]) -> list[dict]:
+def run_walk_forward(
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    param_grid: list[SimParams],
+    train_days: int = WF_TRAIN_DAYS,
+    test_days: int = WF_TEST_DAYS,
+    max_workers: int = 2,
+    batch_size: int = 100,
+    db: Optional[Session] = None,
+) -> list[dict]:
     """
-    Analyze simulation results to discover conditional rules.
-    Groups trades by (regime × parameter pattern) and finds
-    conditions where win rate deviates significantly from baseline.
+    Per-fold walk-forward statistics for param_grid ([] if the history is too
+    short for one fold). See simulate_walk_forward() for the shape.
+
+    db: reuse results stored for the same data and fold layout.
     """
-    # Collect all trade outcomes across top-performing parameter sets
-    # We only analyze top 100 results to focus on viable strategies
-    top_results = results[:min(100, len(results))]
-    if not top_results:
+    folds = walk_forward_folds(len(benchmark), train_days, test_days)
+    if not folds:
+        logger.warning("Walk-forward: %d days is too short for a %d+%d day fold", len(benchmark),
+                       train_days, test_days)
         return []
 
-    # Compute baseline metrics from overall best result
-    baseline = top_results[0]
-    baseline_win = baseline.get("win_rate", 50)
+    by_hash = {p.param_hash(): p for p in param_grid}
+    hits: dict[str, dict] = {}
+    if db is not None:
+        from services import compass_sim_store as store
+
+        version = f"{SIMULATOR_VERSION}/wf{train_days}x{test_days}-folds"
+        fingerprint = store.data_fingerprint(prices, benchmark, sector_keys)
+        hits = store.lookup(db, list(by_hash), fingerprint, version=version)
+    jobs = [(p.to_dict(), None) for h, p in by_hash.items() if h not in hits]
+    fresh = _simulate_all(prices, benchmark, sector_keys, jobs, max_workers, batch_size, folds=folds)
+    if db is not None:
+        store.save(db, fresh, fingerprint, len(benchmark), version=version)
+
+    results = sorted(list(hits.values()) + fresh, key=lambda r: r["param_hash"])
+    logger.info("Walk-forward: %d param sets x %d folds (%d reused)", len(results), len(folds), len(hits))
+    return results
 
-    discovered = []
 
-    # Rule 1: Regime-specific stop-loss effectiveness
+def select_walk_forward(wf_results: list[dict]) -> dict[str, dict]:
+    """
+    Regime configs from walk-forward statistics. Returns {regime_name: {params, evidence}}.
+
+    For each fold and regime, the config with the best train-window regime
+    Sortino (among those with REGIME_MIN_TRADES train trades) is picked and
+    scored on that fold's test window only. params are the most recent
+    fold's pick; evidence pools the picks' test-window trades over all folds.
+    """
+    scored = [r for r in wf_results if r["folds"]]
+    n_folds = min((len(r["folds"]) for r in scored), default=0)
+    regime_best: dict[str, dict] = {}
+
     for regime_name in REGIME_NAMES.values():
-        regime_results = []
-        for r in top_results:
-            rm = r.get("regime_metrics", {}).get(regime_name, {})
-            if rm.get("n_trades", 0) >= 5:
-                regime_results.append({
-                    "params": r["params"],
-                    "win_rate": rm["win_rate"],
-                    "n_trades": rm["n_trades"],
-                    "sortino": rm.get("sortino", 0),
-                })
+        picks = []      # (fold index, result)
+        for f in range(n_folds):
+            eligible = [r for r in scored if r["folds"][f]["train_regimes"][regime_name]["n_trades"] >= REGIME_MIN_TRADES]
+            if eligible:
+                picks.append((f, max(eligible, key=lambda r: r["folds"][f]["train_regimes"][regime_name]["sortino"])))
+        if not picks:
+            continue
+
+        oos = pooled_regime_metrics(regime_name, [r["folds"][f]["test_trades"][regime_name] for f, r in picks])
+        regime_best[regime_name] = {
+            "params": picks[-1][1]["params"],
+            "evidence": {
+                "sortino": oos.sortino,
+                "sharpe": oos.sharpe,
+                "win_rate": oos.win_rate,
+                "max_drawdown": max(r["folds"][f]["test_max_drawdown"] for f, r in picks),
+                "n_trades": oos.n_trades,
+                "folds": len(picks),
+            },
+        }
+        logger.info(
+            "Walk-forward config for %s: OOS Sortino=%.2f, WinRate=%.0f%%, n=%d over %d folds | params=%s",
+            regime_name, oos.sortino, oos.win_rate, oos.n_trades, len(picks), picks[-1][1]["params"],
+        )
 
-        if len(regime_results) < 5:
+    return regime_best
+
+
+def _oos_regime_configs(
+    db: Session,
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    pool: list[SimParams],
+) -> tuple[dict[str, dict], int]:
+    """Walk-forward-selected regime configs from an unranked candidate pool. Returns (configs, n scored)."""
+    wf_results = run_walk_forward(prices, benchmark, sector_keys, pool, max_workers=2, db=db)
+    return select_walk_forward(wf_results), len(wf_results)
+
+
+# ─── Rule Discovery ─────────────────────────────────────────
+
+# A (combo, regime) cell needs this many trades to count as evidence
+RULE_MIN_REGIME_TRADES = 5
+# ... and each side of a comparison this many combos / trades
+RULE_MIN_COMBOS = 5
+RULE_MIN_TRADES = 30
+# Effect-size floors (as before) — significance alone is cheap on 76,800 combos
+RULE_MIN_WIN_DIFF = 10.0
+RULE_MIN_SORTINO_LIFT = 0.3
+# Two-sided p-value a rule must beat
+RULE_MAX_P = 0.01
+
+_RULE_PARAMS = ("rs_period", "stop_loss_pct", "max_positions")
+
+
+def _results_frame(results: list[dict]) -> pd.DataFrame:
+    """One row per (combo, regime) with that combo's parameters and regime metrics."""
+    regimes = list(REGIME_NAMES.values())
+    params = {k: np.tile([r["params"][k] for r in results], len(regimes)) for k in _RULE_PARAMS}
+    metrics = [(r.get("regime_metrics") or {}).get(regime) or {} for regime in regimes for r in results]
+    frame = pd.DataFrame({
+        **params,
+        "rs_period": pd.Categorical(params["rs_period"]),
+        "regime": pd.Categorical.from_codes(np.repeat(np.arange(len(regimes)), len(results)), regimes),
+        "n_trades": np.array([m.get("n_trades", 0) for m in metrics], dtype=np.int64),
+        "win_rate": np.array([m.get("win_rate", 0.0) for m in metrics], dtype=np.float64),
+        "sortino": np.array([m.get("sortino", 0.0) for m in metrics], dtype=np.float64),
+    })
+    frame = frame[frame["n_trades"] >= RULE_MIN_REGIME_TRADES]
+    # Trade-weighted win rates need win counts, not per-combo percentages
+    return frame.assign(wins=frame["win_rate"] * frame["n_trades"] / 100.0)
+
+
+def _buckets(below, above, names: tuple[str, str]) -> pd.Categorical:
+    """names[0] where `below`, names[1] where `above`, "mid" elsewhere."""
+    return pd.Categorical.from_codes(np.select([below, above], [0, 1], 2), [*names, "mid"])
+
+
+def _bucket_stats(frame: pd.DataFrame, bucket: pd.Categorical) -> pd.DataFrame:
+    """Per (regime, bucket): combos, trades, wins, win rate and Sortino mean/variance."""
+    stats = frame.groupby([frame["regime"], pd.Series(bucket, index=frame.index, name="bucket")], observed=True).agg(
+        combos=("sortino", "size"),
+        trades=("n_trades", "sum"),
+        wins=("wins", "sum"),
+        sortino=("sortino", "mean"),
+        sortino_var=("sortino", "var"),
+    )
+    stats["win_rate"] = stats["wins"] / stats["trades"] * 100.0
+    return stats
+
+
+def _two_sided_p(z: float) -> float:
+    return math.erfc(abs(z) / math.sqrt(2.0))
+
+
+def _win_rate_p(a, b) -> float:
+    """Two-proportion z-test on pooled trade wins."""
+    pooled = (a.wins + b.wins) / (a.trades + b.trades)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / a.trades + 1 / b.trades))
+    return _two_sided_p((a.wins / a.trades - b.wins / b.trades) / se) if se > 0 else 1.0
+
+
+def _sortino_p(a, b) -> float:
+    """Welch's t on per-combo Sortino (normal tail — both sides have >= RULE_MIN_COMBOS)."""
+    se = math.sqrt(np.nan_to_num(a.sortino_var) / a.combos + np.nan_to_num(b.sortino_var) / b.combos)
+    return _two_sided_p((a.sortino - b.sortino) / se) if se > 0 else 1.0
+
+
+def _pairs(stats: pd.DataFrame, first, second):
+    """(regime, stats[first], stats[second]) where both buckets have enough evidence."""
+    for regime in stats.index.get_level_values("regime").unique():
+        per = stats.loc[regime]
+        if first not in per.index or second not in per.index:
             continue
+        a, b = per.loc[first], per.loc[second]
+        if min(a.combos, b.combos) >= RULE_MIN_COMBOS:
+            yield regime, a, b
 
-        # Find if tight stops work better in this regime
-        tight_stop = [r for r in regime_results if r["params"]["stop_loss_pct"] <= 6]
-        wide_stop = [r for r in regime_results if r["params"]["stop_loss_pct"] >= 12]
-
-        if tight_stop and wide_stop:
-            tight_wr = np.mean([r["win_rate"] for r in tight_stop])
-            wide_wr = np.mean([r["win_rate"] for r in wide_stop])
-            n_tight = sum(r["n_trades"] for r in tight_stop)
-            n_wide = sum(r["n_trades"] for r in wide_stop)
-
-            if abs(tight_wr - wide_wr) > 10 and min(n_tight, n_wide) >= 30:
-                better = "tight" if tight_wr > wide_wr else "wide"
-                discovered.append({
-                    "condition": f"regime={regime_name} AND stop_loss={'<=6' if better == 'tight' else '>=12'}",
-                    "condition_json": json.dumps({
-                        "regime": regime_name,
-                        "stop_loss_preference": better,
-                    }),
-                    "historical_n": n_tight if better == "tight" else n_wide,
-                    "historical_win_rate": round(tight_wr if better == "tight" else wide_wr, 1),
-                    "baseline_win_rate": round(baseline_win, 1),
-                    "override_action": f"USE_{better.upper()}_STOPS",
-                    "confidence": "HIGH" if min(n_tight, n_wide) >= 50 else "MEDIUM",
-                })
 
-        # Find if fewer positions work better in volatile regimes
-        few_pos = [r for r in regime_results if r["params"]["max_positions"] <= 4]
-        many_pos = [r for r in regime_results if r["params"]["max_positions"] >= 6]
-
-        if few_pos and many_pos:
-            few_sortino = np.mean([r["sortino"] for r in few_pos])
-            many_sortino = np.mean([r["sortino"] for r in many_pos])
-
-            if few_sortino > many_sortino * 1.3:
-                discovered.append({
-                    "condition": f"regime={regime_name} AND max_positions<=4",
-                    "condition_json": json.dumps({
-                        "regime": regime_name,
-                        "max_positions_preference": "fewer",
-                    }),
-                    "historical_n": sum(r["n_trades"] for r in few_pos),
-                    "historical_win_rate": round(np.mean([r["win_rate"] for r in few_pos]), 1),
-                    "baseline_win_rate": round(baseline_win, 1),
-                    "override_action": "REDUCE_POSITIONS",
-                    "confidence": "MEDIUM",
-                })
+def _rule(condition: str, condition_json: dict, side, baseline: float, action: str,
+          p_value: float, confidence: str) -> dict:
+    return {
+        "condition": condition,
+        "condition_json": json.dumps(condition_json),
+        "historical_n": int(side.trades),
+        "historical_win_rate": round(float(side.win_rate), 1),
+        "baseline_win_rate": round(float(baseline), 1),
+        "override_action": action,
+        "confidence": confidence,
+        "p_value": round(p_value, 6),
+    }
 
-    # Rule 2: RS period effectiveness by regime
-    for regime_name in REGIME_NAMES.values():
-        period_stats: dict[str, list] = {}
-        for r in top_results:
-            rm = r.get("regime_metrics", {}).get(regime_name, {})
-            if rm.get("n_trades", 0) >= 5:
-                period = r["params"]["rs_period"]
-                if period not in period_stats:
-                    period_stats[period] = []
-                period_stats[period].append(rm.get("sortino", 0))
-
-        if len(period_stats) >= 2:
-            best_period = max(period_stats.keys(), key=lambda p: np.mean(period_stats[p]))
-            best_sortino = np.mean(period_stats[best_period])
-            other_sortinos = [np.mean(v) for k, v in period_stats.items() if k != best_period]
-            avg_other = np.mean(other_sortinos) if other_sortinos else 0
-
-            if best_sortino > avg_other * 1.3 and best_sortino > 0.3:
-                discovered.append({
-                    "condition": f"regime={regime_name} AND rs_period={best_period}",
-                    "condition_json": json.dumps({
-                        "regime": regime_name,
-                        "optimal_rs_period": best_period,
-                    }),
-                    "historical_n": sum(len(v) for v in period_stats.values()),
-                    "historical_win_rate": round(best_sortino * 20 + 50, 1),  # approximate
-                    "baseline_win_rate": round(baseline_win, 1),
-                    "override_action": f"USE_{best_period}_LOOKBACK",
-                    "confidence": "MEDIUM",
-                })
 
-    logger.info("Discovered %d rules from simulation data", len(discovered))
+def discover_rules(results: list[dict]) -> list[dict]:
+    """
+    Analyze simulation results to discover conditional rules.
+
+    Every combo's per-regime metrics go into one (combo × regime) frame; each
+    rule family is a grouped aggregation over it, so the full grid costs the
+    same few passes as a handful of results. Win rates are trade-weighted
+    (wins / trades), and a rule needs both an effect-size floor and a
+    significant test — two-proportion z for win rates, Welch for Sortino.
+    """
+    frame = _results_frame(results)
+    if frame.empty:
+        return []
+
+    regime_trades = frame.groupby("regime", observed=True)[["wins", "n_trades"]].sum()
+    baseline = (regime_trades["wins"] / regime_trades["n_trades"] * 100.0).to_dict()
+    discovered = []
+
+    # Rule 1a: tight (<=6%) vs wide (>=12%) stops, by win rate
+    stops = _buckets(frame["stop_loss_pct"] <= 6, frame["stop_loss_pct"] >= 12, ("tight", "wide"))
+    for regime, tight, wide in _pairs(_bucket_stats(frame, stops), "tight", "wide"):
+        n_min = min(tight.trades, wide.trades)
+        if n_min < RULE_MIN_TRADES or abs(tight.win_rate - wide.win_rate) <= RULE_MIN_WIN_DIFF:
+            continue
+        p = _win_rate_p(tight, wide)
+        if p >= RULE_MAX_P:
+            continue
+        better, side = ("tight", tight) if tight.win_rate > wide.win_rate else ("wide", wide)
+        discovered.append(_rule(
+            f"regime={regime} AND stop_loss={'<=6' if better == 'tight' else '>=12'}",
+            {"regime": regime, "stop_loss_preference": better},
+            side, baseline[regime], f"USE_{better.upper()}_STOPS", p,
+            "HIGH" if n_min >= 50 and p < RULE_MAX_P / 10 else "MEDIUM",
+        ))
+
+    # Rule 1b: few (<=4) vs many (>=6) positions, by Sortino
+    positions = _buckets(frame["max_positions"] <= 4, frame["max_positions"] >= 6, ("few", "many"))
+    for regime, few, many in _pairs(_bucket_stats(frame, positions), "few", "many"):
+        if few.sortino - many.sortino <= RULE_MIN_SORTINO_LIFT * abs(many.sortino):
+            continue
+        p = _sortino_p(few, many)
+        if p < RULE_MAX_P:
+            discovered.append(_rule(
+                f"regime={regime} AND max_positions<=4",
+                {"regime": regime, "max_positions_preference": "fewer"},
+                few, baseline[regime], "REDUCE_POSITIONS", p, "MEDIUM",
+            ))
+
+    # Rule 2: the best RS period per regime vs all other periods, by Sortino
+    by_period = frame.groupby(["regime", "rs_period"], observed=True)["sortino"].mean()
+    best_period = by_period.groupby(level="regime").idxmax().str[1]
+    is_best = frame["rs_period"].astype(str) == frame["regime"].map(best_period).astype(str)
+    best_or_rest = _buckets(is_best, ~is_best, ("best", "rest"))
+    for regime, best, rest in _pairs(_bucket_stats(frame, best_or_rest), "best", "rest"):
+        if best.sortino <= RULE_MIN_SORTINO_LIFT or best.sortino <= rest.sortino * 1.3:
+            continue
+        p = _sortino_p(best, rest)
+        if p < RULE_MAX_P:
+            period = best_period[regime]
+            discovered.append(_rule(
+                f"regime={regime} AND rs_period={period}",
+                {"regime": regime, "optimal_rs_period": period},
+                best, baseline[regime], f"USE_{period}_LOOKBACK", p, "MEDIUM",
+            ))
+
+    logger.info("Discovered %d rules from %d combos (%d regime cells)",
+                len(discovered), len(results), len(frame))
     return discovered
 
 
@@ -371,13 +627,174 @@ def persist_discovered_rules(db: Session, rules: list[dict], lab_run_id: int) ->
     logger.info("Persisted rules: %d new, %d updated", added, len(rules) - added)
 
 
+# ─── Adaptive Search ─────────────────────────────────────────
+# Successive halving: many configs on a short recent window, the best 1/eta
+# of them on an eta-times longer one, ... and only the last survivors on the
+# full history. An optional surrogate (main-effects ridge over one-hot
+# params, fitted on the first rung) then proposes 1/eta² as many unseen
+# configs, which skip the first rung and are halved from the second.
+
+HALVING_ETA = 3
+HALVING_INITIAL = 2430          # ~3% of the 76,800-combo grid
+HALVING_MIN_WINDOW = 120        # shortest rung, trading days after warm-up
+HALVING_MAX_RUNGS = 4
+# Unranked configs (a random prefix of the halving sample) for walk-forward selection and rule
+# discovery — about one halving run's full-history budget, not the whole sample
+HALVING_POOL = HALVING_INITIAL // HALVING_ETA ** 2
+SURROGATE_EXPLORE = 0.25        # share of proposals drawn at random
+SURROGATE_RIDGE = 1.0
+
+
+def halving_windows(
+    n_days: int,
+    eta: int = HALVING_ETA,
+    min_window: int = HALVING_MIN_WINDOW,
+    max_rungs: int = HALVING_MAX_RUNGS,
+) -> list[Optional[int]]:
+    """run_sweep window_days per rung, shortest first; the last (None) is the full history."""
+    span = n_days - SIM_WARMUP_DAYS
+    windows: list[Optional[int]] = [None]
+    while len(windows) < max_rungs and span // eta ** len(windows) >= min_window:
+        windows.insert(0, span // eta ** len(windows))
+    return windows
+
+
+def successive_halving(
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    candidates: list[SimParams],
+    windows: list[Optional[int]],
+    eta: int = HALVING_ETA,
+    max_workers: int = 2,
+    db: Optional[Session] = None,
+) -> tuple[list[dict], list[list[dict]]]:
+    """Returns (last-rung results sorted by Sortino, every rung's results)."""
+    rungs: list[list[dict]] = []
+    for i, window in enumerate(windows):
+        if not candidates:
+            break
+        results = run_sweep(prices, benchmark, sector_keys, candidates,
+                            max_workers=max_workers, window_days=window, db=db)
+        rungs.append(results)
+        if i < len(windows) - 1:
+            keep = max(1, math.ceil(len(results) / eta))
+            candidates = [SimParams(**r["params"]) for r in results[:keep]]
+    return (rungs[-1] if rungs else []), rungs
+
+
+def _param_features(params: list[dict], levels: dict[str, list]) -> np.ndarray:
+    """One-hot of every parameter value, plus an intercept column."""
+    cols = [np.ones(len(params))]
+    for key, values in levels.items():
+        column = np.array([p[key] for p in params], dtype=object)
+        cols.extend((column == v).astype(float) for v in values)
+    return np.column_stack(cols)
+
+
+def propose_params(
+    observed: list[dict],
+    pool: list[SimParams],
+    n: int,
+    exclude: set[str] = frozenset(),
+    explore: float = SURROGATE_EXPLORE,
+    seed: int = 0,
+) -> list[SimParams]:
+    """n unseen configs from pool: the surrogate's top predicted Sortino, plus a random share."""
+    rng = np.random.default_rng(seed)
+    unseen = [p for p in pool if p.param_hash() not in exclude]
+    if not observed or len(unseen) <= n:
+        return unseen
+    pool_dicts = [p.to_dict() for p in unseen]
+    levels = {k: sorted({d[k] for d in pool_dicts} | {r["params"][k] for r in observed}, key=str)
+              for k in pool_dicts[0]}
+
+    x = _param_features([r["params"] for r in observed], levels)
+    y = np.array([r.get("sortino", 0.0) for r in observed])
+    ridge = np.sqrt(SURROGATE_RIDGE) * np.eye(x.shape[1])
+    ridge[0, 0] = 0.0  # leave the intercept unpenalised
+    coef, *_ = np.linalg.lstsq(np.vstack([x, ridge]), np.concatenate([y, np.zeros(x.shape[1])]), rcond=None)
+
+    predicted = _param_features(pool_dicts, levels) @ coef
+    n_best = n - int(n * explore)
+    order = np.argsort(-predicted, kind="stable")
+    chosen = list(order[:n_best])
+    rest = order[n_best:]
+    chosen.extend(rng.choice(rest, size=n - n_best, replace=False))
+    return [unseen[i] for i in chosen]
+
+
+def sample_grid(grid: list[SimParams], n: int, seed: int = 0) -> list[SimParams]:
+    """Random sample of n grid configs (the whole grid if smaller), reproducible by seed."""
+    rng = np.random.default_rng(seed)
+    return [grid[i] for i in rng.choice(len(grid), size=min(n, len(grid)), replace=False)]
+
+
+def run_adaptive_search(
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    grid: Optional[list[SimParams]] = None,
+    n_initial: int = HALVING_INITIAL,
+    eta: int = HALVING_ETA,
+    surrogate: bool = True,
+    max_workers: int = 2,
+    seed: int = 0,
+    db: Optional[Session] = None,
+) -> tuple[list[dict], dict]:
+    """
+    Successive halving over a random sample of the grid, then (if surrogate)
+    one surrogate-proposed bracket. Returns (full-history results sorted by
+    Sortino, search summary for CompassLabRun.notes).
+    """
+    grid = grid if grid is not None else generate_param_grid()
+    sample = sample_grid(grid, n_initial, seed)
+    windows = halving_windows(len(benchmark), eta)
+
+    final, rungs = successive_halving(prices, benchmark, sector_keys, sample, windows, eta, max_workers, db)
+    brackets = [rungs]
+    if surrogate and len(windows) > 1 and rungs:
+        seen = {r["param_hash"] for rung in rungs for r in rung}
+        proposals = propose_params(rungs[0], grid, max(1, len(sample) // eta ** 2), exclude=seen, seed=seed)
+        extra, extra_rungs = successive_halving(prices, benchmark, sector_keys, proposals, windows[1:], eta,
+                                                max_workers, db)
+        final = final + extra
+        brackets.append(extra_rungs)
+
+    best: dict[str, dict] = {}
+    for r in final:
+        best.setdefault(r["param_hash"], r)
+    results = sorted(best.values(), key=lambda r: r.get("sortino", 0), reverse=True)
+
+    full_days = max(1, len(benchmark) - SIM_WARMUP_DAYS)
+    bracket_rungs = [
+        [(window, len(rung)) for window, rung in zip(bracket_windows, bracket)]
+        for bracket_windows, bracket in zip((windows, windows[1:]), brackets)
+    ]
+    summary = {
+        "search": "halving+surrogate" if len(brackets) > 1 else "halving",
+        "eta": eta,
+        "brackets": [[{"days": w or full_days, "configs": n} for w, n in b] for b in bracket_rungs],
+        "configs_tested": len({r["param_hash"] for b in brackets for rung in b for r in rung}),
+        "full_history_sims": sum(n for b in bracket_rungs for w, n in b if w is None),
+        "full_history_equivalents": round(sum((w or full_days) * n for b in bracket_rungs for w, n in b) / full_days, 1),
+    }
+    logger.info("Adaptive search: %s", summary)
+    return results, summary
+
+
 # ─── Full Lab Run ────────────────────────────────────────────
 
-def run_full_lab_sweep(db: Session) -> dict:
+def run_full_lab_sweep(db: Session, search: str = "halving") -> dict:
     """
     Execute a full Lab sweep: download/load data, run simulations,
     extract configs, discover rules.
+
+    search: "halving" (adaptive search, recorded as an ADAPTIVE run) or
+    "grid" (every combo of a fixed ~3,200-combo sample on the full history).
     """
+    if search not in ("halving", "grid"):
+        raise ValueError(f"Unknown lab search {search!r}")
     from services.compass_history import load_historical_data, update_historical_data
 
     # Load or download historical data
@@ -394,7 +811,7 @@ def run_full_lab_sweep(db: Session) -> dict:
 
     # Record Lab run
     lab_run = CompassLabRun(
-        run_type="FULL",
+        run_type="ADAPTIVE" if search == "halving" else "FULL",
         status="RUNNING",
         data_start=data["dates"][0],
         data_end=data["dates"][-1],
@@ -405,49 +822,67 @@ def run_full_lab_sweep(db: Session) -> dict:
     try:
         # Generate parameter grid
         param_grid = generate_param_grid()
-
-        # For first run or small server, use reduced grid
-        # Full grid: 76,800 combos. Reduced: ~3,200 (skip some combos)
-        if len(param_grid) > 10000:
-            # Sample strategically: keep all rs_period × stop_loss × max_positions combos
-            # but reduce trailing/holding variations
-            reduced = []
-            for p in param_grid:
-                d = p.to_dict()
-                # Keep every 4th trailing combo, every 2nd holding combo
-                t_hash = hash((d["trailing_trigger_pct"], d["trailing_stop_pct"])) % 4
-                h_hash = hash(d["min_holding_days"]) % 2
-                if t_hash == 0 and h_hash == 0:
-                    reduced.append(p)
-            if reduced:
-                param_grid = reduced
-            logger.info("Reduced grid from 76800 to %d combos", len(param_grid))
-
-        # Run sweep
-        results = run_sweep(prices, benchmark, sector_keys, param_grid, max_workers=2)
-
-        # Extract regime configs
-        regime_configs = extract_regime_configs(results)
+        search_summary = None
+
+        # Adaptive: successive halving over a sample, only survivors see the full history.
+        # Survivors are ranked by full-history Sortino, so regime selection and rule
+        # discovery use an unranked pool instead; its full-history runs are stored and
+        # extended onto new days like any sweep's.
+        if search == "halving":
+            results, search_summary = run_adaptive_search(prices, benchmark, sector_keys, param_grid,
+                                                          max_workers=2, db=db)
+            pool = sample_grid(param_grid, HALVING_INITIAL)[:HALVING_POOL]
+            pool_results = run_sweep(prices, benchmark, sector_keys, pool, max_workers=2, db=db)
+        else:
+            # For first run or small server, use reduced grid
+            # Full grid: 76,800 combos. Reduced: ~3,200 (skip some combos)
+            if len(param_grid) > 10000:
+                # Sample strategically: keep all rs_period × stop_loss × max_positions combos
+                # but reduce trailing/holding variations
+                reduced = []
+                for p in param_grid:
+                    d = p.to_dict()
+                    # Keep every 4th trailing combo, every 2nd holding combo
+                    t_hash = hash((d["trailing_trigger_pct"], d["trailing_stop_pct"])) % 4
+                    h_hash = hash(d["min_holding_days"]) % 2
+                    if t_hash == 0 and h_hash == 0:
+                        reduced.append(p)
+                if reduced:
+                    param_grid = reduced
+                logger.info("Reduced grid from 76800 to %d combos", len(param_grid))
+
+            results = run_sweep(prices, benchmark, sector_keys, param_grid, max_workers=2, db=db)
+            pool, pool_results = param_grid, results
+
+        # Extract regime configs — chosen per walk-forward fold on train windows only
+        regime_configs, n_oos = _oos_regime_configs(db, prices, benchmark, sector_keys, pool)
         if regime_configs:
             persist_regime_configs(db, regime_configs, lab_run.id)
 
         # Discover rules
-        rules = discover_rules(results)
+        rules = discover_rules(pool_results)
         if rules:
             persist_discovered_rules(db, rules, lab_run.id)
 
+        if search_summary is not None:
+            search_summary["pool_sims"] = len(pool_results)
+            search_summary["walk_forward_sims"] = n_oos
+            search_summary["full_history_sims"] += len(pool_results) + n_oos
+            search_summary["full_history_equivalents"] += len(pool_results) + n_oos
+            lab_run.notes = json.dumps(search_summary)
+
         # Update Lab run record
         lab_run.status = "COMPLETED"
         lab_run.completed_at = datetime.now()
-        lab_run.combos_tested = len(results)
+        lab_run.combos_tested = (search_summary["configs_tested"] if search_summary else len(results)) + n_oos
         lab_run.best_sharpe = results[0]["sharpe"] if results else None
         db.commit()
 
         # Update status
         with _lab_lock:
             _lab_status["last_sweep"] = datetime.now().isoformat()
-            _lab_status["last_sweep_type"] = "FULL"
-            _lab_status["combos_tested_total"] += len(results)
+            _lab_status["last_sweep_type"] = lab_run.run_type
+            _lab_status["combos_tested_total"] += lab_run.combos_tested
             _lab_status["active_regime_configs"] = {
                 k: v["params"] for k, v in regime_configs.items()
             }
@@ -455,11 +890,13 @@ def run_full_lab_sweep(db: Session) -> dict:
 
         return {
             "status": "completed",
-            "combos_tested": len(results),
+            "combos_tested": lab_run.combos_tested,
             "regime_configs": {k: v["evidence"] for k, v in regime_configs.items()},
             "rules_discovered": len(rules),
             "best_sharpe": results[0]["sharpe"] if results else None,
             "data_range": f"{data['dates'][0]} to {data['dates'][-1]}",
+            "search": search_summary,
+            "walk_forward_configs": n_oos,
         }
 
     except Exception as e:
@@ -521,26 +958,27 @@ def run_focused_sweep(db: Session) -> dict:
                 seen.add(h)
                 unique_params.append(p)
 
-        results = run_sweep(prices, benchmark, sector_keys, unique_params, max_workers=2)
+        results = run_sweep(prices, benchmark, sector_keys, unique_params, max_workers=2, db=db)
 
-        regime_configs = extract_regime_configs(results)
+        regime_configs, n_oos = _oos_regime_configs(db, prices, benchmark, sector_keys, unique_params)
         if regime_configs:
             persist_regime_configs(db, regime_configs, lab_run.id)
 
         lab_run.status = "COMPLETED"
         lab_run.completed_at = datetime.now()
-        lab_run.combos_tested = len(results)
+        lab_run.combos_tested = len(results) + n_oos
         db.commit()
 
         with _lab_lock:
             _lab_status["last_sweep"] = datetime.now().isoformat()
             _lab_status["last_sweep_type"] = "FOCUSED"
-            _lab_status["combos_tested_total"] += len(results)
+            _lab_status["combos_tested_total"] += lab_run.combos_tested
 
         return {
             "status": "completed",
-            "combos_tested": len(results),
+            "combos_tested": lab_run.combos_tested,
             "type": "focused",
+            "walk_forward_configs": n_oos,
         }
 
     except Exception as e:
@@ -551,6 +989,113 @@ def run_focused_sweep(db: Session) -> dict:
         return {"status": "error", "message": str(e)}
 
 
+# ─── Stock-Level Sweep ───────────────────────────────────────
+# Parameters for the stock portfolios, swept on the Nifty 500 panel
+# (services/compass_stock_simulator.py). Each worker gets the panel once via
+# the pool initializer; jobs go out in chunks ordered by signal key, so a
+# worker computes each (rs_period, min_rs, strictness) signal pass once.
+
+STOCK_SWEEP_CHUNK = 48
+
+_stock_panel = None     # per worker process
+
+
+def _init_stock_worker(panel) -> None:
+    global _stock_panel
+    _stock_panel = panel
+
+
+def _run_stock_chunk(params_dicts: list[dict]) -> list[dict]:
+    """Worker function: simulate a chunk of stock param sets on this worker's panel."""
+    from services.compass_stock_simulator import StockSimParams, simulate_stocks
+
+    return [simulate_stocks(_stock_panel, StockSimParams(**d)).to_dict() for d in params_dicts]
+
+
+def run_stock_sweep(panel, param_grid: list, max_workers: int = 2, chunk_size: int = STOCK_SWEEP_CHUNK) -> list[dict]:
+    """Simulate StockSimParams sets on a StockPanel. Returns result dicts sorted by Sortino."""
+    ordered = sorted(param_grid, key=lambda p: (p.rs_period, p.min_rs_entry, p.regime_gate_strictness))
+    chunks = [[p.to_dict() for p in ordered[i:i + chunk_size]] for i in range(0, len(ordered), chunk_size)]
+    logger.info("Starting stock sweep: %d combinations, %d stocks, %d days, %d workers",
+                len(ordered), panel.stock_prices.shape[1], len(panel.benchmark), max_workers)
+    start_time = time.time()
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_stock_worker, initargs=(panel,)) as executor:
+        futures = [executor.submit(_run_stock_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                logger.warning("Stock simulation chunk failed: %s", e)
+
+    results.sort(key=lambda x: x.get("sortino", 0), reverse=True)
+    elapsed = time.time() - start_time
+    logger.info("Stock sweep complete: %d results in %.1f min (%.0f sims/hour)",
+                len(results), elapsed / 60, len(results) / elapsed * 3600 if elapsed > 0 else 0)
+    return results
+
+
+def run_stock_lab_sweep(db: Session) -> dict:
+    """
+    Sweep the stock portfolio parameters on the stock panel. The top results
+    and the best config per regime are recorded in the STOCK run's notes.
+    """
+    from services.compass_history import load_historical_data, update_stock_panel
+    from services.compass_stock_simulator import StockPanel, generate_stock_param_grid
+
+    data = load_historical_data()
+    if not data:
+        return {"status": "error", "message": "No historical data"}
+    stocks = update_stock_panel(db, data)
+    if not stocks:
+        return {"status": "error", "message": "No stock panel data"}
+
+    lab_run = CompassLabRun(run_type="STOCK", status="RUNNING",
+                            data_start=data["dates"][0], data_end=data["dates"][-1])
+    db.add(lab_run)
+    db.commit()
+
+    try:
+        panel = StockPanel(
+            stock_prices=stocks["stock_prices"], sector_prices=data["prices"], benchmark=data["benchmark"],
+            members=stocks["members"], stock_keys=stocks["stock_keys"], sector_keys=data["sector_keys"],
+        )
+        results = run_stock_sweep(panel, generate_stock_param_grid(), max_workers=2)
+        regime_configs = extract_regime_configs(results)
+
+        lab_run.status = "COMPLETED"
+        lab_run.completed_at = datetime.now()
+        lab_run.combos_tested = len(results)
+        lab_run.best_sharpe = results[0]["sharpe"] if results else None
+        lab_run.notes = json.dumps({
+            "top": [{k: r[k] for k in ("params", "sortino", "sharpe", "cagr", "max_drawdown", "total_trades")}
+                    for r in results[:10]],
+            "regime_configs": regime_configs,
+        })
+        db.commit()
+
+        with _lab_lock:
+            _lab_status["last_sweep"] = datetime.now().isoformat()
+            _lab_status["last_sweep_type"] = "STOCK"
+            _lab_status["combos_tested_total"] += len(results)
+
+        return {
+            "status": "completed",
+            "combos_tested": len(results),
+            "type": "stock",
+            "best_params": results[0]["params"] if results else None,
+            "regime_configs": {k: v["evidence"] for k, v in regime_configs.items()},
+        }
+
+    except Exception as e:
+        lab_run.status = "FAILED"
+        lab_run.notes = str(e)[:500]
+        db.commit()
+        logger.error("Stock sweep failed: %s", e, exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
 # ─── Background Daemon ───────────────────────────────────────
 
 def _lab_daemon_loop() -> None:
@@ -633,73 +1178,208 @@ def stop_lab_daemon() -> None:
 
 # ─── Outcome Backfill (nightly job) ─────────────────────────
 
-def backfill_decision_outcomes(db: Session) -> int:
-    """
-    Backfill outcome columns on DecisionLog entries.
-    Checks 5d, 20d, 60d returns for past decisions.
-    """
-    from models import IndexPrice
+# ─── Decision Precedents ─────────────────────────────────────
+# (regime, decision, sector) -> (n, n_correct), kept in step with the outcome
+# backfill so the trader's precedent lookup is one indexed read.
 
-    # Find decisions missing outcomes that are old enough
-    pending = db.query(CompassDecisionLog).filter(
-        CompassDecisionLog.outcome_5d_return.is_(None),
-    ).all()
+PRECEDENT_MIN_SECTOR_N = 5   # below this, fall back to all sectors for the regime
 
-    updated = 0
-    today = datetime.now()
 
-    for decision in pending:
-        decision_date = datetime.strptime(decision.date, "%Y-%m-%d")
-        days_since = (today - decision_date).days
+def rebuild_decision_precedents(db: Session) -> int:
+    """Recompute the precedent tally from the whole decision log (one GROUP BY)."""
+    log = CompassDecisionLog
+    rows = (
+        db.query(log.market_regime, log.decision, log.sector_key, sqlfunc.count(log.id),
+                 sqlfunc.sum(case((log.was_correct.is_(True), 1), else_=0)))
+        .filter(log.was_correct.isnot(None), log.market_regime.isnot(None))
+        .group_by(log.market_regime, log.decision, log.sector_key)
+        .all()
+    )
+    db.query(CompassDecisionPrecedent).delete()
+    db.add_all(
+        CompassDecisionPrecedent(market_regime=regime, decision=decision, sector_key=sector,
+                                 n=n, n_correct=int(correct or 0))
+        for regime, decision, sector, n, correct in rows
+    )
+    db.flush()
+    return len(rows)
 
-        if days_since < 5:
-            continue
 
-        # Get price on decision date and future dates
-        prices = db.query(IndexPrice.date, IndexPrice.close_price).filter(
-            IndexPrice.index_name == decision.sector_key,
-            IndexPrice.date >= decision.date,
-        ).order_by(IndexPrice.date).all()
+def _apply_precedent_deltas(db: Session, deltas: dict[tuple[str, str, str], list[int]]) -> None:
+    deltas = {k: d for k, d in deltas.items() if d[0] or d[1]}
+    if not deltas:
+        return
+    existing = {
+        (p.market_regime, p.decision, p.sector_key): p
+        for p in db.query(CompassDecisionPrecedent).filter(
+            CompassDecisionPrecedent.market_regime.in_({k[0] for k in deltas}),
+            CompassDecisionPrecedent.decision.in_({k[1] for k in deltas}),
+            CompassDecisionPrecedent.sector_key.in_({k[2] for k in deltas}),
+        )
+    }
+    for key, (dn, dcorrect) in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            row = CompassDecisionPrecedent(market_regime=key[0], decision=key[1], sector_key=key[2],
+                                           n=0, n_correct=0)
+            db.add(row)
+        row.n += dn
+        row.n_correct += dcorrect
+
+
+def decision_precedent(db: Session, regime: str, decision: str, sector_key: str) -> tuple[int, float]:
+    """(n_similar, win_rate %) for past decisions with known outcomes.
+
+    Uses the sector's own tally when it has PRECEDENT_MIN_SECTOR_N outcomes,
+    otherwise all sectors in the same regime (a covering-index SUM).
+    """
+    p = CompassDecisionPrecedent
+    row = (
+        db.query(p.n, p.n_correct)
+        .filter(p.market_regime == regime, p.decision == decision, p.sector_key == sector_key)
+        .first()
+    )
+    if row is None or row.n < PRECEDENT_MIN_SECTOR_N:
+        row = (
+            db.query(sqlfunc.sum(p.n), sqlfunc.sum(p.n_correct))
+            .filter(p.market_regime == regime, p.decision == decision)
+            .one()
+        )
+    n, correct = int(row[0] or 0), int(row[1] or 0)
+    if n <= 0:
+        return 0, 0.0
+    return n, round(correct / n * 100, 1)
+
+
+# Calendar-day horizon -> DecisionLog outcome column; the judge horizon sets was_correct
+DEFAULT_OUTCOME_HORIZONS = {5: "outcome_5d_return", 20: "outcome_20d_return", 60: "outcome_60d_return"}
+OUTCOME_JUDGE_HORIZON = 20
+# Days past the longest horizon before an unresolvable outcome (no decision-date close, no
+# prices for the sector) is given up, so it stops pinning the close-matrix query to its date
+OUTCOME_GRACE_DAYS = 30
+
+
+def _judge_decision(decision: str, outcome: Optional[float]) -> Optional[bool]:
+    if outcome is None:
+        return None
+    if decision == "BUY":
+        return outcome > 0
+    if decision in ("SELL", "AVOID"):
+        return outcome <= 0
+    if decision in ("HOLD", "SKIP"):
+        return True  # neutral decisions are always "correct"
+    return None
+
+
+def backfill_decision_outcomes(
+    db: Session,
+    horizons: Optional[dict[int, str]] = None,
+    judge_horizon: int = OUTCOME_JUDGE_HORIZON,
+) -> int:
+    """
+    Backfill outcome columns on DecisionLog entries in one pass.
+
+    Every decision with an unresolved horizon is resolved against one
+    preloaded close matrix (sector x date): the return from the decision-date
+    close to the first close on/after date + N calendar days. Changed rows are
+    written with one bulk UPDATE. Decisions still unresolved OUTCOME_GRACE_DAYS
+    past the longest horizon are marked given up and not loaded again.
+    Returns the number of decisions updated.
+    """
+    from sqlalchemy import or_, update
+
+    from models import IndexPrice
 
-        if len(prices) < 2:
-            continue
+    horizons = horizons or DEFAULT_OUTCOME_HORIZONS
+    if judge_horizon not in horizons:
+        raise ValueError(f"judge_horizon {judge_horizon} is not one of the horizons {sorted(horizons)}")
+
+    if db.query(CompassDecisionPrecedent.id).first() is None:
+        rebuild_decision_precedents(db)   # first run on an existing log
+
+    log = CompassDecisionLog
+    columns = list(horizons.values())
+    today = np.datetime64(datetime.now().date())
+    cutoff = str(today - np.timedelta64(min(horizons), "D"))
+    give_up_before = str(today - np.timedelta64(max(horizons) + OUTCOME_GRACE_DAYS, "D"))
+    pending = (
+        db.query(log.id, log.date, log.sector_key, log.decision, log.market_regime, log.was_correct,
+                 *[getattr(log, c) for c in columns])
+        .filter(log.date <= cutoff, log.outcome_given_up_at.is_(None),
+                or_(*[getattr(log, c).is_(None) for c in columns]))
+        .all()
+    )
+    if not pending:
+        logger.info("Backfilled outcomes for 0 decisions")
+        return 0
+
+    # Close matrix: one query for every sector involved, from the earliest decision on
+    series: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    rows = (
+        db.query(IndexPrice.index_name, IndexPrice.date, IndexPrice.close_price)
+        .filter(
+            IndexPrice.index_name.in_({p.sector_key for p in pending}),
+            IndexPrice.date >= min(p.date for p in pending),
+            IndexPrice.close_price > 0,
+        )
+        .order_by(IndexPrice.index_name, IndexPrice.date)
+        .all()
+    )
+    by_sector: dict[str, list] = {}
+    for name, d, close in rows:
+        by_sector.setdefault(name, []).append((d, close))
+    for name, pts in by_sector.items():
+        series[name] = (np.array([d for d, _ in pts], dtype="datetime64[D]"),
+                        np.array([c for _, c in pts], dtype=float))
+
+    updates = []
+    deltas: dict[tuple[str, str, str], list[int]] = {}
+    now = datetime.now()
+    for sector, group in _group_by(pending, lambda p: p.sector_key).items():
+        returns = {}
+        if sector in series:
+            dates, closes = series[sector]
+            d0 = np.array([p.date for p in group], dtype="datetime64[D]")
+            base_idx = np.searchsorted(dates, d0)
+            has_base = base_idx < len(dates)
+            has_base[has_base] &= dates[base_idx[has_base]] == d0[has_base]
+            base = np.where(has_base, closes[np.minimum(base_idx, len(dates) - 1)], np.nan)
+
+            for h, col in horizons.items():
+                target = d0 + np.timedelta64(h, "D")
+                idx = np.searchsorted(dates, target)
+                ok = has_base & (idx < len(dates)) & (target <= today)
+                fwd = np.where(ok, closes[np.minimum(idx, len(dates) - 1)], np.nan)
+                returns[col] = np.round((fwd / base - 1) * 100, 2)
+
+        for i, p in enumerate(group):
+            values = {}
+            for col in columns:
+                current = getattr(p, col)
+                new = returns[col][i] if returns else np.nan
+                values[col] = float(new) if current is None and np.isfinite(new) else current
+            was_correct = _judge_decision(p.decision, values[horizons[judge_horizon]])
+            if was_correct is None:
+                was_correct = p.was_correct
+            given_up = now if p.date < give_up_before and any(v is None for v in values.values()) else None
+            if all(values[c] == getattr(p, c) for c in columns) and was_correct == p.was_correct and not given_up:
+                continue
+            updates.append({"id": p.id, **values, "was_correct": was_correct, "outcome_given_up_at": given_up})
+            if p.market_regime and was_correct != p.was_correct:
+                delta = deltas.setdefault((p.market_regime, p.decision, p.sector_key), [0, 0])
+                delta[0] += int(was_correct is not None) - int(p.was_correct is not None)
+                delta[1] += int(bool(was_correct)) - int(bool(p.was_correct))
+
+    if updates:
+        db.execute(update(CompassDecisionLog), updates)
+    _apply_precedent_deltas(db, deltas)
+    db.commit()
+    logger.info("Backfilled outcomes for %d of %d pending decisions", len(updates), len(pending))
+    return len(updates)
 
-        price_map = {p.date: p.close_price for p in prices if p.close_price}
-        base_price = price_map.get(decision.date)
-        if not base_price or base_price <= 0:
-            continue
 
-        dates_sorted = sorted(price_map.keys())
-        def _get_return_at_offset(offset_days: int) -> Optional[float]:
-            target = (decision_date + timedelta(days=offset_days)).strftime("%Y-%m-%d")
-            # Find closest date
-            for d in dates_sorted:
-                if d >= target:
-                    p = price_map.get(d)
-                    if p and p > 0:
-                        return round((p / base_price - 1) * 100, 2)
-                    break
-            return None
-
-        if days_since >= 5:
-            decision.outcome_5d_return = _get_return_at_offset(5)
-        if days_since >= 20:
-            decision.outcome_20d_return = _get_return_at_offset(20)
-        if days_since >= 60:
-            decision.outcome_60d_return = _get_return_at_offset(60)
-
-        # Was decision correct?
-        if decision.outcome_20d_return is not None:
-            if decision.decision in ("BUY",):
-                decision.was_correct = decision.outcome_20d_return > 0
-            elif decision.decision in ("SELL", "AVOID"):
-                decision.was_correct = decision.outcome_20d_return <= 0
-            elif decision.decision in ("HOLD", "SKIP"):
-                decision.was_correct = True  # neutral decisions are always "correct"
-
-        updated += 1
-
-    if updated:
-        db.commit()
-    logger.info("Backfilled outcomes for %d decisions", updated)
-    return updated
+def _group_by(items, key) -> dict:
+    groups: dict = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return groups
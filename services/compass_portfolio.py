@@ -19,8 +19,9 @@ import logging
 import math
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Optional
+from typing import Mapping, Optional
 
+from sqlalchemy import func as sa_func
 from sqlalchemy.orm import Session
 
 from index_constants import COMPASS_SECTOR_ETF_MAP, NSE_DISPLAY_MAP
@@ -34,6 +35,8 @@ from models import (
     IndexPrice,
     PortfolioNAV,
 )
+from services.asof_prices import latest_prices
+from services.drawdown import max_drawdown_pct
 
 logger = logging.getLogger("fie_v3.compass.portfolio")
 
@@ -559,8 +562,12 @@ def update_model_nav(db: Session) -> dict:
     return result
 
 
-def _compute_nav_for_portfolio(db: Session, portfolio_type: str) -> Optional[dict]:
-    """Compute and store today's NAV for one portfolio type."""
+def _compute_nav_for_portfolio(db: Session, portfolio_type: str, prices: Optional[Mapping] = None) -> Optional[dict]:
+    """Compute and store today's NAV for one portfolio type.
+
+    prices: {(instrument_id, instrument_type): close} already looked up —
+    only instruments missing from it are queried.
+    """
     today_str = datetime.now().strftime("%Y-%m-%d")
 
     open_positions = (
@@ -569,9 +576,15 @@ def _compute_nav_for_portfolio(db: Session, portfolio_type: str) -> Optional[dic
         .all()
     )
 
-    # Update current prices
+    # Update current prices (one batched lookup instead of one query per position)
+    known = prices or {}
+    missing = [
+        (pos.instrument_id, pos.instrument_type) for pos in open_positions
+        if (pos.instrument_id, pos.instrument_type) not in known
+    ]
+    prices = {**known, **(_get_latest_prices(db, missing) if missing else {})}
     for pos in open_positions:
-        price = _get_latest_price(db, pos.instrument_id, pos.instrument_type)
+        price = prices.get((pos.instrument_id, pos.instrument_type))
         if price:
             pos.current_price = price
 
@@ -619,27 +632,30 @@ def _compute_nav_for_portfolio(db: Session, portfolio_type: str) -> Optional[dic
 
     cash_pct = max(0, 100 - sum((p.weight_pct or 0) for p in open_positions))
 
-    # Max drawdown (running)
-    all_navs = (
-        db.query(CompassModelNAV.nav)
-        .filter(CompassModelNAV.portfolio_type == portfolio_type)
-        .order_by(CompassModelNAV.date)
-        .all()
+    # Max drawdown (running): carry forward the last stored value and peak
+    # instead of rescanning every CompassModelNAV row
+    prev = (
+        db.query(CompassModelNAV.max_drawdown)
+        .filter(CompassModelNAV.portfolio_type == portfolio_type, CompassModelNAV.date < today_str)
+        .order_by(CompassModelNAV.date.desc())
+        .first()
     )
-    peak = 100
-    max_dd = 0
-    for row in all_navs:
-        if row.nav > peak:
-            peak = row.nav
-        dd = (peak - row.nav) / peak * 100 if peak > 0 else 0
-        if dd > max_dd:
-            max_dd = dd
-    # Include today
-    if nav > peak:
-        peak = nav
-    dd_today = (peak - nav) / peak * 100 if peak > 0 else 0
-    if dd_today > max_dd:
-        max_dd = dd_today
+    if prev is not None and prev.max_drawdown is not None:
+        prev_peak = (
+            db.query(sa_func.max(CompassModelNAV.nav))
+            .filter(CompassModelNAV.portfolio_type == portfolio_type, CompassModelNAV.date < today_str)
+            .scalar()
+        )
+        peak = max(100, prev_peak or 100)
+        max_dd = max(prev.max_drawdown, max_drawdown_pct([nav], initial_peak=peak))
+    else:
+        history = [
+            r.nav for r in db.query(CompassModelNAV.nav)
+            .filter(CompassModelNAV.portfolio_type == portfolio_type, CompassModelNAV.date < today_str)
+            .order_by(CompassModelNAV.date)
+            .all()
+        ]
+        max_dd = max_drawdown_pct(history + [nav], initial_peak=100)
 
     # Upsert
     existing_nav = (
@@ -680,32 +696,20 @@ def _compute_holding_days(entry_date_str: str) -> int:
         return 0
 
 
+def _get_latest_prices(db: Session, instruments) -> dict:
+    """{(instrument_id, instrument_type): latest close} — one as-of lookup per instrument type."""
+    by_type: dict[str, list[str]] = {}
+    for instrument_id, instrument_type in instruments:
+        by_type.setdefault(instrument_type, []).append(instrument_id)
+    prices = {}
+    for instrument_type, ids in by_type.items():
+        if instrument_type not in ("etf", "stock", "index"):
+            continue
+        for instrument_id, p in latest_prices(db, ids, source=instrument_type).items():
+            prices[(instrument_id, instrument_type)] = p.close
+    return prices
+
+
 def _get_latest_price(db: Session, instrument_id: str, instrument_type: str) -> Optional[float]:
     """Get the most recent close price for an instrument."""
-    from models import CompassETFPrice, CompassStockPrice
-
-    if instrument_type == "etf":
-        row = (
-            db.query(CompassETFPrice)
-            .filter(CompassETFPrice.ticker == instrument_id)
-            .order_by(CompassETFPrice.date.desc())
-            .first()
-        )
-        return row.close if row else None
-    elif instrument_type == "stock":
-        row = (
-            db.query(CompassStockPrice)
-            .filter(CompassStockPrice.ticker == instrument_id)
-            .order_by(CompassStockPrice.date.desc())
-            .first()
-        )
-        return row.close if row else None
-    elif instrument_type == "index":
-        row = (
-            db.query(IndexPrice)
-            .filter(IndexPrice.index_name == instrument_id)
-            .order_by(IndexPrice.date.desc())
-            .first()
-        )
-        return row.close_price if row else None
-    return None
+    return _get_latest_prices(db, [(instrument_id, instrument_type)]).get((instrument_id, instrument_type))
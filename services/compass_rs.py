@@ -13,6 +13,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from sqlalchemy import func as sqlfunc
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
 from index_constants import (
@@ -33,6 +34,7 @@ from models import (
     IndexConstituent,
     IndexPrice,
 )
+from services.fundamentals import pe_ratios, sector_pe_ratios
 
 logger = logging.getLogger("fie_v3.compass.rs")
 
@@ -481,8 +483,8 @@ def compute_sector_rs_scores(
         if past_rel is not None:
             past_rs_map[sector_key] = past_rel
 
-    # Step 3: fetch P/E ratios (cached)
-    pe_cache = _get_cached_sector_pe(db)
+    # Step 3: P/E ratios from the fundamentals store
+    pe_cache = sector_pe_ratios(db, [k for k, _, _ in sector_data])
 
     # Step 4: market regime — is NIFTY in bull/bear/correction?
     market_regime = _compute_market_regime(benchmark_closes)
@@ -623,9 +625,8 @@ def compute_stock_rs_scores(
         if past_rel is not None:
             past_rs_map[c.ticker] = past_rel
 
-    # Step 3: fetch P/E for stocks (threaded)
-    stock_tickers = [t for t, _, _, _ in stock_data]
-    pe_map = fetch_pe_ratios_for_stocks(stock_tickers)
+    # Step 3: P/E for stocks from the fundamentals store
+    pe_map = pe_ratios(db, [t for t, _, _, _ in stock_data])
 
     # Step 4: market regime + absolute returns for stocks
     benchmark_closes = _get_index_close_map(db, base_index, days=period_days + TRADING_DAYS_4W + 60)
@@ -723,14 +724,9 @@ def compute_etf_rs_scores(
 
     market_regime = _compute_market_regime(benchmark_closes)
 
-    # Step 3: P/E — use sector P/E cache (ETF inherits parent sector's P/E)
-    sector_pe_cache = _get_cached_sector_pe(db)
-
-    # Also try to fetch P/E directly for ETFs without a sector mapping
-    etf_tickers_no_sector = [t for t, ps, _ in etf_data if not ps]
-    etf_direct_pe: dict[str, Optional[float]] = {}
-    if etf_tickers_no_sector:
-        etf_direct_pe = _fetch_etf_pe_ratios(etf_tickers_no_sector)
+    # Step 3: P/E — ETF inherits parent sector's P/E, unmapped ETFs use their own
+    sector_pe_cache = sector_pe_ratios(db, {ps for _, ps, _ in etf_data if ps})
+    etf_direct_pe = pe_ratios(db, [t for t, ps, _ in etf_data if not ps])
 
     results = []
     for ticker, parent_sector, rs_score in etf_data:
@@ -803,171 +799,60 @@ def compute_annualized_volatility(closes: dict[str, float], lookback: int = 60)
     return round(daily_vol * (252 ** 0.5) * 100, 2)  # annualized, as %
 
 
+# Columns refreshed when a (date, instrument_id, instrument_type) row already exists
+_RS_UPDATE_COLUMNS = (
+    "rs_score", "rs_momentum", "volume_signal", "quadrant", "action",
+    "relative_return", "pe_ratio", "stop_loss_pct",
+)
+# Rows per statement — 13 columns each stays under SQLite's bound-parameter limit
+_RS_UPSERT_CHUNK = 1000
+
+
 def persist_rs_scores(db: Session, scores: list[dict], instrument_type: str, date_str: Optional[str] = None) -> int:
-    """Save computed RS scores to compass_rs_scores table."""
+    """Upsert a day's RS scores for one instrument type in a single statement.
+
+    INSERT ... ON CONFLICT (date, instrument_id, instrument_type) DO UPDATE,
+    where the update only fires for rows whose values actually changed.
+    Returns the number of scores written or already up to date.
+    """
     if not date_str:
         date_str = datetime.now().strftime("%Y-%m-%d")
 
-    stored = 0
+    rows: dict[str, dict] = {}
     for s in scores:
         inst_id = s.get("sector_key") or s.get("ticker", "")
-        existing = (
-            db.query(CompassRSScore)
-            .filter_by(date=date_str, instrument_id=inst_id, instrument_type=instrument_type)
-            .first()
-        )
-        if existing:
-            existing.rs_score = s["rs_score"]
-            existing.rs_momentum = s["rs_momentum"]
-            existing.volume_signal = s.get("volume_signal")
-            existing.quadrant = s["quadrant"]
-            existing.action = s["action"]
-            existing.relative_return = s.get("relative_return")
-            existing.pe_ratio = s.get("pe_ratio")
-            existing.stop_loss_pct = s.get("stop_loss_pct")
-        else:
-            db.add(CompassRSScore(
-                date=date_str,
-                instrument_id=inst_id,
-                instrument_type=instrument_type,
-                parent_sector=s.get("parent_sector"),
-                rs_score=s["rs_score"],
-                rs_momentum=s["rs_momentum"],
-                volume_signal=s.get("volume_signal"),
-                quadrant=s["quadrant"],
-                action=s["action"],
-                relative_return=s.get("relative_return"),
-                pe_ratio=s.get("pe_ratio"),
-                market_cap_cr=s.get("market_cap_cr"),
-                stop_loss_pct=s.get("stop_loss_pct"),
-            ))
-        stored += 1
+        rows[inst_id] = {    # last one wins: ON CONFLICT cannot touch a row twice
+            "date": date_str,
+            "instrument_id": inst_id,
+            "instrument_type": instrument_type,
+            "parent_sector": s.get("parent_sector"),
+            "rs_score": s["rs_score"],
+            "rs_momentum": s["rs_momentum"],
+            "volume_signal": s.get("volume_signal"),
+            "quadrant": s["quadrant"],
+            "action": s["action"],
+            "relative_return": s.get("relative_return"),
+            "pe_ratio": s.get("pe_ratio"),
+            "market_cap_cr": s.get("market_cap_cr"),
+            "stop_loss_pct": s.get("stop_loss_pct"),
+        }
+    if not rows:
+        return 0
 
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    table = CompassRSScore.__table__
+    values = list(rows.values())
+    for i in range(0, len(values), _RS_UPSERT_CHUNK):
+        stmt = dialect_insert(CompassRSScore).values(values[i:i + _RS_UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["date", "instrument_id", "instrument_type"],
+            set_={col: stmt.excluded[col] for col in _RS_UPDATE_COLUMNS},
+            where=or_(*[table.c[col].is_distinct_from(stmt.excluded[col]) for col in _RS_UPDATE_COLUMNS]),
+        )
+        db.execute(stmt)
     db.commit()
-    return stored
-
-
-# ─── P/E Cache ────────────────────────────────────────
-# P/E ratios from yfinance are slow (1 call per index).
-# Cache for 24h so they only refresh once daily.
-_pe_cache: dict[str, Optional[float]] = {}
-_pe_cache_ts: float = 0
-PE_CACHE_TTL = 86400  # 24 hours
-
-
-def _get_cached_sector_pe(db: Session) -> dict[str, Optional[float]]:
-    """Get P/E ratios for sector indices, cached for 24h."""
-    import time
-    global _pe_cache, _pe_cache_ts
-
-    if _pe_cache and (time.time() - _pe_cache_ts) < PE_CACHE_TTL:
-        return _pe_cache
-
-    # Fetch in background — don't block if it fails
-    try:
-        sector_keys = [sk for sk, _ in COMPASS_SECTOR_INDICES]
-        _pe_cache = fetch_pe_ratios_for_sectors(sector_keys)
-        _pe_cache_ts = time.time()
-        logger.info("P/E cache refreshed: %d sectors", len(_pe_cache))
-    except Exception as e:
-        logger.warning("P/E cache refresh failed: %s", e)
-
-    return _pe_cache
-
-
-def fetch_pe_ratios_for_sectors(sector_keys: list[str]) -> dict[str, Optional[float]]:
-    """Fetch P/E ratios for sector indices via yfinance.
-
-    Strategy: try index ticker first, then fall back to sector ETF's P/E.
-    ETFs usually have trailingPE even when index tickers don't.
-    """
-    from index_constants import NSE_TICKER_MAP
-    import yfinance as yf
-    from concurrent.futures import ThreadPoolExecutor
-
-    result: dict[str, Optional[float]] = {}
-
-    def _fetch_pe(key: str) -> tuple[str, Optional[float]]:
-        # Try 1: index ticker (e.g. ^CNXPHARMA)
-        yf_symbol = NSE_TICKER_MAP.get(key)
-        if yf_symbol:
-            try:
-                info = yf.Ticker(yf_symbol).info
-                pe = info.get("trailingPE") or info.get("forwardPE")
-                if pe:
-                    return key, round(float(pe), 2)
-            except Exception:
-                pass
-
-        # Try 2: sector ETF (e.g. PHARMABEES.NS)
-        etfs = COMPASS_SECTOR_ETF_MAP.get(key, [])
-        for etf_ticker in etfs:
-            try:
-                info = yf.Ticker(f"{etf_ticker}.NS").info
-                pe = info.get("trailingPE") or info.get("forwardPE")
-                if pe:
-                    return key, round(float(pe), 2)
-            except Exception:
-                pass
-
-        return key, None
-
-    with ThreadPoolExecutor(max_workers=8) as pool:
-        futures = [pool.submit(_fetch_pe, k) for k in sector_keys]
-        for f in futures:
-            key, pe = f.result()
-            result[key] = pe
-
-    return result
-
-
-def _fetch_etf_pe_ratios(tickers: list[str]) -> dict[str, Optional[float]]:
-    """Fetch P/E ratios for ETFs directly via yfinance (for ETFs without a sector mapping)."""
-    import yfinance as yf
-    from concurrent.futures import ThreadPoolExecutor
-
-    result: dict[str, Optional[float]] = {}
-
-    def _fetch_one(ticker: str) -> tuple[str, Optional[float]]:
-        try:
-            info = yf.Ticker(f"{ticker}.NS").info
-            if info is None:
-                return ticker, None
-            pe = info.get("trailingPE") or info.get("forwardPE")
-            return ticker, round(float(pe), 2) if pe else None
-        except Exception:
-            return ticker, None
-
-    with ThreadPoolExecutor(max_workers=8) as pool:
-        futures = [pool.submit(_fetch_one, t) for t in tickers]
-        for f in futures:
-            ticker, pe = f.result()
-            result[ticker] = pe
-
-    return result
-
-
-def fetch_pe_ratios_for_stocks(tickers: list[str]) -> dict[str, Optional[float]]:
-    """Fetch P/E ratios for stocks via yfinance in batches."""
-    import yfinance as yf
-    from concurrent.futures import ThreadPoolExecutor
-
-    result: dict[str, Optional[float]] = {}
-
-    def _fetch_one(ticker: str) -> tuple[str, Optional[float]]:
-        try:
-            info = yf.Ticker(f"{ticker}.NS").info
-            if info is None:
-                return ticker, None
-            pe = info.get("trailingPE") or info.get("forwardPE")
-            return ticker, round(float(pe), 2) if pe else None
-        except Exception:
-            return ticker, None
-
-    with ThreadPoolExecutor(max_workers=8) as pool:
-        futures = [pool.submit(_fetch_one, t) for t in tickers]
-        for f in futures:
-            ticker, pe = f.result()
-            result[ticker] = pe
-
-    return result
+    return len(rows)
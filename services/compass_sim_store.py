@@ -0,0 +1,172 @@
+"""
+Compass Lab — Simulation Result Store
+Content-addressed cache for sweep results, so a Lab run only simulates what
+changed since the last one.
+
+A stored result is keyed by (param_hash, data_fingerprint, SIMULATOR_VERSION),
+where the fingerprint is a sha1 of the exact price slice simulated. For each
+combo a sweep then does one of:
+  - reuse     same key stored (data unchanged since the last sweep)
+  - extend    a stored slice for the same params is a prefix of this one
+              (history only grew) — resume its SimState over the new days
+  - simulate  from scratch (new params, revised history, new simulator)
+Every simulated run is saved with its end state; the row it extended is
+deleted. Rows older than STORE_RETENTION_DAYS are pruned.
+
+Walk-forward scores are stored under a variant version
+("<SIMULATOR_VERSION>/wf<train>x<test>") and are only ever reused, not extended.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from models import CompassSimResult
+from services.compass_simulator import SIMULATOR_VERSION
+
+logger = logging.getLogger("fie_v3.compass.sim_store")
+
+STORE_RETENTION_DAYS = 7
+# param hashes per IN (...) query
+_CHUNK = 500
+
+
+def data_fingerprint(prices: np.ndarray, benchmark: np.ndarray, sector_keys: Iterable[str]) -> str:
+    """sha1 over the price slice a simulation sees."""
+    h = hashlib.sha1()
+    h.update("|".join(sector_keys).encode())
+    h.update(np.ascontiguousarray(prices, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(benchmark, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _chunks(items: List[str]) -> Iterable[List[str]]:
+    for i in range(0, len(items), _CHUNK):
+        yield items[i:i + _CHUNK]
+
+
+def lookup(
+    db: Session, param_hashes: List[str], fingerprint: str, version: str = SIMULATOR_VERSION,
+) -> Dict[str, dict]:
+    """{param_hash: result dict} stored for exactly this data and simulator."""
+    hits: Dict[str, dict] = {}
+    for chunk in _chunks(param_hashes):
+        rows = (
+            db.query(CompassSimResult.param_hash, CompassSimResult.result)
+            .filter(
+                CompassSimResult.param_hash.in_(chunk),
+                CompassSimResult.data_fingerprint == fingerprint,
+                CompassSimResult.simulator_version == version,
+            )
+            .all()
+        )
+        hits.update({h: json.loads(result) for h, result in rows})
+    return hits
+
+
+def resumable(
+    db: Session,
+    param_hashes: List[str],
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: List[str],
+) -> Dict[str, Tuple[int, str]]:
+    """{param_hash: (row id, SimState JSON)} for stored runs over a prefix of this data."""
+    n_days = len(benchmark)
+    candidates: Dict[str, List[Tuple[int, int, str]]] = {}   # hash -> [(n_days, id, fingerprint)]
+    for chunk in _chunks(param_hashes):
+        rows = (
+            db.query(CompassSimResult.param_hash, CompassSimResult.n_days,
+                     CompassSimResult.id, CompassSimResult.data_fingerprint)
+            .filter(
+                CompassSimResult.param_hash.in_(chunk),
+                CompassSimResult.simulator_version == SIMULATOR_VERSION,
+                CompassSimResult.n_days < n_days,
+                CompassSimResult.state.isnot(None),
+            )
+            .all()
+        )
+        for h, days, row_id, fp in rows:
+            candidates.setdefault(h, []).append((days, row_id, fp))
+    if not candidates:
+        return {}
+
+    # One fingerprint per distinct stored length (normally one or two)
+    prefix_fp = {
+        days: data_fingerprint(prices[:days], benchmark[:days], sector_keys)
+        for days in {days for rows in candidates.values() for days, _, _ in rows}
+    }
+    matched: Dict[int, str] = {}
+    for h, rows in candidates.items():
+        for days, row_id, fp in sorted(rows, reverse=True):
+            if prefix_fp[days] == fp:
+                matched[row_id] = h
+                break
+    if not matched:
+        return {}
+
+    states: Dict[str, Tuple[int, str]] = {}
+    ids = list(matched)
+    for i in range(0, len(ids), _CHUNK):
+        for row_id, state in (
+            db.query(CompassSimResult.id, CompassSimResult.state)
+            .filter(CompassSimResult.id.in_(ids[i:i + _CHUNK]))
+            .all()
+        ):
+            states[matched[row_id]] = (row_id, state)
+    return states
+
+
+def save(
+    db: Session,
+    results: List[dict],
+    fingerprint: str,
+    n_days: int,
+    superseded: List[int] = (),
+    version: str = SIMULATOR_VERSION,
+) -> int:
+    """Store freshly simulated results (popping their "state"), drop the rows they extended,
+    prune old rows. Returns rows stored."""
+    now = datetime.now()
+    rows = []
+    for r in results:
+        state = r.pop("state", None)
+        rows.append({
+            "param_hash": r["param_hash"], "data_fingerprint": fingerprint,
+            "simulator_version": version, "n_days": n_days,
+            "result": json.dumps(r), "state": state, "created_at": now,
+        })
+    superseded = list(superseded)
+    for i in range(0, len(superseded), _CHUNK):
+        db.execute(delete(CompassSimResult).where(CompassSimResult.id.in_(superseded[i:i + _CHUNK])))
+    # A result for this exact key may already exist (e.g. a concurrent sweep) — replace it
+    hashes = [r["param_hash"] for r in rows]
+    for chunk in _chunks(hashes):
+        db.execute(delete(CompassSimResult).where(
+            CompassSimResult.param_hash.in_(chunk),
+            CompassSimResult.data_fingerprint == fingerprint,
+            CompassSimResult.simulator_version == version,
+        ))
+    if rows:
+        db.execute(insert(CompassSimResult), rows)
+    pruned = prune(db)
+    db.commit()
+    logger.info("Sim store: %d stored, %d extended rows replaced, %d pruned", len(rows), len(superseded), pruned)
+    return len(rows)
+
+
+def prune(db: Session, keep_days: int = STORE_RETENTION_DAYS) -> int:
+    """Delete rows older than keep_days or from another simulator version (variants included)."""
+    cutoff = datetime.now() - timedelta(days=keep_days)
+    current = (CompassSimResult.simulator_version == SIMULATOR_VERSION) | (
+        CompassSimResult.simulator_version.like(f"{SIMULATOR_VERSION}/%")
+    )
+    return db.execute(delete(CompassSimResult).where(
+        (CompassSimResult.created_at < cutoff) | ~current
+    )).rowcount
@@ -10,12 +10,19 @@ Usage:
     benchmark = np.array(...)       # shape (n_days,)
     params = SimParams(stop_loss_pct=8.0, ...)
     result = simulate(prices, benchmark, sector_keys, params)
+
+Metrics are built from running statistics, and every result carries the
+end-of-run SimState. simulate(..., resume=state) on the same history plus
+new days picks up where that run stopped and only walks the new days.
+
+simulate_walk_forward() scores one run on rolling train/test folds.
 """
 
+import json
 import logging
 import math
-from dataclasses import dataclass, field
-from typing import Optional
+from dataclasses import asdict, dataclass, field
+from typing import NamedTuple, Optional
 
 import numpy as np
 
@@ -25,6 +32,10 @@ logger = logging.getLogger("fie_v3.compass.simulator")
 
 PERIOD_DAYS = {"1M": 21, "2M": 42, "3M": 63, "6M": 126, "12M": 252}
 
+# Bump whenever simulate() can produce different results for the same inputs —
+# stored Lab results and end states are keyed on it.
+SIMULATOR_VERSION = "2"
+
 
 # ─── Simulation Parameters ──────────────────────────────────
 
@@ -113,8 +124,9 @@ class SimResult:
     avg_win: float = 0.0
     avg_loss: float = 0.0
     regime_metrics: dict = field(default_factory=dict)  # regime_name → RegimeMetrics
-    nav_curve: Optional[np.ndarray] = None
-    trades: list = field(default_factory=list)
+    nav_curve: Optional[np.ndarray] = None   # days walked by this call (only the new ones when resumed)
+    trades: list = field(default_factory=list)   # likewise
+    state: Optional["SimState"] = None
 
     def to_dict(self) -> dict:
         return {
@@ -149,6 +161,130 @@ class _Position:
     regime_at_entry: str = ""
 
 
+# ─── Running Statistics (metrics without keeping every day) ─
+
+def _std(n: int, total: float, sq: float) -> float:
+    """Population std from count / sum / sum of squares (0 when all values are equal)."""
+    if n == 0:
+        return 0.0
+    mean_sq = sq / n
+    var = mean_sq - (total / n) ** 2
+    return math.sqrt(var) if var > 1e-12 * mean_sq else 0.0
+
+
+@dataclass
+class _Moments:
+    """Count, sum and sum of squares of a series, and of its negative values."""
+    n: int = 0
+    total: float = 0.0
+    sq: float = 0.0
+    neg_n: int = 0
+    neg_total: float = 0.0
+    neg_sq: float = 0.0
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        self.total += x
+        self.sq += x * x
+        if x < 0:
+            self.neg_n += 1
+            self.neg_total += x
+            self.neg_sq += x * x
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.n if self.n else 0.0
+
+    @property
+    def std(self) -> float:
+        return _std(self.n, self.total, self.sq)
+
+    @property
+    def neg_std(self) -> float:
+        return _std(self.neg_n, self.neg_total, self.neg_sq)
+
+
+@dataclass
+class _NavStats:
+    days: int = 0
+    first: float = 0.0
+    last: float = 0.0
+    peak: float = 0.0
+    max_drawdown: float = 0.0
+    returns: _Moments = field(default_factory=_Moments)
+
+    @classmethod
+    def of(cls, navs: np.ndarray) -> "_NavStats":
+        """Statistics of a whole NAV series at once (same result as add() per value)."""
+        if len(navs) == 0:
+            return cls()
+        rets = np.diff(navs) / navs[:-1]
+        neg = rets[rets < 0]
+        peak = np.maximum.accumulate(navs)
+        return cls(
+            days=len(navs), first=float(navs[0]), last=float(navs[-1]), peak=float(peak[-1]),
+            max_drawdown=float(np.max((peak - navs) / peak * 100)),
+            returns=_Moments(n=len(rets), total=float(rets.sum()), sq=float(rets @ rets),
+                             neg_n=len(neg), neg_total=float(neg.sum()), neg_sq=float(neg @ neg)),
+        )
+
+    def add(self, nav: float) -> None:
+        if self.days:
+            self.returns.add((nav - self.last) / self.last)
+        else:
+            self.first = self.peak = nav
+        self.days += 1
+        self.last = nav
+        self.peak = max(self.peak, nav)
+        self.max_drawdown = max(self.max_drawdown, (self.peak - nav) / self.peak * 100)
+
+
+@dataclass
+class _TradeStats:
+    pnl: _Moments = field(default_factory=_Moments)
+    wins: int = 0
+    win_total: float = 0.0
+    holding_days: int = 0
+
+    def add(self, pnl_pct: float, holding_days: int) -> None:
+        self.pnl.add(pnl_pct)
+        self.holding_days += holding_days
+        if pnl_pct > 0:
+            self.wins += 1
+            self.win_total += pnl_pct
+
+
+@dataclass
+class SimState:
+    """Where a run stopped: open positions, cash and the running statistics.
+    Only valid for resuming on the same history it was built from (plus new days)."""
+    next_day: int
+    cash: float
+    positions: list
+    allocations: dict              # sector_idx → capital allocated at entry
+    nav: _NavStats
+    trade_stats: dict              # "ALL" and each regime name → _TradeStats
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "SimState":
+        d = json.loads(raw)
+
+        def trade_stats(t: dict) -> _TradeStats:
+            return _TradeStats(**{**t, "pnl": _Moments(**t["pnl"])})
+
+        return cls(
+            next_day=d["next_day"],
+            cash=d["cash"],
+            positions=[_Position(**p) for p in d["positions"]],
+            allocations={int(k): v for k, v in d["allocations"].items()},
+            nav=_NavStats(**{**d["nav"], "returns": _Moments(**d["nav"]["returns"])}),
+            trade_stats={k: trade_stats(v) for k, v in d["trade_stats"].items()},
+        )
+
+
 # ─── Regime Detection (vectorized) ──────────────────────────
 
 def detect_regimes_vectorized(benchmark: np.ndarray) -> np.ndarray:
@@ -256,6 +392,71 @@ def evaluate_gates(
     return action
 
 
+def gate_masks(
+    absolute_return: np.ndarray,
+    rs_score: np.ndarray,
+    momentum: np.ndarray,
+    regimes: np.ndarray,
+    min_rs: float,
+    strictness: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    evaluate_gates() over whole (n_days, n_instruments) arrays.
+    Returns (buy, exit) masks — exit is SELL or AVOID; both are False where
+    any input is NaN. regimes has shape (n_days,).
+    """
+    valid = ~(np.isnan(absolute_return) | np.isnan(rs_score) | np.isnan(momentum))
+    g1 = absolute_return > 0
+    g2 = rs_score > min_rs
+    g3 = momentum > 0
+    buy_allowed = regimes != 3
+    if strictness == "strict":
+        buy_allowed &= regimes != 2
+    buy = valid & g1 & g2 & g3 & buy_allowed[:, np.newaxis]
+    exit_ = valid & ~g3 & ~(g1 & g2)
+    return buy, exit_
+
+
+# ─── Signal Pre-computation (vectorized) ────────────────────
+
+def rs_signals(
+    prices: np.ndarray,
+    base: np.ndarray,
+    lookback: int,
+    momentum_window: int = 20,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Absolute return, RS and momentum for every day × instrument, in %.
+
+    prices: (n_days, n) closes; 0 where an instrument has no price yet.
+    base: (n_days,) benchmark, or (n_days, n) per-instrument benchmark.
+    RS = return - base return over lookback; momentum = RS - RS momentum_window
+    days earlier. NaN until enough history.
+    """
+    n_days = len(prices)
+    past_prices = prices[:-lookback]
+    curr_prices = prices[lookback:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets_block = np.where(past_prices > 0, (curr_prices / past_prices - 1) * 100, np.nan)
+    returns = np.full(prices.shape, np.nan)
+    returns[lookback:] = rets_block
+
+    past_base = base[:-lookback]
+    curr_base = base[lookback:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base_block = np.where(past_base > 0, (curr_base / past_base - 1) * 100, np.nan)
+    base_returns = np.full(base.shape, np.nan)
+    base_returns[lookback:] = base_block
+    if base_returns.ndim == 1:
+        base_returns = base_returns[:, np.newaxis]
+
+    rs = returns - base_returns
+
+    momentum = np.full(prices.shape, np.nan)
+    momentum[lookback + momentum_window:] = rs[lookback + momentum_window:] - rs[lookback:n_days - momentum_window]
+    return returns, rs, momentum
+
+
 # ─── Core Simulator ─────────────────────────────────────────
 
 def simulate(
@@ -263,6 +464,7 @@ def simulate(
     benchmark: np.ndarray,
     sector_keys: list[str],
     params: SimParams,
+    resume: Optional[SimState] = None,
 ) -> SimResult:
     """
     Replay gate engine across full price history with given parameters.
@@ -272,9 +474,11 @@ def simulate(
         benchmark: shape (n_days,) — benchmark (NIFTY) daily closes
         sector_keys: list of sector key names, length = n_sectors
         params: simulation parameters
+        resume: end state of an earlier run of the same params whose history
+            is a prefix of this one — only days from resume.next_day are walked
 
     Returns:
-        SimResult with full metrics, NAV curve, and trade list
+        SimResult with full metrics, NAV curve, trade list and end state
     """
     n_days, n_sectors = prices.shape
     lookback = PERIOD_DAYS.get(params.rs_period, 63)
@@ -292,42 +496,21 @@ def simulate(
     regimes = detect_regimes_vectorized(benchmark)
 
     # Pre-compute returns, RS scores, momentum — FULLY VECTORIZED
-    # Sector returns: prices[i] / prices[i - lookback] - 1
-    past_prices = prices[:-lookback]    # shape (n_days - lookback, n_sectors)
-    curr_prices = prices[lookback:]     # shape (n_days - lookback, n_sectors)
-    with np.errstate(divide='ignore', invalid='ignore'):
-        sector_rets_block = np.where(past_prices > 0, (curr_prices / past_prices - 1) * 100, np.nan)
-
-    sector_returns = np.full((n_days, n_sectors), np.nan)
-    sector_returns[lookback:] = sector_rets_block
-
-    # Benchmark returns
-    past_bench = benchmark[:-lookback]
-    curr_bench = benchmark[lookback:]
-    with np.errstate(divide='ignore', invalid='ignore'):
-        bench_rets_block = np.where(past_bench > 0, (curr_bench / past_bench - 1) * 100, np.nan)
-    bench_returns = np.full(n_days, np.nan)
-    bench_returns[lookback:] = bench_rets_block
-
-    # RS = sector return - benchmark return (broadcast)
-    rs_scores = sector_returns - bench_returns[:, np.newaxis]
-
-    # Momentum = RS[day] - RS[day - 20]
-    momentum = np.full((n_days, n_sectors), np.nan)
-    momentum[lookback + momentum_window:] = (
-        rs_scores[lookback + momentum_window:] - rs_scores[lookback:-momentum_window]
-    )
+    sector_returns, rs_scores, momentum = rs_signals(prices, benchmark, lookback, momentum_window)
 
     # ── Walk forward day by day ──────────────────────────────
-    start_day = lookback + momentum_window
-    positions: list[_Position] = []
+    state = SimState.from_json(resume.to_json()) if resume else SimState(
+        next_day=lookback + momentum_window, cash=1_000_000.0, positions=[], allocations={},
+        nav=_NavStats(), trade_stats={k: _TradeStats() for k in ("ALL", *REGIME_NAMES.values())},
+    )
+    positions: list[_Position] = state.positions
     trades: list[SimTrade] = []
     nav_values: list[float] = []
     initial_capital = 1_000_000.0  # ₹10L notional
-    cash = initial_capital
-    position_value_at_entry: dict[int, float] = {}  # sector_idx → value allocated
+    cash = state.cash
+    position_value_at_entry: dict[int, float] = state.allocations  # sector_idx → value allocated
 
-    for day in range(start_day, n_days):
+    for day in range(state.next_day, n_days):
         regime = regimes[day]
         current_prices = prices[day]
 
@@ -371,6 +554,8 @@ def simulate(
                     pnl_pct=pnl_pct, holding_days=holding_d,
                     exit_reason=exit_reason,
                 ))
+                state.trade_stats["ALL"].add(pnl_pct, holding_d)
+                state.trade_stats[REGIME_NAMES[regime]].add(pnl_pct, holding_d)
                 # Return capital + P&L
                 allocated = position_value_at_entry.get(pos.sector_idx, initial_capital / params.max_positions)
                 cash += allocated * (1 + pnl_pct / 100)
@@ -449,92 +634,188 @@ def simulate(
                 port_value += allocated * pnl_ratio
         nav = (port_value / initial_capital) * 100  # base 100
         nav_values.append(nav)
+        state.nav.add(nav)
+
+    state.next_day = max(state.next_day, n_days)
+    state.cash = cash
+
+    result = _summarize(params, state.nav, state.trade_stats)
+    result.nav_curve = np.array(nav_values) if nav_values else np.array([100.0])
+    result.trades = trades
+    result.state = state
+    return result
 
-    # ── Compute aggregate metrics ────────────────────────────
-    nav_arr = np.array(nav_values) if nav_values else np.array([100.0])
-    sell_trades = [t for t in trades if t.side == "SELL"]
+
+def _summarize(params: SimParams, nav_stats: _NavStats, trade_stats: dict) -> SimResult:
+    """SimResult metrics from running NAV / trade statistics."""
+    all_trades: _TradeStats = trade_stats["ALL"]
 
     result = SimResult(
         param_hash=params.param_hash(),
         params=params.to_dict(),
-        total_trades=len(sell_trades),
-        nav_curve=nav_arr,
-        trades=trades,
+        total_trades=all_trades.pnl.n,
     )
 
-    if len(nav_arr) > 1:
-        result.total_return = float(nav_arr[-1] / nav_arr[0] - 1) * 100
+    if nav_stats.days > 1:
+        result.total_return = float(nav_stats.last / nav_stats.first - 1) * 100
 
         # CAGR
-        years = len(nav_arr) / 252
-        if years > 0 and nav_arr[0] > 0 and nav_arr[-1] > 0:
-            result.cagr = float((nav_arr[-1] / nav_arr[0]) ** (1 / years) - 1) * 100
+        years = nav_stats.days / 252
+        if years > 0 and nav_stats.first > 0 and nav_stats.last > 0:
+            result.cagr = float((nav_stats.last / nav_stats.first) ** (1 / years) - 1) * 100
 
         # Sharpe (daily returns annualized)
-        daily_returns = np.diff(nav_arr) / nav_arr[:-1]
-        if len(daily_returns) > 1 and np.std(daily_returns) > 0:
-            result.sharpe = float(
-                np.mean(daily_returns) / np.std(daily_returns) * np.sqrt(252)
-            )
+        daily = nav_stats.returns
+        if daily.n > 1 and daily.std > 0:
+            result.sharpe = float(daily.mean / daily.std * np.sqrt(252))
 
         # Sortino (downside deviation only)
-        downside = daily_returns[daily_returns < 0]
-        if len(downside) > 1:
-            downside_std = float(np.std(downside))
-            if downside_std > 0:
-                result.sortino = float(
-                    np.mean(daily_returns) / downside_std * np.sqrt(252)
-                )
+        if daily.neg_n > 1 and daily.neg_std > 0:
+            result.sortino = float(daily.mean / daily.neg_std * np.sqrt(252))
 
         # Max drawdown
-        peak = np.maximum.accumulate(nav_arr)
-        drawdowns = (peak - nav_arr) / peak * 100
-        result.max_drawdown = float(np.max(drawdowns))
+        result.max_drawdown = float(nav_stats.max_drawdown)
 
     # Win rate, avg win/loss, profit factor
-    if sell_trades:
-        wins = [t for t in sell_trades if t.pnl_pct > 0]
-        losses = [t for t in sell_trades if t.pnl_pct <= 0]
-        result.win_rate = len(wins) / len(sell_trades) * 100
-
-        if wins:
-            result.avg_win = sum(t.pnl_pct for t in wins) / len(wins)
-        if losses:
-            result.avg_loss = sum(t.pnl_pct for t in losses) / len(losses)
-
-        total_win = sum(t.pnl_pct for t in wins) if wins else 0
-        total_loss = abs(sum(t.pnl_pct for t in losses)) if losses else 0
+    n_sells = all_trades.pnl.n
+    if n_sells:
+        n_losses = n_sells - all_trades.wins
+        total_win = all_trades.win_total
+        total_loss = abs(all_trades.pnl.total - total_win)
+        result.win_rate = all_trades.wins / n_sells * 100
+
+        if all_trades.wins:
+            result.avg_win = total_win / all_trades.wins
+        if n_losses:
+            result.avg_loss = (all_trades.pnl.total - total_win) / n_losses
+
         result.profit_factor = total_win / total_loss if total_loss > 0 else float('inf')
 
-        result.avg_holding_days = sum(t.holding_days for t in sell_trades) / len(sell_trades)
+        result.avg_holding_days = all_trades.holding_days / n_sells
 
     # ── Per-regime metrics ───────────────────────────────────
-    for regime_code, regime_name in REGIME_NAMES.items():
-        regime_sells = [t for t in sell_trades if t.regime == regime_name]
-        rm = RegimeMetrics(regime=regime_name, n_trades=len(regime_sells))
-
-        if regime_sells:
-            r_wins = [t for t in regime_sells if t.pnl_pct > 0]
-            r_losses = [t for t in regime_sells if t.pnl_pct <= 0]
-            rm.win_rate = len(r_wins) / len(regime_sells) * 100
-            if r_wins:
-                rm.avg_gain = sum(t.pnl_pct for t in r_wins) / len(r_wins)
-            if r_losses:
-                rm.avg_loss = sum(t.pnl_pct for t in r_losses) / len(r_losses)
-
-            # Sharpe for regime trades (approximate — use trade P&L as returns)
-            pnls = np.array([t.pnl_pct for t in regime_sells])
-            if len(pnls) > 1 and np.std(pnls) > 0:
-                rm.sharpe = float(np.mean(pnls) / np.std(pnls))
-                downside_pnl = pnls[pnls < 0]
-                if len(downside_pnl) > 0 and np.std(downside_pnl) > 0:
-                    rm.sortino = float(np.mean(pnls) / np.std(downside_pnl))
-
-        result.regime_metrics[regime_name] = rm
+    for regime_name in REGIME_NAMES.values():
+        result.regime_metrics[regime_name] = _regime_metrics(regime_name, trade_stats[regime_name])
 
     return result
 
 
+def _regime_metrics(regime_name: str, stats: _TradeStats) -> RegimeMetrics:
+    rm = RegimeMetrics(regime=regime_name, n_trades=stats.pnl.n)
+
+    if stats.pnl.n:
+        r_losses = stats.pnl.n - stats.wins
+        rm.win_rate = stats.wins / stats.pnl.n * 100
+        if stats.wins:
+            rm.avg_gain = stats.win_total / stats.wins
+        if r_losses:
+            rm.avg_loss = (stats.pnl.total - stats.win_total) / r_losses
+
+        # Sharpe for regime trades (approximate — use trade P&L as returns)
+        if stats.pnl.n > 1 and stats.pnl.std > 0:
+            rm.sharpe = float(stats.pnl.mean / stats.pnl.std)
+            if stats.pnl.neg_n > 0 and stats.pnl.neg_std > 0:
+                rm.sortino = float(stats.pnl.mean / stats.pnl.neg_std)
+
+    return rm
+
+
+def pooled_regime_metrics(regime_name: str, trade_stats: list[dict]) -> RegimeMetrics:
+    """RegimeMetrics over the trades of several windows (each an asdict(_TradeStats))."""
+    pooled = _TradeStats()
+    for t in trade_stats:
+        for k, v in t["pnl"].items():
+            setattr(pooled.pnl, k, getattr(pooled.pnl, k) + v)
+        pooled.wins += t["wins"]
+        pooled.win_total += t["win_total"]
+        pooled.holding_days += t["holding_days"]
+    return _regime_metrics(regime_name, pooled)
+
+
+# ─── Walk-Forward Evaluation ────────────────────────────────
+# Rolling train/test folds scored from ONE simulation pass per parameter set:
+# the run's daily NAV and closed trades are sliced per fold window, so more
+# folds cost a few array slices, not more simulations. Choosing a config is
+# left to the caller (compass_lab.select_walk_forward): per fold, on the
+# train-window stats only, then scored on that fold's test window.
+
+WF_TRAIN_DAYS = 756        # 3 years
+WF_TEST_DAYS = 252         # 1 year — also the step between folds
+WF_MIN_TEST_DAYS = 63      # a trailing partial test window shorter than this is dropped
+
+
+class Fold(NamedTuple):
+    train_start: int
+    test_start: int
+    test_end: int          # exclusive
+
+
+def walk_forward_folds(
+    n_days: int,
+    train_days: int = WF_TRAIN_DAYS,
+    test_days: int = WF_TEST_DAYS,
+    start_day: int = max(PERIOD_DAYS.values()) + 20,
+) -> list[Fold]:
+    """Rolling folds over days start_day..n_days; test windows tile the span after the first train window."""
+    folds = []
+    train_start = start_day
+    while train_start + train_days + min(WF_MIN_TEST_DAYS, test_days) <= n_days:
+        test_start = train_start + train_days
+        folds.append(Fold(train_start, test_start, min(test_start + test_days, n_days)))
+        train_start += test_days
+    return folds
+
+
+def _window_stats(run: SimResult, first_day: int, start: int, end: int) -> tuple[_NavStats, dict]:
+    """NAV / trade statistics of days [start, end) of one run (NAV from the day before, so
+    the first day's return counts)."""
+    nav = _NavStats.of(run.nav_curve[max(start - 1 - first_day, 0):end - first_day])
+    trades = {k: _TradeStats() for k in ("ALL", *REGIME_NAMES.values())}
+    for t in run.trades:
+        if t.side == "SELL" and start <= t.day_idx < end:
+            trades["ALL"].add(t.pnl_pct, t.holding_days)
+            trades[t.regime].add(t.pnl_pct, t.holding_days)
+    return nav, trades
+
+
+def simulate_walk_forward(
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    sector_keys: list[str],
+    params: SimParams,
+    folds: list[Fold],
+) -> dict:
+    """
+    Per-fold statistics of one parameter set, from a single simulation.
+
+    Returns {param_hash, params, folds}. Each fold carries "train_regimes"
+    ({regime: {n_trades, sortino}} on the train window — the only inputs a
+    selection may use) and, for scoring the selected config, "test_trades"
+    ({regime: raw trade statistics} on the test window) and
+    "test_max_drawdown". folds is [] when the history is too short.
+    """
+    run = simulate(prices, benchmark, sector_keys, params)
+    out = {"param_hash": params.param_hash(), "params": params.to_dict(), "folds": []}
+    if run.state is None:
+        return out
+
+    first_day = len(benchmark) - len(run.nav_curve)
+    for f in folds:
+        train = _summarize(params, *_window_stats(run, first_day, f.train_start, f.test_start))
+        test_nav, test_trades = _window_stats(run, first_day, f.test_start, f.test_end)
+        out["folds"].append({
+            "train": [f.train_start, f.test_start],
+            "test": [f.test_start, f.test_end],
+            "train_regimes": {
+                name: {"n_trades": rm.n_trades, "sortino": rm.sortino}
+                for name, rm in train.regime_metrics.items()
+            },
+            "test_trades": {name: asdict(test_trades[name]) for name in REGIME_NAMES.values()},
+            "test_max_drawdown": test_nav.max_drawdown,
+        })
+    return out
+
+
 # ─── Parameter Grid Generation ──────────────────────────────
 
 def generate_param_grid() -> list[SimParams]:
@@ -0,0 +1,276 @@
+"""
+Compass Lab — Stock-Level Simulator
+Replays the gate engine on a stocks × days panel (e.g. Nifty 500), so the
+stock portfolios can be tuned directly instead of borrowing sector params.
+
+A stock is a BUY candidate on a day when its own gates pass (RS against its
+sector index) AND its sector's gates pass (RS against the benchmark).
+Candidates are ranked by RS within their sector, at most max_per_sector
+positions are held per sector, and entries go best RS first up to
+max_positions. Exits mirror simulate(): stop-loss, trailing stop, and a
+SELL / AVOID on the stock or its sector once min_holding_days is met.
+
+Signals, gate masks and per-sector ranks are (n_days, n_stocks) array
+operations, computed once per (rs_period, min_rs_entry, strictness) and
+cached on the StockPanel — a sweep ordered by that key reuses them across
+every stop / trailing / position-limit combination. The daily walk only
+books the few open positions.
+
+Usage:
+    panel = StockPanel(stock_prices, sector_prices, benchmark, members)
+    result = simulate_stocks(panel, StockSimParams(max_per_sector=2))
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+import numpy as np
+
+from services.compass_simulator import (
+    PERIOD_DAYS,
+    REGIME_NAMES,
+    SimParams,
+    SimResult,
+    SimTrade,
+    _NavStats,
+    _Position,
+    _summarize,
+    _TradeStats,
+    detect_regimes_vectorized,
+    gate_masks,
+    rs_signals,
+)
+
+logger = logging.getLogger("fie_v3.compass.stock_simulator")
+
+MOMENTUM_WINDOW = 20
+
+
+# ─── Parameters ──────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class StockSimParams(SimParams):
+    """SimParams plus the per-sector position limit of the stock portfolios."""
+    max_per_sector: int = 2             # max simultaneous positions in one sector
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "max_per_sector": self.max_per_sector}
+
+
+# ─── Panel + cached signal pass ─────────────────────────────
+
+class _Gates(NamedTuple):
+    rs: np.ndarray          # stock RS vs its sector index
+    momentum: np.ndarray
+    buy: np.ndarray         # stock BUY and its sector BUY
+    exit: np.ndarray        # stock or its sector SELL / AVOID
+    rank: np.ndarray        # RS rank among the day's BUY stocks of the same sector (0 = best)
+
+
+@dataclass
+class StockPanel:
+    """
+    Aligned daily closes for one sweep.
+
+    members[i, j] is True when stock i is in sector j's index. A stock in
+    several sector indices counts under the first; stocks in none are
+    never traded. Prices are 0 before a stock lists.
+    """
+    stock_prices: np.ndarray        # (n_days, n_stocks)
+    sector_prices: np.ndarray       # (n_days, n_sectors)
+    benchmark: np.ndarray           # (n_days,)
+    members: np.ndarray             # (n_stocks, n_sectors) bool
+    stock_keys: list[str] = field(default_factory=list)
+    sector_keys: list[str] = field(default_factory=list)
+
+    home: np.ndarray = field(init=False, repr=False)
+    regimes: np.ndarray = field(init=False, repr=False)
+    _signals: tuple = field(default=(None, None), init=False, repr=False)
+    _gates: tuple = field(default=(None, None), init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.home = np.where(self.members.any(axis=1), self.members.argmax(axis=1), -1)
+        self.regimes = detect_regimes_vectorized(self.benchmark)
+
+    def signals(self, lookback: int) -> tuple:
+        """((return, RS, momentum) of stocks vs their sector, same of sectors vs benchmark)."""
+        key, cached = self._signals
+        if key != lookback:
+            sector_base = self.sector_prices[:, np.maximum(self.home, 0)]
+            cached = (
+                rs_signals(self.stock_prices, sector_base, lookback, MOMENTUM_WINDOW),
+                rs_signals(self.sector_prices, self.benchmark, lookback, MOMENTUM_WINDOW),
+            )
+            self._signals = (lookback, cached)
+        return cached
+
+    def gates(self, params: SimParams) -> _Gates:
+        lookback = PERIOD_DAYS.get(params.rs_period, 63)
+        key = (lookback, params.min_rs_entry, params.regime_gate_strictness)
+        cached_key, cached = self._gates
+        if cached_key == key:
+            return cached
+
+        (ret, rs, mom), sector_signals = self.signals(lookback)
+        sector_buy, sector_exit = gate_masks(*sector_signals, self.regimes,
+                                             params.min_rs_entry, params.regime_gate_strictness)
+        buy, exit_ = gate_masks(ret, rs, mom, self.regimes, params.min_rs_entry, params.regime_gate_strictness)
+        home = np.maximum(self.home, 0)
+        buy &= sector_buy[:, home] & (self.home >= 0) & (self.stock_prices > 0)
+        exit_ |= sector_exit[:, home]
+        gates = _Gates(rs, mom, buy, exit_, _sector_ranks(np.where(buy, rs, -np.inf), self.home))
+        self._gates = (key, gates)
+        return gates
+
+
+def _sector_ranks(score: np.ndarray, home: np.ndarray) -> np.ndarray:
+    """Per day, each stock's rank by score (descending) among stocks of the same sector."""
+    rank = np.full(score.shape, len(home), dtype=np.int32)
+    for sector in np.unique(home[home >= 0]):
+        cols = np.flatnonzero(home == sector)
+        order = np.argsort(-score[:, cols], axis=1, kind="stable")
+        block = np.empty_like(order)
+        np.put_along_axis(block, order, np.arange(len(cols)), axis=1)
+        rank[:, cols] = block
+    return rank
+
+
+# ─── Core Simulator ─────────────────────────────────────────
+
+def simulate_stocks(panel: StockPanel, params: StockSimParams) -> SimResult:
+    """
+    Replay the gate engine over the stock panel with the given parameters.
+    Trades carry the stock's column in sector_idx.
+    """
+    n_days, _ = panel.stock_prices.shape
+    lookback = PERIOD_DAYS.get(params.rs_period, 63)
+    if n_days < lookback + MOMENTUM_WINDOW + 1:
+        return SimResult(param_hash=params.param_hash(), params=params.to_dict())
+
+    gates = panel.gates(params)
+    candidates = gates.buy & (gates.rank < params.max_per_sector)
+    prices = panel.stock_prices
+    home = panel.home
+
+    initial_capital = 1_000_000.0
+    alloc_size = initial_capital / params.max_positions
+    cash = initial_capital
+    positions: list[_Position] = []
+    allocations: dict[int, float] = {}
+    per_sector: dict[int, int] = {}
+    trades: list[SimTrade] = []
+    nav_values: list[float] = []
+    nav_stats = _NavStats()
+    trade_stats = {k: _TradeStats() for k in ("ALL", *REGIME_NAMES.values())}
+
+    for day in range(lookback + MOMENTUM_WINDOW, n_days):
+        regime = REGIME_NAMES[panel.regimes[day]]
+        current_prices = prices[day]
+
+        # ── Exits ────────────────────────────────────────────
+        kept = []
+        for pos in positions:
+            s = pos.sector_idx
+            price_now = current_prices[s]
+            if price_now <= 0:
+                kept.append(pos)
+                continue
+            holding_d = day - pos.entry_day
+            exit_reason = ""
+            if price_now <= pos.stop_loss:
+                exit_reason = "STOP_LOSS"
+            if pos.trailing_active and price_now <= pos.trailing_stop:
+                exit_reason = "TRAILING_STOP"
+            if gates.exit[day, s] and holding_d >= params.min_holding_days:
+                exit_reason = "SELL_SIGNAL"
+
+            if exit_reason:
+                pnl_pct = (price_now / pos.entry_price - 1) * 100
+                rs, mom = gates.rs[day, s], gates.momentum[day, s]
+                trades.append(SimTrade(
+                    day_idx=day, sector_idx=s, side="SELL", price=price_now, regime=regime,
+                    rs_score=rs if not np.isnan(rs) else 0, momentum=mom if not np.isnan(mom) else 0,
+                    pnl_pct=pnl_pct, holding_days=holding_d, exit_reason=exit_reason,
+                ))
+                trade_stats["ALL"].add(pnl_pct, holding_d)
+                trade_stats[regime].add(pnl_pct, holding_d)
+                cash += allocations.pop(s) * (1 + pnl_pct / 100)
+                per_sector[home[s]] -= 1
+                continue
+
+            if price_now > pos.highest_price:
+                pos.highest_price = price_now
+            if (price_now / pos.entry_price - 1) * 100 >= params.trailing_trigger_pct:
+                pos.trailing_active = True
+                pos.trailing_stop = max(pos.trailing_stop, pos.highest_price * (1 - params.trailing_stop_pct / 100))
+            kept.append(pos)
+        positions = kept
+
+        # ── Entries: best RS first, per-sector and overall limits ──
+        slots = params.max_positions - len(positions)
+        if slots > 0 and cash > 0:
+            picks = np.flatnonzero(candidates[day])
+            picks = picks[np.argsort(-gates.rs[day, picks], kind="stable")]
+            for s in picks:
+                if slots == 0 or cash <= 0:
+                    break
+                if s in allocations or per_sector.get(home[s], 0) >= params.max_per_sector:
+                    continue
+                price_now = current_prices[s]
+                alloc = min(cash, alloc_size)
+                positions.append(_Position(
+                    sector_idx=int(s), entry_day=day, entry_price=price_now,
+                    stop_loss=price_now * (1 - params.stop_loss_pct / 100),
+                    highest_price=price_now, regime_at_entry=regime,
+                ))
+                allocations[s] = alloc
+                per_sector[home[s]] = per_sector.get(home[s], 0) + 1
+                cash -= alloc
+                slots -= 1
+                trades.append(SimTrade(
+                    day_idx=day, sector_idx=int(s), side="BUY", price=price_now, regime=regime,
+                    rs_score=gates.rs[day, s], momentum=gates.momentum[day, s],
+                ))
+
+        # ── NAV ──────────────────────────────────────────────
+        port_value = cash
+        for pos in positions:
+            price_now = current_prices[pos.sector_idx]
+            ratio = price_now / pos.entry_price if price_now > 0 else 1.0
+            port_value += allocations[pos.sector_idx] * ratio
+        nav = port_value / initial_capital * 100
+        nav_values.append(nav)
+        nav_stats.add(nav)
+
+    result = _summarize(params, nav_stats, trade_stats)
+    result.nav_curve = np.array(nav_values) if nav_values else np.array([100.0])
+    result.trades = trades
+    return result
+
+
+# ─── Parameter Grid ─────────────────────────────────────────
+
+def generate_stock_param_grid() -> list[StockSimParams]:
+    """Stock portfolio sweep grid: wider stops and more positions than the sector grid (3,456 combos)."""
+    grid = []
+    for rs_period in ["1M", "3M", "6M", "12M"]:
+        for min_rs in [0.0, 5.0]:
+            for strictness in ["moderate", "strict"]:
+                for stop_loss in [8.0, 12.0, 15.0, 20.0]:
+                    for trailing_trigger, trailing_stop in [(15.0, 10.0), (20.0, 12.0), (25.0, 15.0)]:
+                        for max_pos in [10, 15, 20]:
+                            for max_per_sector in [1, 2, 3]:
+                                for min_hold in [5, 20]:
+                                    grid.append(StockSimParams(
+                                        rs_period=rs_period,
+                                        stop_loss_pct=stop_loss,
+                                        trailing_trigger_pct=trailing_trigger,
+                                        trailing_stop_pct=trailing_stop,
+                                        max_positions=max_pos,
+                                        min_rs_entry=min_rs,
+                                        min_holding_days=min_hold,
+                                        regime_gate_strictness=strictness,
+                                        max_per_sector=max_per_sector,
+                                    ))
+    return grid
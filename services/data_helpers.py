@@ -6,6 +6,7 @@ Database upsert and portfolio ticker helpers used by backfill, scheduler, and ro
 import logging
 from datetime import datetime, timedelta
 
+from sqlalchemy import func as sqlfunc
 from sqlalchemy.orm import Session
 
 from models import (
@@ -42,6 +43,20 @@ def upsert_price_row(db: Session, idx_name: str, row: dict) -> bool:
     return True
 
 
+def get_last_price_dates(db: Session, names: list) -> dict:
+    """{index_name: latest stored IndexPrice date} for the given names, one grouped query.
+    Names with no rows are absent."""
+    if not names:
+        return {}
+    rows = (
+        db.query(IndexPrice.index_name, sqlfunc.max(IndexPrice.date))
+        .filter(IndexPrice.index_name.in_(names))
+        .group_by(IndexPrice.index_name)
+        .all()
+    )
+    return {name: last for name, last in rows if last}
+
+
 def get_portfolio_tickers(db: Session) -> list:
     """Unique stock tickers from active portfolios (excluding ETFs/indices)."""
     from price_service import NSE_ETF_UNIVERSE, NSE_TICKER_MAP
@@ -0,0 +1,63 @@
+"""
+FIE v3 — Drawdown Analytics
+Array primitives for drawdown work: running peak, underwater-period
+segmentation (peak / trough / recovery indices) and max drawdown.
+Pure NumPy, no DB dependency.
+"""
+
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+
+class DrawdownSegment(NamedTuple):
+    """One underwater period, as indices into the input series."""
+    peak: int                  # last point at the running max before going underwater
+    trough: int                # lowest point inside the period (first occurrence)
+    recovery: Optional[int]    # first point back at/above the peak, None if still underwater
+    depth_pct: float           # (trough / peak - 1) * 100, negative
+
+
+def running_peak(values, initial_peak: Optional[float] = None) -> np.ndarray:
+    """Running maximum of values, optionally seeded with an earlier peak."""
+    v = np.asarray(values, dtype=float)
+    peaks = np.maximum.accumulate(v)
+    if initial_peak is not None and len(v):
+        peaks = np.maximum(peaks, initial_peak)
+    return peaks
+
+
+def drawdown_segments(values) -> List[DrawdownSegment]:
+    """Split a series into underwater periods.
+
+    A point is underwater while it is strictly below the running max; each
+    maximal run of underwater points is one segment whose trough is the
+    argmin of the run. The first point can never be underwater.
+    """
+    v = np.asarray(values, dtype=float)
+    n = len(v)
+    if n < 2:
+        return []
+    underwater = v < running_peak(v)
+    edges = np.diff(np.concatenate(([0], underwater.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # exclusive
+
+    segments = []
+    for s, e in zip(starts, ends):
+        peak = int(s - 1)
+        trough = int(s + np.argmin(v[s:e]))
+        depth = (v[trough] / v[peak] - 1) * 100 if v[peak] > 0 else 0.0
+        segments.append(DrawdownSegment(peak, trough, int(e) if e < n else None, float(depth)))
+    return segments
+
+
+def max_drawdown_pct(values, initial_peak: Optional[float] = None) -> float:
+    """Largest peak-to-trough decline in %, as a positive number (0 when none)."""
+    v = np.asarray(values, dtype=float)
+    if not len(v):
+        return 0.0
+    peaks = running_peak(v, initial_peak)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.where(peaks > 0, (peaks - v) / peaks * 100, 0.0)
+    return float(max(dd.max(), 0.0))
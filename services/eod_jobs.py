@@ -1,11 +1,15 @@
 """
 Scheduled EOD jobs — daily price fetch, sentiment refresh, compass rebalance.
 All functions are called by APScheduler from server.py.
+
+The daily EOD job is a stage graph (services/pipeline.py): independent fetch
+stages run concurrently, and NAVs, snapshots, sentiment and the Compass
+rebalance start as soon as the prices they read are committed.
 """
 
-import asyncio
 import logging
 from datetime import datetime
+from typing import Callable, Dict
 
 from models import (
     AlertStatus,
@@ -15,227 +19,258 @@ from models import (
     TradingViewAlert,
 )
 from services.data_helpers import get_portfolio_tickers, upsert_price_row
+from services.pipeline import Stage, StageResult, run_pipeline
 
 logger = logging.getLogger("fie_v3.eod_jobs")
 
 
-def scheduled_eod_fetch() -> None:
-    """Store ALL nsetools indices + ETFs + portfolio stocks + constituents daily."""
-    from price_service import (
-        NSE_ETF_UNIVERSE,
-        NSE_INDEX_KEYS,
-        fetch_live_indices,
-        fetch_yfinance_bulk_history,
-        fetch_yfinance_bulk_stock_history,
-    )
-
-    logger.info("Scheduled EOD fetch starting...")
-    db = SessionLocal()
+# ─── EOD pipeline stages ────────────────────────────────
+# Each stage gets its own session (committed by the runner) and the shared
+# run context; it returns the number of rows it wrote. upsert_price_row checks
+# then inserts, so stages that can write the same IndexPrice (date, name) keys
+# are ordered, never concurrent: the index stages run as a chain, and nifty500
+# skips the tickers constituents already fetched.
+
+_INDEX_STAGES = ("live_indices", "index_fallback", "nse_history")
+_PRICE_STAGES = ("etf_prices", "portfolio_prices", "alert_prices", "basket_prices")
+
+
+def _store_rows(db, data: dict) -> int:
+    stored = 0
+    for name, rows in data.items():
+        for row in rows or []:
+            if upsert_price_row(db, name, row):
+                stored += 1
+    return stored
+
+
+def _stage_universe(db, ctx: dict) -> int:
+    """Ticker groups for the price stages, each excluding the groups before it."""
+    from price_service import NSE_ETF_UNIVERSE
+    from services.basket_service import get_all_basket_constituent_tickers
+
+    etf_tickers = list(NSE_ETF_UNIVERSE.keys())
+    portfolio_tickers = get_portfolio_tickers(db)
+    covered = {t.upper() for t in (*etf_tickers, *portfolio_tickers)}
+    alert_tickers = [
+        r[0]
+        for r in db.query(TradingViewAlert.ticker)
+        .filter(TradingViewAlert.status.in_([AlertStatus.APPROVED, AlertStatus.PENDING]))
+        .distinct()
+        .all()
+        if r[0] and r[0] != "UNKNOWN" and r[0].upper() not in covered
+    ]
+    covered.update(t.upper() for t in alert_tickers)
     try:
-        today_str = datetime.now().strftime("%Y-%m-%d")
-
-        # ── 1. Live nsetools indices (135+) ──────────────────────
-        live = fetch_live_indices()
-        nsetools_names = set()
-        idx_stored = 0
-        for item in live:
-            close = item.get("last")
-            if not close:
-                continue
-            nsetools_names.add(item["index_name"])
-            existing = db.query(IndexPrice).filter_by(date=today_str, index_name=item["index_name"]).first()
-            if existing:
-                existing.close_price = close
-                existing.open_price = item.get("open")
-                existing.high_price = item.get("high")
-                existing.low_price = item.get("low")
-                existing.fetched_at = datetime.now()
-            else:
-                db.add(
-                    IndexPrice(
-                        date=today_str,
-                        index_name=item["index_name"],
-                        close_price=close,
-                        open_price=item.get("open"),
-                        high_price=item.get("high"),
-                        low_price=item.get("low"),
-                    )
+        basket_tickers = [t for t in get_all_basket_constituent_tickers(db) if t.upper() not in covered]
+    except Exception as e:
+        logger.warning("Basket ticker lookup failed (non-fatal): %s", e)
+        basket_tickers = []
+    covered.update(t.upper() for t in basket_tickers)
+    ctx["universe"] = {
+        "etf": etf_tickers,
+        "portfolio": portfolio_tickers,
+        "alert": alert_tickers,
+        "basket": basket_tickers,
+        "covered": covered,
+    }
+    return 0
+
+
+def _stage_live_indices(db, ctx: dict) -> int:
+    """Live nsetools indices (135+) as today's close."""
+    from price_service import fetch_live_indices
+
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    names = set()
+    stored = 0
+    for item in fetch_live_indices():
+        close = item.get("last")
+        if not close:
+            continue
+        names.add(item["index_name"])
+        existing = db.query(IndexPrice).filter_by(date=today_str, index_name=item["index_name"]).first()
+        if existing:
+            existing.close_price = close
+            existing.open_price = item.get("open")
+            existing.high_price = item.get("high")
+            existing.low_price = item.get("low")
+            existing.fetched_at = datetime.now()
+        else:
+            db.add(
+                IndexPrice(
+                    date=today_str,
+                    index_name=item["index_name"],
+                    close_price=close,
+                    open_price=item.get("open"),
+                    high_price=item.get("high"),
+                    low_price=item.get("low"),
                 )
-            idx_stored += 1
-
-        # ── 1b. yfinance fallback for missed indices ─────────────
-        missed_keys = [k for k in NSE_INDEX_KEYS if k not in nsetools_names]
-        yf_idx_stored = 0
-        if missed_keys:
-            yf_idx_data = fetch_yfinance_bulk_history(missed_keys, period="5d")
-            for idx_name, rows in yf_idx_data.items():
-                for row in rows:
-                    if upsert_price_row(db, idx_name, row):
-                        yf_idx_stored += 1
-
-        # ── 1c. NSE API historical refresh ───────────────────────
-        nse_eod_stored = 0
-        try:
-            from price_service import fetch_historical_indices_nse_sync
-
-            nse_eod = fetch_historical_indices_nse_sync()
-            tracked = set(NSE_INDEX_KEYS)
-            for idx_name, rows in nse_eod.items():
-                if idx_name not in tracked:
-                    continue
-                for row in rows:
-                    if upsert_price_row(db, idx_name, row):
-                        nse_eod_stored += 1
-            db.commit()
-            logger.info("EOD: stored %d NSE API historical records", nse_eod_stored)
-        except Exception as e:
-            logger.warning("EOD NSE API refresh failed (non-fatal): %s", e)
-
-        # ── 2. ETF prices ────────────────────────────────────────
-        etf_tickers = list(NSE_ETF_UNIVERSE.keys())
-        etf_data = fetch_yfinance_bulk_stock_history(etf_tickers, period="5d")
-        etf_stored = 0
-        for ticker, rows in etf_data.items():
-            for row in rows:
-                if upsert_price_row(db, ticker, row):
-                    etf_stored += 1
-
-        # ── 3. Portfolio stock prices ────────────────────────────
-        stock_tickers = get_portfolio_tickers(db)
-        stk_stored = 0
-        if stock_tickers:
-            stock_data = fetch_yfinance_bulk_stock_history(stock_tickers, period="5d")
-            for ticker, rows in stock_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        stk_stored += 1
-
-        # ── 4. Alert tickers ────────────────────────────────────
-        alert_tickers = [
-            r[0]
-            for r in db.query(TradingViewAlert.ticker)
-            .filter(TradingViewAlert.status.in_([AlertStatus.APPROVED, AlertStatus.PENDING]))
-            .distinct()
-            .all()
-            if r[0] and r[0] != "UNKNOWN"
-        ]
-        covered = set(t.upper() for t in stock_tickers)
-        covered.update(t.upper() for t in etf_tickers)
-        new_alert_tickers = [t for t in alert_tickers if t.upper() not in covered]
-        alert_stored = 0
-        if new_alert_tickers:
-            alert_data = fetch_yfinance_bulk_stock_history(new_alert_tickers, period="5d")
-            for ticker, rows in alert_data.items():
-                for row in rows:
-                    if upsert_price_row(db, ticker, row):
-                        alert_stored += 1
-
-        # ── 5. Basket constituent prices + NAVs ──────────────────
-        basket_nav_count = 0
-        try:
-            from services.basket_service import compute_today_basket_navs, get_all_basket_constituent_tickers
-
-            basket_tickers = get_all_basket_constituent_tickers(db)
-            covered.update(t.upper() for t in new_alert_tickers)
-            new_basket_tickers = [t for t in basket_tickers if t.upper() not in covered]
-            if new_basket_tickers:
-                bkt_data = fetch_yfinance_bulk_stock_history(new_basket_tickers, period="5d")
-                for ticker, rows in bkt_data.items():
-                    for row in rows:
-                        upsert_price_row(db, ticker, row)
-            basket_nav_count = compute_today_basket_navs(db)
-        except Exception as e:
-            logger.warning("Basket EOD step failed (non-fatal): %s", e)
-
-        # ── 6. Sector index constituents ─────────────────────────
-        constituent_count = 0
-        constituent_price_count = 0
-        try:
-            from routers.recommendations import refresh_sector_constituents
-
-            constituent_count = refresh_sector_constituents(db)
-            all_constituent_tickers = [r[0] for r in db.query(IndexConstituent.ticker).distinct().all() if r[0]]
-            new_constituent_tickers = [t for t in all_constituent_tickers if t.upper() not in covered]
-            if new_constituent_tickers:
-                cst_data = fetch_yfinance_bulk_stock_history(new_constituent_tickers, period="5d")
-                for ticker, rows in cst_data.items():
-                    for row in rows:
-                        if upsert_price_row(db, ticker, row):
-                            constituent_price_count += 1
-        except Exception as e:
-            logger.warning("Constituent refresh step failed (non-fatal): %s", e)
-
-        # ── 7. Nifty 500 constituents ────────────────────────────
-        try:
-            from price_service import fetch_nse_index_constituents
-
-            nifty500_items = fetch_nse_index_constituents("NIFTY 500")
-            if nifty500_items:
-                for item in nifty500_items:
-                    symbol = item.get("symbol", "").strip()
-                    if not symbol:
-                        continue
-                    existing = (
-                        db.query(IndexConstituent)
-                        .filter(IndexConstituent.index_name == "NIFTY 500", IndexConstituent.ticker == symbol)
-                        .first()
-                    )
-                    if existing:
-                        existing.last_price = item.get("last_price")
-                        existing.fetched_at = datetime.now()
-                    else:
-                        db.add(
-                            IndexConstituent(
-                                index_name="NIFTY 500",
-                                ticker=symbol,
-                                company_name=item.get("company_name"),
-                                weight_pct=item.get("weight"),
-                                last_price=item.get("last_price"),
-                            )
-                        )
-                nifty500_tickers = [i["symbol"] for i in nifty500_items if i.get("symbol")]
-                new_n500 = [t for t in nifty500_tickers if t.upper() not in covered]
-                if new_n500:
-                    n500_data = fetch_yfinance_bulk_stock_history(new_n500, period="5d")
-                    for ticker, rows in n500_data.items():
-                        for row in rows:
-                            upsert_price_row(db, ticker, row)
-        except Exception as e:
-            logger.warning("Nifty 500 EOD refresh failed (non-fatal): %s", e)
-
-        db.commit()
-        logger.info(
-            "Scheduled EOD: %d nsetools + %d yf-fallback + %d nse-api index, %d ETF, %d stock, %d alert, %d basket NAV, %d constituent",
-            idx_stored, yf_idx_stored, nse_eod_stored, etf_stored, stk_stored, alert_stored, basket_nav_count, constituent_count,
+            )
+        stored += 1
+    ctx["live_indices"] = names
+    return stored
+
+
+def _stage_index_fallback(db, ctx: dict) -> int:
+    """yfinance 5d history for tracked indices nsetools did not return."""
+    from price_service import NSE_INDEX_KEYS, fetch_yfinance_bulk_history
+
+    live = ctx.get("live_indices", set())
+    missed_keys = [k for k in NSE_INDEX_KEYS if k not in live]
+    return _store_rows(db, fetch_yfinance_bulk_history(missed_keys, period="5d")) if missed_keys else 0
+
+
+def _stage_nse_history(db, ctx: dict) -> int:
+    """NSE API history for tracked indices, from each one's last stored date."""
+    from price_service import NSE_INDEX_KEYS, fetch_historical_indices_nse_sync
+
+    tracked = set(NSE_INDEX_KEYS)
+    nse_eod = fetch_historical_indices_nse_sync(db=db)
+    return _store_rows(db, {k: rows for k, rows in nse_eod.items() if k in tracked})
+
+
+def _price_stage(group: str) -> Callable:
+    def _stage(db, ctx: dict) -> int:
+        from price_service import fetch_yfinance_bulk_stock_history
+
+        tickers = ctx["universe"][group]
+        return _store_rows(db, fetch_yfinance_bulk_stock_history(tickers, period="5d")) if tickers else 0
+    _stage.__doc__ = f"yfinance 5d prices for {group} tickers."
+    return _stage
+
+
+def _stage_basket_navs(db, ctx: dict) -> int:
+    from services.basket_service import compute_today_basket_navs
+
+    return compute_today_basket_navs(db)
+
+
+def _stage_portfolio_navs(db, ctx: dict) -> int:
+    """Incremental manual portfolio NAV; a failed portfolio rolls back only its own rows."""
+    from services.nav_service import materialize_all_navs
+
+    return materialize_all_navs(db, datetime.now().strftime("%Y-%m-%d"))
+
+
+def _stage_constituents(db, ctx: dict) -> int:
+    """Sector index constituents from NSE, plus 5d prices for the uncovered ones.
+    ctx["constituents"]: the (upper-cased) tickers priced here."""
+    from price_service import fetch_yfinance_bulk_stock_history
+    from routers.recommendations import refresh_sector_constituents
+
+    refreshed = refresh_sector_constituents(db)
+    covered = ctx["universe"]["covered"]
+    new_tickers = [
+        r[0] for r in db.query(IndexConstituent.ticker).distinct().all() if r[0] and r[0].upper() not in covered
+    ]
+    ctx["constituents"] = {t.upper() for t in new_tickers}
+    stored = _store_rows(db, fetch_yfinance_bulk_stock_history(new_tickers, period="5d")) if new_tickers else 0
+    return refreshed + stored
+
+
+def _stage_nifty500(db, ctx: dict) -> int:
+    """Nifty 500 constituents from NSE, plus 5d prices for those not covered or priced by constituents."""
+    from price_service import fetch_nse_index_constituents, fetch_yfinance_bulk_stock_history
+
+    nifty500_items = fetch_nse_index_constituents("NIFTY 500")
+    if not nifty500_items:
+        return 0
+    for item in nifty500_items:
+        symbol = item.get("symbol", "").strip()
+        if not symbol:
+            continue
+        existing = (
+            db.query(IndexConstituent)
+            .filter(IndexConstituent.index_name == "NIFTY 500", IndexConstituent.ticker == symbol)
+            .first()
         )
+        if existing:
+            existing.last_price = item.get("last_price")
+            existing.fetched_at = datetime.now()
+        else:
+            db.add(
+                IndexConstituent(
+                    index_name="NIFTY 500",
+                    ticker=symbol,
+                    company_name=item.get("company_name"),
+                    weight_pct=item.get("weight"),
+                    last_price=item.get("last_price"),
+                )
+            )
+    covered = ctx["universe"]["covered"] | ctx.get("constituents", set())
+    new_n500 = [i["symbol"] for i in nifty500_items if i.get("symbol") and i["symbol"].upper() not in covered]
+    return _store_rows(db, fetch_yfinance_bulk_stock_history(new_n500, period="5d")) if new_n500 else 0
 
-        # ── 8. Per-stock sentiment ───────────────────────────────
-        try:
-            from services.stock_sentiment import compute_and_store_stock_sentiment
 
-            stock_count = compute_and_store_stock_sentiment(db)
-            logger.info("Per-stock sentiment: computed for %d stocks", stock_count)
-        except Exception as e:
-            logger.warning("Per-stock sentiment failed (non-fatal): %s", e)
+def _stage_period_returns(db, ctx: dict) -> int:
+    """Period returns snapshot (indices/latest, baskets/live)."""
+    from services.period_returns import refresh_period_returns
 
-    except Exception as e:
-        logger.error("Scheduled EOD fetch failed: %s", e)
-        db.rollback()
-    finally:
-        db.close()
+    return refresh_period_returns(db)
 
 
-def eod_sentiment_refresh() -> None:
-    """Refresh sentiment indicators 5 min after EOD prices are stored."""
+def _stage_reco_snapshot(db, ctx: dict) -> int:
+    """Recommendation snapshot, warm for the first request."""
+    from routers.recommendations import get_recommendation_snapshot
+
+    get_recommendation_snapshot(db)
+    return 0
+
+
+def _stage_stock_sentiment(db, ctx: dict) -> int:
+    from services.stock_sentiment import compute_and_store_stock_sentiment
+
+    return compute_and_store_stock_sentiment(db)
+
+
+def _stage_market_sentiment(db, ctx: dict) -> int:
+    """Market sentiment composite + snapshot."""
     from routers.sentiment import refresh_sentiment
 
-    db = SessionLocal()
+    result = refresh_sentiment(include_tickers=False, db=db)
+    return result.get("stocks_computed", 0)
+
+
+def _stage_compass_rebalance(db, ctx: dict) -> int:
+    """Autonomous Compass rebalance."""
+    from services.compass_autonomous_trader import run_autonomous_rebalance
+
+    result = run_autonomous_rebalance(db)
+    logger.info("Autonomous rebalance complete: regime=%s", result.get("regime"))
+    return 0
+
+
+EOD_STAGES = [
+    Stage("universe", _stage_universe),
+    Stage("live_indices", _stage_live_indices),
+    Stage("index_fallback", _stage_index_fallback, after=("live_indices",)),
+    Stage("nse_history", _stage_nse_history, after=("index_fallback",)),
+    Stage("etf_prices", _price_stage("etf"), after=("universe",)),
+    Stage("portfolio_prices", _price_stage("portfolio"), after=("universe",)),
+    Stage("alert_prices", _price_stage("alert"), after=("universe",)),
+    Stage("basket_prices", _price_stage("basket"), after=("universe",)),
+    Stage("basket_navs", _stage_basket_navs, after=_PRICE_STAGES),
+    Stage("portfolio_navs", _stage_portfolio_navs, after=(*_PRICE_STAGES, "basket_navs")),
+    Stage("constituents", _stage_constituents, after=("universe",)),
+    Stage("nifty500", _stage_nifty500, after=("universe", "constituents")),
+    Stage("period_returns", _stage_period_returns, after=(*_INDEX_STAGES, "etf_prices", "basket_navs")),
+    Stage("reco_snapshot", _stage_reco_snapshot, after=(*_INDEX_STAGES, "etf_prices", "constituents")),
+    Stage("stock_sentiment", _stage_stock_sentiment, after=(*_PRICE_STAGES, "constituents", "nifty500")),
+    Stage("market_sentiment", _stage_market_sentiment, after=(*_INDEX_STAGES, "stock_sentiment")),
+    Stage("compass_rebalance", _stage_compass_rebalance, after=_INDEX_STAGES),
+]
+
+
+def scheduled_eod_fetch() -> Dict[str, StageResult]:
+    """Daily EOD pipeline: indices, ETFs, portfolio/alert/basket/constituent prices,
+    NAVs, snapshots, sentiment and the Compass rebalance, in dependency order."""
+    logger.info("Scheduled EOD pipeline starting...")
     try:
-        asyncio.run(refresh_sentiment(db))
+        return run_pipeline("eod", EOD_STAGES)
     except Exception as e:
-        logger.warning("EOD sentiment refresh failed: %s", e)
-    finally:
-        db.close()
+        logger.error("Scheduled EOD pipeline failed: %s", e)
+        return {}
 
 
 def compass_intraday_refresh() -> None:
@@ -257,16 +292,16 @@ def compass_intraday_refresh() -> None:
         db.close()
 
 
-def compass_eod_rebalance() -> None:
-    """EOD rebalance at 3:40 PM IST — autonomous trader takes decisions."""
+def fundamentals_refresh() -> None:
+    """Nightly rate-limited fundamentals batch (P/E, EPS, 52W, market cap). Runs at 2 AM IST."""
     db = SessionLocal()
     try:
-        from services.compass_autonomous_trader import run_autonomous_rebalance
+        from services.fundamentals import refresh_fundamentals
 
-        result = run_autonomous_rebalance(db)
-        logger.info("Autonomous rebalance complete: regime=%s", result.get("regime"))
+        refresh_fundamentals(db)
     except Exception as e:
-        logger.warning("Autonomous rebalance failed: %s", e)
+        logger.warning("Fundamentals refresh failed: %s", e)
+        db.rollback()
     finally:
         db.close()
 
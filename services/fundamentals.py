@@ -0,0 +1,193 @@
+"""
+FIE v3 — Fundamentals Store
+P/E, EPS, market cap and 52W range for stocks, ETFs and sector indices,
+kept in the `fundamentals` table.
+
+Only the scheduled batch job (refresh_fundamentals) talks to yfinance: it
+picks symbols whose row is missing or older than FUNDAMENTALS_MAX_AGE,
+oldest first, and fetches them through a shared token bucket. Failed
+symbols keep their last good values and back off exponentially. Request
+paths use the readers below — one query, no network calls.
+"""
+
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from index_constants import (
+    COMPASS_ETF_UNIVERSE,
+    COMPASS_SECTOR_ETF_MAP,
+    COMPASS_SECTOR_INDICES,
+    NSE_TICKER_MAP,
+    SECTOR_ETF_MAP,
+    SECTOR_INDICES_FOR_RECO,
+)
+from models import Fundamental, IndexConstituent
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger("fie_v3.fundamentals")
+
+FUNDAMENTALS_MAX_AGE = timedelta(hours=20)   # nightly job refreshes everything once per day
+FUNDAMENTALS_MAX_BACKOFF_DAYS = 7
+FUNDAMENTALS_RATE_PER_SEC = 2.0              # yfinance .info calls per second, across workers
+FUNDAMENTALS_WORKERS = 4
+FUNDAMENTALS_MAX_PER_RUN = 1500
+
+# .info field -> Fundamental column
+_INFO_FIELDS = {
+    "trailingPE": "trailing_pe",
+    "forwardPE": "forward_pe",
+    "trailingEps": "trailing_eps",
+    "fiftyTwoWeekHigh": "week_52_high",
+    "fiftyTwoWeekLow": "week_52_low",
+    "marketCap": "market_cap",
+}
+
+
+# ─── Universe ────────────────────────────────────────────
+
+def fundamentals_universe(db: Session) -> List[Tuple[str, str, str]]:
+    """(symbol, kind, yf_symbol) for every instrument the app shows fundamentals for:
+    all stored index constituents, sector/compass ETFs and sector indices."""
+    universe: Dict[str, Tuple[str, str, str]] = {}
+
+    sector_keys = {k for k, _ in COMPASS_SECTOR_INDICES} | {k for k, _ in SECTOR_INDICES_FOR_RECO}
+    for key in sorted(sector_keys):
+        yf_symbol = NSE_TICKER_MAP.get(key)
+        if yf_symbol:
+            universe[key] = (key, "index", yf_symbol)
+
+    etfs = set(COMPASS_ETF_UNIVERSE)
+    for etf_list in (*COMPASS_SECTOR_ETF_MAP.values(), *SECTOR_ETF_MAP.values()):
+        etfs.update(etf_list)
+    for ticker in sorted(etfs):
+        universe.setdefault(ticker, (ticker, "etf", f"{ticker}.NS"))
+
+    for (ticker,) in db.query(IndexConstituent.ticker).distinct().all():
+        if ticker:
+            universe.setdefault(ticker, (ticker, "stock", f"{ticker}.NS"))
+    return list(universe.values())
+
+
+def _is_due(row: Optional[Fundamental], now: datetime) -> bool:
+    if row is None:
+        return True
+    if row.fail_count and row.last_attempt_at:
+        backoff = timedelta(days=min(2 ** (row.fail_count - 1), FUNDAMENTALS_MAX_BACKOFF_DAYS))
+        if now - row.last_attempt_at < backoff:
+            return False
+    return row.fetched_at is None or now - row.fetched_at >= FUNDAMENTALS_MAX_AGE
+
+
+# ─── Fetch ───────────────────────────────────────────────
+
+def _num(value) -> Optional[float]:
+    """Coerce a yfinance .info value to float ('Infinity', strings and NaN become None)."""
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def fetch_info(yf_symbol: str) -> Optional[Dict[str, Optional[float]]]:
+    """One yfinance .info call -> {column: value}; None if nothing usable came back."""
+    import yfinance as yf
+
+    info = yf.Ticker(yf_symbol).info or {}
+    values = {col: _num(info.get(field)) for field, col in _INFO_FIELDS.items()}
+    return values if any(v is not None for v in values.values()) else None
+
+
+def refresh_fundamentals(db: Session, max_symbols: int = FUNDAMENTALS_MAX_PER_RUN) -> dict:
+    """Fetch due symbols (missing/stale, oldest first) and upsert them. Returns counts."""
+    now = datetime.now()
+    existing = {f.symbol: f for f in db.query(Fundamental).all()}
+    due = [u for u in fundamentals_universe(db) if _is_due(existing.get(u[0]), now)]
+    due.sort(key=lambda u: (existing[u[0]].fetched_at or datetime.min) if u[0] in existing else datetime.min)
+    due = due[:max_symbols]
+    if not due:
+        return {"due": 0, "fetched": 0, "failed": 0}
+
+    limiter = TokenBucket(FUNDAMENTALS_RATE_PER_SEC)
+
+    def _fetch(yf_symbol: str) -> Optional[Dict[str, Optional[float]]]:
+        limiter.acquire()
+        try:
+            return fetch_info(yf_symbol)
+        except Exception as e:
+            logger.debug("Fundamentals fetch failed for %s: %s", yf_symbol, e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=FUNDAMENTALS_WORKERS) as pool:
+        results = list(pool.map(_fetch, [u[2] for u in due]))
+
+    fetched = failed = 0
+    attempted_at = datetime.now()
+    for (symbol, kind, yf_symbol), values in zip(due, results):
+        row = existing.get(symbol)
+        if row is None:
+            row = Fundamental(symbol=symbol, fail_count=0)
+            db.add(row)
+        row.kind = kind
+        row.yf_symbol = yf_symbol
+        row.last_attempt_at = attempted_at
+        if values is None:
+            row.fail_count = (row.fail_count or 0) + 1   # keep the last good values
+            failed += 1
+            continue
+        for col, value in values.items():
+            setattr(row, col, value)
+        row.fetched_at = attempted_at
+        row.fail_count = 0
+        fetched += 1
+    db.commit()
+
+    logger.info("Fundamentals refresh: %d due, %d fetched, %d failed", len(due), fetched, failed)
+    return {"due": len(due), "fetched": fetched, "failed": failed}
+
+
+# ─── Readers (request paths) ─────────────────────────────
+
+def load_fundamentals(db: Session, symbols: Iterable[str]) -> Dict[str, Fundamental]:
+    """{symbol: Fundamental} for the stored rows among `symbols` (one query)."""
+    symbols = set(symbols)
+    if not symbols:
+        return {}
+    return {f.symbol: f for f in db.query(Fundamental).filter(Fundamental.symbol.in_(symbols)).all()}
+
+
+def pe_of(row: Optional[Fundamental]) -> Optional[float]:
+    """Trailing P/E, else forward P/E, rounded for display."""
+    if row is None:
+        return None
+    pe = row.trailing_pe or row.forward_pe
+    return round(pe, 2) if pe else None
+
+
+def pe_ratios(db: Session, symbols: Iterable[str]) -> Dict[str, Optional[float]]:
+    """{symbol: P/E} for stocks or ETFs."""
+    symbols = list(symbols)
+    rows = load_fundamentals(db, symbols)
+    return {s: pe_of(rows.get(s)) for s in symbols}
+
+
+def sector_pe_ratios(db: Session, sector_keys: Iterable[str]) -> Dict[str, Optional[float]]:
+    """{sector_key: P/E} — the index's own P/E, else its first sector ETF with one.
+    Index tickers often lack trailingPE on yfinance; ETFs usually have it."""
+    sector_keys = list(sector_keys)
+    etfs = {k: COMPASS_SECTOR_ETF_MAP.get(k, []) for k in sector_keys}
+    rows = load_fundamentals(db, [*sector_keys, *(t for ts in etfs.values() for t in ts)])
+    result: Dict[str, Optional[float]] = {}
+    for key in sector_keys:
+        pe = pe_of(rows.get(key))
+        for etf in etfs[key]:
+            if pe is not None:
+                break
+            pe = pe_of(rows.get(etf))
+        result[key] = pe
+    return result
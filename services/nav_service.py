@@ -0,0 +1,275 @@
+"""
+FIE v3 — Incremental NAV Service
+Daily PortfolioNAV materialization for manual portfolios.
+Each portfolio keeps a checkpoint (positions + running realized P&L as of the
+last materialized date); a run applies only transactions and closes after it
+and writes the new NAV rows in bulk. Back-dated transactions mark the
+checkpoint dirty so the next run recomputes from that date forward only.
+A portfolio without a checkpoint starts after its last stored NAV row, so
+imported history is kept.
+"""
+
+import logging
+from datetime import date as date_type
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func as sa_func
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import (
+    IndexPrice,
+    ModelPortfolio,
+    PortfolioNAV,
+    PortfolioNavState,
+    PortfolioStatus,
+    PortfolioTransaction,
+    TransactionType,
+)
+
+logger = logging.getLogger("fie_v3.nav")
+
+Positions = Dict[str, List[float]]  # {ticker: [quantity, total_cost]}
+
+
+# ─── Position Replay ─────────────────────────────────────
+
+def _apply_txn(positions: Positions, txn) -> float:
+    """Apply one transaction to positions in place. Returns realized P&L."""
+    qty, cost = positions.get(txn.ticker, [0, 0.0])
+    realized = 0.0
+    if txn.txn_type == TransactionType.BUY:
+        qty += txn.quantity
+        cost += txn.total_value
+    else:
+        cost_of_sold = (cost / qty) * txn.quantity if qty > 0 else 0.0
+        if txn.realized_pnl is not None:
+            realized = txn.realized_pnl
+        elif qty > 0:
+            realized = txn.total_value - cost_of_sold
+        qty -= txn.quantity
+        cost -= cost_of_sold
+        if qty <= 0:
+            qty, cost = 0, 0.0
+    if qty > 0:
+        positions[txn.ticker] = [qty, cost]
+    else:
+        positions.pop(txn.ticker, None)
+    return realized
+
+
+def _prev_day(date_str: str) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d").date() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _next_day(date_str: str) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d").date() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+# ─── Price Loading ───────────────────────────────────────
+
+def _prices_before(tickers: List[str], date_str: str, db: Session) -> Dict[str, float]:
+    """Latest close strictly before date_str for each ticker (forward-fill seed)."""
+    if not tickers:
+        return {}
+    subq = (
+        db.query(IndexPrice.index_name, sa_func.max(IndexPrice.date).label("max_date"))
+        .filter(IndexPrice.index_name.in_(tickers), IndexPrice.date < date_str)
+        .group_by(IndexPrice.index_name)
+        .subquery()
+    )
+    rows = (
+        db.query(IndexPrice.index_name, IndexPrice.close_price)
+        .join(subq, (IndexPrice.index_name == subq.c.index_name) & (IndexPrice.date == subq.c.max_date))
+        .all()
+    )
+    return {name: close for name, close in rows if close}
+
+
+def _closes_between(
+    tickers: List[str], start: str, end: str, db: Session
+) -> Dict[str, Dict[str, float]]:
+    """{date: {ticker: close}} for start <= date <= end."""
+    by_date: Dict[str, Dict[str, float]] = {}
+    if not tickers:
+        return by_date
+    rows = (
+        db.query(IndexPrice.date, IndexPrice.index_name, IndexPrice.close_price)
+        .filter(IndexPrice.index_name.in_(tickers), IndexPrice.date >= start, IndexPrice.date <= end)
+        .all()
+    )
+    for d, name, close in rows:
+        if close:
+            by_date.setdefault(d, {})[name] = close
+    return by_date
+
+
+# ─── Invalidation ────────────────────────────────────────
+
+def invalidate_nav_from(portfolio_id: int, date_str: str, db: Session) -> None:
+    """Mark NAV rows from date_str onward as stale (back-dated transaction).
+
+    Does not commit — callers commit with the transaction that caused it.
+    """
+    state = db.query(PortfolioNavState).filter(PortfolioNavState.portfolio_id == portfolio_id).first()
+    if not state or date_str > state.as_of_date:
+        return
+    if state.dirty_from is None or date_str < state.dirty_from:
+        state.dirty_from = date_str
+
+
+# ─── Materialization ─────────────────────────────────────
+
+def _load_checkpoint(
+    portfolio_id: int, db: Session
+) -> Tuple[Optional[PortfolioNavState], Positions, float, Optional[str], List]:
+    """Resolve where this run starts.
+
+    Returns (state, positions, realized, checkpoint_date, pending_txns) where
+    positions/realized are as of checkpoint_date and pending_txns are the
+    transactions dated after it, in order.
+    """
+    state = db.query(PortfolioNavState).filter(PortfolioNavState.portfolio_id == portfolio_id).first()
+
+    if state is not None:
+        # Safety net: transactions added since the last run but dated inside
+        # the materialized range (e.g. bulk imports) also invalidate.
+        backdated = (
+            db.query(sa_func.min(PortfolioTransaction.txn_date))
+            .filter(
+                PortfolioTransaction.portfolio_id == portfolio_id,
+                PortfolioTransaction.id > (state.last_txn_id or 0),
+                PortfolioTransaction.txn_date <= state.as_of_date,
+            )
+            .scalar()
+        )
+        if backdated and (state.dirty_from is None or backdated < state.dirty_from):
+            state.dirty_from = backdated
+
+    if state is not None and state.dirty_from is None:
+        positions = {t: list(v) for t, v in (state.positions or {}).items()}
+        pending = (
+            db.query(PortfolioTransaction)
+            .filter(PortfolioTransaction.portfolio_id == portfolio_id, PortfolioTransaction.txn_date > state.as_of_date)
+            .order_by(PortfolioTransaction.txn_date, PortfolioTransaction.id)
+            .all()
+        )
+        return state, positions, state.realized_pnl_cumulative or 0.0, state.as_of_date, pending
+
+    # Fresh build or dirty rebuild: replay everything dated before the restart point
+    txns = (
+        db.query(PortfolioTransaction)
+        .filter(PortfolioTransaction.portfolio_id == portfolio_id)
+        .order_by(PortfolioTransaction.txn_date, PortfolioTransaction.id)
+        .all()
+    )
+    if not txns:
+        return state, {}, 0.0, None, []
+    if state is not None:
+        restart = state.dirty_from
+    else:
+        # No checkpoint yet: NAV rows already stored (e.g. bulk-imported
+        # history) are kept, and valuation starts the day after the last one
+        last_nav = (
+            db.query(sa_func.max(PortfolioNAV.date)).filter(PortfolioNAV.portfolio_id == portfolio_id).scalar()
+        )
+        restart = _next_day(last_nav) if last_nav else txns[0].txn_date
+    positions: Positions = {}
+    realized = 0.0
+    pending = []
+    for t in txns:
+        if t.txn_date < restart:
+            realized += _apply_txn(positions, t)
+        else:
+            pending.append(t)
+    return state, positions, realized, _prev_day(restart), pending
+
+
+def materialize_portfolio_nav(portfolio_id: int, db: Session, end_date: Optional[str] = None) -> int:
+    """Bring PortfolioNAV for one portfolio up to end_date (default today).
+
+    Only days after the checkpoint are valued; rows are written in one bulk
+    insert and the checkpoint is advanced. Returns the number of NAV rows written.
+    """
+    end = end_date or date_type.today().strftime("%Y-%m-%d")
+    state, positions, realized, checkpoint, pending = _load_checkpoint(portfolio_id, db)
+    if checkpoint is None or checkpoint >= end:
+        return 0
+
+    start = _next_day(checkpoint)
+    tickers = sorted(set(positions) | {t.ticker for t in pending})
+    last_prices = _prices_before(tickers, start, db)
+    closes = _closes_between(tickers, start, end, db)
+
+    rows = []
+    now = datetime.now()
+    i = 0
+    for day in sorted(closes):
+        while i < len(pending) and pending[i].txn_date <= day:
+            realized += _apply_txn(positions, pending[i])
+            i += 1
+        last_prices.update(closes[day])
+
+        total_value = 0.0
+        total_cost = 0.0
+        for ticker, (qty, cost) in positions.items():
+            close = last_prices.get(ticker)
+            total_value += qty * close if close else cost
+            total_cost += cost
+        rows.append({
+            "portfolio_id": portfolio_id, "date": day,
+            "total_value": round(total_value, 2), "total_cost": round(total_cost, 2),
+            "unrealized_pnl": round(total_value - total_cost, 2),
+            "realized_pnl_cumulative": round(realized, 2),
+            "num_holdings": len(positions), "computed_at": now,
+        })
+        checkpoint = day
+
+    # Replace everything from the restart point (only past rows when dirty), then bulk insert
+    db.query(PortfolioNAV).filter(
+        PortfolioNAV.portfolio_id == portfolio_id, PortfolioNAV.date >= start
+    ).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(PortfolioNAV), rows)
+
+    # Transactions dated after the last valued day stay pending for next run
+    applied = pending[:i]
+    if state is None:
+        state = PortfolioNavState(portfolio_id=portfolio_id)
+        db.add(state)
+    max_txn_id = (
+        db.query(sa_func.max(PortfolioTransaction.id))
+        .filter(PortfolioTransaction.portfolio_id == portfolio_id)
+        .scalar()
+    )
+    state.as_of_date = checkpoint
+    state.positions = positions
+    state.realized_pnl_cumulative = realized
+    state.last_txn_id = max_txn_id
+    state.dirty_from = None
+    db.commit()
+    logger.debug(
+        "NAV materialized for portfolio %d: %d rows, %d txns applied, as of %s",
+        portfolio_id, len(rows), len(applied), checkpoint,
+    )
+    return len(rows)
+
+
+def materialize_all_navs(db: Session, end_date: Optional[str] = None) -> int:
+    """Incremental NAV for every active manual portfolio. Returns rows written."""
+    portfolios = (
+        db.query(ModelPortfolio.id, ModelPortfolio.portfolio_type)
+        .filter(ModelPortfolio.status == PortfolioStatus.ACTIVE)
+        .all()
+    )
+    written = 0
+    for pid, ptype in portfolios:
+        if (ptype or "manual") == "pms":
+            continue
+        try:
+            written += materialize_portfolio_nav(pid, db, end_date)
+        except Exception as e:
+            db.rollback()
+            logger.warning("NAV materialization failed for portfolio %d: %s", pid, e)
+    return written
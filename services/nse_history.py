@@ -0,0 +1,189 @@
+"""
+FIE v3 — NSE History Fetcher
+Parallel daily-history download from NSE's historicalOR/indicesHistory API.
+
+The API serves at most ~90 days per call, so each index's missing range is
+split into 90-day chunks and every (index, chunk) pair is fetched by a small
+worker pool. Workers share:
+  - a pool of warmed sessions (NSE wants its homepage cookies first); a
+    session is re-warmed after SESSION_MAX_USES calls or on a 401/403
+  - one token bucket, so the pool as a whole stays under NSE_RATE_PER_SEC
+
+Callers pass a start date per index (e.g. the last stored date), so a daily
+refresh only asks for the few missing days. NSE_BASE_URL can point at a
+local fixture server for offline tests.
+"""
+
+import logging
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from price_service import _parse_nse_history_response
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger("fie_v3.nse_history")
+
+NSE_BASE_URL = os.getenv("NSE_BASE_URL", "https://www.nseindia.com")
+HISTORY_PATH = "/api/historicalOR/indicesHistory"
+CHUNK_DAYS = 90
+NSE_WORKERS = 4
+NSE_RATE_PER_SEC = 3.0
+NSE_BURST = 3
+SESSION_MAX_USES = 25
+REQUEST_TIMEOUT = 15
+
+NSE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+# ─── Session Pool ────────────────────────────────────────
+
+class _PooledSession:
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.uses = 0
+        self.stale = False
+
+
+class NSESessionPool:
+    """Fixed set of cookie-warmed sessions handed out one per in-flight request."""
+
+    def __init__(self, size: int, base_url: str = NSE_BASE_URL, max_uses: int = SESSION_MAX_USES):
+        self.base_url = base_url
+        self.max_uses = max_uses
+        self._idle: "queue.Queue[_PooledSession]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._warm())
+
+    def _warm(self) -> _PooledSession:
+        session = requests.Session()
+        try:
+            session.get(self.base_url, headers=NSE_HEADERS, timeout=10)
+        except requests.RequestException as e:
+            logger.warning("NSE session warm-up failed: %s", e)
+        return _PooledSession(session)
+
+    @contextmanager
+    def session(self) -> Iterator[_PooledSession]:
+        pooled = self._idle.get()
+        try:
+            yield pooled
+        finally:
+            pooled.uses += 1
+            if pooled.stale or pooled.uses >= self.max_uses:
+                pooled.session.close()
+                pooled = self._warm()
+            self._idle.put(pooled)
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().session.close()
+
+
+# ─── Fetch ───────────────────────────────────────────────
+
+def plan_chunks(start: date, end: date, chunk_days: int = CHUNK_DAYS) -> List[Tuple[date, date]]:
+    """Inclusive [from, to] windows of at most chunk_days covering start..end."""
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def _fetch_chunk(pool: NSESessionPool, limiter: TokenBucket, nse_name: str, start: date, end: date) -> List[dict]:
+    url = (
+        f"{pool.base_url}{HISTORY_PATH}?indexType={quote(nse_name)}"
+        f"&from={start.strftime('%d-%m-%Y')}&to={end.strftime('%d-%m-%Y')}"
+    )
+    headers = {
+        **NSE_HEADERS,
+        "referer": f"{pool.base_url}/",
+        "Accept": "application/json, text/html, */*",
+        "Sec-Fetch-Site": "same-origin",
+        "Sec-Fetch-Mode": "cors",
+    }
+    for _attempt in range(2):  # second try runs on a freshly warmed session
+        limiter.acquire()
+        with pool.session() as pooled:
+            try:
+                resp = pooled.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                logger.debug("NSE history %s %s..%s failed: %s", nse_name, start, end, e)
+                pooled.stale = True
+                continue
+            if resp.status_code in (401, 403):
+                pooled.stale = True
+                continue
+            if resp.status_code != 200:
+                logger.debug("NSE history chunk returned %d for %s (%s..%s)", resp.status_code, nse_name, start, end)
+                return []
+            try:
+                return _parse_nse_history_response(resp.json().get("data", []))
+            except ValueError:
+                pooled.stale = True  # HTML block page instead of JSON
+                continue
+    return []
+
+
+def fetch_index_histories(
+    indices: Dict[str, str],
+    start_dates: Dict[str, date],
+    end: Optional[date] = None,
+    base_url: Optional[str] = None,
+    workers: int = NSE_WORKERS,
+    rate_per_sec: float = NSE_RATE_PER_SEC,
+) -> Dict[str, List[dict]]:
+    """Fetch daily history for many indices concurrently.
+
+    indices: {key: NSE display name}; start_dates: {key: first date wanted}
+    (keys without a start date, or starting after `end`, are skipped).
+    Returns {key: [{date, open, high, low, close, volume}, ...]} sorted by date.
+    """
+    end = end or date.today()
+    tasks = [
+        (key, nse_name, c_start, c_end)
+        for key, nse_name in indices.items()
+        if start_dates.get(key) is not None
+        for c_start, c_end in plan_chunks(start_dates[key], end)
+    ]
+    if not tasks:
+        return {}
+
+    pool = NSESessionPool(size=min(workers, len(tasks)), base_url=base_url or NSE_BASE_URL)
+    limiter = TokenBucket(rate_per_sec, capacity=NSE_BURST)
+    by_key: Dict[str, Dict[str, dict]] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = {
+                executor.submit(_fetch_chunk, pool, limiter, nse_name, c_start, c_end): key
+                for key, nse_name, c_start, c_end in tasks
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    logger.debug("NSE history chunk for %s failed: %s", key, e)
+                    continue
+                dated = by_key.setdefault(key, {})
+                for row in rows:
+                    dated.setdefault(row["date"], row)
+    finally:
+        pool.close()
+
+    result = {key: [dated[d] for d in sorted(dated)] for key, dated in by_key.items() if dated}
+    logger.info("NSE history: %d chunks for %d indices -> %d with data", len(tasks), len(indices), len(result))
+    return result
@@ -0,0 +1,167 @@
+"""
+FIE v3 — Period Returns Snapshot
+Materializes each instrument's latest close, period anchor closes and
+returns (1d … 12m) into the period_returns table so /api/indices/latest
+and /api/baskets/live are single indexed reads. Ratio returns against any
+base are derived from the same rows at read time.
+
+Refreshed after EOD price writes; readers also refresh lazily when the
+snapshot no longer covers the latest IndexPrice date, or when a close on
+that date was rewritten in place (its fetched_at moved past the one the
+snapshot was built from).
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+from sqlalchemy import func as sa_func
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import IndexPrice, PeriodReturn
+
+logger = logging.getLogger("fie_v3.period_returns")
+
+PERIOD_DAYS = {"1d": 1, "1w": 7, "1m": 30, "3m": 90, "6m": 180, "12m": 365}
+# Max gap (days) between the period target date and the anchor close used
+PERIOD_TOLERANCE = {"1d": 5, "1w": 5, "1m": 10, "3m": 15, "6m": 15, "12m": 15}
+
+_refresh_lock = threading.Lock()
+
+
+# ─── Refresh ─────────────────────────────────────────────
+
+def _anchor_frame(prices: pd.DataFrame, latest: pd.DataFrame, period: str) -> pd.DataFrame:
+    """Per-instrument anchor (date, close) for one period.
+
+    1d uses the previous trading close; longer periods use the close nearest
+    to (as_of - N days) within the period tolerance.
+    """
+    tol = pd.Timedelta(days=PERIOD_TOLERANCE[period])
+    if period == "1d":
+        prev = prices.groupby("index_name").nth(-2)[["index_name", "dt", "close"]]
+        anchors = latest[["index_name", "as_of"]].merge(prev, on="index_name", how="left")
+        too_old = (anchors["as_of"] - anchors["dt"]) > tol + pd.Timedelta(days=1)
+        anchors.loc[too_old, "dt"] = pd.NaT
+        anchors.loc[too_old, "close"] = float("nan")
+        return anchors[["index_name", "dt", "close"]]
+
+    targets = latest[["index_name", "as_of"]].copy()
+    targets["target"] = targets["as_of"] - pd.Timedelta(days=PERIOD_DAYS[period])
+    anchors = pd.merge_asof(
+        targets.sort_values("target"),
+        prices.sort_values("dt"),
+        left_on="target", right_on="dt", by="index_name",
+        direction="nearest", tolerance=tol,
+    )
+    return anchors[["index_name", "dt", "close"]]
+
+
+def _latest_date_stats(db: Session, latest_date: str):
+    """(priced rows, max fetched_at) on latest_date — one indexed aggregate."""
+    return (
+        db.query(sa_func.count(IndexPrice.id), sa_func.max(IndexPrice.fetched_at))
+        .filter(IndexPrice.date == latest_date, IndexPrice.close_price.isnot(None), IndexPrice.close_price > 0)
+        .one()
+    )
+
+
+def refresh_period_returns(db: Session) -> int:
+    """Rebuild the period_returns table from IndexPrice. Returns instruments covered."""
+    latest_date = db.query(sa_func.max(IndexPrice.date)).scalar()
+    if not latest_date:
+        return 0
+    # Read before the prices: a write landing in between leaves the key behind, so the next check refreshes
+    _, source_fetched_at = _latest_date_stats(db, latest_date)
+    start = (
+        datetime.strptime(latest_date, "%Y-%m-%d")
+        - timedelta(days=max(PERIOD_DAYS.values()) + max(PERIOD_TOLERANCE.values()))
+    ).strftime("%Y-%m-%d")
+
+    rows = (
+        db.query(IndexPrice.index_name, IndexPrice.date, IndexPrice.close_price)
+        .filter(IndexPrice.date >= start, IndexPrice.close_price.isnot(None), IndexPrice.close_price > 0)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    prices = pd.DataFrame(rows, columns=["index_name", "date", "close"])
+    prices["dt"] = pd.to_datetime(prices["date"])
+    prices = prices.sort_values(["index_name", "dt"])
+    latest = prices.groupby("index_name").tail(1).rename(columns={"dt": "as_of", "close": "as_of_close"})
+
+    now = datetime.now()
+    records = []
+    for period in PERIOD_DAYS:
+        anchors = latest.merge(_anchor_frame(prices, latest, period), on="index_name", how="left")
+        for r in anchors.itertuples(index=False):
+            has_anchor = pd.notna(r.close) and r.close > 0
+            records.append({
+                "index_name": r.index_name, "period": period,
+                "as_of_date": r.date, "close": float(r.as_of_close),
+                "anchor_date": r.dt.strftime("%Y-%m-%d") if has_anchor else None,
+                "anchor_close": float(r.close) if has_anchor else None,
+                "return_pct": round((r.as_of_close / r.close - 1) * 100, 2) if has_anchor else None,
+                "computed_at": now, "source_fetched_at": source_fetched_at,
+            })
+
+    with _refresh_lock:
+        db.query(PeriodReturn).delete(synchronize_session=False)
+        db.execute(insert(PeriodReturn), records)
+        db.commit()
+    logger.info("Period returns refreshed: %d instruments as of %s", len(latest), latest_date)
+    return len(latest)
+
+
+def ensure_period_returns(db: Session) -> Optional[str]:
+    """Refresh the snapshot if it does not cover the latest IndexPrice date,
+    or a close on that date changed since it was built.
+
+    Staleness check is two indexed aggregates on the latest date only.
+    Returns the latest IndexPrice date (None when there is no price data).
+    """
+    latest_date = db.query(sa_func.max(IndexPrice.date)).scalar()
+    if not latest_date:
+        return None
+    priced, fetched_at = _latest_date_stats(db, latest_date)
+    covered, built_from = (
+        db.query(sa_func.count(PeriodReturn.id), sa_func.max(PeriodReturn.source_fetched_at))
+        .filter(PeriodReturn.as_of_date == latest_date, PeriodReturn.period == "1d")
+        .one()
+    )
+    if priced != covered or fetched_at != built_from:
+        refresh_period_returns(db)
+    return latest_date
+
+
+# ─── Read ────────────────────────────────────────────────
+
+def load_period_returns(
+    db: Session, names: Optional[Iterable[str]] = None, as_of_date: Optional[str] = None
+) -> Dict[str, Dict[str, PeriodReturn]]:
+    """{index_name: {period: PeriodReturn}} for the given instruments and/or as-of date."""
+    query = db.query(PeriodReturn)
+    if names is not None:
+        query = query.filter(PeriodReturn.index_name.in_(list(names)))
+    if as_of_date is not None:
+        query = query.filter(PeriodReturn.as_of_date == as_of_date)
+    snapshot: Dict[str, Dict[str, PeriodReturn]] = defaultdict(dict)
+    for r in query.all():
+        snapshot[r.index_name][r.period] = r
+    return snapshot
+
+
+def ratio_return(inst: Optional[PeriodReturn], base: Optional[PeriodReturn]) -> Optional[float]:
+    """Return (%) of inst/base between the two rows' anchors and current closes."""
+    if not inst or not base or not inst.anchor_close or not base.anchor_close or not base.close:
+        return None
+    ratio_old = inst.anchor_close / base.anchor_close
+    ratio_now = inst.close / base.close
+    if ratio_old <= 0:
+        return None
+    return round((ratio_now / ratio_old - 1) * 100, 2)
@@ -0,0 +1,130 @@
+"""
+FIE v3 — Stage Pipeline
+Tiny dependency-graph runner for scheduled jobs.
+
+Each Stage names the stages it runs `after`. Stages whose inputs are done run
+concurrently on a thread pool, each with its own DB session, which is
+committed when the stage returns (so downstream stages see its rows) and
+rolled back if it raises. A failed stage is logged and recorded but does not
+stop its dependents — the jobs this replaces treated every step as non-fatal.
+
+Every run records per-stage status, duration and row count; the last result
+per pipeline is kept in memory for /health.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence
+
+from models import SessionLocal
+
+logger = logging.getLogger("fie_v3.pipeline")
+
+PIPELINE_WORKERS = 4
+
+
+class Stage(NamedTuple):
+    """run(db, ctx) -> rows written. ctx is shared by all stages of one run;
+    a stage should only write ctx[its own name]."""
+    name: str
+    run: Callable[[Any, dict], Optional[int]]
+    after: Sequence[str] = ()
+
+
+class StageResult(NamedTuple):
+    name: str
+    status: str              # "ok" | "failed"
+    rows: int
+    seconds: float
+    error: Optional[str] = None
+
+
+_last_runs: Dict[str, dict] = {}
+_last_runs_lock = threading.Lock()
+
+
+def _check_graph(stages: Sequence[Stage]) -> None:
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate stage names in pipeline")
+    known = set(names)
+    for s in stages:
+        unknown = set(s.after) - known
+        if unknown:
+            raise ValueError(f"Stage {s.name!r} depends on unknown stages {sorted(unknown)}")
+    # Kahn's algorithm — anything left over sits on a cycle
+    pending = {s.name: set(s.after) for s in stages}
+    while True:
+        ready = [n for n, deps in pending.items() if not deps]
+        if not ready:
+            break
+        for n in ready:
+            del pending[n]
+        for deps in pending.values():
+            deps.difference_update(ready)
+    if pending:
+        raise ValueError(f"Pipeline has a dependency cycle through {sorted(pending)}")
+
+
+def _run_stage(stage: Stage, ctx: dict, session_factory: Callable) -> StageResult:
+    started = time.perf_counter()
+    db = session_factory()
+    try:
+        rows = stage.run(db, ctx) or 0
+        db.commit()
+        return StageResult(stage.name, "ok", int(rows), round(time.perf_counter() - started, 3))
+    except Exception as e:
+        db.rollback()
+        logger.warning("Pipeline stage %s failed (non-fatal): %s", stage.name, e)
+        return StageResult(stage.name, "failed", 0, round(time.perf_counter() - started, 3), str(e))
+    finally:
+        db.close()
+
+
+def run_pipeline(
+    name: str,
+    stages: Sequence[Stage],
+    workers: int = PIPELINE_WORKERS,
+    session_factory: Callable = SessionLocal,
+) -> Dict[str, StageResult]:
+    """Run stages in dependency order, independent ones concurrently. Returns {stage: StageResult}."""
+    _check_graph(stages)
+    started_at = datetime.now()
+    t0 = time.perf_counter()
+    ctx: dict = {}
+    results: Dict[str, StageResult] = {}
+    waiting = {s.name: s for s in stages}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-stage") as executor:
+        running = {}
+        while waiting or running:
+            for stage in [s for s in waiting.values() if all(d in results for d in s.after)]:
+                del waiting[stage.name]
+                running[executor.submit(_run_stage, stage, ctx, session_factory)] = stage.name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[running.pop(future)] = result
+                logger.info("Pipeline %s: %s %s in %.1fs (%d rows)",
+                            name, result.name, result.status, result.seconds, result.rows)
+
+    elapsed = round(time.perf_counter() - t0, 3)
+    failed = [r.name for r in results.values() if r.status != "ok"]
+    logger.info("Pipeline %s finished in %.1fs: %d stages, %d failed%s",
+                name, elapsed, len(results), len(failed), f" ({', '.join(failed)})" if failed else "")
+    with _last_runs_lock:
+        _last_runs[name] = {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "seconds": elapsed,
+            "stages": [r._asdict() for r in (results[s.name] for s in stages)],
+        }
+    return results
+
+
+def last_runs() -> Dict[str, dict]:
+    """{pipeline name: summary of its most recent run in this process}."""
+    with _last_runs_lock:
+        return {k: dict(v) for k, v in _last_runs.items()}
@@ -10,9 +10,12 @@ from typing import Optional
 
 import numpy as np
 import pandas as pd
+from sqlalchemy import desc
+from sqlalchemy import func as sa_func
 from sqlalchemy.orm import Session
 
 from models import DrawdownEvent, PmsNavDaily, PortfolioMetric
+from services.drawdown import drawdown_segments
 
 # Re-export parsers so existing imports still work
 from services.pms_parser import parse_nav_excel, parse_transaction_excel  # noqa: F401
@@ -275,66 +278,77 @@ def recalculate_portfolio_metrics(portfolio_id: int, db: Session) -> int:
     return count
 
 
-def detect_drawdown_events(portfolio_id: int, db: Session) -> int:
-    """Identify peak-to-trough drawdown events using unit_nav. Returns count."""
-    rows = (
-        db.query(PmsNavDaily)
-        .filter(PmsNavDaily.portfolio_id == portfolio_id)
-        .order_by(PmsNavDaily.date)
-        .all()
+def detect_drawdown_events(portfolio_id: int, db: Session, full: bool = False) -> int:
+    """Identify peak-to-trough drawdown events using unit_nav. Returns count of events.
+
+    Incremental by default: everything before the last open drawdown's peak
+    (or the last recovery) is settled, so only rows from there on are loaded
+    and re-segmented. Falls back to a full pass when there is no prior event
+    or the stored anchor no longer matches the NAV series (history rewritten).
+    """
+    start_date = None
+    anchor = None
+    if not full:
+        anchor = (
+            db.query(DrawdownEvent)
+            .filter(DrawdownEvent.portfolio_id == portfolio_id)
+            .order_by(desc(DrawdownEvent.peak_date))
+            .first()
+        )
+        if anchor is not None:
+            start_date = anchor.peak_date if anchor.status == 'underwater' else anchor.recovery_date
+
+    query = db.query(PmsNavDaily.date, PmsNavDaily.unit_nav, PmsNavDaily.nav).filter(
+        PmsNavDaily.portfolio_id == portfolio_id
     )
-    if len(rows) < 2:
-        return 0
+    if start_date is not None:
+        query = query.filter(PmsNavDaily.date >= start_date)
+    rows = query.order_by(PmsNavDaily.date).all()
 
     # Use unit_nav (TWR-adjusted) for drawdown detection
     navs = [r.unit_nav if r.unit_nav else r.nav for r in rows]
     dates = [r.date for r in rows]
 
-    db.query(DrawdownEvent).filter(DrawdownEvent.portfolio_id == portfolio_id).delete()
+    if start_date is not None:
+        anchor_ok = bool(rows) and dates[0] == start_date and (
+            abs(navs[0] - anchor.peak_nav) < 1e-6 if anchor.status == 'underwater'
+            else navs[0] >= anchor.peak_nav
+        )
+        if not anchor_ok:
+            return detect_drawdown_events(portfolio_id, db, full=True)
+
+    stale = db.query(DrawdownEvent).filter(DrawdownEvent.portfolio_id == portfolio_id)
+    if start_date is not None:
+        stale = stale.filter(DrawdownEvent.peak_date >= start_date)
+    stale.delete()
 
     events = []
-    peak_idx = 0
-    trough_idx = 0
-    in_drawdown = False
-
-    for i in range(1, len(navs)):
-        if navs[i] >= navs[peak_idx]:
-            if in_drawdown:
-                dd_pct = ((navs[trough_idx] - navs[peak_idx]) / navs[peak_idx]) * 100
-                if abs(dd_pct) >= 2.0:
-                    events.append(DrawdownEvent(
-                        portfolio_id=portfolio_id,
-                        peak_date=dates[peak_idx], peak_nav=navs[peak_idx],
-                        trough_date=dates[trough_idx], trough_nav=navs[trough_idx],
-                        drawdown_pct=round(dd_pct, 2),
-                        duration_days=(dates[trough_idx] - dates[peak_idx]).days,
-                        recovery_date=dates[i],
-                        recovery_days=(dates[i] - dates[trough_idx]).days,
-                        status='recovered',
-                    ))
-                in_drawdown = False
-            peak_idx = i
-            trough_idx = i
-        elif navs[i] < navs[trough_idx]:
-            trough_idx = i
-            in_drawdown = True
-
-    if in_drawdown:
-        dd_pct = ((navs[trough_idx] - navs[peak_idx]) / navs[peak_idx]) * 100
-        if abs(dd_pct) >= 2.0:
-            events.append(DrawdownEvent(
-                portfolio_id=portfolio_id,
-                peak_date=dates[peak_idx], peak_nav=navs[peak_idx],
-                trough_date=dates[trough_idx], trough_nav=navs[trough_idx],
-                drawdown_pct=round(dd_pct, 2),
-                duration_days=(dates[trough_idx] - dates[peak_idx]).days,
-                status='underwater',
-            ))
+    for seg in drawdown_segments(navs):
+        if abs(seg.depth_pct) < 2.0:
+            continue
+        peak_d, trough_d = dates[seg.peak], dates[seg.trough]
+        event = DrawdownEvent(
+            portfolio_id=portfolio_id,
+            peak_date=peak_d, peak_nav=navs[seg.peak],
+            trough_date=trough_d, trough_nav=navs[seg.trough],
+            drawdown_pct=round(seg.depth_pct, 2),
+            duration_days=(trough_d - peak_d).days,
+            status='underwater',
+        )
+        if seg.recovery is not None:
+            event.recovery_date = dates[seg.recovery]
+            event.recovery_days = (dates[seg.recovery] - trough_d).days
+            event.status = 'recovered'
+        events.append(event)
 
     db.add_all(events)
     db.commit()
-    logger.info("Detected %d drawdown events for portfolio %d", len(events), portfolio_id)
-    return len(events)
+    total = db.query(sa_func.count(DrawdownEvent.id)).filter(DrawdownEvent.portfolio_id == portfolio_id).scalar()
+    logger.info(
+        "Detected %d drawdown events for portfolio %d (%d re-evaluated from %s)",
+        total, portfolio_id, len(events), start_date or "inception",
+    )
+    return total
 
 
 def compute_monthly_returns(portfolio_id: int, db: Session) -> list[dict]:
@@ -9,17 +9,18 @@ from datetime import datetime
 from typing import Dict, List, Optional
 
 import httpx
+import numpy as np
 from cachetools import TTLCache
 from sqlalchemy import func as sa_func
 from sqlalchemy.orm import Session
 
 from models import (
-    IndexPrice,
     PortfolioHolding,
     PortfolioNAV,
     PortfolioTransaction,
     TransactionType,
 )
+from services.asof_prices import asof_prices
 
 logger = logging.getLogger("fie_v3.portfolio")
 
@@ -54,7 +55,8 @@ def get_yahoo_symbol(ticker: str) -> Optional[str]:
 _http_client: Optional[httpx.Client] = None
 
 # TTLCache automatically evicts entries after 15 min and caps at 500 entries
-_price_cache: TTLCache = TTLCache(maxsize=500, ttl=900)
+PRICE_CACHE_TTL = 900
+_price_cache: TTLCache = TTLCache(maxsize=500, ttl=PRICE_CACHE_TTL)
 
 
 def _get_http_client() -> httpx.Client:
@@ -120,7 +122,7 @@ def fetch_live_price(yf_symbol: str) -> Optional[Dict]:
 def get_live_prices(tickers: List[str], overrides: Optional[Dict[str, str]] = None) -> Dict[str, Dict]:
     """Fetch live prices for multiple tickers in parallel (max 8 concurrent).
     overrides: {ticker: yf_symbol} — per-holding overrides from FM, checked first.
-    Handles MB_ (microbasket) tickers by computing live basket values.
+    Handles MB_ (microbasket) tickers by valuing them from the same quote batch.
     Returns dict keyed by ticker -> price data dict. Tickers not found are absent."""
     ticker_to_yf: Dict[str, str] = {}
     basket_tickers: List[str] = []
@@ -138,73 +140,183 @@ def get_live_prices(tickers: List[str], overrides: Optional[Dict[str, str]] = No
                 if yf_sym:
                     ticker_to_yf[ticker] = yf_sym
 
-    prices: Dict[str, Dict] = {}
+    # Microbaskets: add every constituent to the same quote batch (deduplicated)
+    basket_weights = None
+    if basket_tickers:
+        try:
+            from services.basket_service import get_basket_weights
+
+            basket_weights = get_basket_weights()
+            wanted = set(basket_tickers)
+            for slug in basket_weights.slugs:
+                if slug not in wanted:
+                    continue
+                for ticker, _, _ in basket_weights.constituents[slug]:
+                    if ticker not in ticker_to_yf:
+                        yf_sym = get_yahoo_symbol(ticker)
+                        if yf_sym:
+                            ticker_to_yf[ticker] = yf_sym
+        except Exception as exc:
+            logger.debug("Basket weight load failed: %s", exc)
+
+    fetched: Dict[str, Dict] = {}
 
-    # Fetch regular Yahoo Finance prices
+    # Fetch Yahoo Finance prices
     if ticker_to_yf:
         with ThreadPoolExecutor(max_workers=8) as executor:
             future_to_ticker = {
                 executor.submit(fetch_live_price, yf_sym): ticker
                 for ticker, yf_sym in ticker_to_yf.items()
             }
-            for future in as_completed(future_to_ticker, timeout=20):
-                ticker = future_to_ticker[future]
-                try:
-                    data = future.result()
-                    if data:
-                        prices[ticker] = data
-                except Exception as exc:
-                    logger.debug("Parallel price fetch failed for %s: %s", ticker, exc)
-
-    # Fetch microbasket live prices
-    if basket_tickers:
-        try:
-            from models import BasketStatus, Microbasket, SessionLocal
-            from services.basket_service import compute_basket_live_value
-
-            db = SessionLocal()
-            for slug in basket_tickers:
-                basket = db.query(Microbasket).filter(
-                    Microbasket.slug == slug,
-                    Microbasket.status == BasketStatus.ACTIVE,
-                ).first()
-                if basket and basket.constituents:
-                    live_data = compute_basket_live_value(basket.constituents)
-                    if live_data:
-                        prices[slug] = {
-                            "current_price": live_data["current_price"],
-                            "change_pct": None,
-                            "yf_symbol": slug,
-                        }
-            db.close()
-        except Exception as exc:
-            logger.debug("Basket live price fetch failed: %s", exc)
+            try:
+                for future in as_completed(future_to_ticker, timeout=20):
+                    ticker = future_to_ticker[future]
+                    try:
+                        data = future.result()
+                        if data:
+                            fetched[ticker] = data
+                    except Exception as exc:
+                        logger.debug("Parallel price fetch failed for %s: %s", ticker, exc)
+            except TimeoutError:
+                # Serve what arrived in time; stragglers are simply absent
+                logger.warning("Live price batch timed out: %d/%d quotes received", len(fetched), len(future_to_ticker))
+
+    requested = set(tickers)
+    prices: Dict[str, Dict] = {t: d for t, d in fetched.items() if t in requested}
+
+    # Value all requested microbaskets in one pass from the shared quotes
+    if basket_weights is not None:
+        from services.basket_service import value_baskets
+
+        closes = {t: d.get("current_price") for t, d in fetched.items()}
+        for slug, live_data in value_baskets(basket_weights, closes, basket_tickers).items():
+            prices[slug] = {
+                "current_price": live_data["current_price"],
+                "change_pct": None,
+                "yf_symbol": slug,
+            }
 
     return prices
 
 
 # ─── Financial Calculations ──────────────────────────────────────────
 
-def compute_xirr(cashflows) -> Optional[float]:
-    """Compute XIRR using Newton-Raphson method. cashflows = [(date, amount), ...]"""
-    if not cashflows or len(cashflows) < 2:
-        return None
+# XIRR search bounds (annual rate as a fraction) and bracketing grid
+XIRR_MIN_RATE = -0.99
+XIRR_MAX_RATE = 100.0
+_XIRR_GRID = np.array([-0.99, -0.9, -0.75, -0.5, -0.25, 0.0, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0])
+
+
+def _xirr_arrays(cashflows):
+    """Cashflows -> (amounts, year fractions from the first cashflow date)."""
     t0 = cashflows[0][0]
-    days = [(d - t0).days / 365.0 for d, _ in cashflows]
-    amounts = [a for _, a in cashflows]
-    rate = 0.1
-    for _ in range(100):
-        npv = sum(a / (1 + rate) ** t for a, t in zip(amounts, days))
-        dnpv = sum(-t * a / (1 + rate) ** (t + 1) for a, t in zip(amounts, days))
-        if abs(dnpv) < 1e-12:
+    years = np.array([(d - t0).days / 365.0 for d, _ in cashflows], dtype=float)
+    amounts = np.array([a for _, a in cashflows], dtype=float)
+    return amounts, years
+
+
+def _xirr_npv(rates, amounts, years):
+    """NPV for each rate in `rates` (broadcasts over a leading rate axis)."""
+    rates = np.asarray(rates, dtype=float)
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        return np.sum(amounts * (1.0 + rates[..., None]) ** -years, axis=-1)
+
+
+def _xirr_bisect(amounts, years) -> Optional[float]:
+    """Bracketed fallback: find a sign change on a fixed grid, then bisect."""
+    npvs = _xirr_npv(_XIRR_GRID, amounts, years)
+    signs = np.sign(npvs)
+    crossings = np.nonzero(np.isfinite(npvs[:-1]) & np.isfinite(npvs[1:]) & (signs[:-1] * signs[1:] <= 0))[0]
+    if len(crossings) == 0:
+        return None
+    # Prefer the root closest to zero (the economically meaningful one)
+    i = crossings[np.argmin(np.abs(_XIRR_GRID[crossings]))]
+    lo, hi = _XIRR_GRID[i], _XIRR_GRID[i + 1]
+    f_lo = npvs[i]
+    for _ in range(200):
+        mid = 0.5 * (lo + hi)
+        f_mid = _xirr_npv(mid, amounts, years)
+        if f_mid == 0 or (hi - lo) < 1e-10:
+            return mid
+        if np.sign(f_mid) == np.sign(f_lo):
+            lo, f_lo = mid, f_mid
+        else:
+            hi = mid
+    return 0.5 * (lo + hi)
+
+
+def _xirr_newton(amounts, years, rates, max_iter: int = 50, tol: float = 1e-8):
+    """Vectorized Newton-Raphson over a batch of padded cashflow rows.
+
+    amounts/years are (m, n); rates is (m,). Returns (rates, converged mask).
+    """
+    rates = rates.astype(float).copy()
+    converged = np.zeros(len(rates), dtype=bool)
+    active = np.ones(len(rates), dtype=bool)
+    for _ in range(max_iter):
+        if not active.any():
             break
-        new_rate = rate - npv / dnpv
-        if abs(new_rate - rate) < 1e-8:
-            return round(new_rate * 100, 2)
-        rate = new_rate
-        if rate < -0.99 or rate > 100:
-            return None
-    return round(rate * 100, 2)
+        r = rates[active]
+        a, t = amounts[active], years[active]
+        with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+            disc = (1.0 + r[:, None]) ** -t
+            npv = np.sum(a * disc, axis=1)
+            dnpv = np.sum(-t * a * disc / (1.0 + r[:, None]), axis=1)
+            step = npv / dnpv
+        new_r = r - step
+
+        idx = np.nonzero(active)[0]
+        bad = ~np.isfinite(new_r) | (np.abs(dnpv) < 1e-12) | (new_r < XIRR_MIN_RATE) | (new_r > XIRR_MAX_RATE)
+        done = ~bad & (np.abs(new_r - r) < tol)
+        rates[idx[~bad]] = new_r[~bad]
+        converged[idx[done]] = True
+        active[idx[bad | done]] = False
+    return rates, converged
+
+
+def compute_xirr(cashflows) -> Optional[float]:
+    """Compute XIRR (%) for cashflows = [(date, amount), ...].
+
+    Newton-Raphson on NumPy arrays; if Newton diverges or leaves the
+    [-99%, 10000%] band, falls back to a bracketed bisection. Returns None
+    when the cashflows have no root in that band.
+    """
+    return compute_xirr_batch([cashflows])[0]
+
+
+def compute_xirr_batch(cashflow_sets) -> List[Optional[float]]:
+    """XIRR (%) for many cashflow series at once (portfolios, holdings, ...).
+
+    Series are zero-padded into one matrix so every Newton iteration is a
+    single array operation; series that fail to converge are re-solved
+    individually with the bracketed fallback.
+    """
+    results: List[Optional[float]] = [None] * len(cashflow_sets)
+    valid = []
+    for i, cfs in enumerate(cashflow_sets):
+        if not cfs or len(cfs) < 2:
+            continue
+        amounts, years = _xirr_arrays(cfs)
+        # A root needs both inflows and outflows
+        if not (amounts > 0).any() or not (amounts < 0).any():
+            continue
+        valid.append((i, amounts, years))
+    if not valid:
+        return results
+
+    width = max(len(a) for _, a, _ in valid)
+    amounts_m = np.zeros((len(valid), width))
+    years_m = np.zeros((len(valid), width))
+    for row, (_, a, t) in enumerate(valid):
+        amounts_m[row, :len(a)] = a
+        years_m[row, :len(t)] = t
+
+    rates, converged = _xirr_newton(amounts_m, years_m, np.full(len(valid), 0.1))
+    for row, (i, a, t) in enumerate(valid):
+        rate = rates[row] if converged[row] else _xirr_bisect(a, t)
+        if rate is not None:
+            results[i] = round(float(rate) * 100, 2)
+    return results
 
 
 def compute_max_drawdown(values) -> Optional[float]:
@@ -235,24 +347,9 @@ def compute_nav_for_portfolio(portfolio_id: int, date_str: str, db: Session):
     if not holdings:
         return None
 
-    # Batch-fetch latest price for each holding ticker on or before date_str
-    # instead of querying inside a loop (N+1 -> 1 query)
-    tickers = [h.ticker for h in holdings]
-    subq = (
-        db.query(
-            IndexPrice.index_name,
-            sa_func.max(IndexPrice.date).label("max_date"),
-        )
-        .filter(IndexPrice.index_name.in_(tickers), IndexPrice.date <= date_str)
-        .group_by(IndexPrice.index_name)
-        .subquery()
-    )
-    price_rows = (
-        db.query(IndexPrice.index_name, IndexPrice.close_price)
-        .join(subq, (IndexPrice.index_name == subq.c.index_name) & (IndexPrice.date == subq.c.max_date))
-        .all()
-    )
-    price_map = {r[0]: r[1] for r in price_rows if r[1]}
+    # Latest close on or before date_str for every holding in one lookup
+    asof = asof_prices(db, [h.ticker for h in holdings], [date_str])[date_str]
+    price_map = {ticker: p.close for ticker, p in asof.items()}
 
     total_value = 0.0
     total_cost = 0.0
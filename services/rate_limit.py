@@ -0,0 +1,30 @@
+"""
+FIE v3 — Rate Limiting
+Thread-safe token bucket shared by the worker pools that call external
+APIs (NSE history, yfinance fundamentals).
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """`rate` tokens per second, bursts of up to `capacity`. acquire() blocks until a token is free."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token (possibly going negative); callers sleep off the debt outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,286 @@
+"""
+FIE v3 — Portfolio Valuation Service
+Batched totals for every active portfolio (portfolio list view).
+Manual portfolios: one grouped holdings query, one grouped realized P&L query,
+and a single live-price batch over the union of tickers.
+PMS portfolios: latest NAV, corpus history and SI metric loaded in three queries.
+Results are cached per (holdings version, price window).
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func as sa_func
+from sqlalchemy.orm import Session
+
+from models import (
+    ModelPortfolio,
+    PmsNavDaily,
+    PortfolioHolding,
+    PortfolioMetric,
+    PortfolioStatus,
+    PortfolioTransaction,
+    TransactionType,
+)
+from services.portfolio_service import PRICE_CACHE_TTL, get_live_prices
+
+logger = logging.getLogger("fie_v3.valuation")
+
+# Corpus increase (INR) treated as a capital infusion for PMS total_invested
+CAPITAL_INFUSION_THRESHOLD = 10000
+
+# Single-slot cache: {"key": (membership, holdings_version, price_epoch), "totals": {portfolio_id: dict}}
+_summary_cache: dict = {"key": None, "totals": {}}
+_summary_cache_lock = threading.Lock()
+
+
+# ─── Cache Key ───────────────────────────────────────────
+
+def _holdings_version(db: Session) -> tuple:
+    """Cheap fingerprint of everything the portfolio totals depend on.
+
+    One round trip of scalar aggregates over holdings, transactions and
+    PMS NAV/metric rows — any write that can change a total changes this.
+    """
+    def scalar(*cols):
+        return [db.query(c).scalar_subquery() for c in cols]
+
+    row = db.query(
+        *scalar(
+            sa_func.count(PortfolioHolding.id),
+            sa_func.sum(PortfolioHolding.quantity),
+            sa_func.sum(PortfolioHolding.total_cost),
+            sa_func.max(PortfolioHolding.updated_at),
+        ),
+        *scalar(
+            sa_func.count(PortfolioTransaction.id),
+            sa_func.sum(PortfolioTransaction.realized_pnl),
+        ),
+        *scalar(
+            sa_func.count(PmsNavDaily.id),
+            sa_func.max(PmsNavDaily.date),
+            sa_func.sum(PmsNavDaily.nav),
+            sa_func.sum(PmsNavDaily.corpus),
+        ),
+        *scalar(
+            sa_func.count(PortfolioMetric.id),
+            sa_func.max(PortfolioMetric.as_of_date),
+            sa_func.sum(PortfolioMetric.cagr_pct),
+        ),
+    ).one()
+    return tuple(str(v) for v in row)
+
+
+def _price_epoch() -> int:
+    """Live prices are cached for PRICE_CACHE_TTL — totals share that window."""
+    return int(time.time() // PRICE_CACHE_TTL)
+
+
+# ─── Manual Portfolios ───────────────────────────────────
+
+def _compute_manual_totals(portfolio_ids: List[int], db: Session) -> Dict[int, dict]:
+    """Totals for manual portfolios from two grouped queries + one price batch."""
+    if not portfolio_ids:
+        return {}
+
+    holding_rows = (
+        db.query(
+            PortfolioHolding.portfolio_id,
+            PortfolioHolding.ticker,
+            PortfolioHolding.quantity,
+            PortfolioHolding.total_cost,
+        )
+        .filter(PortfolioHolding.portfolio_id.in_(portfolio_ids), PortfolioHolding.quantity > 0)
+        .all()
+    )
+    realized_rows = (
+        db.query(PortfolioTransaction.portfolio_id, sa_func.sum(PortfolioTransaction.realized_pnl))
+        .filter(
+            PortfolioTransaction.portfolio_id.in_(portfolio_ids),
+            PortfolioTransaction.txn_type == TransactionType.SELL,
+        )
+        .group_by(PortfolioTransaction.portfolio_id)
+        .all()
+    )
+    realized_map = {pid: (total or 0.0) for pid, total in realized_rows}
+
+    tickers = sorted({r.ticker for r in holding_rows if r.ticker})
+    prices = get_live_prices(tickers) if tickers else {}
+
+    by_portfolio: Dict[int, list] = defaultdict(list)
+    for r in holding_rows:
+        by_portfolio[r.portfolio_id].append(r)
+
+    totals: Dict[int, dict] = {}
+    for pid in portfolio_ids:
+        holdings = by_portfolio.get(pid, [])
+        total_invested = sum(h.total_cost for h in holdings)
+        current_value = 0.0
+        for h in holdings:
+            cp = prices.get(h.ticker, {}).get("current_price")
+            current_value += (h.quantity * cp) if cp else h.total_cost
+        realized = realized_map.get(pid, 0.0)
+
+        total_return = (current_value - total_invested) + realized
+        total_return_pct = (total_return / total_invested * 100) if total_invested > 0 else 0.0
+        totals[pid] = {
+            "num_holdings": len(holdings),
+            "total_invested": round(total_invested, 2),
+            "current_value": round(current_value, 2),
+            "realized_pnl": round(realized, 2),
+            "total_return_pct": round(total_return_pct, 2),
+        }
+    return totals
+
+
+# ─── PMS Portfolios ──────────────────────────────────────
+
+def total_invested_from_corpus(corpus_values: List[float]) -> float:
+    """First corpus + every positive corpus change above the infusion threshold."""
+    if not corpus_values:
+        return 0.0
+    total_invested = corpus_values[0] or 0.0
+    for prev, curr in zip(corpus_values, corpus_values[1:]):
+        delta = (curr or 0.0) - (prev or 0.0)
+        if delta > CAPITAL_INFUSION_THRESHOLD:
+            total_invested += delta
+    return total_invested
+
+
+def _compute_pms_totals(portfolio_ids: List[int], db: Session) -> Dict[int, dict]:
+    """Totals for PMS portfolios: latest NAV, corpus infusions, SI CAGR (3 queries)."""
+    if not portfolio_ids:
+        return {}
+
+    latest_sub = (
+        db.query(PmsNavDaily.portfolio_id, sa_func.max(PmsNavDaily.date).label("max_date"))
+        .filter(PmsNavDaily.portfolio_id.in_(portfolio_ids))
+        .group_by(PmsNavDaily.portfolio_id)
+        .subquery()
+    )
+    latest_nav = {
+        pid: nav or 0.0
+        for pid, nav in db.query(PmsNavDaily.portfolio_id, PmsNavDaily.nav)
+        .join(
+            latest_sub,
+            (PmsNavDaily.portfolio_id == latest_sub.c.portfolio_id)
+            & (PmsNavDaily.date == latest_sub.c.max_date),
+        )
+        .all()
+    }
+
+    corpus_map: Dict[int, list] = defaultdict(list)
+    for pid, corpus in (
+        db.query(PmsNavDaily.portfolio_id, PmsNavDaily.corpus)
+        .filter(PmsNavDaily.portfolio_id.in_(portfolio_ids), PmsNavDaily.corpus.isnot(None))
+        .order_by(PmsNavDaily.portfolio_id, PmsNavDaily.date)
+        .all()
+    ):
+        corpus_map[pid].append(corpus)
+
+    si_sub = (
+        db.query(PortfolioMetric.portfolio_id, sa_func.max(PortfolioMetric.as_of_date).label("max_date"))
+        .filter(PortfolioMetric.portfolio_id.in_(portfolio_ids), PortfolioMetric.period == "SI")
+        .group_by(PortfolioMetric.portfolio_id)
+        .subquery()
+    )
+    si_map = {
+        m.portfolio_id: m
+        for m in db.query(PortfolioMetric)
+        .join(
+            si_sub,
+            (PortfolioMetric.portfolio_id == si_sub.c.portfolio_id)
+            & (PortfolioMetric.as_of_date == si_sub.c.max_date),
+        )
+        .filter(PortfolioMetric.period == "SI")
+        .all()
+    }
+
+    totals: Dict[int, dict] = {}
+    for pid in portfolio_ids:
+        current_value = latest_nav.get(pid, 0.0)
+        total_invested = total_invested_from_corpus(corpus_map.get(pid, [])) if pid in latest_nav else 0.0
+
+        total_return_pct = 0.0
+        si_metric = si_map.get(pid) if pid in latest_nav else None
+        if si_metric:
+            # Prefer CAGR, fall back to simple return
+            total_return_pct = si_metric.cagr_pct if si_metric.cagr_pct is not None else (si_metric.return_pct or 0.0)
+        elif total_invested > 0:
+            total_return_pct = ((current_value - total_invested) / total_invested) * 100
+
+        totals[pid] = {
+            "num_holdings": 0,
+            "total_invested": round(total_invested, 2),
+            "current_value": round(current_value, 2),
+            "realized_pnl": 0.0,
+            "total_return_pct": round(total_return_pct, 2),
+        }
+    return totals
+
+
+# ─── Public API ──────────────────────────────────────────
+
+def _portfolio_type(p: ModelPortfolio) -> str:
+    return getattr(p, "portfolio_type", "manual") or "manual"
+
+
+def _compute_all_totals(portfolios: List[ModelPortfolio], db: Session) -> Dict[int, dict]:
+    manual_ids = [p.id for p in portfolios if _portfolio_type(p) != "pms"]
+    pms_ids = [p.id for p in portfolios if _portfolio_type(p) == "pms"]
+    totals = _compute_manual_totals(manual_ids, db)
+    totals.update(_compute_pms_totals(pms_ids, db))
+    return totals
+
+
+def get_portfolio_summaries(db: Session) -> List[dict]:
+    """All active portfolios with totals, ordered by most recently updated.
+
+    Metadata is always read fresh; totals come from the cache when neither
+    holdings/NAV data nor the live-price window has changed.
+    """
+    portfolios = (
+        db.query(ModelPortfolio)
+        .filter(ModelPortfolio.status == PortfolioStatus.ACTIVE)
+        .order_by(ModelPortfolio.updated_at.desc())
+        .all()
+    )
+    if not portfolios:
+        return []
+
+    membership: Tuple = tuple(sorted((p.id, _portfolio_type(p)) for p in portfolios))
+    key = (membership, _holdings_version(db), _price_epoch())
+
+    with _summary_cache_lock:
+        totals = _summary_cache["totals"] if _summary_cache["key"] == key else None
+
+    if totals is None:
+        totals = _compute_all_totals(portfolios, db)
+        with _summary_cache_lock:
+            _summary_cache["key"] = key
+            _summary_cache["totals"] = totals
+        logger.debug("Portfolio totals recomputed for %d portfolios", len(portfolios))
+
+    results = []
+    for p in portfolios:
+        results.append({
+            "id": p.id, "name": p.name, "description": p.description,
+            "benchmark": p.benchmark,
+            "status": p.status.value if p.status else "ACTIVE",
+            "portfolio_type": _portfolio_type(p),
+            "ucc_code": getattr(p, "ucc_code", None),
+            "created_at": (p.created_at.isoformat() + "Z") if p.created_at else None,
+            "updated_at": (p.updated_at.isoformat() + "Z") if p.updated_at else None,
+            **totals[p.id],
+        })
+    return results
+
+
+def clear_summary_cache() -> None:
+    """Drop cached totals (next list request recomputes)."""
+    with _summary_cache_lock:
+        _summary_cache["key"] = None
+        _summary_cache["totals"] = {}
@@ -7,6 +7,8 @@ for the microbasket feature.
 
 from unittest.mock import patch
 
+import pytest
+
 from models import BasketStatus, IndexPrice, Microbasket, MicrobasketConstituent
 
 # ─── Helpers ────────────────────────────────────────────────
@@ -122,8 +124,9 @@ class TestCreateBasket:
         response = client.post("/api/baskets", json=payload)
         assert response.status_code == 422  # Pydantic le=100
 
+    @patch("routers.baskets.compute_basket_live_value", return_value=None)
     @patch("routers.baskets.threading.Thread")
-    def test_should_auto_compute_portfolio_size_from_price_and_quantity(self, mock_thread, client):
+    def test_should_auto_compute_portfolio_size_from_price_and_quantity(self, mock_thread, mock_live, client):
         """When portfolio_size is not set, it should be computed from buy_price * quantity."""
         payload = {
             "name": "Auto Size",
@@ -141,8 +144,9 @@ class TestCreateBasket:
         assert detail_resp.status_code == 200
         assert detail_resp.json()["portfolio_size"] == 42500.0
 
+    @patch("routers.baskets.compute_basket_live_value", return_value=None)
     @patch("routers.baskets.threading.Thread")
-    def test_should_uppercase_ticker(self, mock_thread, client):
+    def test_should_uppercase_ticker(self, mock_thread, mock_live, client):
         """Tickers should be uppercased and stripped."""
         payload = _valid_basket_payload(name="Upper Test", constituents=[
             {"ticker": "  reliance  ", "weight_pct": 50.0},
@@ -156,8 +160,9 @@ class TestCreateBasket:
         assert "RELIANCE" in tickers
         assert "TCS" in tickers
 
+    @patch("routers.baskets.compute_basket_live_value", return_value=None)
     @patch("routers.baskets.threading.Thread")
-    def test_should_default_benchmark_to_nifty(self, mock_thread, client):
+    def test_should_default_benchmark_to_nifty(self, mock_thread, mock_live, client):
         payload = _valid_basket_payload(name="Default Benchmark")
         del payload["benchmark"]
         response = client.post("/api/baskets", json=payload)
@@ -434,3 +439,107 @@ class TestBasketsLive:
         assert "ratio_returns" in live_basket
         assert "index_returns" in live_basket
         assert "constituents" in live_basket
+
+
+class TestBackfillBasketNav:
+    """services/basket_service.backfill_basket_nav — vectorized over the window."""
+
+    def _seed_prices(self, db_session):
+        from datetime import datetime, timedelta
+        today = datetime.now().date()
+        # INFY trades daily; HDFCBANK has a 10-day hole (> 7-day forward-fill limit)
+        for i in range(30, -1, -1):
+            d = (today - timedelta(days=i)).strftime("%Y-%m-%d")
+            db_session.add(IndexPrice(date=d, index_name="INFY", close_price=1000.0 + i))
+            if not 12 <= i <= 21:
+                db_session.add(IndexPrice(date=d, index_name="HDFCBANK", close_price=500.0 - i))
+        db_session.commit()
+
+    def test_should_match_per_day_basket_value(self, db_session):
+        from datetime import datetime, timedelta
+
+        from services.basket_service import backfill_basket_nav, compute_basket_value_from_db
+        basket = _seed_basket(db_session, name="Backfill Basket")
+        self._seed_prices(db_session)
+
+        stored = backfill_basket_nav(basket, db_session, days=30)
+        navs = dict(
+            db_session.query(IndexPrice.date, IndexPrice.close_price)
+            .filter(IndexPrice.index_name == basket.slug)
+            .all()
+        )
+        assert stored == len(navs) > 0
+
+        today = datetime.now().date()
+        for i in range(30, -1, -1):
+            day = today - timedelta(days=i)
+            d = day.strftime("%Y-%m-%d")
+            expected = compute_basket_value_from_db(basket.constituents, d, db_session) if day.weekday() < 5 else None
+            if expected is None:
+                assert d not in navs
+            else:
+                assert navs[d] == pytest.approx(expected, abs=1e-4), d
+
+    def test_should_update_existing_nav_rows_on_rerun(self, db_session):
+        from services.basket_service import backfill_basket_nav
+        basket = _seed_basket(db_session, name="Rerun Basket")
+        self._seed_prices(db_session)
+
+        first = backfill_basket_nav(basket, db_session, days=30)
+        assert backfill_basket_nav(basket, db_session, days=30) == first
+        assert db_session.query(IndexPrice).filter(IndexPrice.index_name == basket.slug).count() == first
+
+
+class TestLiveBasketValuation:
+    """Shared-quote live valuation (services/basket_service + get_live_prices)."""
+
+    def _seed_two_baskets(self, db_session):
+        from services.basket_service import invalidate_basket_weights
+        first = _seed_basket(db_session, name="Live One")            # INFY 60 / HDFCBANK 40
+        second = Microbasket(name="Live Two", slug="MB_LIVE_TWO", benchmark="NIFTY", status=BasketStatus.ACTIVE)
+        db_session.add(second)
+        db_session.flush()
+        db_session.add(MicrobasketConstituent(basket_id=second.id, ticker="INFY", weight_pct=50.0))
+        db_session.add(MicrobasketConstituent(basket_id=second.id, ticker="TCS", weight_pct=50.0))
+        db_session.commit()
+        invalidate_basket_weights()
+        return first.slug, second.slug
+
+    def test_should_value_all_baskets_in_one_pass(self, db_session):
+        from services.basket_service import get_basket_weights, value_baskets
+        one, two = self._seed_two_baskets(db_session)
+
+        weights = get_basket_weights(db_session)
+        assert weights.tickers == ["HDFCBANK", "INFY", "TCS"]
+        values = value_baskets(weights, {"INFY": 1000.0, "HDFCBANK": 500.0, "TCS": 3000.0})
+        assert values[one]["current_price"] == 800.0
+        assert values[two]["current_price"] == 2000.0
+        assert [c["ticker"] for c in values[two]["constituents"]] == ["INFY", "TCS"]
+
+    def test_should_fetch_each_constituent_once_across_baskets(self, db_session):
+        from services.portfolio_service import get_live_prices
+        one, two = self._seed_two_baskets(db_session)
+        quotes = {"INFY.NS": 1000.0, "HDFCBANK.NS": 500.0, "TCS.NS": 3000.0}
+
+        with patch(
+            "services.portfolio_service.fetch_live_price",
+            side_effect=lambda sym: {"current_price": quotes[sym], "change_pct": None, "yf_symbol": sym},
+        ) as mock_fetch:
+            prices = get_live_prices([one, two, "INFY"])
+
+        assert sorted(c.args[0] for c in mock_fetch.call_args_list) == sorted(quotes)
+        assert prices[one]["current_price"] == 800.0
+        assert prices[two]["current_price"] == 2000.0
+        assert prices["INFY"]["current_price"] == 1000.0
+        assert "TCS" not in prices  # constituent-only quotes are not returned
+
+    def test_should_reload_weights_after_invalidation(self, db_session):
+        from services.basket_service import get_basket_weights, invalidate_basket_weights
+        one, _ = self._seed_two_baskets(db_session)
+        assert one in get_basket_weights(db_session).slugs
+
+        db_session.query(Microbasket).filter(Microbasket.slug == one).update({"status": BasketStatus.ARCHIVED})
+        db_session.commit()
+        assert one in get_basket_weights(db_session).slugs  # cached
+        invalidate_basket_weights()
+        assert one not in get_basket_weights(db_session).slugs
@@ -4,6 +4,7 @@ Tests for Sector Compass — Gate-based RS engine, portfolio rules, and API rout
 
 import pytest
 from datetime import datetime, timedelta
+from unittest.mock import patch
 
 from models import (
     CompassAction,
@@ -499,6 +500,79 @@ class TestCompassAPI:
         assert resp.status_code == 200
         assert isinstance(resp.json(), list)
 
+    def test_history_endpoint_columnar(self, client):
+        resp = client.get("/api/compass/history/NIFTYIT?instrument_type=index&shape=columns&max_points=20")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert set(data) >= {"dates", "values", "rs_momentum"}
+        assert "etag" in resp.headers
+
+    def test_history_batch_endpoint_aligns_paths_to_shared_dates(self, client, db_session):
+        from routers.compass import _clear_cache
+
+        _clear_cache()
+        d1 = (datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d")
+        d2 = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        for date, inst, score in [(d1, "NIFTYIT", 60.0), (d2, "NIFTYIT", 65.0), (d2, "NIFTYBANK", 40.0),
+                                  (d2, "ITBEES", 55.0)]:
+            db_session.add(CompassRSScore(
+                date=date, instrument_id=inst, instrument_type="etf" if inst == "ITBEES" else "index",
+                rs_score=score, rs_momentum=1.0, quadrant=CompassQuadrant.LEADING, action=CompassAction.BUY,
+            ))
+        db_session.commit()
+
+        resp = client.get("/api/compass/history?instrument_type=index")
+        assert resp.status_code == 200 and "etag" in resp.headers
+        data = resp.json()
+        assert data["dates"] == [d1, d2]
+        assert set(data["instruments"]) == {"NIFTYIT", "NIFTYBANK"}
+        assert data["instruments"]["NIFTYIT"]["rs_score"] == [60.0, 65.0]
+        assert data["instruments"]["NIFTYBANK"]["rs_score"] == [None, 40.0]
+        assert data["instruments"]["NIFTYBANK"]["quadrant"] == [None, "LEADING"]
+
+        only = client.get("/api/compass/history?instrument_type=index&ids=NIFTYBANK").json()
+        assert list(only["instruments"]) == ["NIFTYBANK"]
+
+    def test_history_batch_endpoint_serves_cache_until_scores_recomputed(self, client, db_session):
+        from routers.compass import _clear_cache
+
+        _clear_cache()
+        d1 = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        row = CompassRSScore(date=d1, instrument_id="NIFTYIT", instrument_type="index", rs_score=50.0,
+                             rs_momentum=0.0, quadrant=CompassQuadrant.LAGGING, action=CompassAction.AVOID)
+        db_session.add(row)
+        db_session.commit()
+        assert client.get("/api/compass/history").json()["instruments"]["NIFTYIT"]["rs_score"] == [50.0]
+
+        row.rs_score = 70.0     # same-day re-score: served from cache until the RS cache is cleared
+        db_session.commit()
+        assert client.get("/api/compass/history").json()["instruments"]["NIFTYIT"]["rs_score"] == [50.0]
+        _clear_cache()
+        assert client.get("/api/compass/history").json()["instruments"]["NIFTYIT"]["rs_score"] == [70.0]
+
+    def test_refresh_clears_history_cache_after_persisting_scores(self, client, db_session):
+        from routers.compass import _clear_cache
+
+        _clear_cache()
+        d1 = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        row = CompassRSScore(date=d1, instrument_id="NIFTYREALTY", instrument_type="index", rs_score=40.0,
+                             rs_momentum=0.0, quadrant=CompassQuadrant.LAGGING, action=CompassAction.AVOID)
+        db_session.add(row)
+        db_session.commit()
+
+        def persist(db, scores, instrument_type):
+            # a history read racing the refresh caches the pre-refresh row
+            client.get("/api/compass/history")
+            row.rs_score = 60.0
+            db_session.commit()
+
+        with patch("services.compass_rs.compute_sector_rs_scores", return_value=[]), \
+                patch("services.compass_rs.persist_rs_scores", side_effect=persist), \
+                patch("services.compass_portfolio.run_weekly_rebalance", return_value={}), \
+                patch("services.compass_portfolio.update_model_nav", return_value={}):
+            assert client.post("/api/compass/refresh").status_code == 200
+        assert client.get("/api/compass/history").json()["instruments"]["NIFTYREALTY"]["rs_score"] == [60.0]
+
     def test_refresh_endpoint(self, client):
         resp = client.post("/api/compass/refresh")
         assert resp.status_code == 200
@@ -524,6 +598,18 @@ class TestCompassPortfolioRules:
         metrics = get_performance_metrics(db_session, portfolio_type="etf_only")
         assert metrics["status"] == "no_data"
 
+    def test_nav_max_drawdown_carries_forward(self, db_session):
+        from services.compass_portfolio import _compute_nav_for_portfolio
+
+        for d, nav, dd in [("2025-01-01", 100.0, 0.0), ("2025-01-02", 125.0, 0.0), ("2025-01-03", 110.0, 12.0)]:
+            db_session.add(CompassModelNAV(portfolio_type="etf_only", date=d, nav=nav, max_drawdown=dd))
+        db_session.commit()
+
+        # No positions -> today's NAV is 100, i.e. 20% below the 125 peak
+        result = _compute_nav_for_portfolio(db_session, "etf_only")
+        assert result["nav"] == 100.0
+        assert result["max_drawdown"] == 20.0
+
     def test_rebalance_no_data(self, db_session):
         from services.compass_portfolio import run_weekly_rebalance
         result = run_weekly_rebalance(db_session, [])
@@ -650,3 +736,37 @@ class TestCompassRSComputation:
         assert row is not None
         assert row.rs_score == 72
         assert row.quadrant == CompassQuadrant.LEADING
+
+    def test_persist_rs_scores_upserts_in_one_statement_and_skips_unchanged(self, db_session):
+        from sqlalchemy import event
+
+        from services.compass_rs import persist_rs_scores
+
+        def score(key, rs, quadrant="LEADING"):
+            return {"sector_key": key, "rs_score": rs, "rs_momentum": 1.0, "quadrant": quadrant, "action": "BUY"}
+
+        persist_rs_scores(db_session, [score("NIFTYIT", 60), score("NIFTYBANK", 40)], "index", "2025-06-02")
+
+        statements = []
+        engine = db_session.get_bind()
+
+        def _capture(conn, cursor, statement, params, context, executemany):
+            if "compass_rs_scores" in statement:
+                statements.append(cursor.rowcount)
+
+        event.listen(engine, "after_cursor_execute", _capture)
+        try:
+            # Unchanged rows are not rewritten
+            assert persist_rs_scores(db_session, [score("NIFTYIT", 60), score("NIFTYBANK", 40)],
+                                     "index", "2025-06-02") == 2
+            # One changed, one new, duplicate key in the batch: last one wins
+            persist_rs_scores(db_session, [score("NIFTYIT", 10), score("NIFTYIT", 65, "WEAKENING"),
+                                           score("NIFTYBANK", 40), score("NIFTYFMCG", 50)], "index", "2025-06-02")
+        finally:
+            event.remove(engine, "after_cursor_execute", _capture)
+
+        assert statements == [0, 2]
+        rows = {r.instrument_id: r for r in db_session.query(CompassRSScore).filter_by(date="2025-06-02")}
+        assert set(rows) == {"NIFTYIT", "NIFTYBANK", "NIFTYFMCG"}
+        db_session.refresh(rows["NIFTYIT"])
+        assert rows["NIFTYIT"].rs_score == 65 and rows["NIFTYIT"].quadrant == CompassQuadrant.WEAKENING
@@ -11,6 +11,8 @@ Tests for the Compass Lab agentic system:
 """
 
 import json
+from dataclasses import asdict
+
 import numpy as np
 import pytest
 from unittest.mock import MagicMock, patch
@@ -413,6 +415,411 @@ class TestSweepAndExtraction:
             assert "confidence" in rule
 
 
+class TestAdaptiveSearch:
+    @staticmethod
+    def _in_process_sweep(calls):
+        """run_sweep stand-in that simulates in-process and records each rung's window."""
+        from services.compass_lab import SIM_WARMUP_DAYS
+
+        def sweep(prices, benchmark, sector_keys, param_grid, max_workers=2, window_days=None, db=None):
+            calls.append((window_days, len(param_grid)))
+            if window_days is not None:
+                prices = prices[-(window_days + SIM_WARMUP_DAYS):]
+                benchmark = benchmark[-(window_days + SIM_WARMUP_DAYS):]
+            results = [simulate(prices, benchmark, sector_keys, p).to_dict() for p in param_grid]
+            return sorted(results, key=lambda r: r["sortino"], reverse=True)
+        return sweep
+
+    def test_halving_windows(self):
+        from services.compass_lab import SIM_WARMUP_DAYS, halving_windows
+
+        span = 5000 - SIM_WARMUP_DAYS
+        assert halving_windows(5000) == [span // 27, span // 9, span // 3, None]
+        assert halving_windows(5000, max_rungs=2) == [span // 3, None]
+        assert halving_windows(300) == [None]
+
+    def test_survivors_get_longer_windows_and_surrogate_adds_a_bracket(self, synthetic_prices):
+        from services.compass_lab import halving_windows, run_adaptive_search
+
+        prices, benchmark, sector_keys = synthetic_prices
+        grid = [
+            SimParams(stop_loss_pct=sl, max_positions=mp, min_rs_entry=mr, min_holding_days=mh)
+            for sl in [5.0, 10.0, 15.0] for mp in [3, 5, 8] for mr in [0.0, 2.0, 5.0] for mh in [0, 5, 10]
+        ]
+        window = halving_windows(len(benchmark))[0]
+        calls = []
+        with patch("services.compass_lab.run_sweep", side_effect=self._in_process_sweep(calls)):
+            results, summary = run_adaptive_search(prices, benchmark, sector_keys, grid, n_initial=27)
+
+        # bracket 1: 27 on the short window, best 9 on the full history; bracket 2: 3 proposals, full history
+        assert calls == [(window, 27), (None, 9), (None, 3)]
+        assert summary["full_history_sims"] == 12
+        assert summary["configs_tested"] == 30
+        assert summary["full_history_equivalents"] < 30   # vs. every config on the full history
+        assert len(results) == len({r["param_hash"] for r in results}) == 12
+        assert [r["sortino"] for r in results] == sorted((r["sortino"] for r in results), reverse=True)
+
+    def test_surrogate_proposes_the_best_levels(self):
+        from services.compass_lab import propose_params
+
+        grid = generate_param_grid()
+        observed = [
+            {"params": p.to_dict(), "sortino": -p.stop_loss_pct / 5 + (p.rs_period == "6M")}
+            for p in grid[::97]
+        ]
+        seen = {p.param_hash() for p in grid[::97]}
+        proposals = propose_params(observed, grid, 20, exclude=seen, explore=0.0)
+        assert len(proposals) == 20
+        assert all(p.stop_loss_pct == 5.0 and p.rs_period == "6M" for p in proposals)
+        assert not seen & {p.param_hash() for p in proposals}
+
+
+class TestSimStore:
+    @staticmethod
+    def _in_process(jobs_seen):
+        from services.compass_lab import _run_single_simulation
+
+        def simulate_all(prices, benchmark, sector_keys, jobs, max_workers, batch_size, keep_state=False):
+            jobs_seen.append(jobs)
+            return [_run_single_simulation((prices, benchmark, sector_keys, params, resume, keep_state))
+                    for params, resume in jobs]
+        return simulate_all
+
+    def test_reuses_unchanged_and_extends_grown_history(self, synthetic_prices, db_session):
+        from models import CompassSimResult
+        from services.compass_lab import run_sweep
+
+        prices, benchmark, sector_keys = synthetic_prices
+        grid = [SimParams(stop_loss_pct=sl, max_positions=mp) for sl in [5.0, 12.0] for mp in [3, 6]]
+        jobs = []
+        with patch("services.compass_lab._simulate_all", side_effect=self._in_process(jobs)):
+            first = run_sweep(prices[:900], benchmark[:900], sector_keys, grid, db=db_session)
+            again = run_sweep(prices[:900], benchmark[:900], sector_keys, grid, db=db_session)
+            grown = run_sweep(prices, benchmark, sector_keys, grid, db=db_session)
+
+        assert [len(j) for j in jobs] == [4, 0, 4]
+        assert all(resume is None for _, resume in jobs[0])
+        assert all(resume is not None for _, resume in jobs[2])     # extended, not re-simulated
+        assert again == first and "state" not in first[0]
+
+        fresh = {p.param_hash(): simulate(prices, benchmark, sector_keys, p).to_dict() for p in grid}
+        for r in grown:
+            expected = fresh[r["param_hash"]]
+            for key in ("sortino", "sharpe", "total_return", "total_trades", "win_rate", "max_drawdown"):
+                assert r[key] == expected[key]
+        # the 900-day rows were replaced by their extensions
+        assert sorted(n for (n,) in db_session.query(CompassSimResult.n_days).all()) == [1000] * 4
+
+    def test_revised_history_is_simulated_from_scratch(self, synthetic_prices, db_session):
+        from services.compass_lab import run_sweep
+
+        prices, benchmark, sector_keys = synthetic_prices
+        grid = [SimParams()]
+        jobs = []
+        with patch("services.compass_lab._simulate_all", side_effect=self._in_process(jobs)):
+            run_sweep(prices[:900], benchmark[:900], sector_keys, grid, db=db_session)
+            revised = benchmark.copy()
+            revised[100] *= 1.01
+            run_sweep(prices, revised, sector_keys, grid, db=db_session)
+
+        assert jobs[1][0][1] is None
+
+    def test_state_round_trips_and_resume_matches_full_run(self, synthetic_prices):
+        from services.compass_simulator import SimState
+
+        prices, benchmark, sector_keys = synthetic_prices
+        params = SimParams(max_positions=3, min_holding_days=5)
+        part = simulate(prices[:800], benchmark[:800], sector_keys, params)
+        state = SimState.from_json(part.state.to_json())
+        assert state == part.state
+
+        resumed = simulate(prices, benchmark, sector_keys, params, resume=state)
+        full = simulate(prices, benchmark, sector_keys, params)
+        assert resumed.to_dict()["sortino"] == full.to_dict()["sortino"]
+        assert resumed.total_trades == full.total_trades
+        assert len(resumed.nav_curve) == 200
+
+
+class TestWalkForward:
+    @staticmethod
+    def _in_process(jobs_seen):
+        from services.compass_lab import _run_walk_forward_simulation
+
+        def simulate_all(prices, benchmark, sector_keys, jobs, max_workers, batch_size, keep_state=False,
+                         folds=None):
+            jobs_seen.append(jobs)
+            return [_run_walk_forward_simulation((prices, benchmark, sector_keys, params, folds))
+                    for params, _ in jobs]
+        return simulate_all
+
+    def test_folds_roll_and_test_windows_tile(self):
+        from services.compass_simulator import walk_forward_folds
+
+        folds = walk_forward_folds(1000, train_days=300, test_days=100, start_day=272)
+        assert [f.test_start for f in folds] == [572, 672, 772, 872]
+        assert all(f.test_start - f.train_start == 300 for f in folds)
+        assert all(a.test_end == b.test_start for a, b in zip(folds, folds[1:]))
+        assert walk_forward_folds(1000, train_days=756, test_days=252) == []
+
+    def test_oos_metrics_cover_test_windows_from_one_pass_per_param_set(self, synthetic_prices):
+        from services import compass_simulator
+        from services.compass_simulator import simulate_walk_forward, walk_forward_folds
+
+        prices, benchmark, sector_keys = synthetic_prices
+        params = SimParams(max_positions=3)
+        full = simulate(prices, benchmark, sector_keys, params)
+        for test_days in (100, 25):
+            folds = walk_forward_folds(len(benchmark), train_days=300, test_days=test_days)
+            with patch.object(compass_simulator, "simulate", wraps=simulate) as sim:
+                wf = simulate_walk_forward(prices, benchmark, sector_keys, params, folds)
+            assert sim.call_count == 1            # more folds, same single simulation
+
+            span = (folds[0].test_start, folds[-1].test_end)
+            oos_sells = [t for t in full.trades if t.side == "SELL" and span[0] <= t.day_idx < span[1]]
+            fold_trades = [f["test_trades"][r]["pnl"]["n"] for f in wf["folds"] for r in REGIME_NAMES.values()]
+            assert sum(fold_trades) == len(oos_sells)
+            assert len(wf["folds"]) == len(folds)
+            assert set(wf["folds"][0]["train_regimes"]) == set(REGIME_NAMES.values())
+
+    def test_selection_uses_train_windows_and_scores_picks_on_test_windows(self):
+        from services.compass_lab import select_walk_forward
+        from services.compass_simulator import _TradeStats
+
+        def trades(*pnls):
+            stats = _TradeStats()
+            for pnl in pnls:
+                stats.add(pnl, 10)
+            return asdict(stats)
+
+        def fold(train_sortino, test_pnls, drawdown):
+            return {
+                "train_regimes": {r: {"n_trades": 20, "sortino": train_sortino} for r in REGIME_NAMES.values()},
+                "test_trades": {r: trades(*test_pnls) for r in REGIME_NAMES.values()},
+                "test_max_drawdown": drawdown,
+            }
+
+        # A wins every train window, B every test window: A must be chosen, scored on its own test trades
+        a = {"param_hash": "a", "params": {"name": "A"},
+             "folds": [fold(2.0, [1.0, -2.0], 5.0), fold(2.0, [3.0, -1.0, -1.0], 8.0)]}
+        b = {"param_hash": "b", "params": {"name": "B"},
+             "folds": [fold(1.0, [9.0, 8.0], 1.0), fold(1.0, [9.0, 7.0], 1.0)]}
+        configs = select_walk_forward([b, a])
+
+        assert set(configs) == set(REGIME_NAMES.values())
+        for config in configs.values():
+            assert config["params"] == {"name": "A"}
+            assert config["evidence"]["n_trades"] == 5
+            assert config["evidence"]["win_rate"] == 40.0
+            assert config["evidence"]["max_drawdown"] == 8.0
+            assert config["evidence"]["folds"] == 2
+
+        with patch("services.compass_lab.REGIME_MIN_TRADES", 50):
+            assert select_walk_forward([a, b]) == {}
+
+    def test_regime_configs_come_from_walk_forward_and_reuse_stored_runs(self, synthetic_prices, db_session):
+        from services.compass_lab import _oos_regime_configs, run_walk_forward, select_walk_forward
+
+        prices, benchmark, sector_keys = synthetic_prices
+        grid = [SimParams(stop_loss_pct=sl, max_positions=mp) for sl in [5.0, 12.0] for mp in [3, 6]]
+        jobs = []
+        with patch("services.compass_lab._simulate_all", side_effect=self._in_process(jobs)):
+            wf = run_walk_forward(prices, benchmark, sector_keys, grid, train_days=300, test_days=100,
+                                  db=db_session)
+            again = run_walk_forward(prices, benchmark, sector_keys, grid, train_days=300, test_days=100,
+                                     db=db_session)
+            # 1000 days is too short for the default 3y/1y folds: no configs rather than in-sample ones
+            configs, n_oos = _oos_regime_configs(db_session, prices, benchmark, sector_keys, grid)
+
+        assert [len(j) for j in jobs] == [4, 0]
+        assert again == wf
+        assert (configs, n_oos) == ({}, 0)
+
+        with patch("services.compass_lab.REGIME_MIN_TRADES", 2):   # short train windows, few trades per regime
+            wf_configs = select_walk_forward(wf)
+        assert wf_configs
+        hashes = {r["param_hash"] for r in wf}
+        for config in wf_configs.values():
+            assert SimParams(**config["params"]).param_hash() in hashes
+            assert {"sharpe", "n_trades", "win_rate", "max_drawdown"} <= set(config["evidence"])
+
+
+    def test_halving_lab_run_bounds_walk_forward_pool_and_counts_its_sims(self, synthetic_prices, db_session):
+        from services import compass_lab
+
+        prices, benchmark, sector_keys = synthetic_prices
+        data = {"prices": prices, "benchmark": benchmark, "sector_keys": sector_keys,
+                "dates": ["2020-01-01", "2023-12-29"]}
+        summary = {"configs_tested": 2430, "full_history_sims": 100, "full_history_equivalents": 300.0}
+        pools = []
+
+        def oos(db, prices, benchmark, sector_keys, pool):
+            pools.append(pool)
+            return {}, len(pool)
+
+        with patch("services.compass_history.load_historical_data", return_value=data), \
+                patch.object(compass_lab, "run_adaptive_search", return_value=([], dict(summary))), \
+                patch.object(compass_lab, "run_sweep", return_value=[]), \
+                patch.object(compass_lab, "_oos_regime_configs", side_effect=oos):
+            out = compass_lab.run_full_lab_sweep(db_session)
+
+        assert len(pools[0]) == compass_lab.HALVING_POOL < compass_lab.HALVING_INITIAL
+        assert out["combos_tested"] == 2430 + compass_lab.HALVING_POOL
+        assert out["search"]["walk_forward_sims"] == compass_lab.HALVING_POOL
+        assert out["search"]["full_history_sims"] == 100 + compass_lab.HALVING_POOL
+
+class TestStockSimulator:
+    @pytest.fixture
+    def stock_panel(self, synthetic_prices):
+        from services.compass_stock_simulator import StockPanel
+
+        sector_prices, benchmark, sector_keys = synthetic_prices
+        rng = np.random.default_rng(3)
+        home = np.repeat(np.arange(len(sector_keys)), 4)
+        stocks = sector_prices[:, home] * np.cumprod(1 + rng.normal(0.0002, 0.012, (len(benchmark), len(home))), axis=0)
+        stocks[:150, 0] = 0.0                        # lists late
+        members = np.zeros((len(home), len(sector_keys)), dtype=bool)
+        members[np.arange(len(home)), home] = True
+        members[4, 0] = True                         # also in sector 0: counts under sector 0
+        return StockPanel(stocks, sector_prices, benchmark, members)
+
+    def test_gate_masks_match_evaluate_gates(self):
+        from services.compass_simulator import gate_masks
+
+        rng = np.random.default_rng(0)
+        ret, rs, mom = rng.normal(0, 5, (3, 200, 4))
+        rs[5, 1] = np.nan
+        regimes = rng.integers(0, 4, 200)
+        for strictness in ("loose", "moderate", "strict"):
+            buy, exit_ = gate_masks(ret, rs, mom, regimes, 2.0, strictness)
+            for d, i in np.ndindex(buy.shape):
+                if np.isnan(rs[d, i]):
+                    assert not buy[d, i] and not exit_[d, i]
+                    continue
+                action = evaluate_gates(ret[d, i], rs[d, i], mom[d, i], regimes[d], 2.0, strictness)
+                assert buy[d, i] == (action == "BUY")
+                assert exit_[d, i] == (action in ("SELL", "AVOID"))
+
+    def test_entries_respect_gates_and_position_limits(self, stock_panel):
+        from services.compass_stock_simulator import StockSimParams, simulate_stocks
+
+        params = StockSimParams(max_positions=5, max_per_sector=1, stop_loss_pct=10.0)
+        result = simulate_stocks(stock_panel, params)
+        gates = stock_panel.gates(params)
+        assert result.total_trades > 0
+        assert stock_panel.home[4] == 0
+
+        held = set()
+        for t in sorted(result.trades, key=lambda t: (t.day_idx, t.side == "BUY")):
+            if t.side == "SELL":
+                held.remove(t.sector_idx)
+                continue
+            assert gates.buy[t.day_idx, t.sector_idx]
+            held.add(t.sector_idx)
+            sectors = [stock_panel.home[s] for s in held]
+            assert len(held) <= 5 and len(sectors) == len(set(sectors))
+        assert all(t.day_idx >= 150 for t in result.trades if t.sector_idx == 0)
+
+    def test_signal_pass_is_shared_across_configs(self, stock_panel):
+        from services import compass_stock_simulator as stock_sim
+        from services.compass_lab import _init_stock_worker, _run_stock_chunk
+
+        grid = [stock_sim.StockSimParams(stop_loss_pct=sl, max_per_sector=mps)
+                for sl in [8.0, 15.0] for mps in [1, 3]]
+        with patch.object(stock_sim, "rs_signals", wraps=stock_sim.rs_signals) as signals:
+            _init_stock_worker(stock_panel)
+            results = _run_stock_chunk([p.to_dict() for p in grid])
+
+        assert signals.call_count == 2             # stocks vs sectors + sectors vs benchmark, once
+        assert [r["params"]["max_per_sector"] for r in results] == [1, 3, 1, 3]
+        assert len({r["param_hash"] for r in results}) == 4
+
+
+class TestRuleDiscovery:
+    @staticmethod
+    def _grid_results(seed=7):
+        """Synthetic to_dict() results over the full grid with two planted effects:
+        tight stops win more in BEAR, and a 3M lookback has a higher Sortino in BULL."""
+        rng = np.random.default_rng(seed)
+        grid = [p.to_dict() for p in generate_param_grid()]
+        n = rng.integers(0, 40, size=(len(grid), 4))
+        win = rng.uniform(30, 60, size=(len(grid), 4))
+        sortino = rng.normal(0.5, 0.3, size=(len(grid), 4))
+        results = []
+        for i, params in enumerate(grid):
+            if params["stop_loss_pct"] <= 6:
+                win[i, 3] += 15
+            if params["rs_period"] == "3M":
+                sortino[i, 0] += 0.8
+            results.append({"params": params, "regime_metrics": {
+                regime: {"n_trades": int(n[i, j]), "win_rate": float(win[i, j]), "sortino": float(sortino[i, j])}
+                for j, regime in REGIME_NAMES.items()
+            }})
+        return results
+
+    def test_finds_planted_rules_over_full_grid_quickly(self):
+        import time
+
+        from services.compass_lab import discover_rules
+
+        results = self._grid_results()
+        started = time.perf_counter()
+        rules = discover_rules(results)
+        elapsed = time.perf_counter() - started
+
+        by_action = {r["override_action"]: r for r in rules}
+        assert set(by_action) == {"USE_TIGHT_STOPS", "USE_3M_LOOKBACK"}
+        tight = by_action["USE_TIGHT_STOPS"]
+        assert tight["condition"] == "regime=BEAR AND stop_loss=<=6"
+        assert tight["historical_win_rate"] > tight["baseline_win_rate"] + 5
+        assert tight["p_value"] < 0.001 and tight["confidence"] == "HIGH"
+        assert json.loads(by_action["USE_3M_LOOKBACK"]["condition_json"]) == {
+            "regime": "BULL", "optimal_rs_period": "3M",
+        }
+        assert elapsed < 2.0
+
+    def test_win_rates_are_trade_weighted_and_noise_finds_nothing(self):
+        from services.compass_lab import discover_rules
+
+        def result(stop, n_trades, win_rate):
+            return {"params": {"rs_period": "3M", "stop_loss_pct": stop, "max_positions": 5},
+                    "regime_metrics": {"BEAR": {"n_trades": n_trades, "win_rate": win_rate, "sortino": 0.5}}}
+
+        # tight: 5 combos x 100 trades at 70% + 5 x 5 trades at 0% -> 500 / 525 ≈ 66.7%
+        results = [result(5.0, 100, 70.0)] * 5 + [result(5.0, 5, 0.0)] * 5 + [result(15.0, 100, 40.0)] * 10
+        rule = discover_rules(results)[0]
+        assert rule["override_action"] == "USE_TIGHT_STOPS"
+        assert rule["historical_n"] == 525
+        assert rule["historical_win_rate"] == pytest.approx(66.7)
+
+        same = [result(5.0, 100, 50.0)] * 10 + [result(15.0, 100, 50.0)] * 10
+        assert discover_rules(same) == []
+        assert discover_rules([]) == []
+
+
+    def test_halving_lab_run_mines_rules_from_unranked_pool(self, synthetic_prices, db_session):
+        from services import compass_lab
+
+        prices, benchmark, sector_keys = synthetic_prices
+        data = {"prices": prices, "benchmark": benchmark, "sector_keys": sector_keys,
+                "dates": ["2020-01-01", "2023-12-29"]}
+        planted = {json.dumps(r["params"], sort_keys=True): r for r in self._grid_results()}
+
+        def sweep(prices, benchmark, sector_keys, grid, **kwargs):
+            return [planted[json.dumps(p.to_dict(), sort_keys=True)] for p in grid]
+
+        # Halving survivors: a handful of top configs, too few for any bucket
+        survivors = [{**r, "sharpe": 1.0} for r in sweep(None, None, None, generate_param_grid()[:20])]
+        summary = {"configs_tested": 2430, "full_history_sims": 20, "full_history_equivalents": 80.0}
+        with patch("services.compass_history.load_historical_data", return_value=data), \
+                patch.object(compass_lab, "run_adaptive_search", return_value=(survivors, summary)), \
+                patch.object(compass_lab, "run_sweep", side_effect=sweep), \
+                patch.object(compass_lab, "_oos_regime_configs", return_value=({}, 0)):
+            out = compass_lab.run_full_lab_sweep(db_session)
+
+        assert compass_lab.discover_rules(survivors) == []
+        assert out["rules_discovered"] > 0
+        assert out["search"]["pool_sims"] == compass_lab.HALVING_POOL
+
 # ─── Autonomous Trader Unit Tests ────────────────────────────
 
 class TestAutonomousTrader:
@@ -472,9 +879,197 @@ class TestAutonomousTrader:
         assert FALLBACK_CONFIG["max_positions"] == 6
         assert FALLBACK_CONFIG["min_rs_entry"] == 0.0
 
+    def test_types_rebalance_concurrently_against_one_snapshot(self, db_session):
+        import threading
+        from dataclasses import FrozenInstanceError
+
+        from sqlalchemy.orm import sessionmaker
+
+        from models import CompassModelState, CompassModelTrade
+        from services.compass_autonomous_trader import build_rebalance_snapshot, run_autonomous_rebalance
+
+        db_session.add(CompassModelState(
+            portfolio_type="etf_only", sector_key="IT", instrument_id="ITBEES", instrument_type="etf",
+            entry_date="2024-01-02", entry_price=100.0, current_price=100.0, quantity=1, weight_pct=16.7,
+            stop_loss=92.0, status="OPEN",
+        ))
+        db_session.commit()
+        scores = [
+            {"sector_key": "IT", "action": "SELL", "rs_score": -3.0, "etfs": ["ITBEES"], "market_regime": "BULL"},
+            {"sector_key": "BANK", "action": "BUY", "rs_score": 6.0, "etfs": ["BANKBEES"], "market_regime": "BULL"},
+        ]
+        closes = {("ITBEES", "etf"): 97.0, ("BANKBEES", "etf"): 50.0, ("BANK", "index"): 48000.0,
+                  ("IT", "index"): 35000.0}
+        lookups = []
+
+        def latest_prices(db, instruments):
+            lookups.append(set(instruments))
+            return {k: closes[k] for k in instruments if k in closes}
+
+        all_started = threading.Barrier(3, timeout=5)    # deadlocks unless the 3 types overlap
+        make_session = sessionmaker(bind=db_session.get_bind())
+
+        def session_factory():
+            all_started.wait()
+            return make_session()
+
+        with patch("services.compass_data.daily_refresh_compass_prices"), \
+                patch("services.compass_rs.compute_sector_rs_scores", return_value=scores), \
+                patch("services.compass_rs.persist_rs_scores"), \
+                patch("routers.compass._clear_cache"), \
+                patch("services.compass_portfolio._get_latest_prices", side_effect=latest_prices):
+            result = run_autonomous_rebalance(db_session, session_factory=session_factory)
+            assert len(lookups) == 1 and lookups[0] == set(closes)     # navs reuse the snapshot's prices
+            snapshot = build_rebalance_snapshot(db_session, scores, "2025-01-01")
+
+        assert [len(result["portfolios"][pt]["entries"]) for pt in ("etf_only", "stock_etf", "stock_only")] == [1, 1, 1]
+        assert result["portfolios"]["etf_only"]["exits"][0]["pnl_pct"] == -3.0
+        db_session.expire_all()
+        trades = db_session.query(CompassModelTrade.portfolio_type, CompassModelTrade.side).all()
+        assert sorted(trades) == [("etf_only", "BUY"), ("etf_only", "SELL"), ("stock_etf", "BUY"), ("stock_only", "BUY")]
+        assert set(result["nav"]) == {"etf_only", "stock_etf", "stock_only"}
+
+        with pytest.raises(TypeError):
+            snapshot.prices[("X", "etf")] = 1.0
+        with pytest.raises(FrozenInstanceError):
+            snapshot.regime = "BEAR"
+
 
 # ─── History Module Tests ────────────────────────────────────
 
+class TestDecisionOutcomes:
+    """Set-based outcome backfill and the (regime, decision, sector) tally the trader reads."""
+
+    def _seed(self, db_session, sector, closes, decisions, regime="BULL"):
+        from datetime import datetime, timedelta
+
+        from models import CompassDecisionLog, IndexPrice
+
+        start = datetime.now() - timedelta(days=len(closes))
+        dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(len(closes))]
+        for d, c in zip(dates, closes):
+            db_session.add(IndexPrice(date=d, index_name=sector, close_price=c))
+        for offset, decision in decisions:
+            db_session.add(CompassDecisionLog(date=dates[offset], portfolio_type="etf_only", sector_key=sector,
+                                              decision=decision, market_regime=regime))
+        db_session.commit()
+
+    def test_backfill_updates_tally_incrementally(self, db_session):
+        from models import CompassDecisionPrecedent
+        from services.compass_lab import backfill_decision_outcomes, decision_precedent
+
+        # Rising sector: BUYs win; falling sector: BUYs lose
+        self._seed(db_session, "PREC_UP", [100 + i for i in range(40)], [(0, "BUY"), (1, "BUY"), (2, "SKIP")])
+        self._seed(db_session, "PREC_DOWN", [200 - i for i in range(40)], [(0, "BUY")])
+        backfill_decision_outcomes(db_session)
+
+        tally = {(p.decision, p.sector_key): (p.n, p.n_correct)
+                 for p in db_session.query(CompassDecisionPrecedent).filter_by(market_regime="BULL")}
+        assert tally[("BUY", "PREC_UP")] == (2, 2)
+        assert tally[("BUY", "PREC_DOWN")] == (1, 0)
+        assert tally[("SKIP", "PREC_UP")] == (1, 1)
+
+        # Too few sector outcomes -> all-sector fallback for the regime
+        assert decision_precedent(db_session, "BULL", "BUY", "PREC_UP") == (3, 66.7)
+        assert decision_precedent(db_session, "BEAR", "BUY", "PREC_UP") == (0, 0.0)
+
+        # A second run with nothing new leaves the tally untouched
+        backfill_decision_outcomes(db_session)
+        row = db_session.query(CompassDecisionPrecedent).filter_by(decision="BUY", sector_key="PREC_UP").one()
+        assert (row.n, row.n_correct) == (2, 2)
+
+    def test_outcomes_resolved_in_constant_queries(self, db_session):
+        from sqlalchemy import event
+
+        from models import CompassDecisionLog
+        from services.compass_lab import backfill_decision_outcomes
+
+        self._seed(db_session, "OUT_A", [100 + i for i in range(70)], [(i, "BUY") for i in range(8)])
+        self._seed(db_session, "OUT_B", [100 - i * 0.5 for i in range(70)], [(i, "SELL") for i in range(8)])
+        # Stuck under the old per-row loop: 5d filled, 20d/60d never revisited
+        stuck = db_session.query(CompassDecisionLog).filter_by(sector_key="OUT_A").first()
+        stuck.outcome_5d_return = 1.0
+        db_session.commit()
+
+        statements = []
+        engine = db_session.get_bind()
+        listener = lambda *args: statements.append(args[2])  # noqa: E731
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            assert backfill_decision_outcomes(db_session) == 16
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert len([sql for sql in statements if "index_prices" in sql]) == 1
+
+        rows = db_session.query(CompassDecisionLog).order_by(CompassDecisionLog.id).all()
+        a = [r for r in rows if r.sector_key == "OUT_A"]
+        b = [r for r in rows if r.sector_key == "OUT_B"]
+        assert a[0].outcome_5d_return == 1.0                 # already resolved, kept
+        assert a[0].outcome_20d_return == 20.0 and a[0].outcome_60d_return == 60.0
+        assert all(r.was_correct for r in a + b)
+        assert b[0].outcome_20d_return == -10.0
+
+    def test_unresolvable_outcomes_are_given_up_after_grace(self, db_session):
+        from datetime import datetime, timedelta
+
+        from sqlalchemy import event
+
+        from models import CompassDecisionLog
+        from services.compass_lab import OUTCOME_GRACE_DAYS, backfill_decision_outcomes
+
+        def logged(days_ago):
+            row = CompassDecisionLog(date=(datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d"),
+                                     portfolio_type="etf_only", sector_key="OUT_NO_PRICES", decision="BUY")
+            db_session.add(row)
+            return row
+
+        old, recent = logged(60 + OUTCOME_GRACE_DAYS + 5), logged(30)
+        db_session.commit()
+        backfill_decision_outcomes(db_session)
+        db_session.refresh(old)
+        db_session.refresh(recent)
+        assert old.outcome_given_up_at is not None and old.outcome_5d_return is None
+        assert recent.outcome_given_up_at is None          # still inside the horizon + grace
+
+        # Given-up rows no longer pin the close-matrix query to their date
+        bound = []
+
+        def listener(conn, cursor, sql, parameters, *args):
+            if "index_prices" in sql:
+                bound.extend(parameters)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            backfill_decision_outcomes(db_session)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert bound and old.date not in bound
+
+    def test_outcome_horizons_are_configurable(self, db_session):
+        from models import CompassDecisionLog
+        from services.compass_lab import backfill_decision_outcomes
+
+        self._seed(db_session, "OUT_C", [100 + i for i in range(30)], [(0, "BUY")])
+        backfill_decision_outcomes(db_session, horizons={5: "outcome_5d_return"}, judge_horizon=5)
+        row = db_session.query(CompassDecisionLog).filter_by(sector_key="OUT_C").one()
+        assert (row.outcome_5d_return, row.outcome_20d_return, row.was_correct) == (5.0, None, True)
+        with pytest.raises(ValueError):
+            backfill_decision_outcomes(db_session, horizons={5: "outcome_5d_return"}, judge_horizon=20)
+
+    def test_sector_tally_used_once_it_has_enough_outcomes(self, db_session):
+        from models import CompassDecisionPrecedent
+        from services.compass_lab import PRECEDENT_MIN_SECTOR_N, decision_precedent
+
+        db_session.add_all([
+            CompassDecisionPrecedent(market_regime="BULL", decision="BUY", sector_key="PREC_A",
+                                     n=PRECEDENT_MIN_SECTOR_N, n_correct=PRECEDENT_MIN_SECTOR_N),
+            CompassDecisionPrecedent(market_regime="BULL", decision="BUY", sector_key="PREC_B", n=20, n_correct=0),
+        ])
+        db_session.commit()
+        assert decision_precedent(db_session, "BULL", "BUY", "PREC_A") == (PRECEDENT_MIN_SECTOR_N, 100.0)
+
+
 class TestHistory:
     def test_data_summary_no_data(self):
         from services.compass_history import get_data_summary
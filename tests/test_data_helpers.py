@@ -1,14 +1,18 @@
 """
 Tests for FIE v3 — Data Helper Utilities (services/data_helpers.py)
 
-Covers upsert_price_row, get_portfolio_tickers, and
-get_all_portfolio_tickers_with_inception with various data states.
+Covers upsert_price_row, get_portfolio_tickers,
+get_all_portfolio_tickers_with_inception, as-of price lookups (services/asof_prices.py),
+the fundamentals store (services/fundamentals.py) and the backfill planner
+(services/backfill_planner.py) with various data states.
 """
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from unittest.mock import patch
 
 from models import (
+    Fundamental,
+    IndexConstituent,
     IndexPrice,
     ModelPortfolio,
     PortfolioHolding,
@@ -184,6 +188,29 @@ class TestUpsertPriceRow:
         ).first()
         assert abs(saved.close_price - 1234.5678) < 0.0001
 
+    def test_should_store_native_date_and_read_back_iso_string(self, db_session):
+        """IndexPrice.date is a DATE column; str/date/datetime all bind, reads are ISO strings."""
+        from datetime import date
+
+        from sqlalchemy import func as sa_func
+
+        from services.data_helpers import upsert_price_row
+        upsert_price_row(db_session, "DT_TEST", {"date": "2026-03-05", "close": 1.0})
+        upsert_price_row(db_session, "DT_TEST", {"date": date(2026, 3, 6), "close": 2.0})
+        upsert_price_row(db_session, "DT_TEST", {"date": datetime(2026, 3, 9, 15, 30), "close": 3.0})
+        db_session.commit()
+        db_session.expire_all()
+
+        rows = (
+            db_session.query(IndexPrice.date)
+            .filter(IndexPrice.index_name == "DT_TEST", IndexPrice.date >= "2026-03-06")
+            .order_by(IndexPrice.date)
+            .all()
+        )
+        assert [r.date for r in rows] == ["2026-03-06", "2026-03-09"]
+        latest = db_session.query(sa_func.max(IndexPrice.date)).filter(IndexPrice.index_name == "DT_TEST").scalar()
+        assert latest == "2026-03-09"
+
 
 # ─── get_portfolio_tickers ────────────────────────────────
 
@@ -384,3 +411,226 @@ class TestGetAllPortfolioTickersWithInception:
         result = get_all_portfolio_tickers_with_inception(db_session)
         # This function does NOT filter out ETFs (unlike get_portfolio_tickers)
         assert "NIFTYBEES" in result
+
+
+# ─── asof_prices ──────────────────────────────────────────
+
+class TestAsOfPrices:
+    """services/asof_prices.py — tickers x dates grid in one lookup."""
+
+    def _seed(self, db_session):
+        for d, a, b in [("2026-03-02", 100.0, 50.0), ("2026-03-03", 101.0, None), ("2026-03-05", 103.0, 52.0)]:
+            db_session.add(IndexPrice(date=d, index_name="ASOF_A", close_price=a))
+            db_session.add(IndexPrice(date=d, index_name="ASOF_B", close_price=b))
+        db_session.commit()
+
+    def test_should_resolve_grid_to_latest_close_on_or_before(self, db_session):
+        from services.asof_prices import asof_prices
+        self._seed(db_session)
+        grid = asof_prices(db_session, ["ASOF_A", "ASOF_B", "ASOF_MISSING"], ["2026-03-01", "2026-03-04", "2026-03-05"])
+
+        assert grid["2026-03-01"] == {}
+        assert grid["2026-03-04"]["ASOF_A"].close == 101.0
+        # Null close on 03-03 is skipped, falls back to 03-02
+        assert grid["2026-03-04"]["ASOF_B"].date == "2026-03-02"
+        assert grid["2026-03-05"]["ASOF_B"].close == 52.0
+        assert "ASOF_MISSING" not in grid["2026-03-05"]
+
+    def test_should_return_previous_close_when_strict(self, db_session):
+        from services.asof_prices import asof_prices, latest_prices
+        self._seed(db_session)
+        latest = latest_prices(db_session, ["ASOF_A"])["ASOF_A"]
+        prev = asof_prices(db_session, ["ASOF_A"], [latest.date], strict=True)[latest.date]["ASOF_A"]
+        assert (latest.date, prev.date, prev.close) == ("2026-03-05", "2026-03-03", 101.0)
+
+    def test_should_not_serve_cached_price_after_write(self, db_session):
+        from services.asof_prices import latest_prices
+        from services.data_helpers import upsert_price_row
+        self._seed(db_session)
+        assert latest_prices(db_session, ["ASOF_A"])["ASOF_A"].close == 103.0
+
+        upsert_price_row(db_session, "ASOF_A", {"date": "2026-03-06", "close": 104.0})
+        db_session.commit()
+        assert latest_prices(db_session, ["ASOF_A"])["ASOF_A"].close == 104.0
+
+
+# ─── Fundamentals Store ─────────────────────────────────────
+
+
+class TestFundamentalsStore:
+    """refresh_fundamentals staleness/backoff and the request-path readers."""
+
+    def _universe(self):
+        return [("TCS", "stock", "TCS.NS"), ("INFY", "stock", "INFY.NS"), ("WIPRO", "stock", "WIPRO.NS")]
+
+    def test_should_fetch_only_due_symbols_and_keep_last_good_values(self, db_session):
+        from services import fundamentals
+
+        now = datetime.now()
+        db_session.add_all([
+            Fundamental(symbol="TCS", kind="stock", trailing_pe=30.0, fetched_at=now),           # fresh
+            Fundamental(symbol="INFY", kind="stock", trailing_pe=22.0,
+                        fetched_at=now - timedelta(days=2)),                                    # stale
+        ])
+        db_session.commit()
+
+        fetched = {"INFY.NS": None, "WIPRO.NS": {"trailing_pe": 18.0, "market_cap": 2.5e12}}
+        with patch.object(fundamentals, "fundamentals_universe", return_value=self._universe()), \
+                patch.object(fundamentals, "fetch_info", side_effect=fetched.get) as fetch_info:
+            result = fundamentals.refresh_fundamentals(db_session)
+
+        assert sorted(c.args[0] for c in fetch_info.call_args_list) == ["INFY.NS", "WIPRO.NS"]
+        assert result == {"due": 2, "fetched": 1, "failed": 1}
+        rows = {f.symbol: f for f in db_session.query(Fundamental).all()}
+        assert rows["INFY"].trailing_pe == 22.0 and rows["INFY"].fail_count == 1
+        assert rows["WIPRO"].trailing_pe == 18.0 and rows["WIPRO"].fetched_at is not None
+
+    def test_should_back_off_failed_symbols(self, db_session):
+        from services import fundamentals
+
+        db_session.add(Fundamental(symbol="INFY", kind="stock", fail_count=2,
+                                   last_attempt_at=datetime.now() - timedelta(hours=30)))
+        db_session.commit()
+        with patch.object(fundamentals, "fundamentals_universe", return_value=self._universe()[1:2]), \
+                patch.object(fundamentals, "fetch_info") as fetch_info:
+            assert fundamentals.refresh_fundamentals(db_session)["due"] == 0
+        fetch_info.assert_not_called()
+
+    def test_should_coerce_non_numeric_info_values(self):
+        from services import fundamentals
+
+        info = {"trailingPE": "Infinity", "forwardPE": 21.5, "marketCap": float("nan")}
+        with patch("yfinance.Ticker") as ticker:
+            ticker.return_value.info = info
+            values = fundamentals.fetch_info("TCS.NS")
+        assert values["trailing_pe"] is None and values["market_cap"] is None
+        assert values["forward_pe"] == 21.5
+
+    def test_should_include_constituents_etfs_and_sector_indices_in_universe(self, db_session):
+        from services.fundamentals import fundamentals_universe
+
+        db_session.add(IndexConstituent(index_name="NIFTY IT", ticker="TCS"))
+        db_session.commit()
+        kinds = {symbol: kind for symbol, kind, _ in fundamentals_universe(db_session)}
+        assert kinds["TCS"] == "stock"
+        assert kinds["NIFTYIT"] == "index"
+        assert "etf" in kinds.values()
+
+    def test_sector_pe_should_fall_back_to_sector_etf(self, db_session):
+        from index_constants import COMPASS_SECTOR_ETF_MAP
+        from services.fundamentals import pe_ratios, sector_pe_ratios
+
+        sector, etfs = next((k, v) for k, v in COMPASS_SECTOR_ETF_MAP.items() if v)
+        db_session.add_all([
+            Fundamental(symbol=sector, kind="index"),
+            Fundamental(symbol=etfs[0], kind="etf", forward_pe=24.456),
+            Fundamental(symbol="TCS", kind="stock", trailing_pe=30.0),
+        ])
+        db_session.commit()
+        assert sector_pe_ratios(db_session, [sector]) == {sector: 24.46}
+        assert pe_ratios(db_session, ["TCS", "NOPE"]) == {"TCS": 30.0, "NOPE": None}
+
+
+# ─── Backfill Planner ───────────────────────────────────────
+
+
+class TestBackfillPlanner:
+    """services/backfill_planner.py — per-ticker missing ranges and grouped batches."""
+
+    TODAY = date(2026, 3, 13)          # Friday; NIFTY calendar is 03-02 .. 03-13
+    START = "2026-03-02"
+
+    def _seed(self, db_session):
+        days = [d.isoformat() for d in (date(2026, 3, 2) + timedelta(days=i) for i in range(12)) if d.weekday() < 5]
+        held = {
+            "NIFTY": days,
+            "BF_FULL": days,
+            "BF_HOLE": [d for d in days if d not in ("2026-03-04", "2026-03-05", "2026-03-06")],
+            "BF_BLIP": [d for d in days if d != "2026-03-04"],
+            "BF_TAIL": [d for d in days if d <= "2026-03-10"],
+            "BF_TAIL2": [d for d in days if d <= "2026-03-10"],
+        }
+        for name, dates in held.items():
+            db_session.add_all(IndexPrice(date=d, index_name=name, close_price=100.0) for d in dates)
+        db_session.commit()
+        return days
+
+    def _starts(self):
+        return {t: self.START for t in ("BF_FULL", "BF_HOLE", "BF_BLIP", "BF_TAIL", "BF_TAIL2", "BF_NEW")}
+
+    def test_should_find_holes_tails_and_new_tickers_only(self, db_session):
+        from services.backfill_planner import missing_ranges
+
+        self._seed(db_session)
+        assert missing_ranges(db_session, self._starts(), today=self.TODAY) == {
+            "BF_HOLE": [("2026-03-04", "2026-03-06")],
+            "BF_TAIL": [("2026-03-11", "2026-03-13")],
+            "BF_TAIL2": [("2026-03-11", "2026-03-13")],
+            "BF_NEW": [("2026-03-02", "2026-03-13")],
+        }
+
+    def test_should_group_ranges_into_minimal_batches(self, db_session):
+        from services.backfill_planner import BackfillBatch, plan_backfill
+
+        self._seed(db_session)
+        assert plan_backfill(db_session, self._starts(), today=self.TODAY) == [
+            BackfillBatch("2026-03-04", "2026-03-07", ("BF_HOLE",)),
+            BackfillBatch("2026-03-02", "2026-03-14", ("BF_NEW", "BF_TAIL", "BF_TAIL2")),
+        ]
+
+    def test_should_insert_only_missing_rows_and_converge(self, db_session):
+        from services.backfill_planner import plan_backfill, run_backfill
+
+        days = self._seed(db_session)
+        calls = []
+
+        def fake_fetch(tickers, start, end):
+            calls.append((tuple(tickers), start, end))
+            return {t: [{"date": d, "close": 200.0} for d in days if start <= d < end] for t in tickers}
+
+        stored = run_backfill(db_session, self._starts(), fetch=fake_fetch, today=self.TODAY)
+
+        assert len(calls) == 2
+        assert stored == 3 + 10 + 3 + 3
+        # Rows already stored inside a fetched window are left alone
+        tail_closes = {r.close_price for r in db_session.query(IndexPrice).filter_by(index_name="BF_TAIL")}
+        assert tail_closes == {100.0, 200.0}
+        assert plan_backfill(db_session, self._starts(), today=self.TODAY) == []
+        assert run_backfill(db_session, self._starts(), fetch=fake_fetch, today=self.TODAY) == 0
+        assert len(calls) == 2
+
+    def test_should_stop_tails_at_last_nifty_day(self, db_session):
+        from services.backfill_planner import missing_ranges
+
+        days = [d.isoformat() for d in (date(2026, 3, 2) + timedelta(days=i) for i in range(12)) if d.weekday() < 5]
+        held = {
+            "NIFTY": [d for d in days if d <= "2026-03-10"],      # 03-11 .. 03-13 not published / holidays
+            "BF_CURRENT": [d for d in days if d <= "2026-03-10"],
+            "BF_BEHIND": [d for d in days if d <= "2026-03-06"],
+        }
+        for name, dates in held.items():
+            db_session.add_all(IndexPrice(date=d, index_name=name, close_price=100.0) for d in dates)
+        db_session.commit()
+
+        starts = {t: self.START for t in ("NIFTY", "BF_CURRENT", "BF_BEHIND")}
+        assert missing_ranges(db_session, starts, today=self.TODAY) == {
+            "BF_BEHIND": [("2026-03-09", "2026-03-10")],
+            "NIFTY": [("2026-03-11", "2026-03-13")],          # the calendar itself still runs to today
+        }
+
+    def test_should_not_replan_ranges_the_provider_returned_empty(self, db_session):
+        from services.backfill_planner import BackfillBatch, plan_backfill, run_backfill
+
+        days = self._seed(db_session)
+        db_session.add_all(IndexPrice(date=d, index_name="BF_PART", close_price=100.0) for d in days[:5])
+        db_session.commit()
+        starts = {"BF_GONE": self.START, "BF_PART": self.START}     # delisted; suspended after 03-09
+
+        def fake_fetch(tickers, start, end):
+            return {"BF_PART": [{"date": "2026-03-09", "close": 90.0}]}
+
+        assert run_backfill(db_session, starts, fetch=fake_fetch, today=self.TODAY) == 1
+        # Only today is asked for again — its bar may not have been published yet
+        assert plan_backfill(db_session, starts, today=self.TODAY) == [
+            BackfillBatch("2026-03-13", "2026-03-14", ("BF_GONE", "BF_PART")),
+        ]
@@ -2,8 +2,8 @@
 Tests for core financial calculation functions in FIE v3.
 
 Covers:
-- XIRR computation (Newton-Raphson method)
-- Maximum drawdown computation
+- XIRR computation (Newton-Raphson with bracketed fallback, batched solve)
+- Maximum drawdown computation and underwater-period segmentation
 - Yahoo symbol mapping for portfolio tickers
 - Empty portfolio totals helper
 - Price return computation (compute_returns)
@@ -12,12 +12,14 @@ Covers:
 from datetime import date
 
 from price_service import compute_returns
+from services.drawdown import drawdown_segments, max_drawdown_pct
 
 # ─── Import the functions under test from portfolio_service ───
 from services.portfolio_service import (
     YAHOO_SYMBOL_MAP,
     compute_max_drawdown,
     compute_xirr,
+    compute_xirr_batch,
     empty_totals,
     get_yahoo_symbol,
 )
@@ -162,6 +164,53 @@ class TestComputeXirr:
         # Either outcome is acceptable for such an extreme case
         assert result is None or isinstance(result, float)
 
+    def test_should_fall_back_to_bisection_for_deep_loss(self):
+        """Newton from 10% overshoots below -99% here; the bracketed solve finds ~-90%."""
+        cashflows = [
+            (date(2025, 1, 1), -100_000),
+            (date(2026, 1, 1),   10_000),
+        ]
+        result = compute_xirr(cashflows)
+        assert result is not None
+        assert abs(result - (-90.0)) < 0.1, f"Expected ~-90%, got {result}%"
+
+    def test_should_return_none_when_all_cashflows_same_sign(self):
+        cashflows = [
+            (date(2025, 1, 1), -100_000),
+            (date(2025, 6, 1), -50_000),
+        ]
+        assert compute_xirr(cashflows) is None
+
+
+class TestComputeXirrBatch:
+    """Tests for the batched XIRR solver."""
+
+    def test_should_match_single_series_results(self):
+        sets = [
+            [(date(2025, 1, 1), -100_000), (date(2026, 1, 1), 110_000)],
+            [(date(2025, 1, 1), -100_000), (date(2026, 1, 1), 10_000)],
+            [
+                (date(2024, 1, 1), -50_000),
+                (date(2024, 7, 1), -50_000),
+                (date(2025, 1, 1), 115_000),
+            ],
+        ]
+        assert compute_xirr_batch(sets) == [compute_xirr(cf) for cf in sets]
+
+    def test_should_return_none_for_unsolvable_entries(self):
+        sets = [
+            [],
+            [(date(2025, 1, 1), -100_000)],
+            [(date(2025, 1, 1), -100_000), (date(2026, 1, 1), 120_000)],
+        ]
+        result = compute_xirr_batch(sets)
+        assert result[0] is None
+        assert result[1] is None
+        assert abs(result[2] - 20.0) < 0.5
+
+    def test_should_return_empty_list_for_no_series(self):
+        assert compute_xirr_batch([]) == []
+
 
 # ═══════════════════════════════════════════════════════════
 #  MAX DRAWDOWN COMPUTATION
@@ -210,6 +259,32 @@ class TestComputeMaxDrawdown:
         assert result is not None
         assert abs(result - (-50.0)) < 0.01, f"Expected -50.0%, got {result}%"
 
+
+class TestDrawdownSegments:
+    """Tests for the array drawdown primitives (services/drawdown.py)."""
+
+    def test_should_split_underwater_periods_with_trough_and_recovery(self):
+        values = [100, 90, 95, 100, 110, 105, 99, 120, 115]
+        segs = drawdown_segments(values)
+        assert [(s.peak, s.trough, s.recovery) for s in segs] == [(0, 1, 3), (4, 6, 7), (7, 8, None)]
+        assert abs(segs[1].depth_pct - (-10.0)) < 1e-9
+
+    def test_should_use_last_tied_peak(self):
+        segs = drawdown_segments([100, 100, 95, 100])
+        assert segs[0].peak == 1
+
+    def test_should_return_no_segments_for_rising_series(self):
+        assert drawdown_segments([1, 2, 3]) == []
+        assert drawdown_segments([5]) == []
+
+    def test_max_drawdown_pct_matches_compute_max_drawdown(self):
+        values = [100, 80, 100, 120, 60, 100]
+        assert max_drawdown_pct(values) == -compute_max_drawdown(values)
+
+    def test_max_drawdown_pct_honours_initial_peak(self):
+        assert max_drawdown_pct([90], initial_peak=100) == 10.0
+        assert max_drawdown_pct([]) == 0.0
+
     def test_should_handle_monotonically_decreasing_series(self):
         """All values declining means drawdown equals total decline from first value."""
         values = [100, 90, 80, 70, 60]
@@ -139,6 +139,45 @@ class TestIndicesLatest:
         for period in ["1d", "1w", "1m", "3m", "6m", "12m"]:
             assert period in idx, f"Missing period return: {period}"
 
+    def test_should_anchor_1d_to_previous_close_and_1w_to_week_ago(self, client, db_session):
+        for d, close in [("2029-05-30", 100.0), ("2029-06-01", 104.0), ("2029-06-05", 110.0), ("2029-06-06", 121.0)]:
+            db_session.add(IndexPrice(date=d, index_name="TEST_PERIOD_G", close_price=close))
+        db_session.commit()
+
+        idx = {i["index_name"]: i for i in client.get("/api/indices/latest").json()["indices"]}["TEST_PERIOD_G"]
+        assert idx["1d"] == 10.0    # vs 2029-06-05 close, not the latest row itself
+        assert idx["1w"] == 21.0    # nearest to 2029-05-30
+        assert idx["change_pct"] == 10.0
+
+    def test_should_refresh_snapshot_when_new_date_arrives(self, client, db_session):
+        db_session.add(IndexPrice(date="2029-06-07", index_name="TEST_PERIOD_H", close_price=200.0))
+        db_session.commit()
+        assert client.get("/api/indices/latest").json()["date"] == "2029-06-07"
+
+        db_session.add(IndexPrice(date="2029-06-08", index_name="TEST_PERIOD_H", close_price=210.0))
+        db_session.commit()
+        data = client.get("/api/indices/latest").json()
+        assert data["date"] == "2029-06-08"
+        idx = {i["index_name"]: i for i in data["indices"]}["TEST_PERIOD_H"]
+        assert idx["close"] == 210.0
+        assert idx["1d"] == 5.0
+
+    def test_should_refresh_snapshot_when_latest_close_is_edited_in_place(self, client, db_session):
+        from services.data_helpers import upsert_price_row
+
+        db_session.add(IndexPrice(date="2029-06-08", index_name="TEST_PERIOD_I", close_price=100.0))
+        db_session.add(IndexPrice(date="2029-06-09", index_name="TEST_PERIOD_I", close_price=110.0))
+        db_session.commit()
+        idx = {i["index_name"]: i for i in client.get("/api/indices/latest").json()["indices"]}["TEST_PERIOD_I"]
+        assert idx["close"] == 110.0
+
+        # Same row, same row count: only its fetched_at moves
+        upsert_price_row(db_session, "TEST_PERIOD_I", {"date": "2029-06-09", "close": 120.0})
+        db_session.commit()
+        idx = {i["index_name"]: i for i in client.get("/api/indices/latest").json()["indices"]}["TEST_PERIOD_I"]
+        assert idx["close"] == 120.0
+        assert idx["1d"] == 20.0
+
 
 # ── Bulk Upload ─────────────────────────────────────────────
 
@@ -0,0 +1,94 @@
+"""
+Tests for FIE v3 — Stage Pipeline (services/pipeline.py) and the EOD stage graph.
+"""
+
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from services.pipeline import Stage, last_runs, run_pipeline
+
+
+class TestRunPipeline:
+    """Dependency order, concurrency, per-stage sessions and failure isolation."""
+
+    def test_should_run_independent_stages_concurrently_and_respect_dependencies(self):
+        both_started = threading.Barrier(2, timeout=5)
+        order = []
+
+        def fetch(name):
+            def _run(db, ctx):
+                both_started.wait()          # deadlocks unless a and b overlap
+                ctx[name] = 10
+                order.append(name)
+                return 10
+            return _run
+
+        def combine(db, ctx):
+            order.append("combine")
+            return ctx["a"] + ctx["b"]
+
+        sessions = []
+
+        def session_factory():
+            sessions.append(MagicMock())
+            return sessions[-1]
+
+        results = run_pipeline("test", [
+            Stage("combine", combine, after=("a", "b")),
+            Stage("a", fetch("a")),
+            Stage("b", fetch("b")),
+        ], session_factory=session_factory)
+
+        assert order[-1] == "combine"
+        assert results["combine"].rows == 20
+        assert len(sessions) == 3
+        assert all(s.commit.called and s.close.called for s in sessions)
+
+    def test_should_record_failure_and_still_run_dependents(self):
+        def boom(db, ctx):
+            raise RuntimeError("nse down")
+
+        results = run_pipeline("test_fail", [
+            Stage("fetch", boom),
+            Stage("after", lambda db, ctx: 3, after=("fetch",)),
+        ], session_factory=MagicMock)
+
+        assert results["fetch"].status == "failed" and "nse down" in results["fetch"].error
+        assert results["after"].status == "ok" and results["after"].rows == 3
+        summary = last_runs()["test_fail"]
+        assert [s["name"] for s in summary["stages"]] == ["fetch", "after"]
+
+    def test_should_reject_unknown_dependencies_and_cycles(self):
+        noop = lambda db, ctx: 0  # noqa: E731
+        with pytest.raises(ValueError, match="unknown"):
+            run_pipeline("bad", [Stage("a", noop, after=("missing",))], session_factory=MagicMock)
+        with pytest.raises(ValueError, match="cycle"):
+            run_pipeline("bad", [Stage("a", noop, after=("b",)), Stage("b", noop, after=("a",))],
+                         session_factory=MagicMock)
+
+
+def test_eod_graph_is_valid_and_triggers_sentiment_and_rebalance_after_prices():
+    from services.eod_jobs import EOD_STAGES
+    from services.pipeline import _check_graph
+
+    _check_graph(EOD_STAGES)
+    after = {s.name: set(s.after) for s in EOD_STAGES}
+    assert {"live_indices", "nse_history", "stock_sentiment"} <= after["market_sentiment"]
+    assert {"live_indices", "index_fallback", "nse_history"} <= after["compass_rebalance"]
+    assert "basket_navs" in after["portfolio_navs"]
+    # stages upserting the same IndexPrice keys never run concurrently
+    assert "index_fallback" in after["nse_history"] and "live_indices" in after["index_fallback"]
+    assert "constituents" in after["nifty500"]
+
+
+def test_nifty500_skips_tickers_priced_by_constituents(db_session):
+    from services.eod_jobs import _stage_nifty500
+
+    items = [{"symbol": s, "last_price": 100.0} for s in ("TCS", "INFY", "HDFCBANK")]
+    ctx = {"universe": {"covered": {"HDFCBANK"}}, "constituents": {"TCS"}}
+    with patch("price_service.fetch_nse_index_constituents", return_value=items), \
+            patch("price_service.fetch_yfinance_bulk_stock_history", return_value={}) as fetch:
+        _stage_nifty500(db_session, ctx)
+    assert fetch.call_args.args[0] == ["INFY"]
@@ -0,0 +1,94 @@
+"""
+Tests for PMS analytics (services/pms_service.py).
+
+Covers: drawdown event detection (full and incremental passes).
+"""
+
+from datetime import date, timedelta
+
+from models import DrawdownEvent, ModelPortfolio, PmsNavDaily
+from services.pms_service import detect_drawdown_events
+
+
+def _portfolio(db_session, name):
+    p = ModelPortfolio(name=name, portfolio_type="pms", ucc_code="T1")
+    db_session.add(p)
+    db_session.commit()
+    return p.id
+
+
+def _add_navs(db_session, pid, start_offset, values):
+    start = date(2024, 1, 1)
+    for i, v in enumerate(values):
+        db_session.add(PmsNavDaily(
+            portfolio_id=pid, date=start + timedelta(days=start_offset + i), nav=v * 1000, unit_nav=v,
+        ))
+    db_session.commit()
+
+
+def _events(db_session, pid):
+    return (
+        db_session.query(DrawdownEvent)
+        .filter(DrawdownEvent.portfolio_id == pid)
+        .order_by(DrawdownEvent.peak_date)
+        .all()
+    )
+
+
+class TestDetectDrawdownEvents:
+
+    def test_should_record_recovered_and_open_events_above_threshold(self, db_session):
+        pid = _portfolio(db_session, "DD_Full")
+        # -10% recovered, -1% ignored, then an open -5% drawdown
+        _add_navs(db_session, pid, 0, [100, 90, 95, 101, 100, 102, 97])
+
+        assert detect_drawdown_events(pid, db_session) == 2
+        recovered, open_ = _events(db_session, pid)
+        assert recovered.status == "recovered"
+        assert recovered.drawdown_pct == -10.0
+        assert recovered.recovery_date == date(2024, 1, 4)
+        assert recovered.recovery_days == 2
+        assert open_.status == "underwater"
+        assert open_.peak_date == date(2024, 1, 6)
+        assert open_.trough_nav == 97
+
+    def test_should_only_reevaluate_from_open_drawdown(self, db_session):
+        pid = _portfolio(db_session, "DD_Incremental")
+        _add_navs(db_session, pid, 0, [100, 90, 101, 95])
+        detect_drawdown_events(pid, db_session)
+        settled_id = _events(db_session, pid)[0].id
+
+        # Open drawdown deepens, then recovers, then a new dip
+        _add_navs(db_session, pid, 4, [93, 102, 99])
+        assert detect_drawdown_events(pid, db_session) == 3
+        events = _events(db_session, pid)
+        assert events[0].id == settled_id
+        assert events[1].status == "recovered"
+        assert events[1].trough_nav == 93
+        assert events[2].status == "underwater"
+
+    def test_should_match_full_pass(self, db_session):
+        pid = _portfolio(db_session, "DD_Match")
+        series = [100, 97, 99, 103, 98, 104, 104, 100, 95, 105, 101]
+        _add_navs(db_session, pid, 0, series[:5])
+        detect_drawdown_events(pid, db_session)
+        _add_navs(db_session, pid, 5, series[5:])
+        detect_drawdown_events(pid, db_session)
+        incremental = [(e.peak_date, e.trough_date, e.recovery_date, e.drawdown_pct) for e in _events(db_session, pid)]
+
+        detect_drawdown_events(pid, db_session, full=True)
+        full = [(e.peak_date, e.trough_date, e.recovery_date, e.drawdown_pct) for e in _events(db_session, pid)]
+        assert incremental == full
+
+    def test_should_fall_back_to_full_pass_when_history_changes(self, db_session):
+        pid = _portfolio(db_session, "DD_Rewrite")
+        _add_navs(db_session, pid, 0, [100, 90, 95])
+        detect_drawdown_events(pid, db_session)
+
+        # Unit NAV rewritten (e.g. TWR recomputed after a back-dated upload)
+        db_session.query(PmsNavDaily).filter(PmsNavDaily.portfolio_id == pid).update(
+            {PmsNavDaily.unit_nav: PmsNavDaily.unit_nav * 2}, synchronize_session=False,
+        )
+        db_session.commit()
+        assert detect_drawdown_events(pid, db_session) == 1
+        assert _events(db_session, pid)[0].peak_nav == 200
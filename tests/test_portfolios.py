@@ -12,6 +12,7 @@ may seed data during app startup.
 from unittest.mock import patch
 
 from models import (
+    IndexPrice,
     ModelPortfolio,
     PortfolioHolding,
     PortfolioNAV,
@@ -111,6 +112,69 @@ class TestListPortfolios:
         assert "updated_at" in portfolio
 
 
+class TestPortfolioSummaries:
+    """services.valuation_service.get_portfolio_summaries (backs GET /api/portfolios)"""
+
+    def _buy(self, client, pid, ticker, qty, price):
+        client.post(f"/api/portfolios/{pid}/transactions", json={
+            "ticker": ticker, "txn_type": "BUY",
+            "quantity": qty, "price": price, "txn_date": "2025-01-01",
+        })
+
+    @patch("routers.portfolios._background_fetch_stock_history")
+    def test_should_fetch_prices_once_for_union_of_tickers(self, mock_fetch, client):
+        from services.valuation_service import clear_summary_cache
+
+        clear_summary_cache()
+        p1 = client.post("/api/portfolios", json={"name": "Summary_A"}).json()["id"]
+        p2 = client.post("/api/portfolios", json={"name": "Summary_B"}).json()["id"]
+        self._buy(client, p1, "INFY", 10, 1500.0)
+        self._buy(client, p2, "INFY", 5, 1400.0)
+        self._buy(client, p2, "TCS", 2, 3000.0)
+
+        prices = {"INFY": {"current_price": 1600.0}, "TCS": {"current_price": 3300.0}}
+        with patch("services.valuation_service.get_live_prices", return_value=prices) as mock_prices:
+            response = client.get("/api/portfolios")
+
+        assert mock_prices.call_count == 1
+        assert sorted(mock_prices.call_args[0][0]) == ["INFY", "TCS"]
+        by_id = {p["id"]: p for p in response.json()["portfolios"]}
+        assert by_id[p1]["current_value"] == 16000.0
+        assert by_id[p2]["current_value"] == 14600.0
+        assert by_id[p2]["num_holdings"] == 2
+
+    @patch("routers.portfolios._background_fetch_stock_history")
+    def test_should_serve_cached_totals_until_holdings_change(self, mock_fetch, client):
+        from services.valuation_service import clear_summary_cache
+
+        clear_summary_cache()
+        pid = client.post("/api/portfolios", json={"name": "Summary_Cache"}).json()["id"]
+        self._buy(client, pid, "INFY", 10, 1500.0)
+
+        with patch("services.valuation_service.get_live_prices", return_value={}) as mock_prices:
+            client.get("/api/portfolios")
+            client.get("/api/portfolios")
+            assert mock_prices.call_count == 1
+
+            client.post(f"/api/portfolios/{pid}/transactions", json={
+                "ticker": "INFY", "txn_type": "SELL",
+                "quantity": 4, "price": 1700.0, "txn_date": "2025-02-01",
+            })
+            response = client.get("/api/portfolios")
+            assert mock_prices.call_count == 2
+
+        summary = next(p for p in response.json()["portfolios"] if p["id"] == pid)
+        assert summary["total_invested"] == 9000.0
+        assert summary["realized_pnl"] == 800.0
+
+    def test_should_sum_pms_capital_infusions(self):
+        from services.valuation_service import total_invested_from_corpus
+
+        # 5000 bump is below the infusion threshold, 200000 is a top-up
+        assert total_invested_from_corpus([1_000_000, 1_005_000, 1_205_000]) == 1_200_000
+        assert total_invested_from_corpus([]) == 0.0
+
+
 class TestGetPortfolio:
     """GET /api/portfolios/{portfolio_id}"""
 
@@ -488,6 +552,27 @@ class TestListHoldings:
         assert "unrealized_pnl" in totals
         assert "realized_pnl" in totals
 
+    @patch("routers.portfolios._background_fetch_stock_history")
+    def test_should_include_per_holding_xirr(self, mock_fetch, client):
+        resp = client.post("/api/portfolios", json={"name": "HoldingsTest_Xirr"})
+        pid = resp.json()["id"]
+        client.post(f"/api/portfolios/{pid}/transactions", json={
+            "ticker": "INFY", "txn_type": "BUY",
+            "quantity": 10, "price": 1500.0, "txn_date": "2020-01-01",
+        })
+        client.post(f"/api/portfolios/{pid}/transactions", json={
+            "ticker": "TCS", "txn_type": "BUY",
+            "quantity": 5, "price": 3000.0, "txn_date": "2020-01-01",
+        })
+        prices = {"INFY": {"current_price": 3000.0}}
+        with patch("routers.portfolios.get_live_prices", return_value=prices):
+            data = client.get(f"/api/portfolios/{pid}/holdings").json()
+        by_ticker = {h["ticker"]: h for h in data["holdings"]}
+        assert by_ticker["INFY"]["xirr"] is not None
+        assert by_ticker["INFY"]["xirr"] > 0
+        # No live price -> no terminal value -> no XIRR
+        assert by_ticker["TCS"]["xirr"] is None
+
 
 # ── NAV History ─────────────────────────────────────────────
 
@@ -567,6 +652,172 @@ class TestNavHistory:
         assert "unrealized_pnl" in nav
         assert "benchmark_value" in nav
 
+    def _seed_series(self, db_session, pid, n):
+        from datetime import date, timedelta
+
+        start = date(2023, 1, 1)
+        for i in range(n):
+            val = 100000.0 + (5000.0 if i == n // 2 else 0.0) + i
+            db_session.add(PortfolioNAV(
+                portfolio_id=pid, date=(start + timedelta(days=i)).strftime("%Y-%m-%d"),
+                total_value=val, total_cost=100000.0, unrealized_pnl=val - 100000.0,
+            ))
+        db_session.commit()
+
+    def test_should_downsample_to_max_points_keeping_endpoints_and_spike(self, client, db_session):
+        pid = client.post("/api/portfolios", json={"name": "NavTest_Downsample"}).json()["id"]
+        self._seed_series(db_session, pid, 500)
+
+        rows = client.get(f"/api/portfolios/{pid}/nav-history?max_points=50").json()["nav_history"]
+        assert len(rows) == 50
+        assert rows[0]["date"] == "2023-01-01"
+        assert rows[-1]["total_value"] == 100499.0
+        assert max(r["total_value"] for r in rows) == 105250.0
+
+    def test_should_return_columnar_shape(self, client, db_session):
+        pid = client.post("/api/portfolios", json={"name": "NavTest_Columns"}).json()["id"]
+        self._seed_series(db_session, pid, 10)
+
+        data = client.get(f"/api/portfolios/{pid}/nav-history?shape=columns").json()["nav_history"]
+        assert len(data["dates"]) == 10
+        assert data["values"][0] == 100000.0
+        assert len(data["total_cost"]) == 10
+        assert "benchmark_value" in data
+
+    def test_should_return_304_for_matching_etag(self, client, db_session):
+        pid = client.post("/api/portfolios", json={"name": "NavTest_Etag"}).json()["id"]
+        self._seed_series(db_session, pid, 5)
+
+        first = client.get(f"/api/portfolios/{pid}/nav-history")
+        etag = first.headers["etag"]
+        second = client.get(f"/api/portfolios/{pid}/nav-history", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+
+        db_session.add(PortfolioNAV(portfolio_id=pid, date="2023-02-01", total_value=1.0, total_cost=1.0))
+        db_session.commit()
+        third = client.get(f"/api/portfolios/{pid}/nav-history", headers={"If-None-Match": etag})
+        assert third.status_code == 200
+        assert third.headers["etag"] != etag
+
+
+class TestIncrementalNav:
+    """services.nav_service.materialize_portfolio_nav"""
+
+    def _txn(self, client, pid, txn_type, qty, price, txn_date, ticker="INFY"):
+        client.post(f"/api/portfolios/{pid}/transactions", json={
+            "ticker": ticker, "txn_type": txn_type,
+            "quantity": qty, "price": price, "txn_date": txn_date,
+        })
+
+    def _closes(self, db_session, ticker, closes):
+        for d, c in closes.items():
+            db_session.add(IndexPrice(index_name=ticker, date=d, close_price=c))
+        db_session.commit()
+
+    def _navs(self, db_session, pid):
+        return {
+            n.date: n for n in db_session.query(PortfolioNAV)
+            .filter(PortfolioNAV.portfolio_id == pid).order_by(PortfolioNAV.date).all()
+        }
+
+    @patch("routers.portfolios._background_fetch_stock_history")
+    def test_should_append_only_new_days(self, mock_fetch, client, db_session):
+        from services.nav_service import materialize_portfolio_nav
+
+        pid = client.post("/api/portfolios", json={"name": "NavInc_Append"}).json()["id"]
+        self._txn(client, pid, "BUY", 10, 100.0, "2025-01-01")
+        self._txn(client, pid, "SELL", 4, 120.0, "2025-01-03")
+        self._closes(db_session, "INFY", {"2025-01-01": 100.0, "2025-01-02": 110.0, "2025-01-03": 120.0})
+
+        assert materialize_portfolio_nav(pid, db_session, "2025-01-03") == 3
+        navs = self._navs(db_session, pid)
+        assert navs["2025-01-02"].total_value == 1100.0
+        assert navs["2025-01-03"].total_value == 720.0
+        assert navs["2025-01-03"].realized_pnl_cumulative == 80.0
+        first_ids = {d: n.id for d, n in navs.items()}
+
+        self._closes(db_session, "INFY", {"2025-01-06": 130.0})
+        assert materialize_portfolio_nav(pid, db_session, "2025-01-06") == 1
+        navs = self._navs(db_session, pid)
+        assert navs["2025-01-06"].total_value == 780.0
+        # Earlier rows untouched
+        assert {d: navs[d].id for d in first_ids} == first_ids
+
+    @patch("routers.portfolios._background_fetch_stock_history")
+    def test_should_recompute_from_backdated_transaction(self, mock_fetch, client, db_session):
+        from models import PortfolioNavState
+        from services.nav_service import materialize_portfolio_nav
+
+        pid = client.post("/api/portfolios", json={"name": "NavInc_Backdated"}).json()["id"]
+        self._txn(client, pid, "BUY", 10, 100.0, "2025-01-01")
+        self._closes(db_session, "INFY", {"2025-01-01": 100.0, "2025-01-02": 110.0, "2025-01-03": 120.0})
+        materialize_portfolio_nav(pid, db_session, "2025-01-03")
+        jan1_id = self._navs(db_session, pid)["2025-01-01"].id
+
+        self._txn(client, pid, "BUY", 5, 110.0, "2025-01-02")
+        state = db_session.query(PortfolioNavState).filter(PortfolioNavState.portfolio_id == pid).one()
+        assert state.dirty_from == "2025-01-02"
+
+        assert materialize_portfolio_nav(pid, db_session, "2025-01-03") == 2
+        navs = self._navs(db_session, pid)
+        assert navs["2025-01-01"].id == jan1_id
+        assert navs["2025-01-02"].total_value == 1650.0
+        assert navs["2025-01-03"].total_value == 1800.0
+        assert navs["2025-01-03"].num_holdings == 1
+        db_session.refresh(state)
+        assert state.dirty_from is None
+
+    @patch("routers.portfolios._background_fetch_stock_history")
+    def test_should_match_full_rebuild(self, mock_fetch, client, db_session):
+        from models import PortfolioNavState
+        from services.nav_service import materialize_portfolio_nav
+
+        pid = client.post("/api/portfolios", json={"name": "NavInc_Rebuild"}).json()["id"]
+        self._txn(client, pid, "BUY", 10, 100.0, "2025-01-01")
+        self._txn(client, pid, "BUY", 3, 50.0, "2025-01-02", ticker="TCS")
+        self._txn(client, pid, "SELL", 10, 90.0, "2025-01-06")
+        self._closes(db_session, "INFY", {"2025-01-01": 100.0, "2025-01-02": 95.0, "2025-01-06": 90.0})
+        self._closes(db_session, "TCS", {"2025-01-02": 50.0, "2025-01-03": 55.0, "2025-01-06": 60.0})
+
+        for end in ("2025-01-02", "2025-01-03", "2025-01-06"):
+            materialize_portfolio_nav(pid, db_session, end)
+        incremental = {d: (n.total_value, n.realized_pnl_cumulative) for d, n in self._navs(db_session, pid).items()}
+
+        db_session.query(PortfolioNavState).filter(PortfolioNavState.portfolio_id == pid).delete()
+        db_session.query(PortfolioNAV).filter(PortfolioNAV.portfolio_id == pid).delete()
+        db_session.commit()
+        materialize_portfolio_nav(pid, db_session, "2025-01-06")
+        rebuilt = {d: (n.total_value, n.realized_pnl_cumulative) for d, n in self._navs(db_session, pid).items()}
+
+        assert incremental == rebuilt
+        assert rebuilt["2025-01-06"] == (180.0, -100.0)
+
+    def test_should_keep_imported_history_and_value_only_later_days(self, client, db_session):
+        from services.nav_service import materialize_portfolio_nav
+
+        payload = {
+            "portfolio": {"name": "NavInc_Imported"},
+            "transactions": [
+                {"ticker": "INFY", "txn_type": "BUY", "quantity": 10, "price": 100.0,
+                 "total_value": 1000.0, "txn_date": "2025-01-01"},
+                {"ticker": "INFY", "txn_type": "SELL", "quantity": 4, "price": 120.0,
+                 "total_value": 480.0, "txn_date": "2025-01-02"},
+            ],
+            "nav_history": [
+                {"date": "2025-01-01", "total_value": 999.0, "total_cost": 1000.0},
+                {"date": "2025-01-02", "total_value": 777.0, "total_cost": 600.0},
+            ],
+        }
+        pid = client.post("/api/portfolios/bulk-import", json=payload).json()["portfolio_id"]
+        self._closes(db_session, "INFY", {"2025-01-01": 100.0, "2025-01-02": 120.0, "2025-01-03": 130.0})
+
+        assert materialize_portfolio_nav(pid, db_session, "2025-01-03") == 1
+        navs = self._navs(db_session, pid)
+        assert (navs["2025-01-01"].total_value, navs["2025-01-02"].total_value) == (999.0, 777.0)
+        # Positions and realized P&L replayed through the imported range
+        assert navs["2025-01-03"].total_value == 780.0
+        assert navs["2025-01-03"].realized_pnl_cumulative == 80.0
+
 
 # ── CSV Export ──────────────────────────────────────────────
 
@@ -2,9 +2,18 @@
 Tests for price_service.py — pure data/mapping functions.
 
 These tests cover ticker normalization, symbol mappings, and data constants
-WITHOUT making actual API calls to Yahoo Finance or NSE.
+WITHOUT making actual API calls to Yahoo Finance or NSE. The NSE history
+fetcher runs against a local HTTP fixture server.
 """
 
+import json
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
 
 from price_service import (
     FALLBACK_MAP,
@@ -444,3 +453,138 @@ class TestSafeFloat:
     def test_should_strip_whitespace(self):
         """Leading/trailing whitespace should be stripped before parsing."""
         assert _safe_float("  123.45  ") == 123.45
+
+
+# ═══════════════════════════════════════════════════════════
+#  NSE HISTORY FETCHER (local HTTP fixture)
+# ═══════════════════════════════════════════════════════════
+
+
+class _FakeNSEHandler(BaseHTTPRequestHandler):
+    """Homepage sets the session cookie; history requires it and serves
+    one row per weekday in [from, to] from server.closes[indexType]."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path == "/":
+            with server.lock:
+                server.warmups += 1
+            return self._send(200, b"ok", {"Set-Cookie": "nsit=ok; Path=/"})
+
+        qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with server.lock:
+            server.history_calls.append((qs["indexType"], qs["from"], qs["to"]))
+            forbid = server.forbid_next > 0
+            server.forbid_next -= forbid
+        if forbid or "nsit=ok" not in (self.headers.get("Cookie") or ""):
+            return self._send(403)
+
+        start = datetime.strptime(qs["from"], "%d-%m-%Y").date()
+        end = datetime.strptime(qs["to"], "%d-%m-%Y").date()
+        closes = server.closes.get(qs["indexType"], {})
+        data = [
+            {"EOD_TIMESTAMP": d.strftime("%d-%b-%Y").upper(), "EOD_CLOSE_INDEX_VAL": closes[d],
+             "EOD_OPEN_INDEX_VAL": closes[d], "EOD_HIGH_INDEX_VAL": closes[d], "EOD_LOW_INDEX_VAL": closes[d]}
+            for d in sorted(closes) if start <= d <= end
+        ]
+        self._send(200, json.dumps({"data": data}).encode(), {"Content-Type": "application/json"})
+
+
+@pytest.fixture
+def nse_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeNSEHandler)
+    server.lock = threading.Lock()
+    server.warmups = 0
+    server.history_calls = []
+    server.forbid_next = 0
+    end = date(2026, 3, 6)
+    server.closes = {
+        name: {end - timedelta(days=i): base + i for i in range(200) if (end - timedelta(days=i)).weekday() < 5}
+        for name, base in (("NIFTY 50", 22000.0), ("NIFTY BANK", 48000.0))
+    }
+    server.end = end
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestNseHistoryFetcher:
+    """services/nse_history.py against the fixture server."""
+
+    def test_plan_chunks_covers_range_in_90_day_windows(self):
+        from services.nse_history import plan_chunks
+
+        chunks = plan_chunks(date(2025, 1, 1), date(2025, 12, 31))
+        assert chunks[0][0] == date(2025, 1, 1) and chunks[-1][1] == date(2025, 12, 31)
+        assert all((e - s).days < 90 for s, e in chunks)
+        assert all(b[0] - a[1] == timedelta(days=1) for a, b in zip(chunks, chunks[1:]))
+        assert plan_chunks(date(2025, 2, 1), date(2025, 1, 31)) == []
+
+    def test_should_fetch_all_chunks_concurrently_with_warmed_sessions(self, nse_server):
+        from services.nse_history import fetch_index_histories
+
+        indices = {"NIFTY": "NIFTY 50", "BANKNIFTY": "NIFTY BANK"}
+        start = nse_server.end - timedelta(days=199)
+        result = fetch_index_histories(indices, {k: start for k in indices}, end=nse_server.end,
+                                       base_url=nse_server.base_url, rate_per_sec=1000)
+
+        assert len(nse_server.history_calls) == 6   # 3 chunks x 2 indices
+        assert nse_server.warmups <= 4              # pool, not one session per request
+        nifty = result["NIFTY"]
+        assert len(nifty) == len(nse_server.closes["NIFTY 50"])
+        assert [r["date"] for r in nifty] == sorted(r["date"] for r in nifty)
+        assert nifty[-1] == {"date": "2026-03-06", "close": 22000.0, "open": 22000.0,
+                             "high": 22000.0, "low": 22000.0, "volume": None}
+
+    def test_should_rewarm_session_and_retry_after_403(self, nse_server):
+        from services.nse_history import fetch_index_histories
+
+        nse_server.forbid_next = 1
+        result = fetch_index_histories({"NIFTY": "NIFTY 50"}, {"NIFTY": nse_server.end - timedelta(days=4)},
+                                       end=nse_server.end, base_url=nse_server.base_url, rate_per_sec=1000)
+        assert len(nse_server.history_calls) == 2
+        assert nse_server.warmups == 2
+        assert [r["date"] for r in result["NIFTY"]][-1] == "2026-03-06"
+
+    def test_should_resume_from_last_stored_date(self, db_session):
+        from models import IndexPrice
+        from price_service import fetch_historical_indices_nse_sync
+
+        db_session.add(IndexPrice(date=(date.today() - timedelta(days=3)).isoformat(),
+                                  index_name="NIFTY", close_price=22000.0))
+        db_session.commit()
+        live = [{"index_name": "NIFTY", "nse_name": "NIFTY 50"}, {"index_name": "BANKNIFTY", "nse_name": "NIFTY BANK"}]
+        with patch("price_service.fetch_live_indices", return_value=live), \
+                patch("services.nse_history.fetch_index_histories", return_value={}) as fetch:
+            fetch_historical_indices_nse_sync(period="1y", db=db_session)
+
+        indices, start_dates = fetch.call_args.args
+        assert indices == {"NIFTY": "NIFTY 50", "BANKNIFTY": "NIFTY BANK"}
+        assert start_dates["NIFTY"] == date.today() - timedelta(days=3)
+        assert start_dates["BANKNIFTY"] == date.today() - timedelta(days=365)
+
+    def test_token_bucket_spaces_calls_after_burst(self):
+        import time
+
+        from services.rate_limit import TokenBucket
+
+        bucket = TokenBucket(rate=50, capacity=2)
+        t0 = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        assert time.monotonic() - t0 >= 5 / 50 * 0.9
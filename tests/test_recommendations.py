@@ -5,9 +5,10 @@ Covers the sectors listing endpoint, generate endpoint with various
 parameter combinations, validation, and edge cases.
 """
 
+from datetime import datetime, timedelta
 from unittest.mock import patch
 
-from models import IndexConstituent, IndexPrice
+from models import Fundamental, IndexConstituent, IndexPrice
 
 # ─── Helpers ────────────────────────────────────────────────
 
@@ -139,10 +140,7 @@ class TestGenerateRecommendations:
         })
         assert response.status_code == 400
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_return_non_qualifying_when_ratio_below_threshold(
-        self, mock_fundamentals, client, db_session
-    ):
+    def test_should_return_non_qualifying_when_ratio_below_threshold(self, client, db_session):
         """Sectors whose ratio return is below threshold should be non-qualifying."""
         # Seed prices: sector return close to base (ratio ~ 0)
         today = "2026-03-07"
@@ -165,10 +163,7 @@ class TestGenerateRecommendations:
         assert data["non_qualifying_sectors"][0]["sector_key"] == "BANKNIFTY"
         assert data["non_qualifying_sectors"][0]["qualifies"] is False
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_return_qualifying_when_ratio_above_threshold(
-        self, mock_fundamentals, client, db_session
-    ):
+    def test_should_return_qualifying_when_ratio_above_threshold(self, client, db_session):
         """Sectors whose ratio return exceeds threshold should be qualifying."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -202,8 +197,7 @@ class TestGenerateRecommendations:
         assert sector["ratio_return"] > 5.0
         assert len(sector["top_stocks"]) <= 5
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_clamp_top_n_to_max_10(self, mock_fundamentals, client, db_session):
+    def test_should_clamp_top_n_to_max_10(self, client, db_session):
         """top_n should be clamped to 10 even if a higher value is provided."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -221,8 +215,7 @@ class TestGenerateRecommendations:
         data = response.json()
         assert data["top_n"] == 10
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_clamp_top_n_to_min_1(self, mock_fundamentals, client, db_session):
+    def test_should_clamp_top_n_to_min_1(self, client, db_session):
         """top_n should be at least 1 even if 0 is provided."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -239,8 +232,7 @@ class TestGenerateRecommendations:
         assert response.status_code == 200
         assert response.json()["top_n"] == 1
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_include_etf_recommendations(self, mock_fundamentals, client, db_session):
+    def test_should_include_etf_recommendations(self, client, db_session):
         """Qualifying and non-qualifying sectors should include ETF data."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -262,8 +254,7 @@ class TestGenerateRecommendations:
         etf_tickers = [e["ticker"] for e in bank["recommended_etfs"]]
         assert "BANKBEES" in etf_tickers
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_filter_only_valid_selected_sectors(self, mock_fundamentals, client, db_session):
+    def test_should_filter_only_valid_selected_sectors(self, client, db_session):
         """Invalid sector keys should be silently filtered out."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -286,8 +277,7 @@ class TestGenerateRecommendations:
         assert "BANKNIFTY" in all_sector_keys
         assert "INVALID_SECTOR" not in all_sector_keys
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_return_response_structure(self, mock_fundamentals, client, db_session):
+    def test_should_return_response_structure(self, client, db_session):
         """Verify the full response structure of the generate endpoint."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -312,8 +302,7 @@ class TestGenerateRecommendations:
         assert "generated_at" in data
         assert data["generated_at"].endswith("Z")
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_uppercase_base(self, mock_fundamentals, client, db_session):
+    def test_should_uppercase_base(self, client, db_session):
         """Base index parameter should be uppercased."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -330,8 +319,7 @@ class TestGenerateRecommendations:
         assert response.status_code == 200
         assert response.json()["base"] == "NIFTY"
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_should_handle_no_price_data_gracefully(self, mock_fundamentals, client, db_session):
+    def test_should_handle_no_price_data_gracefully(self, client, db_session):
         """When there is no historical price data, ratio returns should be empty."""
         response = client.post("/api/recommendations/generate", json={
             "base": "NIFTY",
@@ -347,10 +335,7 @@ class TestGenerateRecommendations:
         pharma = data["non_qualifying_sectors"][0]
         assert pharma["ratio_return"] is None
 
-    @patch("routers.recommendations._fetch_fundamentals", return_value={})
-    def test_qualifying_sectors_sorted_by_ratio_return_descending(
-        self, mock_fundamentals, client, db_session
-    ):
+    def test_qualifying_sectors_sorted_by_ratio_return_descending(self, client, db_session):
         """Qualifying sectors should be sorted by ratio_return in descending order."""
         today = "2026-03-07"
         month_ago = "2026-02-05"
@@ -373,6 +358,62 @@ class TestGenerateRecommendations:
             assert qualifying[0]["ratio_return"] >= qualifying[1]["ratio_return"]
 
 
+# ─── Snapshot + Stored Fundamentals ────────────────────────
+
+
+def _seed_it_sector(db_session):
+    """NIFTY flat, NIFTY IT +20% over the last month, two constituents."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    _seed_index_prices(db_session, "NIFTY", {today: 22000.0, month_ago: 22000.0})
+    _seed_index_prices(db_session, "NIFTYIT", {today: 36000.0, month_ago: 30000.0})
+    _seed_constituents(db_session, "NIFTY IT", [
+        {"ticker": "TCS", "company_name": "Tata Consultancy", "weight_pct": 30.0, "last_price": 3500.0},
+        {"ticker": "INFY", "company_name": "Infosys", "weight_pct": 25.0, "last_price": 1500.0},
+    ])
+    _seed_index_prices(db_session, "TCS", {today: 3500.0, month_ago: 2800.0})
+    _seed_index_prices(db_session, "INFY", {today: 1500.0, month_ago: 1400.0})
+
+
+class TestRecommendationSnapshot:
+    """Generate re-ranks a shared snapshot; fundamentals come from the table."""
+
+    def _generate(self, client, **overrides):
+        payload = {"base": "NIFTY", "period": "1m", "selected_sectors": ["NIFTYIT"], "threshold": 5.0, "top_n": 5}
+        payload.update(overrides)
+        return client.post("/api/recommendations/generate", json=payload).json()
+
+    def test_should_rank_from_snapshot_with_stored_fundamentals(self, client, db_session):
+        _seed_it_sector(db_session)
+        db_session.add(Fundamental(symbol="TCS", trailing_pe=28.5, trailing_eps=120.0, market_cap=1.3e13))
+        db_session.commit()
+
+        data = self._generate(client)
+        sector = data["qualifying_sectors"][0]
+        assert sector["ratio_return"] == 20.0
+        assert [s["ticker"] for s in sector["top_stocks"]] == ["TCS", "INFY"]
+        tcs, infy = sector["top_stocks"]
+        assert tcs["ratio_return_vs_sector"] == round((3500 / 36000) / (2800 / 30000) * 100 - 100, 2)
+        assert tcs["pe_ratio"] == 28.5
+        assert tcs["market_cap_cr"] == 1300000.0
+        assert infy["pe_ratio"] is None
+
+    def test_should_not_rebuild_snapshot_for_new_threshold_or_top_n(self, client, db_session):
+        _seed_it_sector(db_session)
+        from routers import recommendations
+
+        with patch.object(recommendations, "_build_snapshot", wraps=recommendations._build_snapshot) as build:
+            self._generate(client)
+            assert len(self._generate(client, top_n=1)["qualifying_sectors"][0]["top_stocks"]) == 1
+            assert self._generate(client, threshold=25.0)["qualifying_sectors"] == []
+            assert build.call_count == 1
+
+            # A price write invalidates the snapshot
+            _seed_index_prices(db_session, "INFY", {"2020-01-01": 1.0})
+            self._generate(client)
+            assert build.call_count == 2
+
+
 # ─── Batch Helper Unit Tests ──────────────────────────────
 
 
@@ -31,7 +31,7 @@ interface HoldingsTableProps {
   onSymbolOverride?: (holdingId: number, yfSymbol: string | null) => void;
 }
 
-type SortKey = "ticker" | "quantity" | "avg_cost" | "current_price" | "current_value" | "unrealized_pnl_pct" | "weight_pct";
+type SortKey = "ticker" | "quantity" | "avg_cost" | "current_price" | "current_value" | "unrealized_pnl_pct" | "xirr" | "weight_pct";
 
 export function HoldingsTable({ holdings, totals, portfolioId, onBuyMore, onSell, onSymbolOverride }: HoldingsTableProps) {
   const [sortKey, setSortKey] = useState<SortKey>("weight_pct");
@@ -77,7 +77,7 @@ export function HoldingsTable({ holdings, totals, portfolioId, onBuyMore, onSell
     <TooltipProvider>
     <div className="rounded-lg border border-border overflow-hidden">
       <div className="overflow-x-auto">
-      <Table className="min-w-[800px]">
+      <Table className="min-w-[890px]">
         <TableHeader>
           <TableRow className="bg-muted/50">
             <TableHead className="w-[180px]"><SortHeader label="Ticker" field="ticker" /></TableHead>
@@ -86,6 +86,7 @@ export function HoldingsTable({ holdings, totals, portfolioId, onBuyMore, onSell
             <TableHead className="text-center w-[100px]"><SortHeader label="CMP" field="current_price" align="center" /></TableHead>
             <TableHead className="text-center w-[110px]"><SortHeader label="Value" field="current_value" align="center" /></TableHead>
             <TableHead className="text-center w-[90px]"><SortHeader label="P&L %" field="unrealized_pnl_pct" align="center" /></TableHead>
+            <TableHead className="text-center w-[90px]"><SortHeader label="XIRR" field="xirr" align="center" /></TableHead>
             <TableHead className="w-[150px]"><SortHeader label="Weight" field="weight_pct" /></TableHead>
             {(onBuyMore || onSell) && <TableHead className="w-[100px] text-center">Actions</TableHead>}
           </TableRow>
@@ -93,6 +94,7 @@ export function HoldingsTable({ holdings, totals, portfolioId, onBuyMore, onSell
         <TableBody>
           {sorted.map((h) => {
             const pnlColor = (h.unrealized_pnl_pct ?? 0) >= 0 ? "text-emerald-600" : "text-red-600";
+            const xirrColor = (h.xirr ?? 0) >= 0 ? "text-emerald-600" : "text-red-600";
             const sectorColor = getSectorDisplayColor(h.sector);
             const weightPct = h.weight_pct ?? 0;
             const barWidth = maxWeight > 0 ? (weightPct / maxWeight) * 100 : 0;
@@ -200,6 +202,11 @@ export function HoldingsTable({ holdings, totals, portfolioId, onBuyMore, onSell
                   {h.unrealized_pnl_pct != null ? formatPct(h.unrealized_pnl_pct) : "—"}
                 </TableCell>
 
+                {/* XIRR */}
+                <TableCell className={`text-center font-mono text-sm tabular-nums ${xirrColor}`}>
+                  {h.xirr != null ? formatPct(h.xirr) : "—"}
+                </TableCell>
+
                 {/* Weight with allocation bar */}
                 <TableCell>
                   <div className="flex items-center gap-2">
@@ -265,6 +272,7 @@ export function HoldingsTable({ holdings, totals, portfolioId, onBuyMore, onSell
               }`}>
                 {formatPct(totals.unrealized_pnl_pct)}
               </TableCell>
+              <TableCell />
               <TableCell className="font-mono text-sm">
                 <div className="flex items-center gap-2">
                   <span className="w-[45px] text-right">100%</span>
@@ -48,6 +48,7 @@ export interface PortfolioHoldingRow {
   price_source: string | null;  // Yahoo Finance symbol used (e.g. LIQUIDBEES.NS)
   yf_symbol_override: string | null;  // FM-set Yahoo Finance symbol override
   price_available?: boolean;  // Whether live price was found for this ticker
+  xirr?: number | null;  // Annualized money-weighted return (%) from this ticker's transactions
 }
 
 export interface HoldingsTotals {